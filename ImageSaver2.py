@@ -8,6 +8,7 @@ import re
 import stat
 import sys
 from collections import deque
+from contextlib import ExitStack
 from configparser import ConfigParser
 from typing import List, Set, Union, Optional, cast, BinaryIO, IO, TextIO, Iterable
 
@@ -21,7 +22,9 @@ from ImageSaverLib.Encapsulation.Wrappers.Types import AES256CTRWrapper, PassThr
 from ImageSaverLib.Errors import CompoundNotExistingException
 from ImageSaverLib.FragmentCache import FragmentCache
 from ImageSaverLib.Helpers import get_size_of_stream
-from ImageSaverLib.Helpers.TqdmReporter import TqdmUpTo
+from ImageSaverLib.Helpers.Chunker import Chunker, ContentDefinedChunker
+from ImageSaverLib.Helpers.JobQueue import JobQueue
+from ImageSaverLib.Helpers.TqdmReporter import TqdmUpTo, ConcurrentTqdmUpTo
 from ImageSaverLib.ImageSaverFS2 import ImageSaverFS
 from ImageSaverLib.ImageSaverLib import ImageSaver
 from ImageSaverLib.MetaDB.MetaDB import MetaDBInterface
@@ -47,6 +50,8 @@ class Actions(object):
     profile = 'profile'
     archive = 'archive'
     snapshot = 'snapshot'
+    export = 'export'
+    import_ = 'import'
 
 # region argparse type checkers
 
@@ -177,6 +182,14 @@ class ImageSaverApp(object):
     snapshot_parser = subparsers.add_parser(Actions.snapshot,
                                             help="Creates a snapshot of a given File or Folder",
                                             allow_abbrev=False)
+    export_parser = subparsers.add_parser(Actions.export,
+                                          help="Exports the Meta-DB into a portable File or backs it up into the "
+                                               "Storage.",
+                                          allow_abbrev=False)
+    import_parser = subparsers.add_parser(Actions.import_,
+                                          help="Imports an exported Meta-DB into the configured Meta-DB, which has to "
+                                               "be empty or hold an interrupted import of the same export.",
+                                          allow_abbrev=False)
 
     upload_parser.add_argument('item', action='append', help="Add the given File or Directory to the Target."
                                , nargs='+', default=[])
@@ -195,6 +208,21 @@ class ImageSaverApp(object):
     upload_parser.add_argument('-fs', '--fragment-size', dest='fragment_size',
                                help="Sets the Fragment Size to the given Value",
                                type=humanfriendly.parse_size)
+    upload_parser.add_argument('-ch', '--chunking', choices=['fixed', 'cdc'], default=None,
+                               help="Sets how Files are cut into Fragments. 'fixed' cuts Fragments at fixed Fragment "
+                                    "Size offsets. 'cdc' uses content defined chunking, Fragments are cut depending "
+                                    "on their content, which finds duplicate data also after inserted or removed "
+                                    "bytes, but cuts slower than 'fixed' (roughly 30-100 MiB/s, depending on the "
+                                    "Fragment Size). The Fragment Size is used as average Fragment Size. "
+                                    "(default: option 'chunking' in Section 'isl' of the config, otherwise 'fixed')")
+    upload_parser.add_argument('-ew', '--encapsulation-workers', dest='encapsulation_workers', type=int, default=0,
+                               help="Number of threads, which compress, wrap and hash Fragments in parallel. "
+                                    "(default: %(default)s)")
+    upload_parser.add_argument('-j', '--jobs', type=int, default=1,
+                               help="Number of Files, which are uploaded concurrently. The Files share the Fragment "
+                                    "Cache, so small Files fill Resources together. The progress of all Files is "
+                                    "reported by one progress bar. Uploading from stdin ignores this option. "
+                                    "(default: %(default)s)")
     upload_parser.add_argument('-c1', '--compress1', choices=['pass', 'zlib', 'lzma', 'bz2'], default='zlib',
                                help="sets the used compressing algorithm during fragment creation. (default: %(default)s)")
     upload_parser.add_argument('-c2', '--compress2', choices=['pass', 'zlib', 'lzma', 'bz2'], default='pass',
@@ -234,6 +262,10 @@ class ImageSaverApp(object):
                                  help="Exclude items that match the given expression.")
     download_parser.add_argument('-ag', '--advanced-globbing', dest='advanced_globbing', action='store_true',
                                  help="Use a more directory orientated filtering.")
+    download_parser.add_argument('-pf', '--prefetch', type=int, default=2,
+                                 help="Number of Resources, which get downloaded in parallel ahead of the currently "
+                                      "restored Fragments. Each prefetched Resource is held in memory. "
+                                      "(default: %(default)s)")
     remove_parser.add_argument('item', action='append', help="Remove the given Item from the Target.",
                                nargs='+', default=[])
     remove_parser.add_argument('-e', '--exclude', action='append',
@@ -264,6 +296,9 @@ class ImageSaverApp(object):
     statistic_parser.add_argument('-o', '--offline', action='store_true',
                                   help="Only prints Statistics using the database. "
                                        "This does not check the total count of Resources stored in the Storage.")
+    statistic_parser.add_argument('-r', '--recompute', action='store_true',
+                                  help="Recomputes the Statistics from all stored Compounds, Fragments and Resources "
+                                       "before printing them. Repairs counters, which got out of sync.")
     clean_parser.add_argument('-os', '--optimize-space',
                               dest='optimize_space',
                               help="Reduces Overall Storage Size, number of uploaded Resources does not change. "
@@ -326,6 +361,20 @@ class ImageSaverApp(object):
     snapshot_parser.add_argument('item', action='append', help="Snapshot the given Item.",
                                  # nargs='+',
                                  default=[])
+
+    export_parser.add_argument('file', nargs='?', default='-',
+                               help="File to write the export into, - writes to stdout (default: %(default)s)")
+    export_parser.add_argument('-s', '--storage', dest='to_storage', action='store_true',
+                               help="Backs up the Meta-DB as regular Resources into the Storage and prints the "
+                                    "locator of the backup, instead of writing a File.")
+
+    import_parser.add_argument('file', nargs='?', default='-',
+                               help="File to read the export from, - reads from stdin. With --storage the locator "
+                                    "printed by the export (default: %(default)s)")
+    import_parser.add_argument('-s', '--storage', dest='from_storage', action='store_true',
+                               help="Restores a backup of the Meta-DB from the Storage.")
+    import_parser.add_argument('-nr', '--no-resume', dest='no_resume', action='store_true',
+                               help="Do not skip the objects of an interrupted import of the same export.")
     # endregion
 
     namespace = argparser.parse_args(sys.argv[1:])
@@ -359,12 +408,23 @@ class ImageSaverApp(object):
         if self._save_service:
             return self._save_service
         else:
+            parser = self._config_parser()
+            if parser.has_option('isl', 'upload_workers'):
+                try:
+                    upload_workers = parser.getint('isl', 'upload_workers')
+                except ValueError:
+                    self.argparser.error(
+                        'Config invalid, Section "isl" option "upload_workers" is not an Integer')
+                    exit(1)
+                    return
+            else:
+                upload_workers = 0
             self._save_service = ImageSaver(self.meta, self.storage,
                                             fragment_size=None,
                                             # fragment_size=tobytes(1, 'MB'),
                                             # resource_size=tobytes(10, 'MB')
+                                            upload_workers=upload_workers,
                                             )
-            parser = self._config_parser()
             if parser.has_option('isl', 'aes_key'):
                 self._save_service.wrapper.addWrapper(AES256CTRWrapper(
                     hashlib.sha256(
@@ -395,10 +455,79 @@ class ImageSaverApp(object):
             #     self.namespace.compress2 = 'pass'
             #     self.save_service.fragment_cache.resource_wrap_type = PassThroughWrapper.get_wrapper_type()
             #     self.save_service.fragment_cache.resource_compress_type = PassThroughCompressor.get_compressor_type()
+            if parser.has_option('isl', 'resource_cache_size'):
+                try:
+                    self._save_service.fragment_cache.resource_payload_cache.max_size = humanfriendly.parse_size(
+                        parser.get('isl', 'resource_cache_size'))
+                except humanfriendly.InvalidSize:
+                    self.argparser.error(
+                        'Config invalid, Section "isl" option "resource_cache_size" is not a valid size')
+                    exit(1)
+                    return
+            if parser.has_option('isl', 'meta_batch_count'):
+                try:
+                    meta_batch_count = parser.getint('isl', 'meta_batch_count')
+                except ValueError:
+                    meta_batch_count = 0
+                if meta_batch_count < 1:
+                    self.argparser.error(
+                        'Config invalid, Section "isl" option "meta_batch_count" is not a positive Integer')
+                    exit(1)
+                    return
+                self._save_service.fragment_cache.meta_batch_count = meta_batch_count
+            if parser.has_option('isl', 'meta_batch_size'):
+                try:
+                    self._save_service.fragment_cache.meta_batch_size = humanfriendly.parse_size(
+                        parser.get('isl', 'meta_batch_size'))
+                except humanfriendly.InvalidSize:
+                    self.argparser.error(
+                        'Config invalid, Section "isl" option "meta_batch_size" is not a valid size')
+                    exit(1)
+                    return
+            if parser.has_option('isl', 'meta_batch_delay'):
+                try:
+                    self._save_service.fragment_cache.meta_batch_delay = humanfriendly.parse_timespan(
+                        parser.get('isl', 'meta_batch_delay'))
+                except humanfriendly.InvalidTimespan:
+                    self.argparser.error(
+                        'Config invalid, Section "isl" option "meta_batch_delay" is not a valid timespan')
+                    exit(1)
+                    return
             if self.namespace.dryrun:
-                self._save_service.fragment_cache.cache_last_downloaded_resource = False
+                self._save_service.fragment_cache.resource_payload_cache.max_size = 0
+            self._save_service.setDefaultChunker(self._make_chunker())
             return self._save_service
 
+    def _make_chunker(self, chunking=None):
+        # type: (Optional[str]) -> Optional[Chunker]
+        parser = self._config_parser()
+        if chunking is None:
+            if parser.has_option('isl', 'chunking'):
+                chunking = parser.get('isl', 'chunking')
+            else:
+                chunking = 'fixed'
+        if chunking == 'fixed':
+            return None
+        elif chunking != 'cdc':
+            self.argparser.error('Config invalid, Section "isl" option "chunking" must be "fixed" or "cdc"')
+            exit(1)
+            return
+        chunk_sizes = {}
+        for option in ('chunk_min_size', 'chunk_avg_size', 'chunk_max_size'):
+            if parser.has_option('isl', option):
+                try:
+                    chunk_sizes[option] = humanfriendly.parse_size(parser.get('isl', option))
+                except humanfriendly.InvalidSize:
+                    self.argparser.error('Config invalid, Section "isl" option "' + option + '" is not a Size')
+                    exit(1)
+                    return
+        resource_size = self._save_service.fragment_cache.resource_size
+        avg_size = chunk_sizes.get('chunk_avg_size', self._save_service.fragment_size)
+        max_size = min(chunk_sizes.get('chunk_max_size', avg_size * 2), resource_size)
+        avg_size = min(avg_size, max_size)
+        min_size = min(chunk_sizes.get('chunk_min_size', max(avg_size // 4, 1)), avg_size)
+        return ContentDefinedChunker(min_size, avg_size, max_size)
+
     @property
     def verbose_storage(self):
         if not self._storage:
@@ -417,7 +546,6 @@ class ImageSaverApp(object):
             from ImageSaverLib.Storage.RamStorage import RamStorage
             from ImageSaverLib.Storage.SambaStorage import SambaStorage
             from ImageSaverLib.Storage.StorageBuilder import StorageBuilder
-            from ImageSaverLib.Storage.SynchronizedStorage import SynchronizedStorage
             from ImageSaverLib.Storage.VoidStorage import VoidStorage
             from ImageSaverLib.Storage.RedundantStorage import RedundantStorage
             storage_builder = StorageBuilder()
@@ -458,16 +586,17 @@ class ImageSaverApp(object):
                     meta_dir = parser.get('pool', 'meta_dir')
                 else:
                     meta_dir = '~/.isl/.pool'
-                storages = storage_builder.build_all_from_config(parser)
+                storages = [self._rate_limited(parser, self._synchronized(built_storage))
+                            for built_storage in storage_builder.build_all_from_config(parser)]
                 if len(storages) < redundancy:
                     self.argparser.error(
                         'Config invalid, Section "pool" option "redundancy": redundancy too high, not enough storages '
                         'defined')
                     exit(1)
                     return
-                storage = RedundantStorage(policy, redundancy, *storages, meta_dir=meta_dir)
+                storage = self._synchronized(RedundantStorage(policy, redundancy, *storages, meta_dir=meta_dir))
             else:
-                storage = storage_builder.build_from_config(parser)
+                storage = self._rate_limited(parser, self._synchronized(storage_builder.build_from_config(parser)))
             storage = VerboseStorage(storage, self.namespace.verbose)
             self._verbose_storage = storage
             if self.namespace.dryrun:
@@ -514,26 +643,72 @@ class ImageSaverApp(object):
                 if ram_cache_size == 0:
                     self._ram_cache.cache_enabled = False
                 self._storage = storage
-            self._storage = SynchronizedStorage(self._storage)
             return self._storage
 
+    @staticmethod
+    def _synchronized(storage):
+        # type: (StorageInterface) -> StorageInterface
+        """
+        serializes the calls to storages with batch_workers = 1, which are not safe to call from the upload workers at
+        the same time. The caches above are thread safe, so other storages get concurrent requests.
+        """
+        from ImageSaverLib.Storage.SynchronizedStorage import SynchronizedStorage, SizableSynchronizedStorage
+        from ImageSaverLib.Storage.StorageInterface import SizableStorageInterface
+        if storage.batch_workers > 1:
+            return storage
+        if isinstance(storage, SizableStorageInterface):
+            return SizableSynchronizedStorage(storage)
+        return SynchronizedStorage(storage)
+
+    def _rate_limited(self, parser, storage):
+        # type: (ConfigParser, StorageInterface) -> StorageInterface
+        from ImageSaverLib.Storage.RateLimitedStorage import RateLimitedStorage, SizableRateLimitedStorage
+        from ImageSaverLib.Storage.StorageInterface import SizableStorageInterface
+        if not parser.has_option('isl', 'rate_limit') or not parser.getboolean('isl', 'rate_limit'):
+            return storage
+        requests_per_second = None
+        max_concurrency = None
+        if parser.has_option('isl', 'rate_limit_requests_per_second'):
+            try:
+                requests_per_second = parser.getfloat('isl', 'rate_limit_requests_per_second')
+                if requests_per_second <= 0:
+                    raise ValueError
+            except ValueError:
+                self.argparser.error(
+                    'Config invalid, Section "isl" option "rate_limit_requests_per_second" is not a positive number')
+                exit(1)
+        if parser.has_option('isl', 'rate_limit_max_concurrency'):
+            try:
+                max_concurrency = parser.getint('isl', 'rate_limit_max_concurrency')
+                if max_concurrency < 1:
+                    raise ValueError
+            except ValueError:
+                self.argparser.error(
+                    'Config invalid, Section "isl" option "rate_limit_max_concurrency" is not a positive Integer')
+                exit(1)
+        if isinstance(storage, SizableStorageInterface):
+            return SizableRateLimitedStorage(storage, requests_per_second, max_concurrency=max_concurrency)
+        return RateLimitedStorage(storage, requests_per_second, max_concurrency=max_concurrency)
+
     @property
     def meta(self):
         if self._meta:
             return self._meta
         else:
             from ImageSaverLib.MetaDB.MetaBuilder import MetaBuilder
-            from ImageSaverLib.MetaDB.db_inits import (sqliteRAM, SqliteRamBuilder, SqliteFileBuilder,
+            from ImageSaverLib.MetaDB.db_inits import (dictRAM, SqliteRamBuilder, DictRamBuilder, SqliteFileBuilder,
                                                        PostgresBuilder)
             meta_builder = MetaBuilder()
             meta_builder.addMetaClass(SqliteRamBuilder)
+            meta_builder.addMetaClass(DictRamBuilder)
             meta_builder.addMetaClass(SqliteFileBuilder)
             meta_builder.addMetaClass(PostgresBuilder)
 
             meta = meta_builder.build_from_config(self._config_parser(),
                                                   force_debug=self.namespace.dbecho)
             if self.namespace.dryrun:
-                self._meta = sqliteRAM(echo=self.namespace.dbecho)
+                # a dry run only needs to size the data, which does not need a database
+                self._meta = dictRAM()
                 self.namespace.fragment_policy = 'pass'
             else:
                 self._meta = meta
@@ -622,6 +797,10 @@ class ImageSaverApp(object):
             self.runArchive()
         elif self.namespace.action == Actions.snapshot:
             self.runSnapshot()
+        elif self.namespace.action == Actions.export:
+            self.runExport()
+        elif self.namespace.action == Actions.import_:
+            self.runImport()
         else:
             self.argparser.print_help()
 
@@ -672,6 +851,13 @@ class ImageSaverApp(object):
         if self.namespace.fragment_size:
             assert type(self.namespace.fragment_size) is int, type(self.namespace.fragment_size)
             self.save_service.fragment_size = self.namespace.fragment_size
+        if self.namespace.chunking or self.namespace.fragment_size:
+            self.save_service.setDefaultChunker(self._make_chunker(self.namespace.chunking))
+        if self.namespace.encapsulation_workers:
+            self.save_service.encapsulation_workers = self.namespace.encapsulation_workers
+        if self.namespace.jobs < 1:
+            self.upload_parser.error('jobs must be at least 1')
+            return
         if self.namespace.dryrun:
             self.namespace.fragment_policy = 'pass'
         # print('???', self.save_service.compress_type, self.namespace.compress1)
@@ -751,203 +937,250 @@ class ImageSaverApp(object):
                 exit(1)
             globbed_items = set(globbed_items)  # type: Set[str]
 
-            for item_index, globbed_item in enumerate(globbed_items):
-                self.is_fs.flush()
-                if os.sep == '\\':
-                    globbed_item = globbed_item.replace('\\', '/')
-                if globbed_item.endswith('/'):
-                    globbed_item = globbed_item[0:-1]
-                if os.path.isfile(globbed_item):
-                    if self._is_skippable(globbed_item, self.namespace.exclude):
-                        if not self.namespace.silent:
-                            print('skipping (' + str(item_index + 1) + ' of ' + str(
-                                len(globbed_items)) + ') ' + globbed_item, file=sys.stderr)
-                        continue
-                    try:
-                        # print(globbed_item, os.path.dirname(globbed_item))
-                        # print(globbed_item, os.path.basename(globbed_item))
-                        with OSFS(os.path.dirname(globbed_item)) as src_fs:
-                            src_file_name = '/' + os.path.basename(globbed_item)
-                            # src_fs.tree(max_levels=1)
-                            with src_fs.open(src_file_name, 'rb') as src_file:
-                                dest_file_name = os.path.basename(os.path.abspath(globbed_item))
-                                if self.namespace.prefix:
-                                    dest_file_name = self.namespace.prefix + '/' + dest_file_name
+            upload_reporter = None  # type: Optional[ConcurrentTqdmUpTo]
+            job_queue = None  # type: Optional[JobQueue]
+            with ExitStack() as upload_jobs:
+                if self.namespace.jobs > 1:
+                    # files are uploaded concurrently into the shared fragment cache, so small files fill resources
+                    # together. the progress of all files is reported by one progress bar
+                    upload_reporter = upload_jobs.enter_context(
+                        ConcurrentTqdmUpTo(desc='uploading', unit='Bytes', unit_scale=True,
+                                           disable=self.namespace.silent))
+                    job_queue = upload_jobs.enter_context(JobQueue(self.namespace.jobs))
+                    self._set_frag_cache_on_upload_callback(upload_reporter)
+                for item_index, globbed_item in enumerate(globbed_items):
+                    self.is_fs.flush()
+                    if os.sep == '\\':
+                        globbed_item = globbed_item.replace('\\', '/')
+                    if globbed_item.endswith('/'):
+                        globbed_item = globbed_item[0:-1]
+                    if os.path.isfile(globbed_item):
+                        if self._is_skippable(globbed_item, self.namespace.exclude):
+                            if not self.namespace.silent:
+                                print('skipping (' + str(item_index + 1) + ' of ' + str(
+                                    len(globbed_items)) + ') ' + globbed_item, file=sys.stderr)
+                            continue
+                        print_prefix = '(' + str(item_index + 1) + ' of ' + str(len(globbed_items)) + ') '
+                        if job_queue is None:
+                            self._upload_globbed_file(globbed_item, print_prefix)
+                        else:
+                            job_queue.submit(self._upload_globbed_file, globbed_item, print_prefix, upload_reporter)
+                    elif os.path.isdir(globbed_item) and not self.namespace.recursive:
+                        if self._is_skippable(globbed_item, self.namespace.exclude):
+                            if not self.namespace.silent:
+                                print('skipping Directory', globbed_item, file=sys.stderr)
+                            continue
+                        dest_dir_name = os.path.basename(os.path.abspath(globbed_item))
+                        if self.namespace.prefix:
+                            dest_dir_name = self.namespace.prefix + '/' + dest_dir_name
+
+                        if self.is_fs.exists(dest_dir_name):
+                            if not self.namespace.silent:
+                                print(globbed_item, "already indexed", file=sys.stderr)
+                            continue
+                        else:
+                            self.is_fs.makedirs(dest_dir_name)
+                            if not self.namespace.silent:
+                                print("indexed Directory", globbed_item, file=sys.stderr)
+                    elif os.path.isdir(globbed_item) and self.namespace.recursive:
+                        if self._is_skippable(globbed_item, self.namespace.exclude):
+                            if not self.namespace.silent:
+                                print('skipping (' + str(item_index + 1) + ' of ' + str(
+                                    len(globbed_items)) + ') ' + globbed_item, file=sys.stderr)
+                            continue
+                        dest_dir_name = os.path.basename(os.path.abspath(globbed_item))
+                        if self.namespace.prefix:
+                            dest_dir_name = self.namespace.prefix + '/' + dest_dir_name
+                        # open source directory
+                        # open/mount the corresponding IS-FS directory
+                        self.is_fs.makedirs(dest_dir_name, recreate=True)
+                        with OSFS(globbed_item) as src_fs, self.is_fs.opendir(dest_dir_name) as dst_fs:
+                            # input('BREAKPOINT, enter enter to continue')
+                            # local_dirs = set(src_fs.walk.dirs())
+                            local_dirs = list(src_fs.walk.dirs())
+                            # local_dirs = sorted(local_dirs, key=lambda i: i.count('/'))
+                            for local_dir_index, local_dir in enumerate(local_dirs):
+                                globbed_dest_dir_name = globbed_item + '/' + local_dir[1:]
+                                if self._is_skippable(globbed_dest_dir_name, self.namespace.exclude):
+                                    if not self.namespace.silent:
+                                        print('(' + str(item_index + 1) + ' of ' + str(
+                                            len(globbed_items)) + ', ' + str(local_dir_index + 1) + ' of ' + str(
+                                            len(local_dirs)) + ') skipping "' + globbed_dest_dir_name + '"', file=sys.stderr
+                                              )
+                                    continue
+                                if dst_fs.exists(local_dir):
+                                    if not self.namespace.silent:
+                                        print('(' + str(item_index + 1) + ' of ' + str(
+                                            len(globbed_items)) + ', ' + str(local_dir_index + 1) + ' of ' + str(
+                                            len(local_dirs)) + ') already indexed "' + globbed_dest_dir_name + '"',
+                                              file=sys.stderr)
                                 else:
-                                    dest_file_name = dest_file_name
-                                self._upload_file(dest_file_name, globbed_item, src_file_name, src_fs, src_file,
-                                                  self.is_fs, '(' + str(item_index + 1) + ' of ' + str(
-                                        len(globbed_items)) + ') ')
-                    except PermissionError as e:
-                        print("Unable to open file,", str(e), file=sys.stderr)
-                elif os.path.isdir(globbed_item) and not self.namespace.recursive:
-                    if self._is_skippable(globbed_item, self.namespace.exclude):
-                        if not self.namespace.silent:
-                            print('skipping Directory', globbed_item, file=sys.stderr)
-                        continue
-                    dest_dir_name = os.path.basename(os.path.abspath(globbed_item))
-                    if self.namespace.prefix:
-                        dest_dir_name = self.namespace.prefix + '/' + dest_dir_name
+                                    if not self.namespace.silent:
+                                        print('(' + str(item_index + 1) + ' of ' + str(
+                                            len(globbed_items)) + ', ' + str(local_dir_index + 1) + ' of ' + str(
+                                            len(local_dirs)) + ') indexing "' + globbed_dest_dir_name + '"', file=sys.stderr
+                                              )
+                                    dst_fs.makedirs(local_dir, recreate=True)
+                            # local_files = set(src_fs.walk.files())
+                            local_files = list(src_fs.walk.files())
+                            for local_file_index, local_file in enumerate(local_files):
+                                globbed_dest_file_name = globbed_item + '/' + local_file[1:]
+                                print_prefix = '(' + str(item_index + 1) + ' of ' + str(
+                                    len(globbed_items)) + ', ' + str(local_file_index + 1) + ' of ' + str(
+                                    len(local_files)) + ') '
+                                if self._is_skippable(globbed_dest_file_name, self.namespace.exclude):
+                                    if not self.namespace.silent:
+                                        self._print_upload_message(
+                                            print_prefix + 'skipping "' + globbed_dest_file_name + '"', upload_reporter)
+                                    continue
+                                if job_queue is None:
+                                    self._upload_local_file(local_file, globbed_dest_file_name, src_fs, dst_fs,
+                                                            print_prefix)
+                                else:
+                                    job_queue.submit(self._upload_local_file, local_file, globbed_dest_file_name,
+                                                     src_fs, dst_fs, print_prefix, upload_reporter)
+                            if job_queue is not None:
+                                # the source directory gets closed and synced, after all of its files got uploaded
+                                job_queue.join()
 
-                    if self.is_fs.exists(dest_dir_name):
-                        if not self.namespace.silent:
-                            print(globbed_item, "already indexed", file=sys.stderr)
-                        continue
-                    else:
-                        self.is_fs.makedirs(dest_dir_name)
-                        if not self.namespace.silent:
-                            print("indexed Directory", globbed_item, file=sys.stderr)
-                elif os.path.isdir(globbed_item) and self.namespace.recursive:
-                    if self._is_skippable(globbed_item, self.namespace.exclude):
-                        if not self.namespace.silent:
-                            print('skipping (' + str(item_index + 1) + ' of ' + str(
-                                len(globbed_items)) + ') ' + globbed_item, file=sys.stderr)
-                        continue
-                    dest_dir_name = os.path.basename(os.path.abspath(globbed_item))
-                    if self.namespace.prefix:
-                        dest_dir_name = self.namespace.prefix + '/' + dest_dir_name
-                    # open source directory
-                    # open/mount the corresponding IS-FS directory
-                    self.is_fs.makedirs(dest_dir_name, recreate=True)
-                    with OSFS(globbed_item) as src_fs, self.is_fs.opendir(dest_dir_name) as dst_fs:
-                        # input('BREAKPOINT, enter enter to continue')
-                        # local_dirs = set(src_fs.walk.dirs())
-                        local_dirs = list(src_fs.walk.dirs())
-                        # local_dirs = sorted(local_dirs, key=lambda i: i.count('/'))
-                        for local_dir_index, local_dir in enumerate(local_dirs):
-                            globbed_dest_dir_name = globbed_item + '/' + local_dir[1:]
-                            if self._is_skippable(globbed_dest_dir_name, self.namespace.exclude):
-                                if not self.namespace.silent:
-                                    print('(' + str(item_index + 1) + ' of ' + str(
-                                        len(globbed_items)) + ', ' + str(local_dir_index + 1) + ' of ' + str(
-                                        len(local_dirs)) + ') skipping "' + globbed_dest_dir_name + '"', file=sys.stderr
-                                          )
-                                continue
-                            if dst_fs.exists(local_dir):
-                                if not self.namespace.silent:
-                                    print('(' + str(item_index + 1) + ' of ' + str(
-                                        len(globbed_items)) + ', ' + str(local_dir_index + 1) + ' of ' + str(
-                                        len(local_dirs)) + ') already indexed "' + globbed_dest_dir_name + '"',
-                                          file=sys.stderr)
-                            else:
+                            # print('chars local dirs', sum((len(i) for i in local_dirs)))
+                            # print('chars local files', sum((len(i) for i in local_files)))
+
+                            if self.namespace.sync:
+                                self.save_service.flush()
                                 if not self.namespace.silent:
-                                    print('(' + str(item_index + 1) + ' of ' + str(
-                                        len(globbed_items)) + ', ' + str(local_dir_index + 1) + ' of ' + str(
-                                        len(local_dirs)) + ') indexing "' + globbed_dest_dir_name + '"', file=sys.stderr
-                                          )
-                                dst_fs.makedirs(local_dir, recreate=True)
-                        # local_files = set(src_fs.walk.files())
-                        local_files = list(src_fs.walk.files())
-                        for local_file_index, local_file in enumerate(local_files):
-                            globbed_dest_file_name = globbed_item + '/' + local_file[1:]
-                            if self._is_skippable(globbed_dest_file_name, self.namespace.exclude):
+                                    print('syncing directories . . .')
+                                    print('. . . building file set . . .')
+                                remote_files = set(dst_fs.walk.files())
+                                # print('chars remote files', sum((len(i) for i in remote_files)))
+
+                                deletable_files = remote_files.difference(local_files)
+                                if len(deletable_files) > 0:
+                                    with TqdmUpTo(deletable_files, desc='removing Files',
+                                                  unit='File',
+                                                  unit_scale=True,
+                                                  disable=self.namespace.silent,
+                                                  total=len(deletable_files)) as progressreporter:
+                                        for deletable_file in progressreporter:
+                                            dst_fs.remove(deletable_file)
+                                            progressreporter.write('removed "' + deletable_file + '"')
                                 if not self.namespace.silent:
-                                    print('(' + str(item_index + 1) + ' of ' + str(
-                                        len(globbed_items)) + ', ' + str(local_file_index + 1) + ' of ' + str(
-                                        len(local_files)) + ') skipping "' + globbed_dest_file_name + '"',
-                                          file=sys.stderr)
-                                continue
-                            # print(globbed_item, local_file, fs.path.join(globbed_item, local_file))
-                            try:
-                                src_file = src_fs.open(local_file, 'rb')
-                            except (ResourceNotFound, FileExpected) as e:
-                                print('(' + str(item_index + 1) + ' of ' + str(
-                                    len(globbed_items)) + ', ' + str(local_file_index + 1) + ' of ' + str(
-                                    len(local_files)) + ') file vanished "' + globbed_dest_file_name + '";', repr(e),
-                                      file=sys.stderr)
-                                continue
-                            except PermissionDenied as e:
-                                print('(' + str(item_index + 1) + ' of ' + str(
-                                    len(globbed_items)) + ', ' + str(local_file_index + 1) + ' of ' + str(
-                                    len(local_files)) + ') permission denied "' + globbed_dest_file_name + '";',
-                                      repr(e), file=sys.stderr)
-                                continue
+                                    print('. . . building directory set . . .')
+                                remote_dirs = set(dst_fs.walk.dirs())
+                                # print('chars remote dirs', sum((len(i) for i in remote_dirs)))
+                                deletable_dirs = remote_dirs.difference(local_dirs)
+                                deletable_dirs = sorted(deletable_dirs, key=lambda k: k.count('/'), reverse=True)
+                                if len(deletable_dirs) > 0:
+                                    with TqdmUpTo(deletable_dirs, desc='removing Directories',
+                                                  unit='Dir',
+                                                  unit_scale=True,
+                                                  disable=self.namespace.silent,
+                                                  total=len(deletable_dirs)) as progressreporter:
+                                        for deletable_dir in progressreporter:
+                                            try:
+                                                dst_fs.removetree(deletable_dir)
+                                                progressreporter.write('removed "' + deletable_dir + '"')
+                                            except ResourceNotFound:
+                                                progressreporter.write('already removed "' + deletable_dir + '"')
 
-                            try:
-                                self._upload_file(local_file, globbed_dest_file_name, local_file, src_fs, src_file,
-                                                  dst_fs, '(' + str(item_index + 1) + ' of ' + str(
-                                        len(globbed_items)) + ', ' + str(local_file_index + 1) + ' of ' + str(
-                                        len(local_files)) + ') ')
-                            finally:
-                                src_file.close()
-
-                        # print('chars local dirs', sum((len(i) for i in local_dirs)))
-                        # print('chars local files', sum((len(i) for i in local_files)))
+            self._set_frag_cache_on_upload_printer()
 
-                        if self.namespace.sync:
-                            self.save_service.flush()
-                            if not self.namespace.silent:
-                                print('syncing directories . . .')
-                                print('. . . building file set . . .')
-                            remote_files = set(dst_fs.walk.files())
-                            # print('chars remote files', sum((len(i) for i in remote_files)))
-
-                            deletable_files = remote_files.difference(local_files)
-                            if len(deletable_files) > 0:
-                                with TqdmUpTo(deletable_files, desc='removing Files',
-                                              unit='File',
-                                              unit_scale=True,
-                                              disable=self.namespace.silent,
-                                              total=len(deletable_files)) as progressreporter:
-                                    for deletable_file in progressreporter:
-                                        dst_fs.remove(deletable_file)
-                                        progressreporter.write('removed "' + deletable_file + '"')
-                            if not self.namespace.silent:
-                                print('. . . building directory set . . .')
-                            remote_dirs = set(dst_fs.walk.dirs())
-                            # print('chars remote dirs', sum((len(i) for i in remote_dirs)))
-                            deletable_dirs = remote_dirs.difference(local_dirs)
-                            deletable_dirs = sorted(deletable_dirs, key=lambda k: k.count('/'), reverse=True)
-                            if len(deletable_dirs) > 0:
-                                with TqdmUpTo(deletable_dirs, desc='removing Directories',
-                                              unit='Dir',
-                                              unit_scale=True,
-                                              disable=self.namespace.silent,
-                                              total=len(deletable_dirs)) as progressreporter:
-                                    for deletable_dir in progressreporter:
-                                        try:
-                                            dst_fs.removetree(deletable_dir)
-                                            progressreporter.write('removed "' + deletable_dir + '"')
-                                        except ResourceNotFound:
-                                            progressreporter.write('already removed "' + deletable_dir + '"')
+    def _upload_globbed_file(self, globbed_item, print_prefix='', upload_reporter=None):
+        # type: (str, str, Optional[ConcurrentTqdmUpTo]) -> None
+        try:
+            # print(globbed_item, os.path.dirname(globbed_item))
+            # print(globbed_item, os.path.basename(globbed_item))
+            with OSFS(os.path.dirname(globbed_item)) as src_fs:
+                src_file_name = '/' + os.path.basename(globbed_item)
+                # src_fs.tree(max_levels=1)
+                with src_fs.open(src_file_name, 'rb') as src_file:
+                    dest_file_name = os.path.basename(os.path.abspath(globbed_item))
+                    if self.namespace.prefix:
+                        dest_file_name = self.namespace.prefix + '/' + dest_file_name
+                    self._upload_file(dest_file_name, globbed_item, src_file_name, src_fs, src_file,
+                                      self.is_fs, print_prefix, upload_reporter)
+        except PermissionError as e:
+            self._print_upload_message("Unable to open file, " + str(e), upload_reporter)
+
+    def _upload_local_file(self, local_file, globbed_dest_file_name, src_fs, dst_fs, print_prefix='',
+                           upload_reporter=None):
+        # type: (str, str, FS, FS, str, Optional[ConcurrentTqdmUpTo]) -> None
+        # print(globbed_item, local_file, fs.path.join(globbed_item, local_file))
+        try:
+            src_file = src_fs.open(local_file, 'rb')
+        except (ResourceNotFound, FileExpected) as e:
+            self._print_upload_message(
+                print_prefix + 'file vanished "' + globbed_dest_file_name + '"; ' + repr(e), upload_reporter)
+            return
+        except PermissionDenied as e:
+            self._print_upload_message(
+                print_prefix + 'permission denied "' + globbed_dest_file_name + '"; ' + repr(e), upload_reporter)
+            return
 
-            self._set_frag_cache_on_upload_printer()
+        try:
+            self._upload_file(local_file, globbed_dest_file_name, local_file, src_fs, src_file, dst_fs, print_prefix,
+                              upload_reporter)
+        finally:
+            src_file.close()
 
     def _upload_file(self, dest_file_name, globbed_src_file_name, src_file_name, src_fs, src_file, dst_fs,
-                     print_prefix=''):
-        # type: (str, str, str, FS, IO, FS, str) -> None
+                     print_prefix='', upload_reporter=None):
+        # type: (str, str, str, FS, IO, FS, str, Optional[ConcurrentTqdmUpTo]) -> None
+        """
+        uploads one file. If an upload_reporter is given, the file is uploaded as one of several concurrent uploads,
+        which report their progress together
+        """
         dest_file_exists = dst_fs.exists(dest_file_name)
         if dest_file_exists and not self.namespace.overwrite:
             if not self.namespace.silent:
-                print(print_prefix + 'already uploaded "' + globbed_src_file_name + '"', file=sys.stderr)
+                self._print_upload_message(print_prefix + 'already uploaded "' + globbed_src_file_name + '"',
+                                           upload_reporter)
             return
         elif dest_file_exists and self.namespace.overwrite and self.namespace.update:
             src_hash = src_fs.hash(src_file_name, 'sha256')
             dst_hash = dst_fs.hash(dest_file_name, 'sha256')
             if src_hash == dst_hash:
                 if not self.namespace.silent:
-                    print(print_prefix + 'already uploaded "' + globbed_src_file_name + '"', file=sys.stderr)
+                    self._print_upload_message(print_prefix + 'already uploaded "' + globbed_src_file_name + '"',
+                                               upload_reporter)
                 return
         elif dest_file_exists and self.namespace.overwrite and not self.namespace.update:
             pass
         else:
             pass
         if not self.namespace.silent:
-            print(print_prefix + 'uploading "' + globbed_src_file_name + '"', file=sys.stderr)
+            self._print_upload_message(print_prefix + 'uploading "' + globbed_src_file_name + '"', upload_reporter)
 
         total_size = get_size_of_stream(cast(BinaryIO, src_file))
+        if upload_reporter is not None:
+            upload_reporter.addTotal(total_size)
+            self._write_upload_file(dest_file_name, src_file, dst_fs, upload_reporter)
+            return
         with TqdmUpTo(unit='Bytes', total=total_size,
                       unit_scale=True,
                       disable=self.namespace.silent) as progressreporter:
-            dst_fs.makedirs(fs.path.dirname(dest_file_name), recreate=True)
             self._set_frag_cache_on_upload_callback(progressreporter)
-            with dst_fs.open(dest_file_name, 'wb') as dst_file:
-                for index, chunk in enumerate(
-                        iter(lambda: src_file.read(self.save_service.fragment_size) or None, None)):
-                    dst_file.write(chunk)
-                    progressreporter.update(len(chunk))
+            self._write_upload_file(dest_file_name, src_file, dst_fs, progressreporter)
         self._set_frag_cache_on_upload_printer()
 
+    def _write_upload_file(self, dest_file_name, src_file, dst_fs, progressreporter):
+        # type: (str, IO, FS, TqdmUpTo) -> None
+        dst_fs.makedirs(fs.path.dirname(dest_file_name), recreate=True)
+        with dst_fs.open(dest_file_name, 'wb') as dst_file:
+            for index, chunk in enumerate(
+                    iter(lambda: src_file.read(self.save_service.fragment_size) or None, None)):
+                dst_file.write(chunk)
+                progressreporter.update(len(chunk))
+
+    @staticmethod
+    def _print_upload_message(message, upload_reporter=None):
+        # type: (str, Optional[ConcurrentTqdmUpTo]) -> None
+        if upload_reporter is None:
+            print(message, file=sys.stderr)
+        else:
+            # keeps the shared progress bar intact
+            upload_reporter.write(message, file=sys.stderr)
+
     def _download_file_to_target(self, src_fs, filepath, dst_fs):
         # type: (FS, str, FS) -> None
         filesize = src_fs.getsize(filepath)
@@ -974,6 +1207,10 @@ class ImageSaverApp(object):
         if self.namespace.target == '-' and len(self.namespace.item[0]) > 1:
             self.download_parser.error('cannot download and write multiple items to stdout')
             return
+        if self.namespace.prefetch < 0:
+            self.download_parser.error('prefetch must not be negative')
+            return
+        self.save_service.prefetch_resources = self.namespace.prefetch
 
         mix_items = self.namespace.item[0]  # type: List[str]
         # noinspection PyProtectedMember
@@ -1074,6 +1311,8 @@ class ImageSaverApp(object):
                     print('(' + str(fileindex + 1) + ' of ' + str(len(downloadable_files))
                           + ') downloading "' + filename + '"', file=sys.stderr)
                     self._download_file_to_target(self.is_fs, filename, dst_fs)
+        if self.namespace.debug:
+            print(self.save_service.fragment_cache.resource_payload_cache, file=sys.stderr)
 
     # noinspection DuplicatedCode
     def runList(self):
@@ -1180,20 +1419,23 @@ class ImageSaverApp(object):
 
     def runStatistic(self):
         with self.save_service:
+            if self.namespace.recompute:
+                self.save_service.recomputeStatistics()
+            statistics = self.save_service.getStatistics()
             print("saved Compounds                                ",
-                  self.save_service.getTotalCompoundCount())
+                  statistics.getTotalCompoundCount())
             print("saved Snapshots                                ",
-                  self.save_service.getSnapshotCount())
+                  statistics.getSnapshotCount())
             print("saved Compounds (Files)                        ",
-                  self.save_service.getTotalCompoundCount(with_type=Compound.FILE_TYPE))
+                  statistics.getTotalCompoundCount(with_type=Compound.FILE_TYPE))
             print("saved Compounds (Directories)                  ",
-                  self.save_service.getTotalCompoundCount(with_type=Compound.DIR_TYPE))
+                  statistics.getTotalCompoundCount(with_type=Compound.DIR_TYPE))
             print("saved unique Compounds                         ",
-                  self.save_service.getUniqueCompoundCount())
+                  statistics.getUniqueCompoundCount())
             print("saved Fragments                                ",
-                  self.save_service.getTotalFragmentCount())
+                  statistics.getTotalFragmentCount())
             print("saved Resources on target (referenced)         ",
-                  self.save_service.getTotalResourceCount())
+                  statistics.getTotalResourceCount())
             if self.namespace.offline:
                 total_resource_count = 0
             else:
@@ -1201,38 +1443,38 @@ class ImageSaverApp(object):
             print("saved Resources on target (total)              ", total_resource_count)
 
             print("multiple used fragments                        ",
-                  self.save_service.getMultipleUsedFragmentsCount())
-            size_bytes = self.save_service.getSavedBytesByMultipleUsedFragments()
+                  statistics.getDuplicateFragmentsCount())
+            size_bytes = statistics.getSavedBytesByDuplicateFragments()
             size_pretty = fromBytes(size_bytes)
             print("saved space by multiple used fragments (Bytes) ", size_bytes)
             print("saved space by multiple used fragments (pretty)", size_pretty)
 
             print("multiple used compounds (Files)                ",
-                  self.save_service.getMultipleUsedCompoundsCount(Compound.FILE_TYPE))
-            size_bytes = self.save_service.getSavedBytesByMultipleUsedCompounds()
+                  statistics.getMultipleUsedCompoundsCount(Compound.FILE_TYPE))
+            size_bytes = statistics.getSavedBytesByMultipleUsedCompounds()
             size_pretty = fromBytes(size_bytes)
             print("saved space by multiple used compounds (Bytes) ", size_bytes)
             print("saved space by multiple used compounds (pretty)", size_pretty)
 
-            size_bytes = self.save_service.getTotalResourceSize()
+            size_bytes = statistics.getTotalResourceSize()
             size_pretty = fromBytes(size_bytes)
             print("total Resource Size on target (Bytes)          ", size_bytes)
             print("total Resource Size on target (pretty)         ", size_pretty)
-            size_bytes = self.save_service.getTotalFragmentSize()
+            size_bytes = statistics.getTotalFragmentSize()
             size_pretty = fromBytes(size_bytes)
             print("total Fragment Size (Bytes)                    ", size_bytes)
             print("total Fragment Size (pretty)                   ", size_pretty)
-            size_bytes = self.save_service.getUniqueCompoundSize()
+            size_bytes = statistics.getUniqueCompoundSize()
             size_pretty = fromBytes(size_bytes)
             print("unique Compounds Size (Bytes)                  ", size_bytes)
             print("unique Compounds Size (pretty)                 ", size_pretty)
-            size_bytes = self.save_service.getTotalCompoundSize()
+            size_bytes = statistics.getTotalCompoundSize()
             size_pretty = fromBytes(size_bytes)
             print("total Compounds Size (Bytes)                   ", size_bytes)
             print("total Compounds Size (pretty)                  ", size_pretty)
             print("unneeded Fragments                             ",
-                  self.save_service.getUnneededFragmentCount())
-            size_bytes = self.save_service.getUnneededFragmentSize()
+                  statistics.getUnneededFragmentCount())
+            size_bytes = statistics.getUnneededFragmentSize()
             size_pretty = fromBytes(size_bytes)
             print("unneeded Fragments Size (Bytes)                ", size_bytes)
             print("unneeded Fragments Size (pretty)               ", size_pretty)
@@ -1533,6 +1775,27 @@ path = {2}""".format(storage_dir, resource_size, meta_file)
                         progressreporter.write('creating snapshot of ' + match.path)
                         self.is_fs.snapshot(match.path)
 
+    def runExport(self):
+        if self.namespace.to_storage:
+            with self.save_service:
+                locator = self.save_service.backupMeta()
+            print("backed up Meta-DB, restore it with: import --storage", locator)
+        elif self.namespace.file == '-':
+            self.meta.exportMeta(sys.stdout.buffer)
+        else:
+            with open(self.namespace.file, 'wb') as f:
+                self.meta.exportMeta(f)
+
+    def runImport(self):
+        resume = not self.namespace.no_resume
+        if self.namespace.from_storage:
+            self.save_service.restoreMeta(self.namespace.file, resume=resume)
+        elif self.namespace.file == '-':
+            self.meta.importMeta(sys.stdin.buffer, resume=resume)
+        else:
+            with open(self.namespace.file, 'rb') as f:
+                self.meta.importMeta(f, resume=resume)
+
     def _count_iter_items(self, iterable):
         # type: (Iterable) -> int
         """
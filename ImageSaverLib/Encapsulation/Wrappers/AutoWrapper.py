@@ -53,6 +53,21 @@ class AutoWrapper(object):
             assert len(wrappers) > 0
             return StackedWrapper(*wrappers)
 
+    def getKeyedWrappingType(self, wrap_type):
+        # type: (WrappingType) -> WrappingType
+        """
+        returns the wrapping type with the key fingerprints of keyed wrappers appended, e.g. 'aes256#1a2b...'.
+        Unlike the wrapping type, it changes if a key is replaced.
+        """
+        fingerprints = []
+        for wt in wrap_type.lower().split('-'):
+            if wt not in self.wrapper_mappings:
+                raise UnsupportedWrapperType("not supported wrapper " + repr(wt))
+            fingerprint = self.wrapper_mappings[wt].get_key_fingerprint()
+            if fingerprint is not None:
+                fingerprints.append('#' + fingerprint)
+        return WrappingType(wrap_type + ''.join(fingerprints))
+
     def wrap(self, data, wrap_type):
         # type: (bytes, WrappingType) -> bytes
         wrapper = self.getStackedWrapper(wrap_type)
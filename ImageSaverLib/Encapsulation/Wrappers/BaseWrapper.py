@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 
 from . import WrappingType
 
@@ -27,6 +28,15 @@ class BaseWrapper(ABC):
     def set_wrapper_type(cls, value):
         cls._wrapper_type = value
 
+    @classmethod
+    def get_key_fingerprint(cls):
+        # type: () -> Optional[str]
+        """
+        wrappers with a secret key return a short fingerprint of it, data wrapped with different keys differs even
+        though the wrapper type is the same. Wrappers without a key return None
+        """
+        return None
+
     @classmethod
     @abstractmethod
     def wrap(cls, data):
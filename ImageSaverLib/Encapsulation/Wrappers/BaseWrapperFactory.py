@@ -24,6 +24,9 @@ class BaseWrapperFactory(BaseWrapper):
         # noinspection PyArgumentList
         return self.bound_wrapper(*self.args, **self.kwargs)
 
+    def get_key_fingerprint(self):
+        return self.buildWrapper().get_key_fingerprint()
+
     def resetContext(self):
         self.current_wrapper = None  # type: Optional[BaseWrapper]
 
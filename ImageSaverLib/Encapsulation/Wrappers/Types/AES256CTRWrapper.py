@@ -16,6 +16,10 @@ class AES256CTRWrapper(BaseWrapper):
         self._key = key
         self._nonce = hashlib.md5(self._key).digest()
 
+    def get_key_fingerprint(self):
+        # type: () -> str
+        return hashlib.sha256(b'ImageSaverKeyFingerprint' + self._key).hexdigest()[:16]
+
     def _getCipher(self):
         # type: () -> Cipher
         algorithm = algorithms.AES(self._key)
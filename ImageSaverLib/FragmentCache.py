@@ -1,8 +1,12 @@
+import asyncio
 import hashlib
 import sys
+import time
 from collections import OrderedDict
-from threading import RLock
-from typing import List, Tuple, Dict, Optional, Iterable, Union, Set, Callable
+from concurrent.futures import ThreadPoolExecutor, Future
+from queue import Queue
+from threading import RLock, Lock, Condition, Thread
+from typing import List, Tuple, Dict, Optional, Iterable, Union, Set, Callable, Generator, AsyncGenerator
 
 import binpacking
 import humanfriendly
@@ -14,10 +18,13 @@ from ImageSaverLib.Errors import ResourceManipulatedException, FragmentMissingEx
 from ImageSaverLib.MetaDB.Errors import NotExistingException
 from ImageSaverLib.MetaDB.MetaDB import MetaDBInterface
 from ImageSaverLib.MetaDB.Types.Fragment import FragmentHash, Fragment, FragmentSize, FragmentPayloadSize
+from ImageSaverLib.MetaDB.Types.FragmentPlaintextMapping import PlaintextHash
 from ImageSaverLib.MetaDB.Types.FragmentResourceMapping import FragmentOffset
 from ImageSaverLib.MetaDB.Types.Resource import (ResourceWrappingType, ResourceCompressionType, ResourceSize,
-                                                 ResourceHash, Resource, ResourcePayloadSize)
+                                                 ResourceHash, Resource, ResourcePayloadSize, ResourceID)
 from ImageSaverLib.PendingObjectsController import PendingObjectsController
+from ImageSaverLib.ResourcePayloadCache import ResourcePayloadCache
+from ImageSaverLib.Storage.AsyncStorageInterface import AsyncStorageInterface
 from ImageSaverLib.Storage.StorageInterface import StorageInterface
 
 
@@ -49,8 +56,9 @@ class FragmentCache(object):
 
     def __init__(self, meta, storage, expected_fragmentsize, resource_wrap_type, resource_compress_type, resource_size,
                  pending_objects_controller, auto_wrapper, auto_compresser, resource_minimum_filllevel=0.9,
-                 auto_delete_resource=False, debug=False):
-        # type: (MetaDBInterface, StorageInterface, int, Union[ResourceWrappingType, WrappingType], Union[ResourceCompressionType, CompressionType], ResourceSize, PendingObjectsController, AutoWrapper, AutoCompressor, float, bool, bool) -> None
+                 auto_delete_resource=False, debug=False, upload_workers=0, upload_queue_size=None,
+                 resource_payload_cache_size=None, meta_batch_count=1, meta_batch_size=None, meta_batch_delay=None):
+        # type: (MetaDBInterface, StorageInterface, int, Union[ResourceWrappingType, WrappingType], Union[ResourceCompressionType, CompressionType], ResourceSize, PendingObjectsController, AutoWrapper, AutoCompressor, float, bool, bool, int, Optional[int], Optional[int], int, Optional[int], Optional[float]) -> None
         """
         Upload cache for fragments, caches given fragments. Packs as much fragments together to one resource.
         Optionally appends fragments to small resources.
@@ -65,11 +73,26 @@ class FragmentCache(object):
         encapsulation is applied
         :param resource_minimum_filllevel: how much space of a resource should be at least used, before it is considered
         a 'upload worthy' resource
+        :param upload_workers: number of background threads, which encapsulate, hash and upload packed resources.
+        0 uploads synchronously while holding the cache lock
+        :param upload_queue_size: maximum number of packed resources waiting for an upload worker, defaults to the
+        number of upload workers. Flushing blocks if the queue is full
+        :param resource_payload_cache_size: maximum summed up size of downloaded resource payloads, which are kept for
+        further fragment reads, defaults to two resources. 0 disables the cache
+        :param meta_batch_count: finished compounds are committed to the meta together, as soon as this many compounds
+        are finished. Until then they stay in the pending objects controller, like compounds waiting for fragments
+        :param meta_batch_size: also commit the finished compounds, once their summed up size reaches this many bytes
+        :param meta_batch_delay: also commit the finished compounds, once the first of them waits this many seconds.
+        Checked whenever the meta gets flushed, e.g. after each written compound
         """
         if not expected_fragmentsize <= resource_size:
             raise ValueError('expected_fragmentsize should not be larger than resource_size')
         if not 0 < resource_minimum_filllevel <= 1.0:
             raise ValueError('invalid resource_minimum_filllevel percentage, must be float between 0.0 and 1.0')
+        if upload_workers < 0:
+            raise ValueError('upload_workers must not be negative')
+        if meta_batch_count < 1:
+            raise ValueError('meta_batch_count must be at least 1')
         self.resource_size = resource_size
         self.policy = self.POLICY_PASS
         self.auto_delete_resource = auto_delete_resource
@@ -86,16 +109,40 @@ class FragmentCache(object):
         self.fragment_cache = OrderedDict()  # type: OrderedDict[FragmentHash, Tuple[bytes, Fragment]]
         self.cache_total_fragmentsize = 0
         self._in_context = 0
-        self.cache_last_downloaded_resource = True
-        self.last_downloaded_resource_hash = None  # type: Optional[ResourceHash]
-        self.last_downloaded_resource_fragments = {}  # type: Dict[FragmentHash, bytes]
+        if resource_payload_cache_size is None:
+            resource_payload_cache_size = 2 * resource_size
+        self.resource_payload_cache = ResourcePayloadCache(resource_payload_cache_size)
         self.debug = debug
         self.resource_reuse_blacklist = set()  # type: Set[ResourceHash]
         self._mutex = RLock()
         self._on_upload = None  # type: Optional[Callable[[ResourceSize, int], None]]
         self._on_download = None  # type: Optional[Callable[[Resource], None]]
+        self._download_callback_lock = Lock()
+        self._upload_callback_lock = Lock()
         self.upload_on_exception = False
         self.resource_packer = ResourcePacker()
+        # plaintext hashes of cached fragments, written to the meta after their fragments got committed
+        self._plaintext_keys = {}  # type: Dict[FragmentHash, Tuple[PlaintextHash, CompressionType, WrappingType]]
+
+        # region meta batching
+        self.meta_batch_count = meta_batch_count
+        self.meta_batch_size = meta_batch_size
+        self.meta_batch_delay = meta_batch_delay
+        self._meta_batch_lock = Lock()
+        self._meta_batch_started = None  # type: Optional[float]
+        # endregion
+
+        # region background upload pipeline
+        self.upload_workers = upload_workers
+        self._upload_queue = Queue(maxsize=upload_queue_size or max(upload_workers, 1))  # type: Queue
+        self._upload_threads = []  # type: List[Thread]
+        self._upload_condition = Condition(Lock())
+        self._commit_lock = Lock()
+        self._in_flight = {}  # type: Dict[FragmentHash, Tuple[bytes, Fragment]]
+        self._pending_uploads = 0
+        self._upload_errors = []  # type: List[Exception]
+        self._failed_packets = []  # type: List[List[Tuple[bytes, Fragment]]]
+        # endregion
 
     def __enter__(self):
         with self._mutex:
@@ -112,10 +159,28 @@ class FragmentCache(object):
                         self._flush(totalflush=True)
                     except Exception:
                         pass
+                else:
+                    # noinspection PyBroadException
+                    try:
+                        self._wait_for_uploads()
+                    except Exception:
+                        pass
+                # finished compounds are complete, commit them like they would have been without batching
+                # noinspection PyBroadException
+                try:
+                    self._flush_meta(force=True)
+                except Exception:
+                    pass
+                if self._in_context == 0:
+                    self._stop_upload_workers()
                 return False
             else:
                 if self._in_context == 0:
-                    self._flush(totalflush=True)
+                    try:
+                        self._flush(totalflush=True)
+                        self._flush_meta(force=True)
+                    finally:
+                        self._stop_upload_workers()
             return self
 
     @property
@@ -147,21 +212,31 @@ class FragmentCache(object):
             if fragment_hash in self.fragment_cache:
                 _, fragment = self.fragment_cache.pop(fragment_hash)
                 self.cache_total_fragmentsize -= fragment.fragment_size
+                with self._upload_condition:
+                    self._plaintext_keys.pop(fragment_hash, None)
 
-    def addFragmentData(self, fragment_data, fragment_hash, fragment_payload_size):
-        # type: (bytes, FragmentHash, FragmentPayloadSize) -> Fragment
+    def addFragmentData(self, fragment_data, fragment_hash, fragment_payload_size, plaintext_key=None):
+        # type: (bytes, FragmentHash, FragmentPayloadSize, Optional[Tuple[PlaintextHash, CompressionType, WrappingType]]) -> Fragment
+        """
+        :param plaintext_key: plaintext hash, compression and wrapping type the fragment_data was created with.
+        gets added to the meta together with the fragment
+        """
         with self._mutex:
             fragment_size = FragmentSize(len(fragment_data))
             if fragment_hash in self.fragment_cache:
+                self._remember_plaintext_key(fragment_hash, plaintext_key)
                 return self.fragment_cache[fragment_hash][1]
             else:
                 fragment = Fragment(fragment_hash, fragment_size, fragment_payload_size)
-                self.addFragment(fragment_data, fragment)
+                self.addFragment(fragment_data, fragment, plaintext_key=plaintext_key)
                 return fragment
 
-    def addFragment(self, fragment_data, fragment, readd=False):
-        # type: (bytes, Fragment, bool) -> None
+    def addFragment(self, fragment_data, fragment, readd=False, plaintext_key=None):
+        # type: (bytes, Fragment, bool, Optional[Tuple[PlaintextHash, CompressionType, WrappingType]]) -> None
         with self._mutex:
+            self._remember_plaintext_key(fragment.fragment_hash, plaintext_key)
+            # check in-flight fragments before the meta, upload workers commit to the meta before releasing them
+            fragment_in_flight = self._get_in_flight(fragment.fragment_hash) is not None
             meta_has_fragment = self.meta.hasFragmentByPayloadHash(fragment.fragment_hash)
             if not fragment.fragment_size == len(fragment_data):
                 raise ValueError("size of given fragment_data and fragment.fragment_size differ")
@@ -172,7 +247,10 @@ class FragmentCache(object):
                         fragment.fragment_size))
             if fragment.fragment_hash in self.fragment_cache:  # fragment already in cache, gets uploaded to storage with next flush
                 return
+            elif not readd and fragment_in_flight:  # fragment gets uploaded by an upload worker
+                return
             elif not readd and meta_has_fragment:  # fragment already uploaded to storage, mapping to resource exists
+                self._commit_plaintext_keys([fragment.fragment_hash])
                 return
             if self.cache_total_fragmentsize >= self.resource_size:
                 old_cache_total_fragmentsize = self.cache_total_fragmentsize
@@ -184,69 +262,252 @@ class FragmentCache(object):
 
     def loadFragment(self, fragment):
         # type: (Fragment) -> bytes
+        return bytes(self.loadFragmentView(fragment))
+
+    def loadFragmentView(self, fragment):
+        # type: (Fragment) -> Union[bytes, memoryview]
+        """
+        like loadFragment, but fragments of downloaded resources are returned as memoryview into the cached resource
+        payload instead of a copy.
+        """
         with self._mutex:
             try:
                 return self.fragment_cache[fragment.fragment_hash][0]
             except KeyError:
                 pass
-            if self.cache_last_downloaded_resource:
-                if fragment.fragment_hash in self.last_downloaded_resource_fragments:
-                    fragment_payload = self.last_downloaded_resource_fragments[fragment.fragment_hash]
+            in_flight = self._get_in_flight(fragment.fragment_hash)
+            if in_flight is not None:
+                return in_flight[0]
+        try:
+            if fragment.fragment_id is None:
+                fragment_id = self.meta.getFragmentByPayloadHash(fragment.fragment_hash).fragment_id
+            else:
+                fragment_id = fragment.fragment_id
+            resource, fragment_offset = self.meta.getResourceOffsetForFragment(fragment_id)
+        except NotExistingException:
+            raise FragmentMissingException(
+                "No fragment offsets found for Fragment with id " + repr(fragment.fragment_id))
+        resource_payload = self._load_cached_resource(resource)
+        return memoryview(resource_payload)[fragment_offset:fragment_offset + fragment.fragment_size]
+
+    def loadFragments(self, fragments, prefetch=0):
+        # type: (Iterable[Fragment], int) -> Generator[Union[bytes, memoryview], None, None]
+        """
+        yields the data of the given fragments in the given order, see loadFragmentView.
+        looks up the resource of every fragment separately, use loadMappedFragments if the resources are already known.
+
+        :param prefetch: see loadMappedFragments
+        """
+        if prefetch <= 0:
+            for fragment in fragments:
+                yield self.loadFragmentView(fragment)
+            return
+        yield from self.loadMappedFragments(((f, ) + self._resolve_resource(f) for f in fragments), prefetch)
+
+    def loadMappedFragments(self, fragment_locations, prefetch=0):
+        # type: (Iterable[Tuple[Fragment, Optional[Resource], Optional[FragmentOffset]]], int) -> Generator[Union[bytes, memoryview], None, None]
+        """
+        yields the data of the given fragments in the given order, see loadFragmentView. Each fragment comes with its
+        resource and offset on that resource, fragments without a resource are loaded with loadFragmentView.
+        Consecutive fragments on the same resource only download the resource once.
+
+        :param prefetch: number of threads, which download the resources of the following fragments while the current
+        ones are consumed. Besides the currently read resource at most this many resources are held in memory.
+        0 downloads each resource when it is reached
+        """
+        runs = self._plan_resource_runs(fragment_locations)
+        executor = None
+        if prefetch > 0:
+            executor = ThreadPoolExecutor(prefetch, thread_name_prefix='FragmentCachePrefetch')
+        # resource id -> download future and the number of planned runs within the window, which read from it
+        window = {}  # type: Dict[ResourceID, List[Union[Future, int]]]
+        submitted = 0
+        try:
+            for run_index, (resource, fragments_offsets) in enumerate(runs):
+                while executor and submitted < len(runs) and submitted <= run_index + prefetch:
+                    next_resource = runs[submitted][0]
+                    if next_resource is not None:
+                        if next_resource.resource_id in window:
+                            window[next_resource.resource_id][1] += 1
+                        else:
+                            window[next_resource.resource_id] = [
+                                executor.submit(self._load_cached_resource, next_resource), 1]
+                    submitted += 1
+                if resource is None:
+                    for fragment, _ in fragments_offsets:
+                        yield self.loadFragmentView(fragment)
+                    continue
+                if executor:
+                    entry = window[resource.resource_id]
+                    resource_payload = entry[0].result()
+                    entry[1] -= 1
+                    if entry[1] == 0:
+                        del window[resource.resource_id]
                 else:
-                    try:
-                        if fragment.fragment_id is None:
-                            fragment_id = self.meta.getFragmentByPayloadHash(fragment.fragment_hash).fragment_id
+                    resource_payload = self._load_cached_resource(resource)
+                payload_view = memoryview(resource_payload)
+                for fragment, offset in fragments_offsets:
+                    yield payload_view[offset:offset + fragment.fragment_size]
+                del resource_payload, payload_view
+        finally:
+            if executor:
+                for future, _ in window.values():
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+    async def loadMappedFragmentsAsync(self, fragment_locations, async_storage, in_flight=64):
+        # type: (Iterable[Tuple[Fragment, Optional[Resource], Optional[FragmentOffset]]], AsyncStorageInterface, int) -> AsyncGenerator[Union[bytes, memoryview], None]
+        """
+        asyncio version of loadMappedFragments, the resources are downloaded through the given async storage.
+
+        :param in_flight: number of resources, which are downloaded at the same time on the event loop. Besides the
+                          currently read resource at most this many resources are held in memory.
+
+        Decapsulating resources and reading fragments, which are not mapped to a resource yet, runs in the default
+        executor of the loop, so it does not stall the other downloads.
+        """
+        loop = asyncio.get_running_loop()
+        runs = self._plan_resource_runs(fragment_locations)
+        # resource id -> download task and the number of planned runs within the window, which read from it
+        window = {}  # type: Dict[ResourceID, List[Union[asyncio.Task, int]]]
+        submitted = 0
+        try:
+            for run_index, (resource, fragments_offsets) in enumerate(runs):
+                while submitted < len(runs) and submitted <= run_index + in_flight:
+                    next_resource = runs[submitted][0]
+                    if next_resource is not None:
+                        if next_resource.resource_id in window:
+                            window[next_resource.resource_id][1] += 1
                         else:
-                            fragment_id = fragment.fragment_id
-                        resource, fragment_offset = self.meta.getResourceOffsetForFragment(fragment_id)
-                    except NotExistingException:
-                        raise FragmentMissingException(
-                            "No fragment offsets found for Fragment with id " + repr(fragment.fragment_id))
-                    self.last_downloaded_resource_fragments.clear()
-                    resource_payload = self.loadResource(resource)
-                    self.last_downloaded_resource_hash = resource.resource_hash
-                    fragments_offsets = self.meta.getFragmentsWithOffsetOnResource(resource.resource_id)
-                    for _fragment, offset in fragments_offsets:
-                        fragment_payload = resource_payload[offset:offset + _fragment.fragment_size]
-                        self.last_downloaded_resource_fragments[_fragment.fragment_hash] = fragment_payload
-                    fragment_payload = self.last_downloaded_resource_fragments[fragment.fragment_hash]
+                            window[next_resource.resource_id] = [
+                                asyncio.ensure_future(self._load_cached_resource_async(next_resource, async_storage)),
+                                1]
+                    submitted += 1
+                if resource is None:
+                    for fragment, _ in fragments_offsets:
+                        yield await loop.run_in_executor(None, self.loadFragmentView, fragment)
+                    continue
+                entry = window[resource.resource_id]
+                resource_payload = await entry[0]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del window[resource.resource_id]
+                payload_view = memoryview(resource_payload)
+                for fragment, offset in fragments_offsets:
+                    yield payload_view[offset:offset + fragment.fragment_size]
+                del resource_payload, payload_view
+        finally:
+            for task, _ in window.values():
+                task.cancel()
+            # collect the cancelled downloads, so their exceptions are not reported as never retrieved
+            await asyncio.gather(*(task for task, _ in window.values()), return_exceptions=True)
+
+    async def _load_cached_resource_async(self, resource, async_storage):
+        # type: (Resource, AsyncStorageInterface) -> bytes
+        resource_payload = self.resource_payload_cache.get(resource.resource_hash)
+        if resource_payload is None:
+            loop = asyncio.get_running_loop()
+            if self._on_download:
+                # the callback lock is shared with download threads, waiting for it would block the loop
+                await loop.run_in_executor(None, self._report_download, resource)
+            resource_data = await async_storage.loadRessource(resource.resource_name)
+            # hashing, unwrapping and decompressing is CPU bound, the loop keeps serving the other downloads meanwhile
+            resource_payload = await loop.run_in_executor(None, self._decapsulate_resource, resource, resource_data)
+            self.resource_payload_cache.put(resource.resource_hash, resource_payload)
+        return resource_payload
+
+    def _report_download(self, resource):
+        # type: (Resource) -> None
+        with self._download_callback_lock:
+            self._on_download(resource)
+
+    def _resolve_resource(self, fragment):
+        # type: (Fragment) -> Tuple[Optional[Resource], Optional[FragmentOffset]]
+        """
+        returns the resource and offset of a fragment, or None, None if the fragment is still cached or not yet mapped
+        to a resource.
+        """
+        with self._mutex:
+            if fragment.fragment_hash in self.fragment_cache or self._get_in_flight(fragment.fragment_hash):
+                return None, None
+        try:
+            if fragment.fragment_id is None:
+                fragment_id = self.meta.getFragmentByPayloadHash(fragment.fragment_hash).fragment_id
             else:
-                try:
-                    if fragment.fragment_id is None:
-                        fragment_id = self.meta.getFragmentByPayloadHash(fragment.fragment_hash).fragment_id
-                    else:
-                        fragment_id = fragment.fragment_id
-                    resource, fragment_offset = self.meta.getResourceOffsetForFragment(fragment_id)
-                except NotExistingException:
-                    raise FragmentMissingException(
-                        "No fragment offsets found for Fragment with id " + repr(fragment.fragment_id))
-                resource_payload = self.loadResource(resource)
-                fragment_payload = resource_payload[fragment_offset:fragment_offset + fragment.fragment_size]
-            return fragment_payload
+                fragment_id = fragment.fragment_id
+            return self.meta.getResourceOffsetForFragment(fragment_id)
+        except NotExistingException:
+            return None, None
 
-    def flushMeta(self):
+    def _plan_resource_runs(self, fragment_locations):
+        # type: (Iterable[Tuple[Fragment, Optional[Resource], Optional[FragmentOffset]]]) -> List[Tuple[Optional[Resource], List[Tuple[Fragment, Optional[FragmentOffset]]]]]
+        """
+        groups consecutive fragments of the same resource into runs, fragments without a resource get their own run.
+        """
+        runs = []  # type: List[Tuple[Optional[Resource], List[Tuple[Fragment, Optional[FragmentOffset]]]]]
+        for fragment, resource, offset in fragment_locations:
+            if runs and resource is not None and runs[-1][0] is not None \
+                    and runs[-1][0].resource_id == resource.resource_id:
+                runs[-1][1].append((fragment, offset))
+            else:
+                runs.append((resource, [(fragment, offset)]))
+        return runs
+
+    def _load_cached_resource(self, resource):
+        # type: (Resource) -> bytes
+        """
+        returns the payload of a resource from the resource payload cache, downloads it on a cache miss.
+        """
+        resource_payload = self.resource_payload_cache.get(resource.resource_hash)
+        if resource_payload is None:
+            resource_payload = self._download_resource(resource)
+            self.resource_payload_cache.put(resource.resource_hash, resource_payload)
+        return resource_payload
+
+    def flushMeta(self, force=False):
         """
         writes flushable pending objects to meta
+        :param force: ignore the meta batch limits, commit all finished compounds
         :return:
         """
         with self._mutex:
-            self._flush_meta()
+            self._flush_meta(force)
 
-    def _flush_meta(self):
+    def _flush_meta(self, force=False):
+        with self._meta_batch_lock:
+            if not force and not self._meta_batch_full():
+                return
             # region add compounds to meta which are 'finished' based on PendingObjectsControlelr
             non_pending_fragment_sequences = self.pending_objects.popNonPendingFragmentSequences()
+            self._meta_batch_started = None
             if non_pending_fragment_sequences:
                 if self.debug:
                     print("persisting", len(non_pending_fragment_sequences), "compounds with a total of",
                           sum((len(fpi) for fpi in non_pending_fragment_sequences.values())),
                           "fragment mappings in meta")
-                for compound, fragment_payload_index in non_pending_fragment_sequences.items():
-                    if self.debug:
+                    for compound, fragment_payload_index in non_pending_fragment_sequences.items():
                         assert compound.compound_id is None
                         assert all((f.fragment_id is None for f, _ in fragment_payload_index))
-                    self.meta.addOverwriteCompoundAndMapFragments(compound, fragment_payload_index)
+                self.meta.addOverwriteCompoundsAndMapFragments(non_pending_fragment_sequences.items())
             # endregion
 
+    def _meta_batch_full(self):
+        # type: () -> bool
+        count = self.pending_objects.getNonPendingCompoundCount()
+        if count == 0:
+            return False
+        if count >= self.meta_batch_count:
+            return True
+        if self.meta_batch_size is not None \
+                and self.pending_objects.getNonPendingCompoundSize() >= self.meta_batch_size:
+            return True
+        if self.meta_batch_delay is not None:
+            now = time.monotonic()
+            if self._meta_batch_started is None:
+                self._meta_batch_started = now
+            return now - self._meta_batch_started >= self.meta_batch_delay
+        return False
+
     def flush(self, force=False):
         """
         tries to empty the built up block cache.
@@ -260,7 +521,7 @@ class FragmentCache(object):
                 self._flush(totalflush=True)
             elif self.cache_total_fragmentsize >= self.resource_size or force:
                 self._flush(totalflush=False)
-            self.flushMeta()
+            self.flushMeta(force)
 
     def _flush(self, totalflush=False):
         with self._mutex:
@@ -295,10 +556,32 @@ class FragmentCache(object):
                     self._flush_resource_appending(empty=True)
                 elif self.policy == self.POLICY_FILL_ALWAYS:
                     self._flush_resource_appending(empty=True)
+                self._wait_for_uploads()
                 if self.debug:
                     assert len(self.fragment_cache) == 0, repr(len(self.fragment_cache)) + ' ' + repr(
                         {h: f for h, (_, f) in self.fragment_cache.items()})
-            self._flush_meta()
+            self._flush_meta(force=totalflush)
+
+    def _encapsulate_resource(self, fragments_data, fragments_count=None):
+        # type: (Union[Iterable[bytes], bytes], Optional[int]) -> Tuple[bytes, ResourceHash, ResourceSize, ResourcePayloadSize, int]
+        """
+        Joins and encapsulates the given blocks to the data of one resource, does not need the cache lock
+        """
+        if type(fragments_data) in (bytes, bytearray):
+            resource_data = fragments_data
+            if fragments_count is None:
+                fragments_count = 1
+        else:
+            fragments_data = list(fragments_data)
+            resource_data = bytes().join((d for d in fragments_data))
+            fragments_count = len(fragments_data)
+        resource_payloadsize = ResourcePayloadSize(len(resource_data))
+        resource_data = encapsulate(self.auto_compresser, self.auto_wrapper, self.resource_compress_type,
+                                    self.resource_wrap_type,
+                                    resource_data)
+        resource_hash = ResourceHash(hashlib.sha256(resource_data).digest())
+        resource_size = ResourceSize(len(resource_data))
+        return resource_data, resource_hash, resource_size, resource_payloadsize, fragments_count
 
     def _upload(self, fragments_data, update=None, fragments_count=None):
         # type: (Union[Iterable[bytes], bytes], Optional[Resource], Optional[int]) -> Resource
@@ -309,26 +592,15 @@ class FragmentCache(object):
             # encapsulate resource
             # upload resource
             # add blocks+resource to cache_meta after successful upload
-            if type(fragments_data) in (bytes, bytearray):
-                resource_data = fragments_data
-                if fragments_count is None:
-                    fragments_count = 1
-            else:
-                fragments_data = list(fragments_data)
-                resource_data = bytes().join((d for d in fragments_data))
-                fragments_count = len(fragments_data)
-            resource_payloadsize = ResourcePayloadSize(len(resource_data))
-            resource_data = encapsulate(self.auto_compresser, self.auto_wrapper, self.resource_compress_type,
-                                        self.resource_wrap_type,
-                                        resource_data)
-            resource_hash = ResourceHash(hashlib.sha256(resource_data).digest())
-            resource_size = ResourceSize(len(resource_data))
+            (resource_data, resource_hash, resource_size,
+             resource_payloadsize, fragments_count) = self._encapsulate_resource(fragments_data, fragments_count)
             try:
                 resource = self.meta.getResourceForResourceHash(resource_hash)
                 assert resource.resource_id is not None
             except NotExistingException:
                 if self._on_upload:
-                    self._on_upload(resource_size, fragments_count)
+                    with self._upload_callback_lock:
+                        self._on_upload(resource_size, fragments_count)
                 resource_name = self.storage.saveResource(resource_data, resource_hash, resource_size)
                 if self.debug:
                     print("created resource (" + humanfriendly.format_size(resource_size) + ") with name:",
@@ -342,28 +614,92 @@ class FragmentCache(object):
                     self.storage.deleteResource(update.resource_name)
             return resource
 
+    def _upload_multiple(self, resources_fragments):
+        # type: (List[Tuple[Union[Iterable[bytes], bytes], Optional[int]]]) -> List[Resource]
+        """
+        Packs every given list of blocks into one resource and uploads the new resources with one batched storage call,
+        ignores resource size limitations
+
+        :param resources_fragments: (blocks, block count) of each resource
+        """
+        with self._mutex:
+            encapsulated = [self._encapsulate_resource(fragments_data, fragments_count)
+                            for fragments_data, fragments_count in resources_fragments]
+            resources = {}  # type: Dict[ResourceHash, Resource]
+            uploads = {}  # type: Dict[ResourceHash, Tuple[bytes, ResourceHash, ResourceSize, ResourcePayloadSize, int]]
+            for packed in encapsulated:
+                resource_hash = packed[1]
+                if resource_hash in resources or resource_hash in uploads:
+                    continue
+                try:
+                    resources[resource_hash] = self.meta.getResourceForResourceHash(resource_hash)
+                except NotExistingException:
+                    uploads[resource_hash] = packed
+            if uploads:
+                if self._on_upload:
+                    with self._upload_callback_lock:
+                        for _, _, resource_size, _, fragments_count in uploads.values():
+                            self._on_upload(resource_size, fragments_count)
+                resource_names = self.storage.saveResources(
+                    [(resource_data, resource_hash, resource_size)
+                     for resource_data, resource_hash, resource_size, _, _ in uploads.values()])
+                for (_, resource_hash, resource_size, resource_payloadsize, _), resource_name in zip(uploads.values(),
+                                                                                                     resource_names):
+                    if self.debug:
+                        print("created resource (" + humanfriendly.format_size(resource_size) + ") with name:",
+                              resource_name)
+                    resources[resource_hash] = self.meta.makeResource(resource_name, resource_size,
+                                                                      resource_payloadsize, resource_hash,
+                                                                      self.resource_wrap_type,
+                                                                      self.resource_compress_type)
+            return [resources[packed[1]] for packed in encapsulated]
+
     def loadResource(self, resource):
         # type: (Resource) -> bytes
         """
         helper, downlaods, dewraps and decompresses resource from storage
         """
         with self._mutex:
-            if self._on_download:
+            return self._download_resource(resource)
+
+    def _download_resource(self, resource):
+        # type: (Resource) -> bytes
+        # does not hold the cache lock, prefetching threads download resources in parallel
+        if self._on_download:
+            with self._download_callback_lock:
                 self._on_download(resource)
-            resource_data = self.storage.loadRessource(resource.resource_name)
-            resource_size = ResourceSize(len(resource_data))
-            if resource_size != resource.resource_size:
-                raise ResourceManipulatedException("resource size is not the expected one")
-            resource_hash = ResourceHash(hashlib.sha256(resource_data).digest())
-            if resource_hash != resource.resource_hash:
-                raise ResourceManipulatedException("resource hash is not the expected one")
-            payload = decapsulate(self.auto_compresser, self.auto_wrapper, resource.compression_type,
-                                  resource.wrapping_type,
-                                  resource_data)
-            if len(payload) != resource.resource_payloadsize:
-                raise ResourceManipulatedException("decapsulated resource has incorrect size, expected " + str(
-                    resource.resource_payloadsize) + ", got " + str(len(payload)))
-            return payload
+        resource_data = self.storage.loadRessource(resource.resource_name)
+        return self._decapsulate_resource(resource, resource_data)
+
+    def loadResources(self, resources):
+        # type: (List[Resource]) -> List[bytes]
+        """
+        downloads the given resources with one batched storage call, dewraps and decompresses them
+        """
+        with self._mutex:
+            if self._on_download:
+                with self._download_callback_lock:
+                    for resource in resources:
+                        self._on_download(resource)
+            resources_data = self.storage.loadResources([r.resource_name for r in resources])
+            return [self._decapsulate_resource(resource, resource_data)
+                    for resource, resource_data in zip(resources, resources_data)]
+
+    def _decapsulate_resource(self, resource, resource_data):
+        # type: (Resource, bytes) -> bytes
+        resource_size = ResourceSize(len(resource_data))
+        if resource_size != resource.resource_size:
+            raise ResourceManipulatedException("resource size is not the expected one")
+        resource_hash = ResourceHash(hashlib.sha256(resource_data).digest())
+        if resource_hash != resource.resource_hash:
+            raise ResourceManipulatedException("resource hash is not the expected one")
+        payload = decapsulate(self.auto_compresser, self.auto_wrapper, resource.compression_type,
+                              resource.wrapping_type,
+                              resource_data)
+        if len(payload) != resource.resource_payloadsize:
+            raise ResourceManipulatedException("decapsulated resource has incorrect size, expected " + str(
+                resource.resource_payloadsize) + ", got " + str(len(payload)))
+        return payload
 
     def loadFragmentsOfResource(self, resource):
         # type: (Resource) -> List[Tuple[Fragment, bytes]]
@@ -385,6 +721,9 @@ class FragmentCache(object):
                     [self.cache_total_fragmentsize, sum((f.fragment_size for _, f in self.fragment_cache.values()))])
             if len(fragment_hashes) == 0:
                 return
+            if self.upload_workers > 0 and update is None:
+                self._dispatch_upload(fragment_hashes)
+                return
             fragments_buffer_size = 0
             if self.debug:
                 assert self.cache_total_fragmentsize >= 0
@@ -409,6 +748,7 @@ class FragmentCache(object):
                               self.cache_total_fragmentsize - fragments_buffer_size,
                               index, len(fragment_hashes)])
             self.meta.makeAndMapFragmentsToResource(resource.resource_id, fragments_offset)
+            self._commit_plaintext_keys(fragment_hashes)
             # endregion
             if self.debug:
                 assert self.cache_total_fragmentsize == sum(
@@ -426,6 +766,164 @@ class FragmentCache(object):
                 print("remaining fragments:", len(self.fragment_cache))
                 assert self.cache_total_fragmentsize >= 0, repr([fragments_buffer_size, self.cache_total_fragmentsize])
 
+    def _remember_plaintext_key(self, fragment_hash, plaintext_key):
+        # type: (FragmentHash, Optional[Tuple[PlaintextHash, CompressionType, WrappingType]]) -> None
+        if plaintext_key is not None:
+            with self._upload_condition:
+                self._plaintext_keys.setdefault(fragment_hash, plaintext_key)
+
+    def _commit_plaintext_keys(self, fragment_hashes):
+        # type: (Iterable[FragmentHash]) -> None
+        """
+        writes the remembered plaintext hashes of the given, already committed fragments to the meta
+        """
+        with self._upload_condition:
+            plaintext_keys = [(fragment_hash,) + self._plaintext_keys.pop(fragment_hash)
+                              for fragment_hash in fragment_hashes if fragment_hash in self._plaintext_keys]
+        if plaintext_keys:
+            self.meta.addFragmentPlaintextHashes(plaintext_keys)
+
+    # region background upload pipeline
+    def _get_in_flight(self, fragment_hash):
+        # type: (FragmentHash) -> Optional[Tuple[bytes, Fragment]]
+        with self._upload_condition:
+            return self._in_flight.get(fragment_hash)
+
+    def _start_upload_workers(self):
+        while len(self._upload_threads) < self.upload_workers:
+            thread = Thread(target=self._upload_worker,
+                            name='FragmentCacheUploader-' + str(len(self._upload_threads)),
+                            daemon=True)
+            thread.start()
+            self._upload_threads.append(thread)
+
+    def _stop_upload_workers(self):
+        """
+        waits until all queued resources are uploaded and stops the upload workers. Workers get restarted on demand.
+        """
+        if not self._upload_threads:
+            return
+        for _ in self._upload_threads:
+            self._upload_queue.put(None)
+        for thread in self._upload_threads:
+            thread.join()
+        self._upload_threads = []
+
+    def _dispatch_upload(self, fragment_hashes):
+        # type: (List[FragmentHash]) -> None
+        """
+        moves the given fragments from the cache to the in-flight fragments and hands them to the upload workers.
+        blocks, if the upload queue is full.
+        """
+        with self._mutex:
+            self._start_upload_workers()
+            packet = []  # type: List[Tuple[bytes, Fragment]]
+            for fragment_hash in fragment_hashes:
+                fragment_data, fragment = self.fragment_cache.pop(fragment_hash)
+                self.cache_total_fragmentsize -= fragment.fragment_size
+                packet.append((fragment_data, fragment))
+            with self._upload_condition:
+                for fragment_data, fragment in packet:
+                    self._in_flight[fragment.fragment_hash] = (fragment_data, fragment)
+                self._pending_uploads += 1
+            if self.debug:
+                print("queued resource containing", len(packet), "fragments for upload,", self._pending_uploads,
+                      "uploads pending")
+            self._upload_queue.put(packet)
+
+    def _upload_worker(self):
+        while True:
+            packet = self._upload_queue.get()
+            if packet is None:
+                self._upload_queue.task_done()
+                return
+            try:
+                self._upload_packet(packet)
+            except Exception as e:
+                with self._upload_condition:
+                    self._upload_errors.append(e)
+                    self._failed_packets.append(packet)
+            finally:
+                with self._upload_condition:
+                    self._pending_uploads -= 1
+                    self._upload_condition.notify_all()
+                self._upload_queue.task_done()
+
+    def _upload_packet(self, packet):
+        # type: (List[Tuple[bytes, Fragment]]) -> None
+        """
+        encapsulates, hashes and uploads the given fragments as one resource without holding the cache lock,
+        afterwards the resource and the fragment mappings get committed to the meta.
+        """
+        (resource_data, resource_hash, resource_size,
+         resource_payloadsize, fragments_count) = self._encapsulate_resource((d for d, _ in packet))
+        fragments_offset = []  # type: List[Tuple[Fragment, FragmentOffset]]
+        fragments_buffer_size = 0
+        for _, fragment in packet:
+            fragments_offset.append((fragment, FragmentOffset(fragments_buffer_size)))
+            fragments_buffer_size += fragment.fragment_size
+        try:
+            resource = self.meta.getResourceForResourceHash(resource_hash)
+            resource_name = None
+        except NotExistingException:
+            resource = None
+            if self._on_upload:
+                with self._upload_callback_lock:
+                    self._on_upload(resource_size, fragments_count)
+            resource_name = self.storage.saveResource(resource_data, resource_hash, resource_size)
+            if self.debug:
+                print("created resource (" + humanfriendly.format_size(resource_size) + ") with name:",
+                      resource_name)
+        with self._commit_lock:
+            if resource is None:
+                try:
+                    # another worker might have uploaded the same resource in the meantime
+                    resource = self.meta.getResourceForResourceHash(resource_hash)
+                    if resource.resource_name != resource_name:
+                        self.storage.deleteResource(resource_name)
+                except NotExistingException:
+                    resource = self.meta.makeResource(resource_name, resource_size, resource_payloadsize,
+                                                      resource_hash, self.resource_wrap_type,
+                                                      self.resource_compress_type)
+            self.meta.makeAndMapFragmentsToResource(resource.resource_id, fragments_offset)
+            for _, fragment in packet:
+                self.pending_objects.removeFragment(fragment)
+            with self._upload_condition:
+                for _, fragment in packet:
+                    self._in_flight.pop(fragment.fragment_hash, None)
+            # after releasing the in-flight fragments, addFragment commits plaintext keys of these fragments itself
+            self._commit_plaintext_keys([fragment.fragment_hash for _, fragment in packet])
+            self._flush_meta()
+
+    def _wait_for_uploads(self):
+        """
+        blocks until all dispatched resources are uploaded.
+        fragments of failed uploads are put back into the cache.
+        :raises FlushError: at least one upload failed
+        """
+        with self._upload_condition:
+            while self._pending_uploads > 0:
+                self._upload_condition.wait()
+            errors = self._upload_errors
+            failed_packets = self._failed_packets
+            self._upload_errors = []
+            self._failed_packets = []
+        if not errors:
+            return
+        with self._mutex:
+            for packet in failed_packets:
+                for fragment_data, fragment in packet:
+                    if fragment.fragment_hash not in self.fragment_cache:
+                        self.fragment_cache[fragment.fragment_hash] = (fragment_data, fragment)
+                        self.cache_total_fragmentsize += fragment.fragment_size
+                    with self._upload_condition:
+                        self._in_flight.pop(fragment.fragment_hash, None)
+        error = FlushError(str(len(errors)) + " background upload(s) failed, first error: " + repr(errors[0]))
+        error.orig_error = errors[0]
+        raise error from errors[0]
+
+    # endregion
+
     def _flush_percentage_filled(self, empty=False):
         """
         pack fragments in cache into percentage or fully filled resources if possible.
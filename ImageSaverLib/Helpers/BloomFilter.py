@@ -0,0 +1,66 @@
+import hashlib
+import math
+from typing import Iterable, Iterator
+
+
+class BloomFilter(object):
+    """
+    Probabilistic set of byte strings.
+
+    A negative membership test is always correct, a positive one is wrong with about error_rate probability, as long
+    as no more than capacity keys got added. Keys cannot be removed, the filter has to be rebuilt instead.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        # type: (int, float) -> None
+        if capacity <= 0:
+            raise ValueError('capacity must be greater than 0')
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bit_count = max(int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))), 8)
+        self.hash_count = max(int(round(self.bit_count / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.bit_count + 7) // 8)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def isFull(self):
+        # type: () -> bool
+        return self._count > self.capacity
+
+    def _indexes(self, key):
+        # type: (bytes) -> Iterator[int]
+        # double hashing, the k indexes are h1 + i*h2, which is as good as k independent hashes
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        bit_count = self.bit_count
+        return (((h1 + i * h2) % bit_count) for i in range(self.hash_count))
+
+    def add(self, key):
+        # type: (bytes) -> None
+        bits = self._bits
+        for index in self._indexes(key):
+            bits[index >> 3] |= 1 << (index & 7)
+        self._count += 1
+
+    def update(self, keys):
+        # type: (Iterable[bytes]) -> None
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key):
+        # type: (bytes) -> bool
+        bits = self._bits
+        for index in self._indexes(key):
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return False
+        return True
+
+    def __repr__(self):
+        return ('<BloomFilter keys=' + str(self._count) + ' capacity=' + str(self.capacity) + ' bits='
+                + str(self.bit_count) + ' hashes=' + str(self.hash_count) + '>')
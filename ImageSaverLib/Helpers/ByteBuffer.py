@@ -0,0 +1,67 @@
+from typing import Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class ByteBuffer(object):
+    """
+    Growing FIFO byte buffer, which avoids re-copying the buffered data on every append or consume.
+
+    Appended data is collected in a bytearray, consumed bytes only advance a read offset. The consumed head of the
+    bytearray gets dropped during compact(), which only copies the remaining unconsumed bytes.
+    bytes appended to an empty buffer are referenced instead of copied, so big writes are not copied at all.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()  # type: Union[bytes, bytearray]
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._buffer) - self._offset
+
+    def append(self, data):
+        # type: (Buffer) -> None
+        if len(self) == 0 and type(data) is bytes:
+            self._buffer = data
+            self._offset = 0
+            return
+        if type(self._buffer) is bytes:
+            self._buffer = bytearray(memoryview(self._buffer)[self._offset:])
+            self._offset = 0
+        self._buffer += data
+
+    def view(self):
+        # type: () -> memoryview
+        """
+        returns a view of the unconsumed bytes without copying them.
+        the view must be released before the next append or compact, the bytearray cannot be resized while exported.
+        """
+        return memoryview(self._buffer)[self._offset:]
+
+    def consume(self, size):
+        # type: (int) -> bytes
+        """
+        removes and returns up to size bytes from the start of the buffer
+        """
+        size = min(size, len(self))
+        with memoryview(self._buffer) as view:
+            data = bytes(view[self._offset:self._offset + size])
+        self._offset += size
+        if self._offset == len(self._buffer):
+            self.clear()
+        return data
+
+    def compact(self):
+        """
+        drops already consumed bytes from the underlying bytearray
+        """
+        if self._offset:
+            if type(self._buffer) is bytes:
+                self._buffer = self._buffer[self._offset:]
+            else:
+                del self._buffer[:self._offset]
+            self._offset = 0
+
+    def clear(self):
+        self._buffer = bytearray()
+        self._offset = 0
@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Optional, Set
+
+
+class JobQueue(object):
+    """
+    Runs jobs on a pool of worker threads, while only a bounded number of jobs is queued or running at once.
+
+    submit blocks while max_pending jobs are not finished yet. The first exception raised by a job is raised again by
+    the next call of submit or join, all jobs which did not start yet are cancelled then.
+    """
+
+    def __init__(self, workers, max_pending=None):
+        # type: (int, Optional[int]) -> None
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+        if max_pending is None:
+            max_pending = 2 * workers
+        if max_pending < workers:
+            raise ValueError('max_pending must not be less than workers')
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending_slots = BoundedSemaphore(max_pending)
+        self._futures_lock = Lock()
+        self._futures = set()  # type: Set[Future]
+        self._error = None  # type: Optional[BaseException]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._cancel()
+            self._executor.shutdown(wait=True)
+
+    def submit(self, fn, *args, **kwargs):
+        # type: (Callable, *object, **object) -> None
+        self._raise_error()
+        self._pending_slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._pending_slots.release()
+            raise
+        with self._futures_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._on_done)
+
+    def join(self):
+        """
+        waits until all submitted jobs are finished
+        """
+        with self._futures_lock:
+            futures = set(self._futures)
+        wait(futures)
+        self._raise_error()
+
+    def close(self):
+        """
+        waits until all submitted jobs are finished and stops the worker threads
+        """
+        try:
+            self.join()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _on_done(self, future):
+        # type: (Future) -> None
+        with self._futures_lock:
+            self._futures.discard(future)
+            if not future.cancelled() and future.exception() is not None and self._error is None:
+                self._error = future.exception()
+        self._pending_slots.release()
+
+    def _cancel(self):
+        with self._futures_lock:
+            futures = set(self._futures)
+        for future in futures:
+            future.cancel()
+
+    def _raise_error(self):
+        if self._error is not None:
+            self._cancel()
+            raise self._error
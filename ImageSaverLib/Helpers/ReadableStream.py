@@ -0,0 +1,218 @@
+import hashlib
+import io
+from bisect import bisect_right
+from typing import Optional, Tuple, List, Generator, Union
+
+from ImageSaverLib.Encapsulation import AutoWrapper, AutoCompressor, decapsulate
+from ImageSaverLib.Errors import (CompoundNotExistingException, FragmentManipulatedException,
+                                  CompoundManipulatedException)
+from ImageSaverLib.FragmentCache import FragmentCache
+from ImageSaverLib.Helpers.ControlledAccess.AccessManager import AccessManager
+from ImageSaverLib.Helpers.ControlledAccess.Context.AccessContext import AccessContext
+from ImageSaverLib.Helpers.ControlledAccess.Context.ParallelAccessContext import ParallelAccessContext
+from ImageSaverLib.Helpers.ControlledAccess.Reserver.MassReserver import MassReserver
+from ImageSaverLib.Helpers.ControlledAccess.Reserver.ParallelMassReserver import ParallelMassReserver
+from ImageSaverLib.Helpers.TqdmReporter import TqdmUpTo
+from ImageSaverLib.MetaDB.Errors import NotExistingException
+from ImageSaverLib.MetaDB.MetaDB import MetaDBInterface
+from ImageSaverLib.MetaDB.Types.Compound import CompoundName, Compound, CompoundVersion
+from ImageSaverLib.MetaDB.Types.Fragment import FragmentHash, Fragment
+from ImageSaverLib.MetaDB.Types.FragmentResourceMapping import FragmentOffset
+from ImageSaverLib.MetaDB.Types.Resource import Resource
+from ImageSaverLib.PendingObjectsController import PendingObjectsController
+
+FragmentLocation = Tuple[Fragment, Optional[Resource], Optional[FragmentOffset]]
+
+
+def openReadableCompound(meta, fragment_cache, compound_am, fragment_am, wrapper, compresser, pending_objects, name,
+                         version=CompoundVersion(None), blocking=True, timeout=None, prefetch=0,
+                         progressreporter=None):
+    # type: (MetaDBInterface, FragmentCache, AccessManager[Tuple[CompoundName, CompoundVersion]], AccessManager[FragmentHash], AutoWrapper, AutoCompressor, PendingObjectsController, CompoundName, CompoundVersion, bool, Optional[float], int, Optional[TqdmUpTo]) -> ReadableCompound
+    compound_reserver = ParallelAccessContext(compound_am, (name, version), blocking=blocking, timeout=timeout)
+    with compound_reserver:
+        with meta:
+            compound = None
+            fragment_locations = None  # type: Optional[List[FragmentLocation]]
+            if version is None:
+                compound = pending_objects.getPendingCompoundWithName(name)
+            if compound:
+                pending_fragments = pending_objects.getFragmentsNeededForPendingCompoundByName(name)
+                # resources of pending fragments are resolved by the fragment cache, when they are read
+                fragment_locations = [(f, None, None) for f, _ in sorted(pending_fragments, key=lambda t: t[1])]
+            else:
+                try:
+                    compound = meta.getCompoundByName(name, version)
+                except NotExistingException:
+                    raise CompoundNotExistingException("no compound found with name " + repr(name))
+                fragment_locations = [(f, r, o) for _, f, r, o in
+                                      meta.getSequenceIndexSortedFragmentsWithResourceForCompound(
+                                          compound.compound_id)]
+        fragment_reserver = ParallelMassReserver(fragment_am, *set(f.fragment_hash for f, _, _ in fragment_locations),
+                                                 blocking=blocking, timeout=timeout)
+        return ReadableCompound(fragment_cache, compound_reserver, fragment_reserver, wrapper, compresser, compound,
+                                fragment_locations, prefetch, progressreporter)
+
+
+class ReadableCompound(io.RawIOBase):
+    """
+    Seekable, read only file object of a compound.
+
+    Byte offsets are mapped to fragments by the payload sizes of the fragments, only the fragments covering the read
+    range are loaded and verified. Sequential reads continue a fragment stream of the fragment cache, which prefetches
+    the following resources. The total compound hash is only verified, if the compound is read from start to end
+    without seeking.
+    """
+
+    def __init__(self, fragment_cache, compound_reserver, fragment_reserver, wrapper, compresser, compound,
+                 fragment_locations, prefetch=0, progressreporter=None):
+        # type: (FragmentCache, AccessContext[Tuple[CompoundName, CompoundVersion]], MassReserver[FragmentHash], AutoWrapper, AutoCompressor, Compound, List[FragmentLocation], int, Optional[TqdmUpTo]) -> None
+        super().__init__()
+        self._fragment_cache = fragment_cache
+        self._compound_reserver = compound_reserver
+        self._fragment_reserver = fragment_reserver
+        self._wrapper = wrapper
+        self._compresser = compresser
+        self._compound = compound
+        self._fragment_locations = fragment_locations
+        self._prefetch = prefetch
+        self._progressreporter = progressreporter
+
+        # start offset of each fragment within the compound payload
+        self._fragment_starts = []  # type: List[int]
+        size = 0
+        for fragment, _, _ in fragment_locations:
+            self._fragment_starts.append(size)
+            size += fragment.fragment_payload_size
+        if size != compound.compound_size:
+            raise CompoundManipulatedException("payload sizes of the fragments do not sum up to the compound size")
+        self._size = size
+        self._position = 0
+
+        # region decoded fragment and fragment stream
+        self._fragment_index = -1
+        self._fragment_payload = b''
+        self._fragments_stream = None  # type: Optional[Generator[Union[bytes, memoryview], None, None]]
+        self._next_stream_index = 0
+        # endregion
+
+        # hash of the payload read sequentially from the start, None after seeking away
+        self._hasher = hashlib.sha256()
+        self._hashed_size = 0
+
+        self._compound_reserver.__enter__()
+        try:
+            self._fragment_reserver.__enter__()
+        except Exception:
+            self._compound_reserver.__exit__(None, None, None)
+            raise
+
+    @property
+    def name(self):
+        # type: () -> CompoundName
+        return self._compound.compound_name
+
+    @property
+    def size(self):
+        # type: () -> int
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        # type: () -> int
+        self._checkClosed()
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # type: (int, int) -> int
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError('invalid whence ' + repr(whence))
+        if position < 0:
+            raise ValueError('negative seek position ' + repr(position))
+        self._position = position
+        return position
+
+    def readinto(self, b):
+        self._checkClosed()
+        with memoryview(b) as view, view.cast('B') as target:
+            written = 0
+            while written < len(target) and self._position < self._size:
+                index = bisect_right(self._fragment_starts, self._position) - 1
+                payload = self._load_fragment_payload(index)
+                start = self._position - self._fragment_starts[index]
+                length = min(len(payload) - start, len(target) - written)
+                target[written:written + length] = payload[start:start + length]
+                self._update_hash(self._position, payload[start:start + length])
+                written += length
+                self._position += length
+        if self._progressreporter is not None:
+            self._progressreporter.update_to(self._position, tsize=self._size)
+        return written
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._stop_fragments_stream()
+            self._fragment_payload = b''
+        finally:
+            try:
+                self._fragment_reserver.__exit__(None, None, None)
+            finally:
+                self._compound_reserver.__exit__(None, None, None)
+                super().close()
+
+    def _load_fragment_payload(self, index):
+        # type: (int) -> bytes
+        if index == self._fragment_index:
+            return self._fragment_payload
+        fragment = self._fragment_locations[index][0]
+        if self._fragments_stream is None or index != self._next_stream_index:
+            self._stop_fragments_stream()
+            self._fragments_stream = self._fragment_cache.loadMappedFragments(self._fragment_locations[index:],
+                                                                              prefetch=self._prefetch)
+        fragment_data = next(self._fragments_stream)
+        self._next_stream_index = index + 1
+        if len(fragment_data) != fragment.fragment_size:
+            raise FragmentManipulatedException(
+                "downloaded fragment has a not expected size, expected " + str(
+                    fragment.fragment_size) + ' got ' + str(len(fragment_data)))
+        if hashlib.sha256(fragment_data).digest() != fragment.fragment_hash:
+            raise FragmentManipulatedException("downloaded fragment has a not expected hash")
+        # not every wrapper can unwrap memoryviews
+        payload = decapsulate(self._compresser, self._wrapper, self._compound.compression_type,
+                              self._compound.wrapping_type, bytes(fragment_data))
+        if len(payload) != fragment.fragment_payload_size:
+            raise FragmentManipulatedException("decapsulated fragment has a not expected payload size")
+        self._fragment_index = index
+        self._fragment_payload = payload
+        return payload
+
+    def _stop_fragments_stream(self):
+        if self._fragments_stream is not None:
+            self._fragments_stream.close()
+            self._fragments_stream = None
+
+    def _update_hash(self, position, data):
+        # type: (int, bytes) -> None
+        if self._hasher is None:
+            return
+        if position != self._hashed_size:
+            # the compound is not read sequentially, the total hash cannot be verified
+            self._hasher = None
+            return
+        self._hasher.update(data)
+        self._hashed_size += len(data)
+        if self._hashed_size == self._size and self._hasher.digest() != self._compound.compound_hash:
+            raise CompoundManipulatedException("Total Compound payload hash does not match the saved one in meta.")
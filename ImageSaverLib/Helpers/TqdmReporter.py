@@ -1,3 +1,4 @@
+from threading import Lock
 from typing import Optional
 
 from tqdm import tqdm
@@ -27,3 +28,27 @@ class TqdmUpTo(tqdm):
         if tsize:
             chunk = tsize if chunk > tsize else chunk
         self.update(chunk - self.n)  # will also set self.n = b * bsize
+
+
+class ConcurrentTqdmUpTo(TqdmUpTo):
+    """
+    Progress bar shared by several threads, which each report the progress of their own item.
+
+    The total grows by the size of each started item.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('total', 0)
+        super(ConcurrentTqdmUpTo, self).__init__(*args, **kwargs)
+        self._progress_lock = Lock()
+
+    def addTotal(self, size):
+        # type: (int) -> None
+        with self._progress_lock:
+            self.total += size
+            if not self.disable:
+                self.refresh()
+
+    def update(self, n=1):
+        with self._progress_lock:
+            return super(ConcurrentTqdmUpTo, self).update(n)
@@ -1,10 +1,13 @@
 import hashlib
-from typing import Optional, BinaryIO, Iterator, AnyStr, Iterable, List, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, BinaryIO, Iterator, AnyStr, Iterable, List, Tuple, Deque, Union, Callable
 
 from ImageSaverLib.Encapsulation import WrappingType, CompressionType, AutoWrapper, AutoCompressor, encapsulate
 from ImageSaverLib.Errors import CompoundAlreadyExistsException
 from ImageSaverLib.FragmentCache import FragmentCache
-from ImageSaverLib.Helpers import split_bytes
+from ImageSaverLib.Helpers.ByteBuffer import ByteBuffer
+from ImageSaverLib.Helpers.Chunker import Chunker, FixedSizeChunker
 from ImageSaverLib.Helpers.ControlledAccess.AccessManager import AccessManager
 from ImageSaverLib.Helpers.ControlledAccess.Context.AccessContext import AccessContext
 from ImageSaverLib.Helpers.ControlledAccess.Context.ExclusiveAccessContext import ExclusiveAccessContext
@@ -17,13 +20,15 @@ from ImageSaverLib.MetaDB.Types.Compound import (CompoundName, Compound, Compoun
                                                  CompoundVersion)
 from ImageSaverLib.MetaDB.Types.CompoundFragmentMapping import SequenceIndex
 from ImageSaverLib.MetaDB.Types.Fragment import FragmentHash, FragmentPayloadSize, Fragment
+from ImageSaverLib.MetaDB.Types.FragmentPlaintextMapping import PlaintextHash
 from ImageSaverLib.PendingObjectsController import PendingObjectsController
 
 
 def openWritableCompound(meta, fragment_cache, compound_am, fragment_am, fragment_size, wrapper, compresser, wrap_type,
                          compress_type, pending_objects, name, compound_type, overwrite=False, compound=None,
-                         blocking=True, timeout=None):
-    # type: (MetaDBInterface, FragmentCache, AccessManager[Tuple[CompoundName, CompoundVersion]], AccessManager[FragmentHash], int, AutoWrapper, AutoCompressor, WrappingType, CompressionType, PendingObjectsController, CompoundName, CompoundType, bool, Optional[Compound], bool, Optional[float]) -> WritableCompound
+                         blocking=True, timeout=None, chunker=None, encapsulation_workers=0,
+                         encapsulation_executor=None, encapsulation_release=None):
+    # type: (MetaDBInterface, FragmentCache, AccessManager[Tuple[CompoundName, CompoundVersion]], AccessManager[FragmentHash], int, AutoWrapper, AutoCompressor, WrappingType, CompressionType, PendingObjectsController, CompoundName, CompoundType, bool, Optional[Compound], bool, Optional[float], Optional[Chunker], int, Optional[ThreadPoolExecutor], Optional[Callable[[], None]]) -> WritableCompound
     if compound:
         assert compound.compound_name == name
     compound_reserver = ExclusiveAccessContext(compound_am,
@@ -59,15 +64,34 @@ def openWritableCompound(meta, fragment_cache, compound_am, fragment_am, fragmen
                 fragment_reserver.reserveAll(*fragment_hashes)
 
         w_c = WritableCompound(meta, fragment_cache, compound_reserver, fragment_reserver, fragment_size, wrapper,
-                               compresser, wrap_type, compress_type, pending_objects, name, compound_type)
+                               compresser, wrap_type, compress_type, pending_objects, name, compound_type, chunker,
+                               encapsulation_workers, encapsulation_executor, encapsulation_release)
         return w_c
 
 
+def encapsulate_fragment(compresser, wrapper, compress_type, wrap_type, fragment_payload):
+    # type: (AutoCompressor, AutoWrapper, CompressionType, WrappingType, bytes) -> Tuple[bytes, FragmentHash, FragmentPayloadSize]
+    """
+    compresses and wraps the given fragment payload, returns the fragment data, its hash and the payload size
+    """
+    fragment_payload_size = FragmentPayloadSize(len(fragment_payload))
+    fragment_data = encapsulate(compresser, wrapper, compress_type, wrap_type, fragment_payload)
+    fragment_hash = FragmentHash(hashlib.sha256(fragment_data).digest())
+    return fragment_data, fragment_hash, fragment_payload_size
+
+
 class WritableCompound(BinaryIO):
 
     def __init__(self, meta, fragment_cache, compound_reserver, fragment_reserver, fragment_size, wrapper, compresser,
-                 wrap_type, compress_type, pending_objects, name, compound_type):
-        # type: (MetaDBInterface, FragmentCache, AccessContext[Tuple[CompoundName, CompoundVersion]], MassReserver[FragmentHash], int, AutoWrapper, AutoCompressor, WrappingType, CompressionType, PendingObjectsController, CompoundName, CompoundType) -> None
+                 wrap_type, compress_type, pending_objects, name, compound_type, chunker=None,
+                 encapsulation_workers=0, encapsulation_executor=None, encapsulation_release=None):
+        # type: (MetaDBInterface, FragmentCache, AccessContext[Tuple[CompoundName, CompoundVersion]], MassReserver[FragmentHash], int, AutoWrapper, AutoCompressor, WrappingType, CompressionType, PendingObjectsController, CompoundName, CompoundType, Optional[Chunker], int, Optional[ThreadPoolExecutor], Optional[Callable[[], None]]) -> None
+        """
+        :param encapsulation_executor: shared executor with encapsulation_workers threads, it is not shut down on close.
+        Without it, an own executor is started if encapsulation_workers is greater than 0
+        :param encapsulation_release: called once on close, tells the owner of the shared executor that this compound
+        does not use it anymore
+        """
         pass
         self.__debug = False
         # must contain meta, fragmentcache, reserved fragments+compounds
@@ -77,9 +101,14 @@ class WritableCompound(BinaryIO):
         self._compound_reserver = compound_reserver
         self._fragment_reserver = fragment_reserver
         self._fragment_size = fragment_size
+        if chunker is None:
+            chunker = FixedSizeChunker(fragment_size)
+        self._chunker = chunker
         self._wrapper = wrapper
         self._compresser = compresser
         self._wrap_type = wrap_type
+        # plaintext lookups must not return fragments wrapped with another key of the same wrapper type
+        self._plaintext_wrap_type = wrapper.getKeyedWrappingType(wrap_type)
         self._compress_type = compress_type
         self._pending_objects = pending_objects
         self._name = name
@@ -89,8 +118,7 @@ class WritableCompound(BinaryIO):
         # region buffers and indexes
         self._stream_hash = hashlib.sha256()
         self._stream_size = CompoundSize(0)
-        self._fragment_data_buffer = bytes()
-        self._fragment_data_buffer_len = 0
+        self._fragment_data_buffer = ByteBuffer()
         self._payload_index = SequenceIndex(0)
         self._fragment_payload_index = []  # type: List[Tuple[Fragment, SequenceIndex]]
         self._pending_fragments = []
@@ -98,6 +126,25 @@ class WritableCompound(BinaryIO):
         self._skip_fragment_hashes = set()
         # endregion
 
+        # region parallel encapsulation
+        # compressors and sha256 release the GIL, so threads encapsulate fragments in parallel. Results are collected
+        # in submission order, which keeps the sequence indexes in order
+        self._owns_encapsulation_executor = False
+        if encapsulation_workers <= 0:
+            self._encapsulation_executor = None  # type: Optional[ThreadPoolExecutor]
+        elif encapsulation_executor is not None:
+            self._encapsulation_executor = encapsulation_executor
+        else:
+            self._encapsulation_executor = ThreadPoolExecutor(
+                max_workers=encapsulation_workers,
+                thread_name_prefix='WritableCompoundEncapsulation')
+            self._owns_encapsulation_executor = True
+        self._encapsulation_release = encapsulation_release
+        self._max_encapsulating_fragments = encapsulation_workers * 2
+        # encapsulating fragments or already known fragments with their plaintext key, in sequence order
+        self._encapsulating_fragments = deque()  # type: Deque[Tuple[Union[Future, Fragment], Tuple[PlaintextHash, CompressionType, WrappingType]]]
+        # endregion
+
         # region BinaryIO object helper fields
         self._closed = False
         self.__reserved = False
@@ -148,6 +195,7 @@ class WritableCompound(BinaryIO):
             else:
                 self._close()
         finally:
+            self._shutdown_encapsulation()
             self._unreserve()
         return
 
@@ -161,9 +209,9 @@ class WritableCompound(BinaryIO):
             self._stream_hash.update(chunk)
             self._stream_size += len(chunk)
             # fill internal buffer of fragment_size size
-            self._fragment_data_buffer += chunk
-            self._fragment_data_buffer_len += len(chunk)
-        if self._fragment_data_buffer_len >= self._fragment_size or (not chunk and self._fragment_data_buffer_len > 0):
+            self._fragment_data_buffer.append(chunk)
+        if len(self._fragment_data_buffer) >= self._chunker.max_size or (
+                not chunk and len(self._fragment_data_buffer) > 0):
             self._flush_full_fragments()
 
     def close(self):
@@ -196,6 +244,7 @@ class WritableCompound(BinaryIO):
             # self._fragment_cache.flush()
             self._closed = True
         finally:
+            self._shutdown_encapsulation()
             self._unreserve()
 
     def flush(self):
@@ -210,45 +259,125 @@ class WritableCompound(BinaryIO):
         if self.__debug:
             print('WritableCompound _flush')
 
-        while self._fragment_data_buffer_len > 0:
-            self._flush_one_fragment()
+        fragment_payloads = []
+        while len(self._fragment_data_buffer) > 0:
+            fragment_payloads.append(self._cut_fragment())
+        self._flush_fragments(fragment_payloads)
+        self._collect_encapsulated_fragments(wait=True)
 
     def _flush_full_fragments(self):
         if self.__debug:
             print('WritableCompound _flush_full_fragments')
 
         # while data in buffer, flush only full fragments, keep remaining data in buffer
+        fragment_payloads = []
         while self._one_full_fragment_flushable():
-            self._flush_one_fragment()
+            fragment_payloads.append(self._cut_fragment())
+        # drop the flushed head of the buffer once, instead of after every fragment
+        self._fragment_data_buffer.compact()
+        self._flush_fragments(fragment_payloads)
+        self._collect_encapsulated_fragments()
 
     def _one_full_fragment_flushable(self):
         if self.__debug:
             print('WritableCompound _one_full_fragment_flushable')
 
         # return bool, if one full fragment is flushable
-        return self._fragment_data_buffer_len >= self._fragment_size
+        # a chunker always finds a boundary within max_size bytes, less buffered data might be cut differently later
+        return len(self._fragment_data_buffer) >= self._chunker.max_size
 
-    def _flush_one_fragment(self):
+    def _cut_fragment(self):
+        # type: () -> bytes
         if self.__debug:
-            print('WritableCompound _flush_one_fragment')
+            print('WritableCompound _cut_fragment')
 
-        pass
-        # reduce internal buffer by only one fragment, if buffer is not sufficiently filled, flush remaining
-        if self._fragment_data_buffer_len <= self._fragment_size:
-            fragment_data = self._fragment_data_buffer
-            self._fragment_data_buffer = bytes()
-            self._fragment_data_buffer_len = 0
-        else:
-            fragment_data, self._fragment_data_buffer = split_bytes(self._fragment_data_buffer, self._fragment_size)
-            self._fragment_data_buffer_len -= self._fragment_size
+        # reduce internal buffer by only one fragment, if buffer is not sufficiently filled, take the remaining data
+        with self._fragment_data_buffer.view() as buffered_data:
+            boundary = self._chunker.nextBoundary(buffered_data)
+        return self._fragment_data_buffer.consume(boundary)
 
-        # remember fragment id and payload index
-        fragment_payload_size = FragmentPayloadSize(len(fragment_data))
-        fragment_data = encapsulate(self._compresser, self._wrapper, self._compress_type, self._wrap_type,
-                                    fragment_data)
-        fragment_hash = FragmentHash(hashlib.sha256(fragment_data).digest())
+    def _flush_fragments(self, fragment_payloads):
+        # type: (List[bytes]) -> None
+        if self.__debug:
+            print('WritableCompound _flush_fragments', len(fragment_payloads))
+
+        if not fragment_payloads:
+            return
+        # fragments of already known plaintexts do not need to be compressed and wrapped again, they are looked up
+        # with one meta query per flush
+        plaintext_hashes = [PlaintextHash(hashlib.sha256(fragment_payload).digest())
+                            for fragment_payload in fragment_payloads]
+        known_fragments = self._meta.getFragmentsByPlaintextHashes(plaintext_hashes, self._compress_type,
+                                                                   self._plaintext_wrap_type)
+        for fragment_payload, plaintext_hash in zip(fragment_payloads, plaintext_hashes):
+            plaintext_key = (plaintext_hash, self._compress_type, self._plaintext_wrap_type)
+            known_fragment = known_fragments.get(plaintext_hash)
+            if known_fragment is not None:
+                known_fragment = Fragment(known_fragment.fragment_hash, known_fragment.fragment_size,
+                                          known_fragment.fragment_payload_size)
+
+            if self._encapsulation_executor is None:
+                if known_fragment is not None:
+                    self._add_known_fragment(known_fragment)
+                else:
+                    self._add_fragment(*encapsulate_fragment(self._compresser, self._wrapper, self._compress_type,
+                                                             self._wrap_type, fragment_payload),
+                                       plaintext_key=plaintext_key)
+            else:
+                if known_fragment is not None:
+                    self._encapsulating_fragments.append((known_fragment, plaintext_key))
+                else:
+                    future = self._encapsulation_executor.submit(encapsulate_fragment, self._compresser,
+                                                                 self._wrapper, self._compress_type, self._wrap_type,
+                                                                 fragment_payload)
+                    self._encapsulating_fragments.append((future, plaintext_key))
+                self._collect_encapsulated_fragments()
+
+    def _collect_encapsulated_fragments(self, wait=False):
+        # type: (bool) -> None
+        """
+        adds encapsulated fragments in submission order to the fragment cache.
+        blocks while too many fragments are encapsulating, or until all are added if wait is True
+        """
+        while self._encapsulating_fragments and (
+                wait
+                or not isinstance(self._encapsulating_fragments[0][0], Future)
+                or self._encapsulating_fragments[0][0].done()
+                or len(self._encapsulating_fragments) > self._max_encapsulating_fragments):
+            item, plaintext_key = self._encapsulating_fragments.popleft()
+            if isinstance(item, Future):
+                self._add_fragment(*item.result(), plaintext_key=plaintext_key)
+            else:
+                self._add_known_fragment(item)
+
+    def _shutdown_encapsulation(self):
+        if self._encapsulation_executor is not None:
+            for item, _ in self._encapsulating_fragments:
+                if isinstance(item, Future):
+                    item.cancel()
+            self._encapsulating_fragments.clear()
+            if self._owns_encapsulation_executor:
+                self._encapsulation_executor.shutdown(wait=True)
+            self._encapsulation_executor = None
+        if self._encapsulation_release is not None:
+            release, self._encapsulation_release = self._encapsulation_release, None
+            release()
+
+    def _add_fragment(self, fragment_data, fragment_hash, fragment_payload_size, plaintext_key=None):
+        # type: (bytes, FragmentHash, FragmentPayloadSize, Optional[Tuple[PlaintextHash, CompressionType, WrappingType]]) -> None
         self._fragment_reserver.reserveOne(fragment_hash)
-        fragment = self._fragment_cache.addFragmentData(fragment_data, fragment_hash, fragment_payload_size)
+        fragment = self._fragment_cache.addFragmentData(fragment_data, fragment_hash, fragment_payload_size,
+                                                        plaintext_key=plaintext_key)
+        self._append_fragment(fragment)
+
+    def _add_known_fragment(self, fragment):
+        # type: (Fragment) -> None
+        self._fragment_reserver.reserveOne(fragment.fragment_hash)
+        self._append_fragment(fragment)
+
+    def _append_fragment(self, fragment):
+        # type: (Fragment) -> None
+        # remember fragment id and payload index
         self._pending_fragments.append(fragment)
         self._fragment_payload_index.append((fragment, self._payload_index))
         self._payload_index += 1
@@ -1,3 +1,5 @@
+from typing import List
+
 import fs
 from fs.base import FS
 from fs.errors import ResourceNotFound
@@ -5,7 +7,6 @@ from fs.info import Info
 from fs.subfs import SubFS
 
 from ImageSaverLib.Errors import CompoundAlreadyExistsException, CompoundNotExistingException
-from ImageSaverLib.Helpers.FileLikeIterator import FileLikeIterator
 from ImageSaverLib.ImageSaverLib import ImageSaver
 from ImageSaverLib.MetaDB.Errors import NotExistingException
 from ImageSaverLib.MetaDB.Types.Compound import Compound
@@ -52,6 +53,7 @@ class ImageSaverFS(FS):
     def close(self):
         with self._lock:
             self._saver.flush()
+            self._saver.close()
             return super().close()
 
     def getinfo(self, path, namespaces=None):
@@ -63,35 +65,45 @@ class ImageSaverFS(FS):
             except NotExistingException:
                 # print('getinfo ERROR', path, abs_path)
                 raise ResourceNotFound(abs_path)
-            raw_info = {'basic': {'name': fs.path.basename(compound.compound_name),
-                                  'is_dir': compound.compound_type == Compound.DIR_TYPE},
-                        'details': {'size': compound.compound_size}}
-            if compound.compound_type == Compound.FILE_TYPE:
-                raw_info['details']['type'] = fs.enums.ResourceType.file
-            elif compound.compound_type == Compound.DIR_TYPE:
-                raw_info['details']['type'] = fs.enums.ResourceType.directory
-            return Info(raw_info)
+            return self._compound_info(compound)
+
+    @staticmethod
+    def _compound_info(compound):
+        # type: (Compound) -> Info
+        raw_info = {'basic': {'name': fs.path.basename(compound.compound_name),
+                              'is_dir': compound.compound_type == Compound.DIR_TYPE},
+                    'details': {'size': compound.compound_size}}
+        if compound.compound_type == Compound.FILE_TYPE:
+            raw_info['details']['type'] = fs.enums.ResourceType.file
+        elif compound.compound_type == Compound.DIR_TYPE:
+            raw_info['details']['type'] = fs.enums.ResourceType.directory
+        return Info(raw_info)
+
+    def _child_compounds(self, abs_path):
+        # type: (str) -> List[Compound]
+        try:
+            compound = self._saver.getCompoundWithName(abs_path)
+        except NotExistingException:
+            raise fs.errors.ResourceNotFound(abs_path)
+        if compound.compound_type != Compound.DIR_TYPE:
+            raise fs.errors.DirectoryExpected(abs_path)
+        # the children are looked up by their indexed parent name, instead of matching the names of all compounds
+        return [c for c in self._saver.listCompounds(parent=abs_path) if c.compound_name != '/']
 
     def listdir(self, path):
         with self._lock:
             abs_path = self.validatepath(path)
-            try:
-                compound = self._saver.getCompoundWithName(abs_path)
-            except NotExistingException:
-                raise fs.errors.ResourceNotFound(abs_path)
-            if compound.compound_type != Compound.DIR_TYPE:
-                raise fs.errors.DirectoryExpected(abs_path)
-            if abs_path == '/':
-                slash_count = 1
-            else:
-                slash_count = abs_path.count('/') + 1
-                abs_path += '/'
-            compound_gen = self._saver.listCompounds(type_filter=None,
-                                                     order_alphabetically=False,
-                                                     starting_with=abs_path,
-                                                     ending_with=None,
-                                                     slash_count=slash_count)
-            return [fs.path.basename(c.compound_name) for c in compound_gen if c.compound_name != '/']
+            return [fs.path.basename(c.compound_name) for c in self._child_compounds(abs_path)]
+
+    def scandir(self, path, namespaces=None, page=None):
+        # the infos are built from the listed compounds, instead of calling getinfo for every child
+        with self._lock:
+            abs_path = self.validatepath(path)
+            infos = [self._compound_info(c) for c in self._child_compounds(abs_path)]
+        if page is not None:
+            start, end = page
+            infos = infos[start:end]
+        return iter(infos)
 
     # def validatepath(self, path):
     #     ret = super().validatepath(path)
@@ -122,7 +134,7 @@ class ImageSaverFS(FS):
                         raise fs.errors.ResourceNotFound(abs_path)
                     if compound.compound_type != Compound.FILE_TYPE:
                         raise fs.errors.FileExpected(abs_path)
-                    f = FileLikeIterator(self._saver.loadCompound(compound.compound_name))
+                    f = self._saver.openReadableCompound(compound.compound_name)
                     return f
             # elif mode == 'w':
             #     raise NotImplementedError('Only wb mode supported')
@@ -1,6 +1,17 @@
+import asyncio
 import hashlib
+import io
+import json
+import tempfile
+import time
 import warnings
-from typing import Optional, Union, Type, Tuple, Generator, List, BinaryIO, Iterable
+from urllib.parse import quote, unquote
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from functools import partial
+from threading import RLock
+from typing import (Optional, Union, Type, Tuple, Generator, List, BinaryIO, Iterable, Dict, AsyncGenerator, Callable,
+                    Any)
 
 import humanfriendly
 
@@ -12,32 +23,44 @@ from ImageSaverLib.Encapsulation.Wrappers.AutoWrapper import AutoWrapper
 from ImageSaverLib.Encapsulation.Wrappers.Types import PassThroughWrapper
 from ImageSaverLib.Errors import (CompoundManipulatedException, ResourceMissingException,
                                   FragmentMissingException, CompoundAlreadyExistsException,
-                                  CompoundNotExistingException, FragmentManipulatedException)
+                                  CompoundNotExistingException, FragmentManipulatedException,
+                                  ResourceManipulatedException)
 from ImageSaverLib.FragmentCache import FragmentCache
 from ImageSaverLib.Helpers import chunkiterable_gen, get_sha256_of_stream
+from ImageSaverLib.Helpers.Chunker import Chunker, FixedSizeChunker
 from ImageSaverLib.Helpers.ControlledAccess.AccessManager import AccessManager
 from ImageSaverLib.Helpers.ControlledAccess.Context.ExclusiveAccessContext import ExclusiveAccessContext
 from ImageSaverLib.Helpers.ControlledAccess.Context.ParallelAccessContext import ParallelAccessContext
 from ImageSaverLib.Helpers.ControlledAccess.Reserver.ExclusiveMassReserver import ExclusiveMassReserver
 from ImageSaverLib.Helpers.ControlledAccess.Reserver.ParallelMassReserver import ParallelMassReserver
 from ImageSaverLib.Helpers.FileLikeIterator import FileLikeIterator
+from ImageSaverLib.Helpers.ReadableStream import openReadableCompound, ReadableCompound
 from ImageSaverLib.Helpers.SizedGenerator import SizedGenerator
 from ImageSaverLib.Helpers.TqdmReporter import TqdmUpTo
 from ImageSaverLib.Helpers.WritableStream import openWritableCompound, WritableCompound
-from ImageSaverLib.MetaDB.Errors import NotExistingException
+from ImageSaverLib.MetaDB.Errors import NotExistingException, InvalidExportException
 from ImageSaverLib.MetaDB.MetaDB import MetaDBInterface
 from ImageSaverLib.MetaDB.Types.Compound import CompoundName, CompoundType, Compound, CompoundHash, CompoundVersion
-from ImageSaverLib.MetaDB.Types.Fragment import FragmentHash, FragmentSize, FragmentID
+from ImageSaverLib.MetaDB.Types.CompoundFragmentMapping import SequenceIndex
+from ImageSaverLib.MetaDB.Types.Fragment import Fragment, FragmentHash, FragmentSize, FragmentID
 from ImageSaverLib.MetaDB.Types.FragmentResourceMapping import FragmentOffset
-from ImageSaverLib.MetaDB.Types.Resource import (ResourceName, ResourceID, ResourceSize, ResourceWrappingType,
-                                                 ResourceCompressionType)
+from ImageSaverLib.MetaDB.Types.Resource import (Resource, ResourceName, ResourceID, ResourceSize,
+                                                 ResourceWrappingType, ResourceCompressionType, ResourceHash,
+                                                 ResourcePayloadSize)
+from ImageSaverLib.MetaDB.Types.Statistic import Statistics
 from ImageSaverLib.PendingObjectsController import PendingObjectsController
+from ImageSaverLib.Storage.AsyncStorageAdapter import AsyncStorageAdapter
+from ImageSaverLib.Storage.AsyncStorageInterface import AsyncStorageInterface
 from ImageSaverLib.Storage.StorageInterface import StorageInterface
 
+META_BACKUP_NAME = '/.isl_meta_backup'
+META_BACKUP_FORMAT = 'isl-meta-backup'
+
 
 class ImageSaver(object):
-    def __init__(self, meta, storage, fragment_size=1000000, resource_size=None):
-        # type: (MetaDBInterface, StorageInterface, Optional[Union[FragmentSize, int]], Optional[Union[ResourceSize, int]]) -> None
+    def __init__(self, meta, storage, fragment_size=1000000, resource_size=None, upload_workers=0,
+                 meta_batch_count=1, meta_batch_size=None, meta_batch_delay=None):
+        # type: (MetaDBInterface, StorageInterface, Optional[Union[FragmentSize, int]], Optional[Union[ResourceSize, int]], int, int, Optional[int], Optional[float]) -> None
         if resource_size is None:
             resource_size = storage.getMaxSupportedResourceSize()
         else:
@@ -47,6 +70,8 @@ class ImageSaver(object):
         elif fragment_size is None:
             fragment_size = 1000000
         self.storage = storage  # storage interface, can throw all kinds of exceptions during upload
+        # used by the async read methods, must hold the same resources as storage, defaults to an AsyncStorageAdapter
+        self._async_storage = None  # type: Optional[AsyncStorageInterface]
         self.meta = meta  # type: MetaDBInterface
         self.fragment_size = fragment_size
         self.resource_size = resource_size
@@ -57,6 +82,19 @@ class ImageSaver(object):
         self.compresser = AutoCompressor()
         self._wrap_type = makeWrappingType(PassThroughWrapper)  # type: WrappingType
         self._compress_type = makeCompressingType(ZLibCompressor)  # type: CompressionType
+        self._chunker = None  # type: Optional[Chunker]
+        self.encapsulation_workers = 0
+        # encapsulation threads shared by all writable compounds, started on first use
+        self._encapsulation_executor = None  # type: Optional[ThreadPoolExecutor]
+        self._encapsulation_executor_workers = 0
+        # open writable compounds per shared executor, a replaced executor is shut down after the last one closed
+        self._encapsulation_users = {}  # type: Dict[ThreadPoolExecutor, int]
+        self._encapsulation_executor_lock = RLock()
+        self.prefetch_resources = 0
+        # resources per batched storage call of collectGarbage and optimizeResourceSpace, optimizing holds this many
+        # downloaded resources in memory
+        self.delete_batch_size = 50
+        self.optimize_batch_size = 8
         self.pending_objects = PendingObjectsController()
         self._within_context = 0
         self.fragment_cache = FragmentCache(self.meta, self.storage, fragment_size,
@@ -64,7 +102,10 @@ class ImageSaver(object):
                                             makeCompressingType(PassThroughCompressor),
                                             resource_size, self.pending_objects,
                                             self.wrapper, self.compresser,
-                                            debug=False)  # type: FragmentCache
+                                            debug=False, upload_workers=upload_workers,
+                                            meta_batch_count=meta_batch_count,
+                                            meta_batch_size=meta_batch_size,
+                                            meta_batch_delay=meta_batch_delay)  # type: FragmentCache
 
     def __enter__(self):
         self._within_context += 1
@@ -73,6 +114,8 @@ class ImageSaver(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._within_context -= 1
+        if self._within_context == 0:
+            self._retire_encapsulation_executor(wait=True)
         error = True
         try:
             self.fragment_cache.__exit__(exc_type, exc_val, exc_tb)
@@ -200,6 +243,32 @@ class ImageSaver(object):
         )
         self._compress_type = value
 
+    @property
+    def defaultChunker(self):
+        # type: () -> Optional[Chunker]
+        return self._chunker
+
+    @defaultChunker.setter
+    def defaultChunker(self, chunker):
+        # type: (Optional[Chunker]) -> None
+        self.setDefaultChunker(chunker)
+
+    def setDefaultChunker(self, chunker):
+        # type: (Optional[Chunker]) -> None
+        """
+        Sets the chunker, which decides where written compounds are cut into fragments.
+        None cuts fragments at fixed fragment_size offsets.
+        """
+        if chunker is not None:
+            self._check_chunker(chunker)
+        self._chunker = chunker
+
+    def _check_chunker(self, chunker):
+        # type: (Chunker) -> None
+        if chunker.max_size > self.fragment_cache.resource_size:
+            raise ValueError('maximum fragment size of chunker is larger than the resource size, max is '
+                             + str(self.fragment_cache.resource_size) + ', got ' + str(chunker.max_size))
+
     def changeFragmentSize(self, fragmentSize):
         # type: (int) -> None
         self.fragment_size = int(fragmentSize)
@@ -207,8 +276,12 @@ class ImageSaver(object):
     def saveStream(self, stream, name, fragment_size=None, wrap_type=None, compress_type=None, blocking=True,
                    timeout=None, read_speed=None, compound_type=Compound.FILE_TYPE, overwrite=False,
                    pre_calc_stream_hash=False,
-                   progressreporter=None):
-        # type: (BinaryIO, str, Optional[int], Optional[WrappingType], Optional[CompressionType], bool, Optional[float], Optional[int], str, bool, bool, Optional[TqdmUpTo]) -> None
+                   progressreporter=None, chunker=None, encapsulation_workers=None):
+        # type: (BinaryIO, str, Optional[int], Optional[WrappingType], Optional[CompressionType], bool, Optional[float], Optional[int], str, bool, bool, Optional[TqdmUpTo], Optional[Chunker], Optional[int]) -> None
+        """
+        :param encapsulation_workers: number of threads, which compress, wrap and hash fragments in parallel.
+        None uses the encapsulation_workers attribute, 0 encapsulates on the calling thread
+        """
         name = CompoundName(name)
         compound_type = CompoundType(compound_type)
         if not wrap_type:
@@ -219,6 +292,9 @@ class ImageSaver(object):
             fragment_size = self.fragment_size
         else:
             fragment_size = int(fragment_size)
+        chunker = self._get_chunker(chunker, fragment_size)
+        if encapsulation_workers is None:
+            encapsulation_workers = self.encapsulation_workers
         if not read_speed:
             read_speed = fragment_size
 
@@ -233,22 +309,24 @@ class ImageSaver(object):
                 if compound.compound_hash == stream_hash:
                     raise CompoundAlreadyExistsException(
                         "compound already exists with same payload, overwrite not needed")
-        w_c = openWritableCompound(meta=self.meta,
-                                   fragment_cache=self.fragment_cache,
-                                   compound_am=self.reserved_compounds,
-                                   fragment_am=self.reserved_fragments,
-                                   fragment_size=fragment_size,
-                                   wrapper=self.wrapper,
-                                   compresser=self.compresser,
-                                   wrap_type=wrap_type,
-                                   compress_type=compress_type,
-                                   pending_objects=self.pending_objects,
-                                   name=name,
-                                   compound_type=compound_type,
-                                   overwrite=overwrite,
-                                   compound=compound,
-                                   blocking=blocking,
-                                   timeout=timeout)
+        w_c = self._open_writable_compound(meta=self.meta,
+                                           fragment_cache=self.fragment_cache,
+                                           compound_am=self.reserved_compounds,
+                                           fragment_am=self.reserved_fragments,
+                                           fragment_size=fragment_size,
+                                           wrapper=self.wrapper,
+                                           compresser=self.compresser,
+                                           wrap_type=wrap_type,
+                                           compress_type=compress_type,
+                                           pending_objects=self.pending_objects,
+                                           name=name,
+                                           compound_type=compound_type,
+                                           overwrite=overwrite,
+                                           compound=compound,
+                                           blocking=blocking,
+                                           timeout=timeout,
+                                           chunker=chunker,
+                                           encapsulation_workers=encapsulation_workers)
         with w_c:
             stream_size = 0
             while True:
@@ -262,8 +340,8 @@ class ImageSaver(object):
 
     def openWritableCompound(self, name, compound_type=Compound.FILE_TYPE,
                              wrap_type=None, compress_type=None, fragment_size=None, overwrite=False, blocking=True,
-                             timeout=None):
-        # type: (Union[str, CompoundName], Union[str, CompoundType], WrappingType, CompressionType, Union[int, FragmentSize], bool, bool, Optional[float]) -> WritableCompound
+                             timeout=None, chunker=None, encapsulation_workers=None):
+        # type: (Union[str, CompoundName], Union[str, CompoundType], WrappingType, CompressionType, Union[int, FragmentSize], bool, bool, Optional[float], Optional[Chunker], Optional[int]) -> WritableCompound
         # create WritableCompound, which feeds into fragment cache
         # writable compound has no control of fragment cache and meta
         # it can only query for fragments or create fragments
@@ -283,28 +361,102 @@ class ImageSaver(object):
             fragment_size = self.fragment_size
         else:
             fragment_size = int(fragment_size)
-
-        w_c = openWritableCompound(meta=self.meta,
-                                   fragment_cache=self.fragment_cache,
-                                   compound_am=self.reserved_compounds,
-                                   fragment_am=self.reserved_fragments,
-                                   fragment_size=fragment_size,
-                                   wrapper=self.wrapper,
-                                   compresser=self.compresser,
-                                   wrap_type=wrap_type,
-                                   compress_type=compress_type,
-                                   pending_objects=self.pending_objects,
-                                   name=name,
-                                   compound_type=compound_type,
-                                   overwrite=overwrite,
-                                   blocking=blocking,
-                                   timeout=timeout)
+        chunker = self._get_chunker(chunker, fragment_size)
+        if encapsulation_workers is None:
+            encapsulation_workers = self.encapsulation_workers
+
+        w_c = self._open_writable_compound(meta=self.meta,
+                                           fragment_cache=self.fragment_cache,
+                                           compound_am=self.reserved_compounds,
+                                           fragment_am=self.reserved_fragments,
+                                           fragment_size=fragment_size,
+                                           wrapper=self.wrapper,
+                                           compresser=self.compresser,
+                                           wrap_type=wrap_type,
+                                           compress_type=compress_type,
+                                           pending_objects=self.pending_objects,
+                                           name=name,
+                                           compound_type=compound_type,
+                                           overwrite=overwrite,
+                                           blocking=blocking,
+                                           timeout=timeout,
+                                           chunker=chunker,
+                                           encapsulation_workers=encapsulation_workers)
         return w_c
 
+    def _open_writable_compound(self, encapsulation_workers, **kwargs):
+        # type: (int, **Any) -> WritableCompound
+        encapsulation_executor, encapsulation_release = self._acquire_encapsulation_executor(encapsulation_workers)
+        try:
+            return openWritableCompound(encapsulation_workers=encapsulation_workers,
+                                        encapsulation_executor=encapsulation_executor,
+                                        encapsulation_release=encapsulation_release, **kwargs)
+        except BaseException:
+            if encapsulation_release is not None:
+                encapsulation_release()
+            raise
+
+    def _acquire_encapsulation_executor(self, encapsulation_workers):
+        # type: (int) -> Tuple[Optional[ThreadPoolExecutor], Optional[Callable[[], None]]]
+        """
+        returns the shared encapsulation executor if it has encapsulation_workers threads, and the function releasing
+        it again. Other worker counts get None, the writable compound starts its own executor then
+        """
+        if encapsulation_workers <= 0 or encapsulation_workers != self.encapsulation_workers:
+            return None, None
+        with self._encapsulation_executor_lock:
+            if self._encapsulation_executor_workers != encapsulation_workers:
+                self._retire_encapsulation_executor()
+                self._encapsulation_executor = ThreadPoolExecutor(max_workers=encapsulation_workers,
+                                                                  thread_name_prefix='ImageSaverEncapsulation')
+                self._encapsulation_executor_workers = encapsulation_workers
+            executor = self._encapsulation_executor
+            self._encapsulation_users[executor] = self._encapsulation_users.get(executor, 0) + 1
+        return executor, partial(self._release_encapsulation_executor, executor)
+
+    def _release_encapsulation_executor(self, executor):
+        # type: (ThreadPoolExecutor) -> None
+        with self._encapsulation_executor_lock:
+            self._encapsulation_users[executor] -= 1
+            if self._encapsulation_users[executor] > 0 or executor is self._encapsulation_executor:
+                return
+            del self._encapsulation_users[executor]
+        executor.shutdown(wait=False)
+
+    def _retire_encapsulation_executor(self, wait=False):
+        # type: (bool) -> None
+        """
+        shuts the shared encapsulation executor down, if writable compounds still use it, the last one closing shuts it
+        down. The next writable compound starts a new one
+        """
+        with self._encapsulation_executor_lock:
+            executor = self._encapsulation_executor
+            self._encapsulation_executor = None
+            self._encapsulation_executor_workers = 0
+            if executor is None or self._encapsulation_users.get(executor):
+                return
+            self._encapsulation_users.pop(executor, None)
+        executor.shutdown(wait=wait)
+
+    def close(self):
+        """
+        stops the shared encapsulation threads, writable compounds still open keep them until they are closed
+        """
+        self._retire_encapsulation_executor(wait=True)
+
+    def _get_chunker(self, chunker, fragment_size):
+        # type: (Optional[Chunker], int) -> Chunker
+        if chunker is None:
+            chunker = self._chunker
+        if chunker is None:
+            return FixedSizeChunker(fragment_size)
+        self._check_chunker(chunker)
+        return chunker
+
     def saveBytes(self, data, name, fragment_size=None, wrap_type=None, compress_type=None, blocking=True,
-                  timeout=None, compound_type=Compound.FILE_TYPE, overwrite=False,
-                  ):
-        # type: (bytes, str, Optional[int], WrappingType, CompressionType, bool, Optional[float], CompoundType, bool) -> None
+                  timeout=None, compound_type=Compound.FILE_TYPE, overwrite=False, chunker=None,
+                  encapsulation_workers=None):
+        # type: (bytes, str, Optional[int], WrappingType, CompressionType, bool, Optional[float], CompoundType, bool, Optional[Chunker], Optional[int]) -> None
         f = self.openWritableCompound(name=name,
                                       compound_type=compound_type,
                                       wrap_type=wrap_type,
@@ -312,7 +464,9 @@ class ImageSaver(object):
                                       fragment_size=fragment_size,
                                       overwrite=overwrite,
                                       blocking=blocking,
-                                      timeout=timeout)
+                                      timeout=timeout,
+                                      chunker=chunker,
+                                      encapsulation_workers=encapsulation_workers)
         with f:
             f.write(data)
 
@@ -372,43 +526,203 @@ class ImageSaver(object):
                     else:
                         sorted_fragments = None
                     if sorted_fragments is None:
-                        sorted_fragments = list(self.meta.getSequenceIndexSortedFragmentsForCompound(
+                        # resolve all fragments and their resources with one query
+                        fragment_locations = list(self.meta.getSequenceIndexSortedFragmentsWithResourceForCompound(
                             compound.compound_id))
+                        sorted_fragments = [(i, f) for i, f, _, _ in fragment_locations]
+                        fragments_data = self.fragment_cache.loadMappedFragments(
+                            ((f, r, o) for _, f, r, o in fragment_locations), prefetch=self.prefetch_resources)
                     else:
                         sorted_fragments = [(i, f) for f, i in sorted_fragments]
+                        fragments_data = self.fragment_cache.loadFragments((f for _, f in sorted_fragments),
+                                                                           prefetch=self.prefetch_resources)
+                    needed_fragment_hashes = set(fragment_hashes)
                     for sequence_index, fragment in sorted_fragments:
-                        assert fragment.fragment_hash in fragment_hashes, repr(
+                        assert fragment.fragment_hash in needed_fragment_hashes, repr(
                             (fragment.fragment_hash, 'not in', fragment_hashes))
                         assert self.reserved_fragments.managesValue(fragment.fragment_hash)
-                    for sequence_index, fragment in sorted_fragments:
-                        fragment_data = self.fragment_cache.loadFragment(fragment)
-                        fragment_reserver.unreserveOne(fragment.fragment_hash)
-                        fragment_size = FragmentSize(len(fragment_data))
-                        if fragment_size != fragment.fragment_size:
-                            raise FragmentManipulatedException(
-                                "downloaded fragment has a not expected size, expected " + str(
-                                    fragment.fragment_size) + ' got ' + str(fragment_size))
-                        fragment_hash = FragmentHash(hashlib.sha256(fragment_data).digest())
-                        if fragment_hash != fragment.fragment_hash:
-                            raise FragmentManipulatedException("downloaded fragment has a not expected hash")
-
-                        fragment_data = decapsulate(self.compresser, self.wrapper, compound.compression_type,
-                                                    compound.wrapping_type,
-                                                    fragment_data)
-                        downloaded_data += len(fragment_data)
+                    with closing(fragments_data):
+                        for (sequence_index, fragment), fragment_data in zip(sorted_fragments, fragments_data):
+                            fragment_reserver.unreserveOne(fragment.fragment_hash)
+                            fragment_size = FragmentSize(len(fragment_data))
+                            if fragment_size != fragment.fragment_size:
+                                raise FragmentManipulatedException(
+                                    "downloaded fragment has a not expected size, expected " + str(
+                                        fragment.fragment_size) + ' got ' + str(fragment_size))
+                            fragment_hash = FragmentHash(hashlib.sha256(fragment_data).digest())
+                            if fragment_hash != fragment.fragment_hash:
+                                raise FragmentManipulatedException("downloaded fragment has a not expected hash")
+
+                            # not every wrapper can unwrap memoryviews
+                            fragment_data = decapsulate(self.compresser, self.wrapper, compound.compression_type,
+                                                        compound.wrapping_type,
+                                                        bytes(fragment_data))
+                            downloaded_data += len(fragment_data)
+
+                            if progressreporter is not None:
+                                progressreporter.update_to(downloaded_data, tsize=compound.compound_size)
+                            hasher.update(fragment_data)
+                            yield fragment_data
 
-                        if progressreporter is not None:
-                            progressreporter.update_to(downloaded_data, tsize=compound.compound_size)
-                        hasher.update(fragment_data)
+        if hasher.digest() != compound.compound_hash:
+            raise CompoundManipulatedException("Total Compound payload hash does not match the saved one in meta.")
+        yield b''
+
+    @property
+    def async_storage(self):
+        # type: () -> AsyncStorageInterface
+        if self._async_storage is None:
+            self._async_storage = AsyncStorageAdapter(self.storage)
+        return self._async_storage
+
+    @async_storage.setter
+    def async_storage(self, async_storage):
+        # type: (Optional[AsyncStorageInterface]) -> None
+        self._async_storage = async_storage
+
+    def loadCompoundAsync(self, name, in_flight=64, blocking=True, timeout=None, progressreporter=None):
+        # type: (str, int, bool, Optional[float], Optional[TqdmUpTo]) -> AsyncGenerator[bytes, None]
+        return self.loadCompoundSnapshotAsync(name, CompoundVersion(None), in_flight, blocking, timeout,
+                                              progressreporter)
+
+    def _check_and_decapsulate_fragment(self, compound, fragment, fragment_data, hasher):
+        # type: (Compound, Fragment, Union[bytes, memoryview], hashlib.sha256) -> bytes
+        """
+        verifies the size and hash of a loaded fragment, decapsulates it and adds the payload to the compound hasher
+        """
+        fragment_size = FragmentSize(len(fragment_data))
+        if fragment_size != fragment.fragment_size:
+            raise FragmentManipulatedException(
+                "downloaded fragment has a not expected size, expected " + str(
+                    fragment.fragment_size) + ' got ' + str(fragment_size))
+        fragment_hash = FragmentHash(hashlib.sha256(fragment_data).digest())
+        if fragment_hash != fragment.fragment_hash:
+            raise FragmentManipulatedException("downloaded fragment has a not expected hash")
+        # not every wrapper can unwrap memoryviews
+        fragment_data = decapsulate(self.compresser, self.wrapper, compound.compression_type,
+                                    compound.wrapping_type,
+                                    bytes(fragment_data))
+        hasher.update(fragment_data)
+        return fragment_data
+
+    async def loadCompoundSnapshotAsync(self, name, version, in_flight=64, blocking=True, timeout=None,
+                                        progressreporter=None):
+        # type: (str, Optional[int], int, bool, Optional[float], Optional[TqdmUpTo]) -> AsyncGenerator[bytes, None]
+        """
+        asyncio version of loadCompoundSnapshot, up to in_flight resources are downloaded through async_storage at the
+        same time.
+
+        The compound and its fragments stay reserved for reading until the generator is exhausted or closed. The
+        reservations and meta lookups run on an own thread of the generator, checking and decapsulating the fragments
+        runs in the default executor of the loop, so the event loop is never blocked by them.
+        """
+        name = CompoundName(name)
+        version = CompoundVersion(version)
+        loop = asyncio.get_running_loop()
+        if version is None and self.pending_objects.getPendingCompoundWithName(name):
+            # pending compounds are read from the fragment cache, the reservations of the sync generator must be taken
+            # and released on the same thread
+            executor = ThreadPoolExecutor(1)
+            sync_gen = self.loadCompoundSnapshot(name, version, blocking, timeout, progressreporter)
+            try:
+                while True:
+                    fragment_data = await loop.run_in_executor(executor, next, sync_gen, None)
+                    if fragment_data is None:
+                        break
+                    if fragment_data:
                         yield fragment_data
+            finally:
+                await loop.run_in_executor(executor, sync_gen.close)
+                executor.shutdown(wait=False)
+            return
+
+        # reservations belong to the thread which took them and may block, they are taken and released on one thread
+        reservation_executor = ThreadPoolExecutor(1, thread_name_prefix='AsyncSnapshotReservations')
+        compound_reserver = ParallelAccessContext(self.reserved_compounds, (name, version), blocking=blocking,
+                                                  timeout=timeout)
+        fragment_reserver = ParallelMassReserver(self.reserved_fragments, blocking=blocking, timeout=timeout)
+        reserved = []  # type: List[bool]
+
+        def reserve():
+            # type: () -> Tuple[Compound, List[Tuple[SequenceIndex, Fragment, Optional[Resource], Optional[FragmentOffset]]]]
+            compound_reserver.__enter__()
+            try:
+                with self.meta:
+                    try:
+                        reserved_compound = self.meta.getCompoundByName(name, version)
+                    except NotExistingException:
+                        raise CompoundNotExistingException("no compound found with name " + repr(name))
+                    # resolve all fragments and their resources with one query
+                    locations = list(self.meta.getSequenceIndexSortedFragmentsWithResourceForCompound(
+                        reserved_compound.compound_id))
+                # the fragments stay reserved until the end, unreserving single fragments would need to track which
+                # coroutine reserved them
+                fragment_reserver.reserveAll(*dict.fromkeys(f.fragment_hash for _, f, _, _ in locations))
+            except BaseException:
+                compound_reserver.__exit__(None, None, None)
+                raise
+            reserved.append(True)
+            return reserved_compound, locations
+
+        def unreserve():
+            # runs after reserve() on the same thread, also if the generator was cancelled while reserving
+            if reserved:
+                try:
+                    fragment_reserver.unreserveAll()
+                finally:
+                    compound_reserver.__exit__(None, None, None)
+
+        downloaded_data = 0
+        hasher = hashlib.sha256()
+        try:
+            compound, fragment_locations = await loop.run_in_executor(reservation_executor, reserve)
+            fragments_data = self.fragment_cache.loadMappedFragmentsAsync(
+                ((f, r, o) for _, f, r, o in fragment_locations), self.async_storage, in_flight=in_flight)
+            try:
+                sorted_fragments = iter(fragment_locations)
+                async for fragment_data in fragments_data:
+                    _, fragment, _, _ = next(sorted_fragments)
+                    fragment_data = await loop.run_in_executor(None, self._check_and_decapsulate_fragment,
+                                                               compound, fragment, fragment_data, hasher)
+                    downloaded_data += len(fragment_data)
+
+                    if progressreporter is not None:
+                        progressreporter.update_to(downloaded_data, tsize=compound.compound_size)
+                    yield fragment_data
+            finally:
+                await fragments_data.aclose()
+        finally:
+            try:
+                await loop.run_in_executor(reservation_executor, unreserve)
+            finally:
+                reservation_executor.shutdown(wait=False)
 
         if hasher.digest() != compound.compound_hash:
             raise CompoundManipulatedException("Total Compound payload hash does not match the saved one in meta.")
-        yield b''
 
     def openReadableCompound(self, name, blocking=True, timeout=None, progressreporter=None):
-        # type: (str, bool, Optional[float], Optional[TqdmUpTo]) -> FileLikeIterator
-        return FileLikeIterator(self.loadCompound(name, blocking, timeout, progressreporter))
+        # type: (str, bool, Optional[float], Optional[TqdmUpTo]) -> ReadableCompound
+        return self.openReadableCompoundSnapshot(name, CompoundVersion(None), blocking, timeout, progressreporter)
+
+    def openReadableCompoundSnapshot(self, name, version, blocking=True, timeout=None, progressreporter=None):
+        # type: (str, Optional[int], bool, Optional[float], Optional[TqdmUpTo]) -> ReadableCompound
+        """
+        opens a seekable file object of the compound, only the fragments covering the read ranges are downloaded.
+        the compound stays reserved for reading until the file object is closed.
+        """
+        return openReadableCompound(meta=self.meta,
+                                    fragment_cache=self.fragment_cache,
+                                    compound_am=self.reserved_compounds,
+                                    fragment_am=self.reserved_fragments,
+                                    wrapper=self.wrapper,
+                                    compresser=self.compresser,
+                                    pending_objects=self.pending_objects,
+                                    name=CompoundName(name),
+                                    version=CompoundVersion(version),
+                                    blocking=blocking,
+                                    timeout=timeout,
+                                    prefetch=self.prefetch_resources,
+                                    progressreporter=progressreporter)
 
     def collectGarbage(self, keep_fragments=True, keep_resources=False, keep_unreferenced_resources=True,
                        blocking=True, timeout=None, progressreporter_fragments=None, progressreporter_resources=None):
@@ -458,16 +772,20 @@ class ImageSaver(object):
             resource_names = [t[0] for t in resources]
             resource_count = len(resources)
             # print(resource_names)
+            deleted_count = 0
             with ExclusiveMassReserver(self.reserved_resources, *resource_names, blocking=blocking,
                                        timeout=timeout) as resource_reserver:
-                for index, name_id in enumerate(resources):
-                    resource_name, resource_id = name_id
-                    self.storage.deleteResource(resource_name)
-                    if resource_id:
-                        self.meta.deleteResourceByID(resource_id)
-                    resource_reserver.unreserveOne(resource_name)
+                for resources_chunk in chunkiterable_gen(resources, self.delete_batch_size, skip_none=True):
+                    if not resources_chunk:
+                        continue
+                    self.storage.deleteResources([resource_name for resource_name, _ in resources_chunk])
+                    for resource_name, resource_id in resources_chunk:
+                        if resource_id:
+                            self.meta.deleteResourceByID(resource_id)
+                        resource_reserver.unreserveOne(resource_name)
+                    deleted_count += len(resources_chunk)
                     if progressreporter_resources is not None:
-                        progressreporter_resources.update_to(index + 1, tsize=resource_count)
+                        progressreporter_resources.update_to(deleted_count, tsize=resource_count)
 
     def optimizeResourceSpace(self, unused_percentage=0.0, blocking=True, timeout=None, progressreporter=None):
         # type: (Optional[float], bool, Optional[float], Optional[TqdmUpTo]) -> None
@@ -486,36 +804,54 @@ class ImageSaver(object):
             resources_fragment_sizes = [(r, f) for r, f in resources_fragment_sizes if
                                         (f / r.resource_payloadsize) < (1.0 - unused_percentage)]
             resources_count = len(resources_fragment_sizes)
-            for index, (resource, fragment_sizes) in enumerate(resources_fragment_sizes):
-                with ExclusiveAccessContext(self.reserved_resources, resource.resource_name, blocking=blocking,
-                                            timeout=timeout):
-                    hole_size = resource.resource_payloadsize - fragment_sizes
-                    if (hole_size / resource.resource_payloadsize) >= unused_percentage:
-                        if progressreporter is not None:
-                            progressreporter.write(
-                                'can optimize Resource ' + resource.resource_name + ', unused space: ' + "{:3.2f}".format(
-                                    ((hole_size / resource.resource_payloadsize) * 100.0)) + ' %')
-                        old_resource_data = self.fragment_cache.loadResource(resource)
-                        new_resource_data = bytes()
-                        fragments_count = 0
-                        fragments_id_offset = []  # type: List[Tuple[FragmentID, FragmentOffset]]
-                        fragments_buffer_size = 0
-                        fragments_on_resource = list(self.meta.getFragmentsWithOffsetOnResource(resource.resource_id))
-                        with ExclusiveMassReserver(self.reserved_fragments,
-                                                   *(f.fragment_hash for f, _ in fragments_on_resource),
-                                                   blocking=blocking, timeout=timeout):
-                            for fragment, offset in fragments_on_resource:
-                                fragment_data = old_resource_data[offset:offset + fragment.fragment_size]
-                                new_resource_data += fragment_data
-                                fragments_count += 1
-                                fragments_id_offset.append(
-                                    (fragment.fragment_id, FragmentOffset(fragments_buffer_size)))
-                                fragments_buffer_size += fragment.fragment_size
-                            # noinspection PyProtectedMember
-                            resource = self.fragment_cache._upload(new_resource_data, fragments_count=fragments_count)
-                            self.meta.makeMultipleFragmentResourceMapping(resource.resource_id, fragments_id_offset)
+            done_count = 0
+            for chunk in chunkiterable_gen(resources_fragment_sizes, self.optimize_batch_size, skip_none=True):
+                if not chunk:
+                    continue
+                with ExclusiveMassReserver(self.reserved_resources, *(r.resource_name for r, _ in chunk),
+                                           blocking=blocking, timeout=timeout):
+                    resources = []  # type: List[Resource]
+                    for resource, fragment_sizes in chunk:
+                        hole_size = resource.resource_payloadsize - fragment_sizes
+                        if (hole_size / resource.resource_payloadsize) >= unused_percentage:
+                            if progressreporter is not None:
+                                progressreporter.write(
+                                    'can optimize Resource ' + resource.resource_name + ', unused space: '
+                                    + "{:3.2f}".format(((hole_size / resource.resource_payloadsize) * 100.0)) + ' %')
+                            resources.append(resource)
+                    if resources:
+                        self._rewriteResources(resources, blocking, timeout)
+                done_count += len(chunk)
                 if progressreporter is not None:
-                    progressreporter.update_to(index + 1, tsize=resources_count)
+                    progressreporter.update_to(done_count, tsize=resources_count)
+
+    def _rewriteResources(self, resources, blocking, timeout):
+        # type: (List[Resource], bool, Optional[float]) -> None
+        """
+        downloads the given resources with one batched call, packs the still mapped fragments of each resource into a
+        new resource and uploads the new resources with one batched call
+        """
+        old_resources_data = self.fragment_cache.loadResources(resources)
+        fragments_on_resources = [list(self.meta.getFragmentsWithOffsetOnResource(r.resource_id)) for r in resources]
+        fragment_hashes = dict.fromkeys(f.fragment_hash for fragments_on_resource in fragments_on_resources
+                                        for f, _ in fragments_on_resource)
+        with ExclusiveMassReserver(self.reserved_fragments, *fragment_hashes, blocking=blocking, timeout=timeout):
+            new_resources = []  # type: List[Tuple[bytes, int]]
+            fragments_id_offsets = []  # type: List[List[Tuple[FragmentID, FragmentOffset]]]
+            for old_resource_data, fragments_on_resource in zip(old_resources_data, fragments_on_resources):
+                new_resource_data = bytes()
+                fragments_id_offset = []  # type: List[Tuple[FragmentID, FragmentOffset]]
+                fragments_buffer_size = 0
+                for fragment, offset in fragments_on_resource:
+                    new_resource_data += old_resource_data[offset:offset + fragment.fragment_size]
+                    fragments_id_offset.append((fragment.fragment_id, FragmentOffset(fragments_buffer_size)))
+                    fragments_buffer_size += fragment.fragment_size
+                new_resources.append((new_resource_data, len(fragments_id_offset)))
+                fragments_id_offsets.append(fragments_id_offset)
+            # noinspection PyProtectedMember
+            uploaded_resources = self.fragment_cache._upload_multiple(new_resources)
+            for resource, fragments_id_offset in zip(uploaded_resources, fragments_id_offsets):
+                self.meta.makeMultipleFragmentResourceMapping(resource.resource_id, fragments_id_offset)
 
     def optimizeResourceUsage(self, fill_percentage=0.9, blocking=True, timeout=None, progressreporter=None):
         # type: (float, bool, Optional[float], Optional[TqdmUpTo]) -> None
@@ -728,9 +1064,9 @@ class ImageSaver(object):
                         progressreporter.update_to(processed_size, tsize=total_compound_size)
 
     def listCompounds(self, type_filter=None, order_alphabetically=False, starting_with=None, ending_with=None,
-                      slash_count=None, min_size=None, include_snapshots=False):
-        # type: (Optional[Union[CompoundType, Iterable[CompoundType]]], bool, Optional[str], Optional[str], Optional[int], Optional[int], bool) -> SizedGenerator[Compound]
-        return self.meta.getAllCompounds(type_filter, order_alphabetically, starting_with, ending_with, slash_count, min_size, include_snapshots)
+                      slash_count=None, min_size=None, include_snapshots=False, parent=None):
+        # type: (Optional[Union[CompoundType, Iterable[CompoundType]]], bool, Optional[str], Optional[str], Optional[int], Optional[int], bool, Optional[CompoundName]) -> SizedGenerator[Compound]
+        return self.meta.getAllCompounds(type_filter, order_alphabetically, starting_with, ending_with, slash_count, min_size, include_snapshots, parent)
 
     def getTotalCompoundSize(self):
         # type: () -> int
@@ -917,6 +1253,135 @@ class ImageSaver(object):
         gen = gen.add_layer(lambda _gen: (f.fragment_size for f in _gen))
         return sum(gen)
 
+    def getStatistics(self):
+        # type: () -> Statistics
+        return self.meta.getStatistics()
+
+    def recomputeStatistics(self):
+        # type: () -> None
+        self.meta.recomputeStatistics()
+
+    def backupMeta(self, name=META_BACKUP_NAME, blocking=True, timeout=None):
+        # type: (str, bool, Optional[float]) -> str
+        """
+        exports the meta and saves the export as a regular compound, so it is deduplicated, wrapped and kept by the
+        garbage collection like every other compound. Manifest compounds list the resources holding the export, the
+        meta is not needed to restore the backup with restoreMeta. Manifests larger than one fragment are listed by
+        another manifest, until the last one fits into one fragment.
+        The resources of a backup may get replaced by resource optimizations, back up the meta again afterwards.
+
+        :return: locator of the last manifest, restoreMeta needs it to find the backup
+        """
+        with tempfile.TemporaryFile() as export:
+            self.meta.exportMeta(export)
+            export.seek(0)
+            self.saveStream(export, name, overwrite=True, blocking=blocking, timeout=timeout)
+        self.flush()
+        compound_name = name
+        level = 0
+        while True:
+            manifest_data = self._meta_backup_manifest(compound_name, level)
+            compound_name = name + '.manifest' + (str(level) if level else '')
+            # manifests are not wrapped, the last one has to be read without knowing the wrapping of the compounds
+            self.saveBytes(manifest_data, compound_name,
+                           chunker=FixedSizeChunker(min(len(manifest_data), self.fragment_cache.resource_size)),
+                           wrap_type=makeWrappingType(PassThroughWrapper),
+                           compress_type=makeCompressingType(ZLibCompressor), overwrite=True, blocking=blocking,
+                           timeout=timeout)
+            self.flush()
+            compound = self.meta.getCompoundByName(CompoundName(compound_name))
+            fragment_locations = list(self.meta.getSequenceIndexSortedFragmentsWithResourceForCompound(
+                compound.compound_id))
+            if len(fragment_locations) == 1:
+                _, fragment, resource, offset = fragment_locations[0]
+                # the resource is read without the meta, its hash and encapsulation are part of the locator. The
+                # resource name comes last, it may contain colons
+                return '{0}:{1}:{2}:{3}:{4}:{5}'.format(offset, fragment.fragment_size, resource.resource_hash.hex(),
+                                                        quote(resource.compression_type, safe=''),
+                                                        quote(resource.wrapping_type, safe=''),
+                                                        resource.resource_name)
+            level += 1
+            if level > 8:
+                raise ValueError('resource size is too small to hold the manifest of the meta backup')
+
+    def _meta_backup_manifest(self, compound_name, level):
+        # type: (str, int) -> bytes
+        compound = self.meta.getCompoundByName(CompoundName(compound_name))
+        resources = {}  # type: Dict[ResourceName, int]
+        manifest = {'format': META_BACKUP_FORMAT,
+                    'created': time.time(),
+                    'level': level,
+                    'compound': [compound.compound_hash.hex(), compound.compound_size, compound.wrapping_type,
+                                 compound.compression_type],
+                    'resources': [],
+                    'fragments': []}
+        for _, fragment, resource, offset in self.meta.getSequenceIndexSortedFragmentsWithResourceForCompound(
+                compound.compound_id):
+            if resource.resource_name not in resources:
+                resources[resource.resource_name] = len(resources)
+                manifest['resources'].append([resource.resource_name, resource.resource_hash.hex(),
+                                              resource.resource_size, resource.resource_payloadsize,
+                                              resource.wrapping_type, resource.compression_type])
+            manifest['fragments'].append([fragment.fragment_hash.hex(), fragment.fragment_size,
+                                          resources[resource.resource_name], offset])
+        return json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+
+    def restoreMeta(self, locator, resume=True):
+        # type: (str, bool) -> None
+        """
+        imports a backup made by backupMeta into the meta
+
+        :param locator: locator of the manifest, returned by backupMeta
+        :param resume: continue an interrupted restore
+        """
+        try:
+            offset, size, resource_hash, compression_type, wrapping_type, resource_name = locator.split(':', 5)
+            offset, size, resource_hash = int(offset), int(size), bytes.fromhex(resource_hash)
+        except ValueError:
+            raise InvalidExportException('invalid backup locator ' + repr(locator))
+        resource_data = self.storage.loadRessource(ResourceName(resource_name))
+        if hashlib.sha256(resource_data).digest() != resource_hash:
+            raise ResourceManipulatedException("resource of the meta backup has a not expected hash")
+        payload = decapsulate(self.compresser, self.wrapper, CompressionType(unquote(compression_type)),
+                              WrappingType(unquote(wrapping_type)), resource_data)
+        manifest_data = decapsulate(self.compresser, self.wrapper, makeCompressingType(ZLibCompressor),
+                                    makeWrappingType(PassThroughWrapper), bytes(payload[offset:offset + size]))
+        while True:
+            try:
+                manifest = json.loads(manifest_data.decode('utf-8'))
+            except ValueError:
+                raise InvalidExportException('locator does not point to a backup manifest')
+            if not isinstance(manifest, dict) or manifest.get('format') != META_BACKUP_FORMAT:
+                raise InvalidExportException('locator does not point to a backup manifest')
+            if manifest['level'] == 0:
+                break
+            manifest_data = b''.join(self._load_meta_backup(manifest))
+        export = io.BufferedReader(FileLikeIterator(self._load_meta_backup(manifest)))
+        self.meta.importMeta(export, resume=resume)
+
+    def _load_meta_backup(self, manifest):
+        # type: (dict) -> Generator[bytes, None, None]
+        _, _, wrapping_type, compression_type = manifest['compound']
+        resources = [Resource(ResourceName(name), ResourceSize(resource_size),
+                              ResourcePayloadSize(resource_payloadsize), ResourceHash(bytes.fromhex(resource_hash)),
+                              ResourceWrappingType(resource_wrapping_type),
+                              ResourceCompressionType(resource_compression_type))
+                     for (name, resource_hash, resource_size, resource_payloadsize, resource_wrapping_type,
+                          resource_compression_type) in manifest['resources']]
+        loaded_index = None
+        resource_payload = b''
+        for fragment_hash, fragment_size, resource_index, offset in manifest['fragments']:
+            # fragments of one resource follow each other, every resource is downloaded once
+            if resource_index != loaded_index:
+                resource_payload = self.fragment_cache.loadResource(resources[resource_index])
+                loaded_index = resource_index
+            fragment_data = bytes(resource_payload[offset:offset + fragment_size])
+            if hashlib.sha256(fragment_data).hexdigest() != fragment_hash:
+                raise FragmentManipulatedException("fragment of the meta backup has a not expected hash")
+            data = decapsulate(self.compresser, self.wrapper, compression_type, wrapping_type, fragment_data)
+            if data:
+                yield data
+
     def getAllCompoundsWithNoFragmentLink(self):
         # type: () -> SizedGenerator[Compound]
         return self.meta.getAllCompoundsWithNoFragmentLink()
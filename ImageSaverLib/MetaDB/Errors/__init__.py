@@ -4,3 +4,7 @@ class AlreadyExistsException(Exception):
 
 class NotExistingException(Exception):
     pass
+
+
+class InvalidExportException(Exception):
+    pass
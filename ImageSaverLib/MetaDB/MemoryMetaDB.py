@@ -0,0 +1,963 @@
+import os
+import pickle
+from array import array
+from collections import Counter
+from threading import RLock
+from typing import Dict, List, Tuple, Optional, Iterable, Callable, Any, Union
+
+from ImageSaverLib.Encapsulation import CompressionType, WrappingType
+from ImageSaverLib.Helpers.SizedGenerator import SizedGenerator
+from ImageSaverLib.MetaDB.Errors import NotExistingException, AlreadyExistsException
+from ImageSaverLib.MetaDB.MetaDB import MetaDBInterface
+from ImageSaverLib.MetaDB.Types.Compound import (Compound, CompoundName, CompoundID, CompoundType, CompoundHash,
+                                                 CompoundSize, CompoundWrappingType, CompoundCompressionType,
+                                                 CompoundVersion, compoundParent)
+from ImageSaverLib.MetaDB.Types.CompoundFragmentMapping import SequenceIndex
+from ImageSaverLib.MetaDB.Types.Fragment import Fragment, FragmentID, FragmentHash, FragmentSize, FragmentPayloadSize
+from ImageSaverLib.MetaDB.Types.FragmentPlaintextMapping import PlaintextHash
+from ImageSaverLib.MetaDB.Types.FragmentResourceMapping import FragmentOffset
+from ImageSaverLib.MetaDB.Types.Resource import (Resource, ResourceName, ResourceID, ResourceHash, ResourceSize,
+                                                 ResourcePayloadSize, ResourceWrappingType, ResourceCompressionType)
+from ImageSaverLib.MetaDB.Types.Statistic import (Statistics, StatisticName, typedStatisticName, COMPOUND_COUNT,
+                                                  SNAPSHOT_COUNT, COMPOUND_SIZE, UNIQUE_COMPOUND_COUNT,
+                                                  UNIQUE_COMPOUND_SIZE, FRAGMENT_COUNT, FRAGMENT_SIZE,
+                                                  DUPLICATE_FRAGMENT_COUNT, DUPLICATE_FRAGMENT_SAVED_SIZE,
+                                                  UNNEEDED_FRAGMENT_COUNT, UNNEEDED_FRAGMENT_SIZE, RESOURCE_COUNT,
+                                                  RESOURCE_SIZE)
+
+PlaintextKey = Tuple[PlaintextHash, CompressionType, WrappingType]
+
+
+class _FragmentRow(object):
+    __slots__ = ('fragment_id', 'fragment_hash', 'fragment_size', 'fragment_payload_size', 'resource_id',
+                 'fragment_offset')
+
+    def __init__(self, fragment_id, fragment_hash, fragment_size, fragment_payload_size):
+        # type: (FragmentID, FragmentHash, FragmentSize, FragmentPayloadSize) -> None
+        self.fragment_id = fragment_id
+        self.fragment_hash = fragment_hash
+        self.fragment_size = fragment_size
+        self.fragment_payload_size = fragment_payload_size
+        # a fragment is stored on at most one resource
+        self.resource_id = None  # type: Optional[ResourceID]
+        self.fragment_offset = None  # type: Optional[FragmentOffset]
+
+    def model(self):
+        # type: () -> Fragment
+        fragment = Fragment(self.fragment_hash, self.fragment_size, self.fragment_payload_size)
+        fragment.fragment_id = self.fragment_id
+        return fragment
+
+
+class _ResourceRow(object):
+    __slots__ = ('resource_id', 'resource_name', 'resource_size', 'resource_payloadsize', 'resource_hash',
+                 'wrapping_type', 'compression_type')
+
+    def __init__(self, resource_id, resource_name, resource_size, resource_payloadsize, resource_hash,
+                 wrapping_type, compression_type):
+        # type: (ResourceID, ResourceName, ResourceSize, ResourcePayloadSize, ResourceHash, ResourceWrappingType, ResourceCompressionType) -> None
+        self.resource_id = resource_id
+        self.resource_name = resource_name
+        self.resource_size = resource_size
+        self.resource_payloadsize = resource_payloadsize
+        self.resource_hash = resource_hash
+        self.wrapping_type = wrapping_type
+        self.compression_type = compression_type
+
+    def model(self):
+        # type: () -> Resource
+        resource = Resource(self.resource_name, self.resource_size, self.resource_payloadsize, self.resource_hash,
+                            self.wrapping_type, self.compression_type)
+        resource.resource_id = self.resource_id
+        return resource
+
+
+class _CompoundRow(object):
+    __slots__ = ('compound_id', 'compound_name', 'compound_type', 'compound_hash', 'compound_size', 'wrapping_type',
+                 'compression_type', 'compound_version', 'sequence_indexes', 'fragment_ids')
+
+    def __init__(self, compound_id, compound_name, compound_type, compound_hash, compound_size, wrapping_type,
+                 compression_type, compound_version):
+        # type: (CompoundID, CompoundName, CompoundType, CompoundHash, CompoundSize, CompoundWrappingType, CompoundCompressionType, CompoundVersion) -> None
+        self.compound_id = compound_id
+        self.compound_name = compound_name
+        self.compound_type = compound_type
+        self.compound_hash = compound_hash
+        self.compound_size = compound_size
+        self.wrapping_type = wrapping_type
+        self.compression_type = compression_type
+        self.compound_version = compound_version
+        # the fragment mapping, both arrays are sorted by sequence index
+        self.sequence_indexes = array('q')
+        self.fragment_ids = array('q')
+
+    def model(self):
+        # type: () -> Compound
+        compound = Compound(self.compound_name, self.compound_type, self.compound_hash, self.compound_size,
+                            self.wrapping_type, self.compression_type, self.compound_version)
+        compound.compound_id = self.compound_id
+        return compound
+
+    def update(self, compound_type, compound_hash, compound_size, wrapping_type, compression_type):
+        # type: (CompoundType, CompoundHash, CompoundSize, CompoundWrappingType, CompoundCompressionType) -> None
+        self.compound_type = compound_type
+        self.compound_hash = compound_hash
+        self.compound_size = compound_size
+        self.wrapping_type = wrapping_type
+        self.compression_type = compression_type
+
+
+def _sized(rows, convert):
+    # type: (List[Any], Callable[[Any], Any]) -> SizedGenerator
+    return SizedGenerator((convert(row) for row in rows), len(rows))
+
+
+class MemoryMetaDB(MetaDBInterface):
+    """
+    MetaDB, which keeps all objects in plain python dicts and arrays instead of a database.
+
+    Every table is a dict of slotted rows by id, all lookups go through hash, name and parent indexes, the fragment
+    mapping of a compound is kept as array of fragment ids. Model objects are only created for returned values, the
+    ORM is not involved in any query. All methods are serialized by one lock.
+
+    The whole meta can be snapshotted into a file, which gets loaded again on construction and written on close.
+    """
+
+    # attributes, which make up the snapshot
+    _STATE = ('_last_ids', '_fragments', '_fragment_ids', '_fragment_usages', '_plaintexts', '_resources',
+              '_resource_ids_by_name', '_resource_ids_by_hash', '_resource_fragments', '_compounds',
+              '_compound_ids_by_name', '_compound_ids_by_hash', '_compound_ids_by_parent')
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, snapshot_path=None):
+        # type: (Optional[str]) -> None
+        """
+        :param snapshot_path: file to load the meta from, if it exists, and to save the meta into on close
+        """
+        MetaDBInterface.__init__(self)
+        self.snapshot_path = snapshot_path
+        self._lock = RLock()
+        self._last_ids = Counter()  # type: Dict[str, int]
+        self._fragments = {}  # type: Dict[FragmentID, _FragmentRow]
+        self._fragment_ids = {}  # type: Dict[FragmentHash, FragmentID]
+        # number of mappings of every fragment, counting snapshots too
+        self._fragment_usages = Counter()  # type: Dict[FragmentID, int]
+        # may still point to deleted fragments, fragment ids are never reused
+        self._plaintexts = {}  # type: Dict[PlaintextKey, FragmentID]
+        self._resources = {}  # type: Dict[ResourceID, _ResourceRow]
+        self._resource_ids_by_name = {}  # type: Dict[ResourceName, ResourceID]
+        self._resource_ids_by_hash = {}  # type: Dict[ResourceHash, ResourceID]
+        # dicts are used as insertion ordered sets
+        self._resource_fragments = {}  # type: Dict[ResourceID, Dict[FragmentID, None]]
+        self._compounds = {}  # type: Dict[CompoundID, _CompoundRow]
+        self._compound_ids_by_name = {}  # type: Dict[CompoundName, Dict[CompoundVersion, CompoundID]]
+        self._compound_ids_by_hash = {}  # type: Dict[CompoundHash, Dict[CompoundID, None]]
+        self._compound_ids_by_parent = {}  # type: Dict[Optional[CompoundName], Dict[CompoundID, None]]
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.loadSnapshot(snapshot_path)
+
+    def close(self):
+        if self.snapshot_path:
+            self.saveSnapshot(self.snapshot_path)
+
+    # region Snapshots
+
+    def saveSnapshot(self, path):
+        # type: (str) -> None
+        """
+        writes all objects into the given file, the file gets replaced atomically
+        """
+        with self._lock:
+            state = {name: getattr(self, name) for name in self._STATE}
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((self.SNAPSHOT_VERSION, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+
+    def loadSnapshot(self, path):
+        # type: (str) -> None
+        """
+        replaces all objects with the ones of the given snapshot file
+        """
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != self.SNAPSHOT_VERSION:
+            raise ValueError('unsupported snapshot version ' + repr(version))
+        with self._lock:
+            for name in self._STATE:
+                setattr(self, name, state[name])
+
+    # endregion
+
+    # region Row Helpers
+
+    def _next_id(self, table):
+        # type: (str) -> int
+        self._last_ids[table] += 1
+        return self._last_ids[table]
+
+    def _fragment_row(self, fragment_id):
+        # type: (FragmentID) -> _FragmentRow
+        try:
+            return self._fragments[fragment_id]
+        except KeyError:
+            raise NotExistingException('no fragment found with id ' + repr(fragment_id))
+
+    def _fragment_row_by_hash(self, fragment_hash):
+        # type: (FragmentHash) -> _FragmentRow
+        try:
+            return self._fragments[self._fragment_ids[fragment_hash]]
+        except KeyError:
+            raise NotExistingException('no fragment known for fragment hash')
+
+    def _resource_row(self, resource_id):
+        # type: (ResourceID) -> _ResourceRow
+        try:
+            return self._resources[resource_id]
+        except KeyError:
+            raise NotExistingException('no resource found with id ' + repr(resource_id))
+
+    def _resource_row_by_name(self, resource_name):
+        # type: (ResourceName) -> _ResourceRow
+        try:
+            return self._resources[self._resource_ids_by_name[resource_name]]
+        except KeyError:
+            raise NotExistingException('no resource found with name ' + resource_name)
+
+    def _compound_row(self, compound_name, compound_version=CompoundVersion(None)):
+        # type: (CompoundName, CompoundVersion) -> _CompoundRow
+        try:
+            return self._compounds[self._compound_ids_by_name[compound_name][compound_version]]
+        except KeyError:
+            raise NotExistingException('no compound found with name ' + compound_name)
+
+    def _compound_rows_by_hash(self, compound_hash, compound_version=CompoundVersion(None)):
+        # type: (CompoundHash, CompoundVersion) -> List[_CompoundRow]
+        return [row for row in (self._compounds[compound_id] for compound_id in
+                                self._compound_ids_by_hash.get(compound_hash, ()))
+                if row.compound_version == compound_version]
+
+    def _create_fragment(self, fragment_hash, fragment_size, fragment_payload_size):
+        # type: (FragmentHash, FragmentSize, FragmentPayloadSize) -> _FragmentRow
+        row = _FragmentRow(FragmentID(self._next_id('fragments')), fragment_hash, fragment_size,
+                           fragment_payload_size)
+        self._fragments[row.fragment_id] = row
+        self._fragment_ids[fragment_hash] = row.fragment_id
+        return row
+
+    def _delete_fragment(self, row):
+        # type: (_FragmentRow) -> None
+        self._unmap_fragment(row)
+        if self._fragment_usages.pop(row.fragment_id, 0):
+            # rarely the case, only the compound arrays know about their fragments
+            for compound in self._compounds.values():
+                if row.fragment_id in compound.fragment_ids:
+                    self._set_compound_fragments(compound, [(f, s) for f, s in
+                                                            zip(compound.fragment_ids, compound.sequence_indexes)
+                                                            if f != row.fragment_id])
+        del self._fragments[row.fragment_id]
+        del self._fragment_ids[row.fragment_hash]
+
+    def _map_fragment(self, row, resource_id, fragment_offset):
+        # type: (_FragmentRow, ResourceID, FragmentOffset) -> None
+        self._unmap_fragment(row)
+        row.resource_id = resource_id
+        row.fragment_offset = fragment_offset
+        self._resource_fragments.setdefault(resource_id, {})[row.fragment_id] = None
+
+    def _unmap_fragment(self, row):
+        # type: (_FragmentRow) -> None
+        if row.resource_id is not None:
+            fragment_ids = self._resource_fragments[row.resource_id]
+            del fragment_ids[row.fragment_id]
+            if not fragment_ids:
+                del self._resource_fragments[row.resource_id]
+        row.resource_id = None
+        row.fragment_offset = None
+
+    def _create_resource(self, resource_name, resource_size, resource_payloadsize, resource_hash, wrapping_type,
+                         compression_type):
+        # type: (ResourceName, ResourceSize, ResourcePayloadSize, ResourceHash, ResourceWrappingType, ResourceCompressionType) -> _ResourceRow
+        if resource_name in self._resource_ids_by_name or resource_hash in self._resource_ids_by_hash:
+            raise AlreadyExistsException('cannot create new model Resource by ' + repr(resource_name))
+        row = _ResourceRow(ResourceID(self._next_id('resources')), resource_name, resource_size, resource_payloadsize,
+                           resource_hash, wrapping_type, compression_type)
+        self._resources[row.resource_id] = row
+        self._resource_ids_by_name[resource_name] = row.resource_id
+        self._resource_ids_by_hash[resource_hash] = row.resource_id
+        return row
+
+    def _delete_resource(self, row):
+        # type: (_ResourceRow) -> None
+        for fragment_id in list(self._resource_fragments.get(row.resource_id, ())):
+            self._unmap_fragment(self._fragments[fragment_id])
+        del self._resources[row.resource_id]
+        del self._resource_ids_by_name[row.resource_name]
+        del self._resource_ids_by_hash[row.resource_hash]
+
+    def _create_compound(self, compound_name, compound_type, compound_hash, compound_size, wrapping_type,
+                         compression_type, compound_version):
+        # type: (CompoundName, CompoundType, CompoundHash, CompoundSize, CompoundWrappingType, CompoundCompressionType, CompoundVersion) -> _CompoundRow
+        versions = self._compound_ids_by_name.setdefault(compound_name, {})
+        if compound_version in versions:
+            raise AlreadyExistsException('cannot create new model Compound by ' + repr(compound_name))
+        row = _CompoundRow(CompoundID(self._next_id('compounds')), compound_name, compound_type, compound_hash,
+                           compound_size, wrapping_type, compression_type, compound_version)
+        self._compounds[row.compound_id] = row
+        versions[compound_version] = row.compound_id
+        self._compound_ids_by_hash.setdefault(compound_hash, {})[row.compound_id] = None
+        self._compound_ids_by_parent.setdefault(compoundParent(compound_name), {})[row.compound_id] = None
+        return row
+
+    def _delete_compound(self, row):
+        # type: (_CompoundRow) -> None
+        self._set_compound_fragments(row, ())
+        del self._compounds[row.compound_id]
+        self._remove_index(self._compound_ids_by_name, row.compound_name, row.compound_version)
+        self._remove_index(self._compound_ids_by_hash, row.compound_hash, row.compound_id)
+        self._remove_index(self._compound_ids_by_parent, compoundParent(row.compound_name), row.compound_id)
+
+    def _update_compound(self, row, compound_type, compound_hash, compound_size, wrapping_type, compression_type):
+        # type: (_CompoundRow, CompoundType, CompoundHash, CompoundSize, CompoundWrappingType, CompoundCompressionType) -> None
+        self._remove_index(self._compound_ids_by_hash, row.compound_hash, row.compound_id)
+        row.update(compound_type, compound_hash, compound_size, wrapping_type, compression_type)
+        self._compound_ids_by_hash.setdefault(compound_hash, {})[row.compound_id] = None
+
+    def _set_compound_fragments(self, row, fragment_id_sequence_index):
+        # type: (_CompoundRow, Iterable[Tuple[FragmentID, SequenceIndex]]) -> None
+        usages = self._fragment_usages
+        for fragment_id in row.fragment_ids:
+            usages[fragment_id] -= 1
+            if not usages[fragment_id]:
+                del usages[fragment_id]
+        mapping = sorted(fragment_id_sequence_index, key=lambda t: t[1])
+        row.fragment_ids = array('q', (fragment_id for fragment_id, _ in mapping))
+        row.sequence_indexes = array('q', (sequence_index for _, sequence_index in mapping))
+        usages.update(row.fragment_ids)
+
+    @staticmethod
+    def _remove_index(index, key, value):
+        # type: (Dict[Any, Dict[Any, Any]], Any, Any) -> None
+        values = index[key]
+        del values[value]
+        if not values:
+            del index[key]
+
+    def _live_fragment_usages(self):
+        # type: () -> Counter
+        usages = Counter()
+        for row in self._compounds.values():
+            if row.compound_version is None:
+                usages.update(row.fragment_ids)
+        return usages
+
+    # endregion
+
+    def getCompoundByName(self, compound_name, compound_version=CompoundVersion(None)):
+        with self._lock:
+            return self._compound_row(compound_name, compound_version).model()
+
+    def getCompoundByHash(self, compound_hash, compound_version=CompoundVersion(None)):
+        with self._lock:
+            rows = self._compound_rows_by_hash(compound_hash, compound_version)
+            if not rows:
+                raise NotExistingException('no compound found with hash ' + repr(compound_hash))
+            return rows[0].model()
+
+    def makeFragment(self, fragment_hash, fragment_size, fragment_payload_size):
+        with self._lock:
+            fragment_id = self._fragment_ids.get(fragment_hash)
+            if fragment_id is None:
+                return self._create_fragment(fragment_hash, fragment_size, fragment_payload_size).model()
+            row = self._fragments[fragment_id]
+            if (row.fragment_size, row.fragment_payload_size) != (fragment_size, fragment_payload_size):
+                raise AlreadyExistsException('cannot create new model Fragment by ' + repr(fragment_hash))
+            return row.model()
+
+    def hasFragmentByPayloadHash(self, fragment_hash):
+        with self._lock:
+            return fragment_hash in self._fragment_ids
+
+    def getFragmentByPayloadHash(self, fragment_hash):
+        with self._lock:
+            return self._fragment_row_by_hash(fragment_hash).model()
+
+    def getFragmentByPlaintextHash(self, plaintext_hash, compression_type, wrapping_type):
+        with self._lock:
+            row = self._fragments.get(self._plaintexts.get((plaintext_hash, compression_type, wrapping_type)))
+            if row is None:
+                raise NotExistingException('no fragment known for plaintext hash')
+            return row.model()
+
+    def getFragmentsByPlaintextHashes(self, plaintext_hashes, compression_type, wrapping_type):
+        with self._lock:
+            fragments = {}
+            for plaintext_hash in plaintext_hashes:
+                row = self._fragments.get(self._plaintexts.get((plaintext_hash, compression_type, wrapping_type)))
+                if row is not None:
+                    fragments[plaintext_hash] = row.model()
+            return fragments
+
+    def addFragmentPlaintextHashes(self, plaintext_hashes):
+        with self._lock:
+            for fragment_hash, plaintext_hash, compression_type, wrapping_type in plaintext_hashes:
+                fragment_id = self._fragment_ids.get(fragment_hash)
+                if fragment_id is None:
+                    continue
+                key = (plaintext_hash, compression_type, wrapping_type)
+                if self._plaintexts.get(key) in self._fragments:
+                    continue
+                self._plaintexts[key] = fragment_id
+
+    def makeResource(self, resource_name, resource_size, resource_payloadsize, resource_hash, wrap_type, compress_type):
+        with self._lock:
+            resource_id = self._resource_ids_by_name.get(resource_name)
+            if resource_id is not None:
+                row = self._resources[resource_id]
+                if (row.resource_size, row.resource_payloadsize, row.resource_hash, row.wrapping_type,
+                        row.compression_type) == (resource_size, resource_payloadsize, resource_hash, wrap_type,
+                                                  compress_type):
+                    return row.model()
+            return self._create_resource(resource_name, resource_size, resource_payloadsize, resource_hash, wrap_type,
+                                         compress_type).model()
+
+    def setFragmentsMappingForCompound(self, compound_id, fragment_id_sequence_index):
+        with self._lock:
+            try:
+                row = self._compounds[compound_id]
+            except KeyError:
+                raise NotExistingException('no compound found with id ' + repr(compound_id))
+            self._set_compound_fragments(row, list(fragment_id_sequence_index))
+
+    def makeCompound(self, name, compound_type, compound_hash, compound_size, wrapping_type, compression_type):
+        with self._lock:
+            compound_id = self._compound_ids_by_name.get(name, {}).get(None)
+            if compound_id is not None:
+                row = self._compounds[compound_id]
+                if (row.compound_type, row.compound_hash, row.compound_size, row.wrapping_type,
+                        row.compression_type) == (compound_type, compound_hash, compound_size, wrapping_type,
+                                                  compression_type):
+                    return row.model()
+            return self._create_compound(name, compound_type, compound_hash, compound_size, wrapping_type,
+                                         compression_type, CompoundVersion(None)).model()
+
+    def makeSnapshottedCompound(self, compound):
+        with self._lock:
+            versions = [v for v in self._compound_ids_by_name.get(compound.compound_name, ()) if v is not None]
+            snapshot_version = CompoundVersion(max(versions) + 1 if versions else 1)
+            return self._create_compound(compound.compound_name, compound.compound_type, compound.compound_hash,
+                                         compound.compound_size, compound.wrapping_type, compound.compression_type,
+                                         snapshot_version).model()
+
+    def updateCompound(self, name, compound_type, compound_hash, compound_size, wrapping_type, compression_type):
+        with self._lock:
+            row = self._compound_row(name)
+            self._update_compound(row, compound_type, compound_hash, compound_size, wrapping_type, compression_type)
+            return row.model()
+
+    def hasCompoundWithName(self, name, version=CompoundVersion(None)):
+        with self._lock:
+            return version in self._compound_ids_by_name.get(name, ())
+
+    def hasCompoundWithHash(self, compound_hash, compound_version=CompoundVersion(None)):
+        with self._lock:
+            return len(self._compound_rows_by_hash(compound_hash, compound_version)) > 0
+
+    def _compound_mapping(self, compound_id):
+        # type: (CompoundID) -> List[Tuple[SequenceIndex, _FragmentRow]]
+        row = self._compounds.get(compound_id)
+        if row is None:
+            return []
+        return [(SequenceIndex(sequence_index), self._fragments[fragment_id])
+                for sequence_index, fragment_id in zip(row.sequence_indexes, row.fragment_ids)]
+
+    def getSequenceIndexSortedFragmentsForCompound(self, compound_id):
+        with self._lock:
+            return _sized(self._compound_mapping(compound_id), lambda t: (t[0], t[1].model()))
+
+    def getSequenceIndexSortedFragmentsWithResourceForCompound(self, compound_id):
+        with self._lock:
+            rows = [(sequence_index, fragment, self._resources.get(fragment.resource_id))
+                    for sequence_index, fragment in self._compound_mapping(compound_id)]
+        return _sized(rows, lambda t: (t[0], t[1].model(), t[2] and t[2].model(),
+                                       t[1].fragment_offset if t[2] else None))
+
+    def getFragmentHashesNeededForCompound(self, compound_id):
+        with self._lock:
+            return _sized(self._compound_mapping(compound_id), lambda t: t[1].fragment_hash)
+
+    @staticmethod
+    def _compound_filter(type_filter=None, starting_with=None, ending_with=None, slash_count=None, min_size=None,
+                         include_snapshots=False):
+        # type: (Optional[Union[CompoundType, Iterable[CompoundType]]], Optional[str], Optional[str], Optional[int], Optional[int], bool) -> Callable[[_CompoundRow], bool]
+        if slash_count is not None and slash_count < 0:
+            raise ValueError("only 0 or positive numbers allowed")
+        if min_size is not None and min_size < 0:
+            raise ValueError('negative minimum file size')
+        if type_filter and isinstance(type_filter, str):
+            type_filter = (type_filter,)
+        elif type_filter:
+            type_filter = set(type_filter)
+
+        def accepts(row):
+            # type: (_CompoundRow) -> bool
+            name = row.compound_name
+            if not include_snapshots and row.compound_version is not None:
+                return False
+            if type_filter and row.compound_type not in type_filter:
+                return False
+            if starting_with and not name.startswith(starting_with):
+                return False
+            if ending_with and not name.endswith(ending_with):
+                return False
+            if slash_count is not None:
+                if slash_count == 0 and name != '':
+                    return False
+                if slash_count > 0 and (not name.startswith('/') or name.count('/') != slash_count):
+                    return False
+            if min_size is not None and row.compound_size < min_size:
+                return False
+            return True
+
+        return accepts
+
+    def getAllCompounds(self, type_filter=None, order_alphabetically=False, starting_with=None, ending_with=None,
+                        slash_count=None, min_size=None, include_snapshots=False, parent=None):
+        accepts = self._compound_filter(type_filter, starting_with, ending_with, slash_count, min_size,
+                                        include_snapshots)
+        with self._lock:
+            if parent is not None:
+                candidates = (self._compounds[compound_id] for compound_id in
+                              self._compound_ids_by_parent.get(parent, ()))
+            else:
+                candidates = self._compounds.values()
+            rows = sorted((row for row in candidates if accepts(row)), key=lambda r: r.compound_id)
+        if order_alphabetically:
+            rows.sort(key=lambda r: (r.compound_name.lower(), r.compound_version is not None,
+                                     r.compound_version or 0))
+        return _sized(rows, _CompoundRow.model)
+
+    def getAllCompoundsSizeSum(self, type_filter=None, starting_with=None, ending_with=None, slash_count=None,
+                               min_size=None):
+        accepts = self._compound_filter(type_filter, starting_with, ending_with, slash_count, min_size)
+        with self._lock:
+            return sum(row.compound_size for row in self._compounds.values() if accepts(row))
+
+    def getAllCompoundNames(self):
+        with self._lock:
+            rows = [row for row in self._compounds.values() if row.compound_version is None]
+        return _sized(rows, lambda r: r.compound_name)
+
+    def getAllCompoundNamesWithVersion(self, include_snapshots=False):
+        with self._lock:
+            rows = [row for row in self._compounds.values() if include_snapshots or row.compound_version is None]
+        return _sized(rows, lambda r: (r.compound_name, r.compound_version))
+
+    def getTotalCompoundSize(self):
+        return self.getStatistics().getTotalCompoundSize()
+
+    def getTotalCompoundCount(self, with_type=None):
+        return self.getStatistics().getTotalCompoundCount(with_type)
+
+    def getSnapshotCount(self, with_type=None):
+        return self.getStatistics().getSnapshotCount(with_type)
+
+    def getUniqueCompoundSize(self):
+        return self.getStatistics().getUniqueCompoundSize()
+
+    def getUniqueCompoundCount(self):
+        return self.getStatistics().getUniqueCompoundCount()
+
+    def getTotalFragmentSize(self):
+        with self._lock:
+            return sum(row.fragment_size for row in self._fragments.values())
+
+    def getTotalFragmentCount(self):
+        with self._lock:
+            return len(self._fragments)
+
+    def getTotalResourceSize(self):
+        with self._lock:
+            return sum(row.resource_size for row in self._resources.values())
+
+    def getTotalResourceCount(self):
+        with self._lock:
+            return len(self._resources)
+
+    def removeCompound(self, compound_id):
+        with self._lock:
+            row = self._compounds.get(compound_id)
+            if row is not None:
+                self._delete_compound(row)
+
+    def renameCompound(self, old_name, new_name):
+        with self._lock:
+            versions = self._compound_ids_by_name.get(old_name)
+            if not versions:
+                raise NotExistingException('no compound found with name ' + old_name)
+            if old_name == new_name:
+                return
+            if new_name in self._compound_ids_by_name and set(versions) & set(self._compound_ids_by_name[new_name]):
+                raise AlreadyExistsException('a compound with name ' + new_name + ' already exists')
+            new_versions = self._compound_ids_by_name.setdefault(new_name, {})
+            for version, compound_id in list(versions.items()):
+                self._remove_index(self._compound_ids_by_parent, compoundParent(old_name), compound_id)
+                self._compound_ids_by_parent.setdefault(compoundParent(new_name), {})[compound_id] = None
+                self._compounds[compound_id].compound_name = new_name
+                new_versions[version] = compound_id
+            del self._compound_ids_by_name[old_name]
+
+    def _rename_resource(self, old_resource_name, new_resource_name):
+        # type: (ResourceName, ResourceName) -> None
+        row = self._resource_row_by_name(old_resource_name)
+        if old_resource_name == new_resource_name:
+            return
+        if new_resource_name in self._resource_ids_by_name:
+            raise AlreadyExistsException('a resource with name ' + new_resource_name + ' already exists')
+        del self._resource_ids_by_name[old_resource_name]
+        row.resource_name = new_resource_name
+        self._resource_ids_by_name[new_resource_name] = row.resource_id
+
+    def renameResource(self, old_resource_name, new_resource_name):
+        with self._lock:
+            self._rename_resource(old_resource_name, new_resource_name)
+
+    def massRenameResource(self, old_new_resource_name_pairs, skip_unknown=False):
+        with self._lock:
+            for old_resource_name, new_resource_name in old_new_resource_name_pairs:
+                if skip_unknown and old_resource_name not in self._resource_ids_by_name:
+                    continue
+                self._rename_resource(old_resource_name, new_resource_name)
+
+    def collectGarbage(self, keep_fragments=False, keep_resources=True):
+        with self._lock:
+            if not keep_fragments:
+                for row in [row for row in self._fragments.values() if not self._fragment_usages[row.fragment_id]]:
+                    self._delete_fragment(row)
+            if not keep_resources:
+                for row in [row for row in self._resources.values()
+                            if row.resource_id not in self._resource_fragments]:
+                    self._delete_resource(row)
+
+    def _unneeded_fragment_rows(self):
+        # type: () -> List[_FragmentRow]
+        return [row for row in self._fragments.values() if not self._fragment_usages[row.fragment_id]]
+
+    def getUnneededFragments(self):
+        with self._lock:
+            return _sized(self._unneeded_fragment_rows(), _FragmentRow.model)
+
+    def getUnneededFragmentHashes(self):
+        with self._lock:
+            return _sized(self._unneeded_fragment_rows(), lambda r: r.fragment_hash)
+
+    def deleteResourceByID(self, resource_id):
+        with self._lock:
+            row = self._resources.get(resource_id)
+            if row is not None:
+                self._delete_resource(row)
+
+    def deleteResourceByName(self, resource_name):
+        with self._lock:
+            resource_id = self._resource_ids_by_name.get(resource_name)
+            if resource_id is not None:
+                self._delete_resource(self._resources[resource_id])
+
+    def getResourceForFragment(self, fragment_id):
+        return self.getResourceOffsetForFragment(fragment_id)[0]
+
+    def truncateAllCompounds(self):
+        with self._lock:
+            for row in list(self._compounds.values()):
+                self._delete_compound(row)
+
+    def getDuplicateFragmentsCount(self):
+        return self.getStatistics().getDuplicateFragmentsCount()
+
+    def getSavedBytesByDuplicateFragments(self):
+        return self.getStatistics().getSavedBytesByDuplicateFragments()
+
+    def getMultipleUsedCompoundsCount(self, compound_type=None):
+        return self.getStatistics().getMultipleUsedCompoundsCount(compound_type)
+
+    def getSavedBytesByMultipleUsedCompounds(self):
+        with self._lock:
+            hash_sizes = Counter((row.compound_hash, row.compound_size) for row in self._compounds.values()
+                                 if row.compound_version is None)
+        return sum(size * (count - 1) for (_, size), count in hash_sizes.items())
+
+    def getStatistics(self):
+        """
+        aggregates the statistics over all stored objects, there are no counters to maintain for in memory objects
+        """
+        values = Counter()  # type: Dict[StatisticName, int]
+        with self._lock:
+            unique_compounds = set()
+            unique_typed_compounds = set()
+            for row in self._compounds.values():
+                if row.compound_version is None:
+                    values[typedStatisticName(COMPOUND_COUNT, row.compound_type)] += 1
+                    values[COMPOUND_SIZE] += row.compound_size
+                    unique_compounds.add((row.compound_hash, row.compound_size))
+                    unique_typed_compounds.add((row.compound_hash, row.compound_type))
+                else:
+                    values[typedStatisticName(SNAPSHOT_COUNT, row.compound_type)] += 1
+            values[UNIQUE_COMPOUND_COUNT] = len(set(compound_hash for compound_hash, _ in unique_compounds))
+            values[UNIQUE_COMPOUND_SIZE] = sum(size for _, size in unique_compounds)
+            for _, compound_type in unique_typed_compounds:
+                values[typedStatisticName(UNIQUE_COMPOUND_COUNT, compound_type)] += 1
+            live_usages = self._live_fragment_usages()
+            for row in self._fragments.values():
+                values[FRAGMENT_COUNT] += 1
+                values[FRAGMENT_SIZE] += row.fragment_size
+                if live_usages[row.fragment_id] > 1:
+                    values[DUPLICATE_FRAGMENT_COUNT] += 1
+                    values[DUPLICATE_FRAGMENT_SAVED_SIZE] += row.fragment_size * (live_usages[row.fragment_id] - 1)
+                if not self._fragment_usages[row.fragment_id]:
+                    values[UNNEEDED_FRAGMENT_COUNT] += 1
+                    values[UNNEEDED_FRAGMENT_SIZE] += row.fragment_size
+            for row in self._resources.values():
+                values[RESOURCE_COUNT] += 1
+                values[RESOURCE_SIZE] += row.resource_size
+        return Statistics(dict(values))
+
+    def recomputeStatistics(self):
+        pass
+
+    def getAllResourceNames(self):
+        with self._lock:
+            return _sized(list(self._resources.values()), lambda r: r.resource_name)
+
+    def getAllResources(self):
+        with self._lock:
+            return _sized(list(self._resources.values()), _ResourceRow.model)
+
+    def getAllResourcesSizeSorted(self):
+        with self._lock:
+            rows = sorted(self._resources.values(), key=lambda r: (-r.resource_size, r.resource_id))
+        return _sized(rows, _ResourceRow.model)
+
+    def getResourceNameForResourceHash(self, resource_hash):
+        return self.getResourceForResourceHash(resource_hash).resource_name
+
+    def getResourceForResourceHash(self, resource_hash):
+        with self._lock:
+            try:
+                return self._resources[self._resource_ids_by_hash[resource_hash]].model()
+            except KeyError:
+                raise NotExistingException('no resource found with hash ' + repr(resource_hash))
+
+    def getFragmentByID(self, fragment_id):
+        with self._lock:
+            return self._fragment_row(fragment_id).model()
+
+    def getResourceOffsetForFragment(self, fragment_id):
+        with self._lock:
+            row = self._fragments.get(fragment_id)
+            if row is None or row.resource_id is None:
+                raise NotExistingException("No offsets exist for Fragment with id " + repr(fragment_id))
+            return self._resources[row.resource_id].model(), row.fragment_offset
+
+    def hasFragmentResourceMappingForFragment(self, fragment_id):
+        with self._lock:
+            row = self._fragments.get(fragment_id)
+            return row is not None and row.resource_id is not None
+
+    def makeFragmentResourceMapping(self, fragment_id, resource_id, fragment_offset):
+        with self._lock:
+            row = self._fragment_row(fragment_id)
+            self._resource_row(resource_id)
+            if row.resource_id is not None and (row.resource_id, row.fragment_offset) != (resource_id,
+                                                                                          fragment_offset):
+                raise AlreadyExistsException('fragment ' + repr(fragment_id) + ' is already mapped to a resource')
+            self._map_fragment(row, resource_id, fragment_offset)
+
+    def makeMultipleFragmentResourceMapping(self, resource_id, fragment_id_fragment_offset):
+        with self._lock:
+            self._resource_row(resource_id)
+            for fragment_id, fragment_offset in fragment_id_fragment_offset:
+                self._map_fragment(self._fragment_row(fragment_id), resource_id, fragment_offset)
+
+    def getSmallestResource(self, ignore=None):
+        ignore = set(ignore or ())
+        with self._lock:
+            rows = [self._resources[resource_id] for resource_id in self._resource_fragments]
+            rows = [row for row in rows if row.resource_hash not in ignore]
+            if not rows:
+                return None
+            return min(rows, key=lambda r: r.resource_payloadsize).model()
+
+    def updateResource(self, resource_id, resource_name, resource_size, resource_payloadsize, resource_hash,
+                       resource_wrap_type,
+                       resource_compress_type):
+        with self._lock:
+            row = self._resource_row(resource_id)
+            old_values = (row.resource_name, row.resource_size, row.resource_payloadsize, row.resource_hash,
+                          row.wrapping_type, row.compression_type)
+            recreate_old = resource_hash != row.resource_hash
+            if recreate_old and resource_name == row.resource_name:
+                # the old resource would be recreated with the same name
+                raise AlreadyExistsException('cannot create new model Resource by ' + repr(resource_name))
+            for index, key in ((self._resource_ids_by_name, resource_name), (self._resource_ids_by_hash,
+                                                                              resource_hash)):
+                if index.get(key, resource_id) != resource_id:
+                    raise AlreadyExistsException('cannot update Resource to ' + repr(key))
+            del self._resource_ids_by_name[row.resource_name]
+            del self._resource_ids_by_hash[row.resource_hash]
+            row.resource_name = resource_name
+            row.resource_size = resource_size
+            row.resource_payloadsize = resource_payloadsize
+            row.resource_hash = resource_hash
+            row.wrapping_type = resource_wrap_type
+            row.compression_type = resource_compress_type
+            self._resource_ids_by_name[resource_name] = resource_id
+            self._resource_ids_by_hash[resource_hash] = resource_id
+            if recreate_old:
+                self._create_resource(*old_values)
+            return row.model()
+
+    def getUnreferencedFragments(self):
+        return self.getUnneededFragments()
+
+    def deleteFragments(self, unreferenced_fragments):
+        fragment_ids = set(f.fragment_id for f in unreferenced_fragments)
+        with self._lock:
+            for fragment_id in fragment_ids:
+                row = self._fragments.get(fragment_id)
+                if row is not None:
+                    self._delete_fragment(row)
+
+    def deleteUnreferencedFragments(self):
+        self.collectGarbage(keep_fragments=False, keep_resources=True)
+
+    def getResourceByResourceName(self, resource_name):
+        with self._lock:
+            return self._resource_row_by_name(resource_name).model()
+
+    def getUnreferencedResources(self):
+        with self._lock:
+            rows = [row for row in self._resources.values() if row.resource_id not in self._resource_fragments]
+        return _sized(rows, _ResourceRow.model)
+
+    def removeCompoundByName(self, compoundname, keep_snapshots=False):
+        with self._lock:
+            versions = self._compound_ids_by_name.get(compoundname, {})
+            for version, compound_id in list(versions.items()):
+                if version is None or not keep_snapshots:
+                    self._delete_compound(self._compounds[compound_id])
+
+    def getResourceWithReferencedFragmentSize(self):
+        with self._lock:
+            rows = [(self._resources[resource_id],
+                     sum(self._fragments[fragment_id].fragment_size for fragment_id in fragment_ids))
+                    for resource_id, fragment_ids in sorted(self._resource_fragments.items())]
+        return _sized(rows, lambda t: (t[0].model(), t[1]))
+
+    def getFragmentsWithOffsetOnResource(self, resource_id):
+        with self._lock:
+            rows = sorted((self._fragments[fragment_id] for fragment_id in
+                           self._resource_fragments.get(resource_id, ())),
+                          key=lambda r: (r.fragment_offset, r.fragment_id))
+        return _sized(rows, lambda r: (r.model(), r.fragment_offset))
+
+    def moveFragmentMappings(self, old_resource, new_resource):
+        with self._lock:
+            for fragment_id in list(self._resource_fragments.get(old_resource, ())):
+                row = self._fragments[fragment_id]
+                self._map_fragment(row, new_resource, row.fragment_offset)
+
+    def getAllFragments(self):
+        with self._lock:
+            return _sized(list(self._fragments.values()), _FragmentRow.model)
+
+    def getAllFragmentsWithNoResourceLink(self):
+        with self._lock:
+            rows = [row for row in self._fragments.values() if row.resource_id is None]
+        return _sized(rows, _FragmentRow.model)
+
+    def getAllCompoundsWithNoFragmentLink(self):
+        with self._lock:
+            rows = [row for row in self._compounds.values() if row.compound_size > 0 and not row.fragment_ids]
+        return _sized(rows, _CompoundRow.model)
+
+    def getCompoundByHashWithFragmentLinks(self, compound_hash):
+        with self._lock:
+            for compound_id in self._compound_ids_by_hash.get(compound_hash, ()):
+                row = self._compounds[compound_id]
+                if row.compound_size > 0 and row.fragment_ids:
+                    return row.model()
+            raise NotExistingException('no compound with fragments found with hash ' + repr(compound_hash))
+
+    def getAllFragmentsSortedByCompoundUsage(self):
+        with self._lock:
+            first_compounds = {}  # type: Dict[FragmentID, CompoundID]
+            for compound_id in sorted(self._compounds):
+                for fragment_id in self._compounds[compound_id].fragment_ids:
+                    first_compounds.setdefault(fragment_id, compound_id)
+            rows = []
+            for compound_id in sorted(self._compounds):
+                row = self._compounds[compound_id]
+                for sequence_index, fragment_id in zip(row.sequence_indexes, row.fragment_ids):
+                    if first_compounds[fragment_id] == compound_id:
+                        rows.append((compound_id, SequenceIndex(sequence_index), self._fragments[fragment_id]))
+        return _sized(rows, lambda t: (t[0], t[1], t[2].model()))
+
+    def makeAndMapFragmentsToResource(self, resource_id, fragments_offset):
+        with self._lock:
+            self._resource_row(resource_id)
+            mapped = []
+            for fragment, fragment_offset in fragments_offset:
+                fragment_id = self._fragment_ids.get(fragment.fragment_hash)
+                if fragment_id is None:
+                    row = self._create_fragment(fragment.fragment_hash, fragment.fragment_size,
+                                                fragment.fragment_payload_size)
+                else:
+                    row = self._fragments[fragment_id]
+                # already mapped fragments are moved to the given resource
+                self._map_fragment(row, resource_id, fragment_offset)
+                mapped.append((row, fragment_offset))
+            return [(row.model(), fragment_offset) for row, fragment_offset in mapped]
+
+    def addOverwriteCompoundAndMapFragments(self, compound, fragment_payload_index):
+        self.addOverwriteCompoundsAndMapFragments([(compound, fragment_payload_index)])
+
+    def addOverwriteCompoundsAndMapFragments(self, compounds_fragment_payload_index):
+        with self._lock:
+            # resolve all fragments first, nothing gets changed if one of them is missing
+            mappings = []
+            for compound, fragment_payload_index in compounds_fragment_payload_index:
+                mapping = []
+                for fragment, sequence_index in fragment_payload_index:
+                    fragment_id = self._fragment_ids.get(fragment.fragment_hash)
+                    if fragment_id is None:
+                        raise NotExistingException('no fragment found with hash ' + repr(fragment.fragment_hash))
+                    mapping.append((fragment_id, sequence_index))
+                mappings.append((compound, mapping))
+            for compound, mapping in mappings:
+                compound_id = self._compound_ids_by_name.get(compound.compound_name, {}).get(
+                    compound.compound_version)
+                if compound_id is None:
+                    row = self._create_compound(compound.compound_name, compound.compound_type,
+                                                compound.compound_hash, compound.compound_size,
+                                                compound.wrapping_type, compound.compression_type,
+                                                compound.compound_version)
+                    compound.compound_id = row.compound_id
+                else:
+                    row = self._compounds[compound_id]
+                    self._update_compound(row, compound.compound_type, compound.compound_hash,
+                                          compound.compound_size, compound.wrapping_type, compound.compression_type)
+                self._set_compound_fragments(row, mapping)
+
+    def getSnapshotsOfCompound(self, compound_name, min_version=None, max_version=None, include_live_version=False):
+        with self._lock:
+            rows = []
+            for version, compound_id in self._compound_ids_by_name.get(compound_name, {}).items():
+                if version is None:
+                    if not include_live_version or min_version is not None or max_version is not None:
+                        continue
+                elif ((min_version is not None and version < min_version)
+                      or (max_version is not None and version > max_version)):
+                    continue
+                rows.append(self._compounds[compound_id])
+        rows.sort(key=lambda r: (r.compound_version is not None, r.compound_version or 0))
+        return _sized(rows, _CompoundRow.model)
@@ -1,17 +1,21 @@
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Optional, Iterable, Any, Union
+from typing import List, Tuple, Optional, Iterable, Any, Union, BinaryIO, Dict
 
+from ImageSaverLib.Encapsulation import CompressionType, WrappingType
 from ImageSaverLib.Helpers.SizedGenerator import SizedGenerator
+from ImageSaverLib.MetaDB.Errors import NotExistingException
 from ImageSaverLib.MetaDB.Types.Compound import (Compound, CompoundName, CompoundID, CompoundType, CompoundHash,
                                                  CompoundSize, CompoundWrappingType, CompoundCompressionType,
                                                  CompoundVersion)
 from ImageSaverLib.MetaDB.Types.CompoundFragmentMapping import SequenceIndex
 from ImageSaverLib.MetaDB.Types.Fragment import Fragment, FragmentID, FragmentHash, FragmentSize, FragmentPayloadSize
+from ImageSaverLib.MetaDB.Types.FragmentPlaintextMapping import PlaintextHash
 # from ImageSaverLib2.MetaDB.Types.Payload import Payload, PayloadHash, PayloadSize, PayloadID
 from ImageSaverLib.MetaDB.Types.FragmentResourceMapping import FragmentOffset
 from ImageSaverLib.MetaDB.Types.Resource import (Resource, ResourceName, ResourceCompressionType, ResourceWrappingType,
                                                  ResourceHash,
                                                  ResourceSize, ResourceID, ResourcePayloadSize)
+from ImageSaverLib.MetaDB.Types.Statistic import Statistics
 
 
 class MetaDBInterface(ABC):
@@ -51,6 +55,38 @@ class MetaDBInterface(ABC):
         # type: (FragmentHash) -> Fragment
         pass
 
+    @abstractmethod
+    def getFragmentByPlaintextHash(self, plaintext_hash, compression_type, wrapping_type):
+        # type: (PlaintextHash, CompressionType, WrappingType) -> Fragment
+        """
+        returns the fragment, which was created by compressing and wrapping a payload with the given hash.
+        :raises NotExistingException: no fragment is known for the given plaintext
+        """
+        pass
+
+    def getFragmentsByPlaintextHashes(self, plaintext_hashes, compression_type, wrapping_type):
+        # type: (Iterable[PlaintextHash], CompressionType, WrappingType) -> Dict[PlaintextHash, Fragment]
+        """
+        returns the known fragments of the given plaintexts by their plaintext hash, unknown plaintexts are left out.
+        """
+        fragments = {}
+        for plaintext_hash in plaintext_hashes:
+            try:
+                fragments[plaintext_hash] = self.getFragmentByPlaintextHash(plaintext_hash, compression_type,
+                                                                            wrapping_type)
+            except NotExistingException:
+                pass
+        return fragments
+
+    @abstractmethod
+    def addFragmentPlaintextHashes(self, plaintext_hashes):
+        # type: (Iterable[Tuple[FragmentHash, PlaintextHash, CompressionType, WrappingType]]) -> None
+        """
+        remembers from which plaintext and encapsulation the fragments were created.
+        unknown fragments and already known plaintexts get ignored.
+        """
+        pass
+
     @abstractmethod
     def makeResource(self, resource_name, resource_size, resource_payloadsize, resource_hash, wrap_type, compress_type):
         # type: (ResourceName, ResourceSize, ResourcePayloadSize, ResourceHash, ResourceWrappingType, ResourceCompressionType) -> Resource
@@ -114,6 +150,15 @@ class MetaDBInterface(ABC):
         # type: (CompoundID) -> SizedGenerator[Tuple[SequenceIndex, Fragment]]
         pass
 
+    @abstractmethod
+    def getSequenceIndexSortedFragmentsWithResourceForCompound(self, compound_id):
+        # type: (CompoundID) -> SizedGenerator[Tuple[SequenceIndex, Fragment, Optional[Resource], Optional[FragmentOffset]]]
+        """
+        returns the fragments of a compound together with their resource and offset on it, sorted by sequence index.
+        resource and offset are None for fragments, which are not mapped to a resource.
+        """
+        pass
+
     @abstractmethod
     def getFragmentHashesNeededForCompound(self, compound_id):
         # type: (CompoundID) -> SizedGenerator[FragmentHash]
@@ -125,8 +170,11 @@ class MetaDBInterface(ABC):
     #     pass
 
     @abstractmethod
-    def getAllCompounds(self, type_filter=None, order_alphabetically=False, starting_with=None, ending_with=None, slash_count=None, min_size=None, include_snapshots=False):
-        # type: (Optional[Union[CompoundType, Iterable[CompoundType]]], bool, Optional[str], Optional[str], Optional[int], Optional[int], bool) -> SizedGenerator[Compound]
+    def getAllCompounds(self, type_filter=None, order_alphabetically=False, starting_with=None, ending_with=None, slash_count=None, min_size=None, include_snapshots=False, parent=None):
+        # type: (Optional[Union[CompoundType, Iterable[CompoundType]]], bool, Optional[str], Optional[str], Optional[int], Optional[int], bool, Optional[CompoundName]) -> SizedGenerator[Compound]
+        """
+        :param parent: only return the direct children of the directory with this name
+        """
         pass
 
     @abstractmethod
@@ -274,6 +322,22 @@ class MetaDBInterface(ABC):
         # type: () -> int
         pass
 
+    @abstractmethod
+    def getStatistics(self):
+        # type: () -> Statistics
+        """
+        returns the incrementally maintained statistic counters, without aggregating over the stored objects
+        """
+        pass
+
+    @abstractmethod
+    def recomputeStatistics(self):
+        # type: () -> None
+        """
+        recomputes all statistic counters from the stored objects
+        """
+        pass
+
     @abstractmethod
     def getAllResourceNames(self):
         # type: () -> SizedGenerator[ResourceName]
@@ -445,6 +509,14 @@ class MetaDBInterface(ABC):
         # type: (Compound, List[Tuple[Fragment, SequenceIndex]]) -> Compound
         pass
 
+    @abstractmethod
+    def addOverwriteCompoundsAndMapFragments(self, compounds_fragment_payload_index):
+        # type: (Iterable[Tuple[Compound, List[Tuple[Fragment, SequenceIndex]]]]) -> None
+        """
+        same as addOverwriteCompoundAndMapFragments for several compounds, which are committed together
+        """
+        pass
+
     @abstractmethod
     def getSnapshotsOfCompound(self, compound_name, min_version=None, max_version=None, include_live_version=False):
         # type: (CompoundName, Optional[int], Optional[int], bool) -> SizedGenerator[Compound]
@@ -454,3 +526,19 @@ class MetaDBInterface(ABC):
         :param max_version: Compound.compound_version &lt= min_version
         """
         pass
+
+    def exportMeta(self, stream, chunk_size=10000):
+        # type: (BinaryIO, int) -> None
+        """
+        writes all objects of the meta in the portable export format into the given binary stream
+        """
+        raise NotImplementedError
+
+    def importMeta(self, stream, resume=True, chunk_size=10000):
+        # type: (BinaryIO, bool, int) -> None
+        """
+        adds all objects of an export to the meta, which has to be empty or hold a partial import of the same export
+
+        :param resume: skip the objects, which were imported by an interrupted import of the same export
+        """
+        raise NotImplementedError
@@ -0,0 +1,212 @@
+import base64
+import gzip
+import json
+from typing import List, Dict, Any, Optional, Generator, BinaryIO, Iterator, Iterable, Union
+
+from sqlalchemy import Table, Column, LargeBinary, Sequence, select, func
+# noinspection PyProtectedMember
+from sqlalchemy.engine import Engine, Connection, RowProxy
+
+from . import Base
+from .Errors import InvalidExportException
+from .Types import register_types_on_base
+from .Types.Statistic import Statistic
+
+# Export format: gzip compressed lines of JSON.
+# The first line is the header, followed by one section per table and the end marker:
+#   {"format": "isl-meta", "version": 1}
+#   {"table": "<table name>", "columns": ["<column name>", ...]}
+#   [<column value>, ...]   one line per row, ordered by primary key, binary values are base64 encoded
+#   {"rows": <row count of the table>}
+#   ...
+#   {"end": true}
+EXPORT_FORMAT = 'isl-meta'
+EXPORT_VERSION = 1
+
+
+def exportedTables():
+    # type: () -> List[Table]
+    """
+    returns all tables of the meta in insert order, statistic counters are recomputed after importing
+    """
+    register_types_on_base()
+    return [table for table in Base.metadata.sorted_tables if table.name != Statistic.__tablename__]
+
+
+def _primary_key(table):
+    # type: (Table) -> Column
+    columns = list(table.primary_key.columns)
+    assert len(columns) == 1, 'only tables with a single primary key column can be exported'
+    return columns[0]
+
+
+def lastKey(connection, table):
+    # type: (Connection, Table) -> Optional[int]
+    return connection.execute(select([func.max(_primary_key(table))])).scalar()
+
+
+def tableChunks(connection, table, chunk_size, after=None):
+    # type: (Connection, Table, int, Optional[int]) -> Generator[List[RowProxy], None, None]
+    """
+    reads the rows of a table ordered by primary key. Every chunk is a query of its own, which continues after the
+    last key of the previous chunk, so neither side holds more than one chunk in memory.
+
+    :param after: only read rows with a greater primary key
+    """
+    key = _primary_key(table)
+    while True:
+        query = select([table]).order_by(key).limit(chunk_size)
+        if after is not None:
+            query = query.where(key > after)
+        rows = connection.execute(query).fetchall()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][key.name]
+
+
+def resetSequence(connection, table):
+    # type: (Connection, Table) -> None
+    """
+    postgres sequences do not advance on inserts with explicit keys, move them behind the copied keys
+    """
+    sequence = _primary_key(table).default
+    if connection.dialect.name != 'postgresql' or not isinstance(sequence, Sequence):
+        return
+    last_key = lastKey(connection, table)
+    if last_key is not None:
+        connection.execute(select([func.setval(sequence.name, last_key)]))
+
+
+def _binary_columns(table, columns):
+    # type: (Table, List[str]) -> List[bool]
+    return [isinstance(table.c[name].type, LargeBinary) for name in columns]
+
+
+def _encode(values, binary_columns):
+    # type: (Iterable[Any], List[bool]) -> List[Any]
+    return [base64.b64encode(value).decode('ascii') if binary and value is not None else value
+            for value, binary in zip(values, binary_columns)]
+
+
+def _decode(values, binary_columns):
+    # type: (List[Any], List[bool]) -> List[Any]
+    return [base64.b64decode(value) if binary and value is not None else value
+            for value, binary in zip(values, binary_columns)]
+
+
+def _write_line(stream, obj):
+    # type: (BinaryIO, Union[Dict[str, Any], List[Any]]) -> None
+    stream.write(json.dumps(obj, separators=(',', ':')).encode('utf-8'))
+    stream.write(b'\n')
+
+
+def exportTables(engine, stream, chunk_size=10000, compresslevel=6):
+    # type: (Engine, BinaryIO, int, int) -> Dict[str, int]
+    """
+    writes all rows of the meta into the given binary stream.
+
+    :return: the number of exported rows per table
+    """
+    counts = {}  # type: Dict[str, int]
+    with gzip.GzipFile(fileobj=stream, mode='wb', compresslevel=compresslevel) as compressed:
+        _write_line(compressed, {'format': EXPORT_FORMAT, 'version': EXPORT_VERSION})
+        with engine.connect() as connection:
+            # one transaction, so the export is a consistent state of the meta
+            with connection.begin():
+                for table in exportedTables():
+                    columns = [column.name for column in table.columns]
+                    binary_columns = _binary_columns(table, columns)
+                    _write_line(compressed, {'table': table.name, 'columns': columns})
+                    count = 0
+                    for rows in tableChunks(connection, table, chunk_size):
+                        for row in rows:
+                            _write_line(compressed, _encode((row[name] for name in columns), binary_columns))
+                        count += len(rows)
+                    _write_line(compressed, {'rows': count})
+                    counts[table.name] = count
+        _write_line(compressed, {'end': True})
+    return counts
+
+
+def _read_line(lines):
+    # type: (Iterator[bytes]) -> Any
+    try:
+        return json.loads(next(lines))
+    except StopIteration:
+        raise InvalidExportException('export is truncated')
+    except ValueError as e:
+        raise InvalidExportException('export contains an invalid line: ' + str(e))
+
+
+def importTables(engine, stream, chunk_size=10000, resume=True):
+    # type: (Engine, BinaryIO, int, bool) -> Dict[str, int]
+    """
+    inserts all rows of an export into the tables of the given engine. Every chunk of rows is committed on its own.
+
+    :param resume: skip the rows, which were already imported by an interrupted import of the same export. Rows are
+                   exported in primary key order, so every row up to the greatest key of a table is already present.
+    :return: the number of imported rows per table
+    :raises InvalidExportException: the stream is no complete export
+    """
+    tables = {table.name: table for table in exportedTables()}
+    counts = {}  # type: Dict[str, int]
+    with gzip.GzipFile(fileobj=stream, mode='rb') as compressed:
+        lines = iter(compressed)
+        header = _read_line(lines)
+        if not isinstance(header, dict) or header.get('format') != EXPORT_FORMAT:
+            raise InvalidExportException('stream is no meta export')
+        if header.get('version') != EXPORT_VERSION:
+            raise InvalidExportException('unsupported export version ' + repr(header.get('version')))
+        with engine.connect() as connection:
+            while True:
+                section = _read_line(lines)
+                if not isinstance(section, dict):
+                    raise InvalidExportException('expected a table section, got a row')
+                if section.get('end'):
+                    break
+                table = tables.get(section.get('table'))
+                if table is None:
+                    raise InvalidExportException('export contains unknown table ' + repr(section.get('table')))
+                columns = section['columns']  # type: List[str]
+                unknown_columns = set(columns).difference(table.c.keys())
+                if unknown_columns:
+                    raise InvalidExportException('export contains unknown columns ' + ', '.join(unknown_columns)
+                                                 + ' of table ' + table.name)
+                counts[table.name] = _import_table(connection, table, columns, lines, chunk_size, resume)
+    return counts
+
+
+def _import_table(connection, table, columns, lines, chunk_size, resume):
+    # type: (Connection, Table, List[str], Iterator[bytes], int, bool) -> int
+    binary_columns = _binary_columns(table, columns)
+    key_index = columns.index(_primary_key(table).name)
+    last_key = lastKey(connection, table) if resume else None
+    read = 0
+    imported = 0
+    chunk = []  # type: List[Dict[str, Any]]
+    while True:
+        values = _read_line(lines)
+        if isinstance(values, dict):
+            if values.get('rows') != read:
+                raise InvalidExportException('expected ' + repr(values.get('rows')) + ' rows of table ' + table.name
+                                             + ', got ' + str(read))
+            break
+        read += 1
+        if last_key is not None and values[key_index] <= last_key:
+            continue
+        chunk.append(dict(zip(columns, _decode(values, binary_columns))))
+        if len(chunk) >= chunk_size:
+            imported += _insert_chunk(connection, table, chunk)
+            chunk = []
+    if chunk:
+        imported += _insert_chunk(connection, table, chunk)
+    resetSequence(connection, table)
+    return imported
+
+
+def _insert_chunk(connection, table, rows):
+    # type: (Connection, Table, List[Dict[str, Any]]) -> int
+    with connection.begin():
+        connection.execute(table.insert(), rows)
+    return len(rows)
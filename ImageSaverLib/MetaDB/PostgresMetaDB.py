@@ -0,0 +1,97 @@
+from io import StringIO
+from typing import List, Dict, Any, Optional, Generator, Iterable
+
+from sqlalchemy import Table, Column, select, sql
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+
+from ImageSaverLib.Helpers.SizedGenerator import SizedGenerator
+from ImageSaverLib.MetaDB.SQLAlchemyHelperMixin2 import ExposableGeneratorQuery
+from ImageSaverLib.MetaDB.SQLAlchemyMetaDB import SQLAlchemyMetaDB
+
+
+def _copy_value(value):
+    # type: (Any) -> str
+    """
+    formats a value for the text format of COPY
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea hex format, the backslash itself has to be escaped
+        return '\\\\x' + bytes(value).hex()
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_buffer(rows, columns):
+    # type: (Iterable[Dict[str, Any]], List[str]) -> StringIO
+    buffer = StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(row[name]) for name in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+class PostgresMetaDB(SQLAlchemyMetaDB):
+    """
+    MetaDB for PostgreSQL databases.
+
+    Large inserts are loaded with COPY FROM STDIN instead of multi row INSERT statements and all generator queries are
+    streamed through named server side cursors, instead of paging through the result with LIMIT and OFFSET.
+    """
+
+    def __init__(self, session, fragment_filter=False, concurrent=True):
+        SQLAlchemyMetaDB.__init__(self, session, fragment_filter=fragment_filter, concurrent=concurrent)
+        # smaller inserts are cheaper as one INSERT statement, than creating, filling and dropping a staging table
+        self.copy_min_rows = 100
+
+    def _bulk_insert(self, session, table, rows, skip_existing=None, replace_existing=None):
+        # type: (Session, Table, List[Dict[str, Any]], Optional[Column], Optional[Column]) -> None
+        """
+        copies the rows into a temporary staging table and moves them with one INSERT ... SELECT into the given
+        table. The INSERT fills in the sequence values of the primary key and skips or replaces existing rows.
+        """
+        if len(rows) < self.copy_min_rows:
+            SQLAlchemyMetaDB._bulk_insert(self, session, table, rows, skip_existing=skip_existing,
+                                          replace_existing=replace_existing)
+            return
+        columns = list(rows[0])
+        staging = sql.table('_copy_' + table.name, *(sql.column(name) for name in columns))
+        column_list = ', '.join(columns)
+        connection = session.connection()
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute('CREATE TEMPORARY TABLE ' + staging.name + ' AS SELECT ' + column_list + ' FROM '
+                           + table.name + ' WITH NO DATA')
+            cursor.copy_expert('COPY ' + staging.name + ' (' + column_list + ') FROM STDIN',
+                               _copy_buffer(rows, columns))
+        finally:
+            cursor.close()
+        statement = postgresql.insert(table).from_select(columns, select([staging.c[name] for name in columns]))
+        if skip_existing is not None or replace_existing is not None:
+            statement = self._postgres_upsert(statement, skip_existing, replace_existing)
+        connection.execute(statement)
+        connection.execute('DROP TABLE ' + staging.name)
+
+    def _exposable_lengen_query(self, exposable_session, query, order_by=None):
+        # type: (ExposableGeneratorQuery, Query, Optional[InstrumentedAttribute]) -> SizedGenerator
+        if order_by:
+            query = query.order_by(order_by)
+        count = query.count
+        gen = self._streamed_query_yielder(exposable_session, query)
+        return SizedGenerator(gen, count)
+
+    def _streamed_query_yielder(self, exposable_session, query):
+        # type: (ExposableGeneratorQuery, Query) -> Generator[Any, Any, None]
+        # the named cursor lives on a session of its own, the thread local session may commit while the rows get
+        # consumed, which would close the cursor
+        stream_session = self.sessionmaker.session_factory()  # type: Session
+        with exposable_session, ExposableGeneratorQuery(stream_session):
+            rows = query.with_session(stream_session).execution_options(stream_results=True)
+            for elem in rows.yield_per(self.yield_size):
+                stream_session.expunge_all()
+                yield elem
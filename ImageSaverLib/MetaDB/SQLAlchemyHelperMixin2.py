@@ -1,10 +1,11 @@
 import traceback
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from sqlite3 import Connection as SQLite3Connection
 from threading import RLock
-from typing import TypeVar, Generic, Type, List, Optional, Dict, Any, Generator, cast
+from typing import TypeVar, Generic, Type, List, Optional, Dict, Any, Generator, cast, ContextManager
 
-from sqlalchemy import engine, event
+from sqlalchemy import engine, event, Table, Column
+from sqlalchemy.dialects import postgresql
 # noinspection PyProtectedMember
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import IntegrityError
@@ -25,6 +26,12 @@ KWARGS = TypeVar('KWARGS', )
 KWARGS_DICT = Dict[str, KWARGS]
 
 
+def _chunks(rows, size):
+    # type: (List[Dict[str, Any]], int) -> Generator[List[Dict[str, Any]], None, None]
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
 @event.listens_for(Engine, "connect")
 def _set_sqlite_pragma(dbapi_connection, connection_record):
     if isinstance(dbapi_connection, SQLite3Connection):
@@ -73,12 +80,22 @@ class ExposableGeneratorQuery(object):
 
 class SQLAlchemyHelperMixin(Generic[M]):
 
-    def __init__(self, session):
-        # type: (scoped_session) -> None
+    def __init__(self, session, concurrent=False):
+        # type: (scoped_session, bool) -> None
+        """
+        :param session: thread local session registry
+        :param concurrent: the engine hands out one connection per thread, sessions of different threads run in
+                           parallel and only writing sessions are serialized. Otherwise all sessions share one
+                           connection and are serialized.
+        """
         self.sessionmaker = session
+        self.concurrent = concurrent
         # noinspection PyTypeChecker
         self._session_lock = RLock()
+        self._write_lock = RLock()
         self.yield_size = 10000
+        # rows per multi row INSERT, keeps the bound parameters of rows with up to 3 columns below the SQLite limit
+        self.insert_chunk_size = 250
         self._closed = False
 
     # region Context Methods
@@ -95,10 +112,22 @@ class SQLAlchemyHelperMixin(Generic[M]):
                 raise RuntimeError('DB Sessions closed.')
             self.close()
 
+    def _scope_lock(self, write):
+        # type: (bool) -> ContextManager
+        if not self.concurrent:
+            return self._session_lock
+        if write:
+            return self._write_lock
+        return nullcontext()
+
     @contextmanager
-    def session_scope(self):
-        # type: () -> Session
-        with self._session_lock:
+    def session_scope(self, write=False):
+        # type: (bool) -> Session
+        """
+        :param write: the session modifies the database. Writing sessions never run in parallel, reading sessions of
+                      a concurrent engine do not wait for them.
+        """
+        with self._scope_lock(write):
             # self._session_lock.acquire()
             session = self.sessionmaker()  # type: Session
             # noinspection PyBroadException
@@ -119,7 +148,7 @@ class SQLAlchemyHelperMixin(Generic[M]):
     @contextmanager
     def exposable_session_scope(self):
         # type: () -> ExposableGeneratorQuery
-        with self._session_lock:
+        with self._scope_lock(False):
             session = self.sessionmaker()  # type: Session
             exposable_session = ExposableGeneratorQuery(session)
             # noinspection PyBroadException
@@ -132,7 +161,7 @@ class SQLAlchemyHelperMixin(Generic[M]):
     # endregion
 
     def close(self):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             # noinspection PyUnresolvedReferences
             session.close_all_sessions()
             self._closed = True
@@ -205,6 +234,48 @@ class SQLAlchemyHelperMixin(Generic[M]):
             session.expunge_all()
         return return_instances
 
+    def _bulk_insert(self, session, table, rows, skip_existing=None, replace_existing=None):
+        # type: (Session, Table, List[Dict[str, Any]], Optional[Column], Optional[Column]) -> None
+        """
+        inserts the rows with multi row INSERT statements, bypassing the ORM.
+
+        :param skip_existing: unique column, rows with an already stored value are skipped instead of failing.
+                              The rows themselves must not contain a value twice.
+        :param replace_existing: unique column, rows with an already stored value replace the stored row.
+                                 The rows themselves must not contain a value twice.
+        """
+        dialect = session.get_bind().dialect.name
+        for chunk in _chunks(rows, self.insert_chunk_size):
+            if skip_existing is None and replace_existing is None:
+                statement = table.insert()
+            elif dialect == 'postgresql':
+                statement = self._postgres_upsert(postgresql.insert(table), skip_existing, replace_existing)
+            elif dialect == 'sqlite':
+                statement = table.insert().prefix_with('OR IGNORE' if replace_existing is None else 'OR REPLACE')
+            elif replace_existing is not None:
+                session.execute(table.delete().where(
+                    replace_existing.in_([row[replace_existing.name] for row in chunk])))
+                statement = table.insert()
+            else:
+                existing = set(v for v, in session.query(skip_existing).filter(
+                    skip_existing.in_([row[skip_existing.name] for row in chunk])))
+                chunk = [row for row in chunk if row[skip_existing.name] not in existing]
+                if not chunk:
+                    continue
+                statement = table.insert()
+            session.execute(statement.values(chunk))
+
+    @staticmethod
+    def _postgres_upsert(statement, skip_existing, replace_existing):
+        # type: (postgresql.Insert, Optional[Column], Optional[Column]) -> postgresql.Insert
+        if replace_existing is None:
+            return statement.on_conflict_do_nothing(index_elements=[skip_existing])
+        # a concurrent transaction inserting the same value is waited for and then replaced, instead of failing
+        return statement.on_conflict_do_update(
+            index_elements=[replace_existing],
+            set_={c.name: statement.excluded[c.name] for c in statement.table.columns
+                  if c is not replace_existing and not c.primary_key})
+
     def _create_or_update(self, session, model, get_by, update_to, **kwargs):
         # type: (Session, Type[M], List[BinaryExpression], Dict[InstrumentedAttribute, Any], **Any) -> M
         """
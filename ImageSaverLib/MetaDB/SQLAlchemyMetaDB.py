@@ -1,41 +1,142 @@
-from typing import Type, Tuple, List, Optional
+from collections import Counter
+from contextlib import contextmanager
+from threading import Lock, Thread
+from typing import Type, Tuple, List, Optional, Iterable, Sequence, Set, Dict, Generator
 
-from sqlalchemy import func, asc, and_
+from sqlalchemy import func, asc, and_, inspect, select, bindparam, distinct, exists, true, event
 # noinspection PyProtectedMember
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, scoped_session, Query, aliased, Session
+from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import functions
-from sqlalchemy.sql.elements import not_
+from sqlalchemy.sql.elements import not_, ClauseElement
 
 from ImageSaverLib.Helpers import chunkiterable_gen
+from ImageSaverLib.Helpers.BloomFilter import BloomFilter
 from ImageSaverLib.MetaDB import Base
 from ImageSaverLib.MetaDB.Errors import NotExistingException
 from ImageSaverLib.MetaDB.MetaDB import MetaDBInterface
+from ImageSaverLib.MetaDB.MetaExport import exportTables, importTables
 from ImageSaverLib.MetaDB.SQLAlchemyHelperMixin2 import SQLAlchemyHelperMixin, ExposableGeneratorQuery
-from ImageSaverLib.MetaDB.Types.Compound import Compound, CompoundVersion
+from ImageSaverLib.MetaDB.Types.Compound import Compound, CompoundVersion, compoundParent, CompoundHash
 from ImageSaverLib.MetaDB.Types.CompoundFragmentMapping import CompoundFragmentMapping, SequenceIndex
-from ImageSaverLib.MetaDB.Types.Fragment import Fragment
-from ImageSaverLib.MetaDB.Types.FragmentResourceMapping import FragmentResourceMapping, FragmentOffset
+from ImageSaverLib.MetaDB.Types.Fragment import Fragment, FragmentID, FragmentHash
+from ImageSaverLib.MetaDB.Types.FragmentPlaintextMapping import FragmentPlaintextMapping
+from ImageSaverLib.MetaDB.Types.FragmentResourceMapping import FragmentResourceMapping
 from ImageSaverLib.MetaDB.Types.Resource import Resource
-
-
-def init_db(engine, recreate=False):
-    # type: (Engine, bool) -> SQLAlchemyMetaDB
+from ImageSaverLib.MetaDB.Types.Statistic import (Statistic, Statistics, StatisticName, typedStatisticName,
+                                                  COMPOUND_COUNT, SNAPSHOT_COUNT, COMPOUND_SIZE,
+                                                  UNIQUE_COMPOUND_COUNT, UNIQUE_COMPOUND_SIZE, FRAGMENT_COUNT,
+                                                  FRAGMENT_SIZE, DUPLICATE_FRAGMENT_COUNT,
+                                                  DUPLICATE_FRAGMENT_SAVED_SIZE, UNNEEDED_FRAGMENT_COUNT,
+                                                  UNNEEDED_FRAGMENT_SIZE, RESOURCE_COUNT, RESOURCE_SIZE)
+
+# statistics of a set of rows are computed by partitioning the tables, every compound statistic is partitioned by
+# the compound hash, every fragment statistic by the fragment and every resource statistic by the resource. A change
+# updates the counters by the difference of the statistics over the touched partitions before and after the change.
+StatisticCriteria = Sequence[ClauseElement]
+# key of the session info, which collects the counter changes of the running transaction
+_STATISTIC_DELTAS = 'statistic_deltas'
+
+
+def init_db(engine, recreate=False, fragment_filter=False, concurrent=False, meta_class=None):
+    # type: (Engine, bool, bool, bool, Optional[Type[SQLAlchemyMetaDB]]) -> SQLAlchemyMetaDB
     db_session = scoped_session(sessionmaker(bind=engine, expire_on_commit=False))
     Base.query = db_session.query_property()
     if recreate:
         Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(engine)
-    return SQLAlchemyMetaDB(db_session)
+    _upgrade_schema(engine)
+    return (meta_class or SQLAlchemyMetaDB)(db_session, fragment_filter=fragment_filter, concurrent=concurrent)
+
+
+def _upgrade_schema(engine, batch_size=10000):
+    # type: (Engine, int) -> None
+    """
+    adds the columns and indexes to databases, which got created before they existed, and drops replaced indexes.
+    create_all does not alter already existing tables
+    """
+    _add_compound_parents(engine, batch_size)
+    _add_missing_indexes(engine)
+    _drop_superseded_indexes(engine)
+
+
+def _add_compound_parents(engine, batch_size):
+    # type: (Engine, int) -> None
+    compounds = Compound.__table__
+    if 'compound_parent' in (c['name'] for c in inspect(engine).get_columns(compounds.name)):
+        return
+    parent_column = compounds.c.compound_parent
+    with engine.begin() as connection:
+        connection.execute('ALTER TABLE ' + compounds.name + ' ADD COLUMN ' + parent_column.name + ' '
+                           + parent_column.type.compile(dialect=engine.dialect))
+        update = compounds.update().where(compounds.c.compound_id == bindparam('_compound_id')).values(
+            compound_parent=bindparam('_compound_parent'))
+        last_id = None
+        while True:
+            query = select([compounds.c.compound_id, compounds.c.compound_name]).order_by(compounds.c.compound_id)
+            if last_id is not None:
+                query = query.where(compounds.c.compound_id > last_id)
+            rows = connection.execute(query.limit(batch_size)).fetchall()
+            if not rows:
+                break
+            connection.execute(update, [{'_compound_id': compound_id, '_compound_parent': compoundParent(name)}
+                                        for compound_id, name in rows])
+            last_id = rows[-1][0]
+
+
+def _add_missing_indexes(engine):
+    # type: (Engine) -> None
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing_indexes = set(index['name'] for index in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=engine)
+
+
+# indexes of older schemas, which are covered by the leading columns of a composite index
+SUPERSEDED_INDEXES = (('compounds', 'ix_compounds_compound_hash'),
+                      ('fragment_resource_mappings', 'ix_fragment_resource_mappings_resource_id'))
+
+
+def _drop_superseded_indexes(engine):
+    # type: (Engine) -> None
+    inspector = inspect(engine)
+    for table_name, index_name in SUPERSEDED_INDEXES:
+        if index_name in (index['name'] for index in inspector.get_indexes(table_name)):
+            with engine.begin() as connection:
+                connection.execute('DROP INDEX IF EXISTS ' + index_name)
 
 
 class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
 
-    def __init__(self, session):
-        # type: (scoped_session) -> None
-        SQLAlchemyHelperMixin.__init__(self, session)
+    def __init__(self, session, fragment_filter=False, concurrent=False):
+        # type: (scoped_session, bool, bool) -> None
+        """
+        :param fragment_filter: keep in-memory bloom filters of all fragment and plaintext hashes, most lookups of new
+                                fragments are answered without a DB query. Only enable this if no other process writes
+                                into the same database, fragments added by others would be reported as missing.
+        :param concurrent: the engine hands out one connection per thread, meta calls of different threads run in
+                           parallel, only writing calls are serialized.
+        """
+        SQLAlchemyHelperMixin.__init__(self, session, concurrent=concurrent)
         MetaDBInterface.__init__(self)
+        self.fragment_filter_enabled = fragment_filter
+        self.filter_error_rate = 0.001
+        self._filter_lock = Lock()
+        self._fragment_filter = None  # type: Optional[BloomFilter]
+        self._plaintext_filter = None  # type: Optional[BloomFilter]
+        # hashes added while the filters get rebuilt, None if no rebuild is running
+        self._filter_additions = None  # type: Optional[Tuple[List[bytes], List[bytes]]]
+        self._filter_generation = 0
+        if fragment_filter:
+            self._startFilterRebuild()
+            self._load_filters()
+        event.listen(session, 'before_commit', self._apply_statistics)
+        event.listen(session, 'after_rollback', self._discard_statistics)
+        self._init_statistics()
 
     def close(self):
         pass
@@ -53,12 +154,16 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
                              Compound.compound_version == compound_version)
 
     def makeFragment(self, fragment_hash, fragment_size, fragment_payload_size):
-        with self.session_scope() as session:  # type: Session
-            return self._get_or_create(session, Fragment, None, fragment_hash=fragment_hash,
-                                       fragment_size=fragment_size,
-                                       fragment_payload_size=fragment_payload_size)
+        with self.session_scope(write=True) as session:  # type: Session
+            self._add_to_filter(False, (fragment_hash,))
+            with self._tracking_statistics(session, fragment_criteria=[Fragment.fragment_hash == fragment_hash]):
+                return self._get_or_create(session, Fragment, None, fragment_hash=fragment_hash,
+                                           fragment_size=fragment_size,
+                                           fragment_payload_size=fragment_payload_size)
 
     def hasFragmentByPayloadHash(self, fragment_hash):
+        if self._surely_missing(fragment_hash, plaintext=False):
+            return False
         with self.session_scope() as session:  # type: Session
             try:
                 self._get(session, Fragment, Fragment.fragment_hash == fragment_hash)
@@ -67,26 +172,93 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
                 return False
 
     def getFragmentByPayloadHash(self, fragment_hash):
+        if self._surely_missing(fragment_hash, plaintext=False):
+            raise NotExistingException('no fragment known for fragment hash')
         with self.session_scope() as session:  # type: Session
             return self._get(session, Fragment, Fragment.fragment_hash == fragment_hash)
 
-    def makeResource(self, resource_name, resource_size, resource_payloadsize, resource_hash, wrap_type, compress_type):
+    def getFragmentByPlaintextHash(self, plaintext_hash, compression_type, wrapping_type):
+        if self._surely_missing(plaintext_hash, plaintext=True):
+            raise NotExistingException('no fragment known for plaintext hash')
         with self.session_scope() as session:  # type: Session
-            # try to create this exact resource
-            return self._get_or_create(session, Resource, None, resource_name=resource_name,
-                                       resource_size=resource_size,
-                                       resource_payloadsize=resource_payloadsize,
-                                       resource_hash=resource_hash, wrapping_type=wrap_type,
-                                       compression_type=compress_type)
+            query = session.query(Fragment)  # type: Query
+            query = query.join(FragmentPlaintextMapping,
+                               FragmentPlaintextMapping.fragment_id == Fragment.fragment_id)  # type: Query
+            query = query.filter(FragmentPlaintextMapping.plaintext_hash == plaintext_hash,
+                                 FragmentPlaintextMapping.compression_type == compression_type,
+                                 FragmentPlaintextMapping.wrapping_type == wrapping_type)
+            fragment = query.first()
+            if fragment is None:
+                raise NotExistingException('no fragment known for plaintext hash')
+            return fragment
+
+    def getFragmentsByPlaintextHashes(self, plaintext_hashes, compression_type, wrapping_type):
+        plaintext_hashes = set(plaintext_hash for plaintext_hash in plaintext_hashes
+                               if not self._surely_missing(plaintext_hash, plaintext=True))
+        fragments = {}
+        if not plaintext_hashes:
+            return fragments
+        with self.session_scope() as session:  # type: Session
+            for chunk in chunkiterable_gen(plaintext_hashes, 500, skip_none=True):
+                if not chunk:
+                    continue
+                query = session.query(FragmentPlaintextMapping.plaintext_hash, Fragment)  # type: Query
+                query = query.join(Fragment,
+                                   FragmentPlaintextMapping.fragment_id == Fragment.fragment_id)  # type: Query
+                query = query.filter(FragmentPlaintextMapping.plaintext_hash.in_(chunk),
+                                     FragmentPlaintextMapping.compression_type == compression_type,
+                                     FragmentPlaintextMapping.wrapping_type == wrapping_type)
+                fragments.update(query.all())
+        return fragments
+
+    def addFragmentPlaintextHashes(self, plaintext_hashes):
+        with self.session_scope(write=True) as session:  # type: Session
+            for chunk in chunkiterable_gen(plaintext_hashes, 500, skip_none=True):
+                fragment_ids = dict(session.query(Fragment.fragment_hash, Fragment.fragment_id).filter(
+                    Fragment.fragment_hash.in_(set(fragment_hash for fragment_hash, _, _, _ in chunk))).all())
+                known_plaintexts = set(session.query(FragmentPlaintextMapping.plaintext_hash,
+                                                     FragmentPlaintextMapping.compression_type,
+                                                     FragmentPlaintextMapping.wrapping_type).filter(
+                    FragmentPlaintextMapping.plaintext_hash.in_(set(p for _, p, _, _ in chunk))).all())
+                new_mappings = []
+                for fragment_hash, plaintext_hash, compression_type, wrapping_type in chunk:
+                    if fragment_hash not in fragment_ids:
+                        continue
+                    key = (plaintext_hash, compression_type, wrapping_type)
+                    if key in known_plaintexts:
+                        continue
+                    known_plaintexts.add(key)
+                    new_mappings.append(dict(plaintext_hash=plaintext_hash,
+                                             compression_type=compression_type,
+                                             wrapping_type=wrapping_type,
+                                             fragment_id=fragment_ids[fragment_hash]))
+                if new_mappings:
+                    self._add_to_filter(True, (m['plaintext_hash'] for m in new_mappings))
+                    session.bulk_insert_mappings(FragmentPlaintextMapping, new_mappings)
+
+    def makeResource(self, resource_name, resource_size, resource_payloadsize, resource_hash, wrap_type, compress_type):
+        with self.session_scope(write=True) as session:  # type: Session
+            with self._tracking_statistics(session, resource_criteria=[Resource.resource_name == resource_name]):
+                # try to create this exact resource
+                return self._get_or_create(session, Resource, None, resource_name=resource_name,
+                                           resource_size=resource_size,
+                                           resource_payloadsize=resource_payloadsize,
+                                           resource_hash=resource_hash, wrapping_type=wrap_type,
+                                           compression_type=compress_type)
 
     def setFragmentsMappingForCompound(self, compound_id, fragment_id_sequence_index):
-        with self.session_scope() as session:  # type: Session
-            self._delete(session, CompoundFragmentMapping, CompoundFragmentMapping.compound_id == compound_id)
-            session.bulk_insert_mappings(CompoundFragmentMapping,
-                                         (dict(compound_id=compound_id,
-                                               fragment_id=fragment_id,
-                                               sequence_index=sequence_index)
-                                          for fragment_id, sequence_index in fragment_id_sequence_index))
+        fragment_id_sequence_index = list(fragment_id_sequence_index)
+        with self.session_scope(write=True) as session:  # type: Session
+            fragment_ids = self._mapped_fragment_ids(session, Compound.compound_id == compound_id)
+            fragment_ids.update(fragment_id for fragment_id, _ in fragment_id_sequence_index)
+            with self._tracking_statistics(session,
+                                           fragment_criteria=self._in_criteria(Fragment.fragment_id, fragment_ids)):
+                self._delete(session, CompoundFragmentMapping, CompoundFragmentMapping.compound_id == compound_id)
+                session.bulk_insert_mappings(CompoundFragmentMapping,
+                                             (dict(compound_id=compound_id,
+                                                   fragment_id=fragment_id,
+                                                   sequence_index=sequence_index)
+                                              for fragment_id, sequence_index in fragment_id_sequence_index))
         # with self.session_scope():
         #     try:
         #         for fragment_id, sequence_index in fragment_id_sequence_index:
@@ -101,25 +273,28 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
         #         exit(1)
 
     def makeCompound(self, name, compound_type, compound_hash, compound_size, wrapping_type, compression_type):
-        with self.session_scope() as session:  # type: Session
-            return self._get_or_create(session, Compound, None, compound_name=name, compound_type=compound_type,
-                                       compound_hash=compound_hash, compound_size=compound_size,
-                                       wrapping_type=wrapping_type, compression_type=compression_type,
-                                       compound_version=CompoundVersion(None))
+        with self.session_scope(write=True) as session:  # type: Session
+            with self._tracking_statistics(session, compound_criteria=[Compound.compound_hash == compound_hash]):
+                return self._get_or_create(session, Compound, None, compound_name=name, compound_type=compound_type,
+                                           compound_hash=compound_hash, compound_size=compound_size,
+                                           wrapping_type=wrapping_type, compression_type=compression_type,
+                                           compound_version=CompoundVersion(None))
 
     def makeSnapshottedCompound(self, compound):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             max_version = self._getMaxVersionOfCompound(compound.compound_name, session)
             snapshot_version = 1 if max_version is None else max_version + 1
             # print(snapshot_version)
-            return self._create(session, Compound,
-                                compound_name=compound.compound_name,
-                                compound_type=compound.compound_type,
-                                compound_hash=compound.compound_hash,
-                                compound_size=compound.compound_size,
-                                wrapping_type=compound.wrapping_type,
-                                compression_type=compound.compression_type,
-                                compound_version=CompoundVersion(snapshot_version))
+            with self._tracking_statistics(session,
+                                           compound_criteria=[Compound.compound_hash == compound.compound_hash]):
+                return self._create(session, Compound,
+                                    compound_name=compound.compound_name,
+                                    compound_type=compound.compound_type,
+                                    compound_hash=compound.compound_hash,
+                                    compound_size=compound.compound_size,
+                                    wrapping_type=compound.wrapping_type,
+                                    compression_type=compound.compression_type,
+                                    compound_version=CompoundVersion(snapshot_version))
 
     def _getMaxVersionOfCompound(self, compound_name, session):
         # type: (str, Session) -> Optional[int]
@@ -131,13 +306,17 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             return None
 
     def updateCompound(self, name, compound_type, compound_hash, compound_size, wrapping_type, compression_type):
-        with self.session_scope() as session:  # type: Session
-            return self._update(session, Compound, get_by=[Compound.compound_name == name],
-                                update_to={Compound.compound_type: compound_type,
-                                           Compound.compound_hash: compound_hash,
-                                           Compound.compound_size: compound_size,
-                                           Compound.wrapping_type: wrapping_type,
-                                           Compound.compression_type: compression_type})
+        with self.session_scope(write=True) as session:  # type: Session
+            compound_hashes = self._compound_hashes(session, Compound.compound_name == name)
+            compound_hashes.add(compound_hash)
+            with self._tracking_statistics(session, compound_criteria=self._in_criteria(Compound.compound_hash,
+                                                                                          compound_hashes)):
+                return self._update(session, Compound, get_by=[Compound.compound_name == name],
+                                    update_to={Compound.compound_type: compound_type,
+                                               Compound.compound_hash: compound_hash,
+                                               Compound.compound_size: compound_size,
+                                               Compound.wrapping_type: wrapping_type,
+                                               Compound.compression_type: compression_type})
 
     def hasCompoundWithName(self, name, version=CompoundVersion(None)):
         with self.session_scope() as session:  # type: Session
@@ -189,6 +368,20 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             #     print(i)
             return self._exposable_lengen_query(exposed_session, query)
 
+    def getSequenceIndexSortedFragmentsWithResourceForCompound(self, compound_id):
+        with self.exposable_session_scope() as exposed_session:  # type: ExposableGeneratorQuery
+            session = exposed_session.session
+            query = session.query(CompoundFragmentMapping.sequence_index, Fragment, Resource,
+                                  FragmentResourceMapping.fragment_offset)  # type: Query
+            query = query.select_from(CompoundFragmentMapping)
+            query = query.filter(CompoundFragmentMapping.compound_id == compound_id)
+            query = query.join(Fragment, Fragment.fragment_id == CompoundFragmentMapping.fragment_id)
+            query = query.outerjoin(FragmentResourceMapping,
+                                    FragmentResourceMapping.fragment_id == Fragment.fragment_id)
+            query = query.outerjoin(Resource, Resource.resource_id == FragmentResourceMapping.resource_id)
+            query = query.order_by(CompoundFragmentMapping.sequence_index.asc())
+            return self._exposable_lengen_query(exposed_session, query)
+
     def getFragmentHashesNeededForCompound(self, compound_id):
         with self.exposable_session_scope() as exposed_session:  # type: ExposableGeneratorQuery
             session = exposed_session.session
@@ -203,7 +396,7 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             # return [fh for fh, in query.all()]
 
     def getAllCompounds(self, type_filter=None, order_alphabetically=False, starting_with=None, ending_with=None,
-                        slash_count=None, min_size=None, include_snapshots=False):
+                        slash_count=None, min_size=None, include_snapshots=False, parent=None):
         with self.exposable_session_scope() as exposed_session:  # type: ExposableGeneratorQuery
             session = exposed_session.session
             query = session.query(Compound)  # type: Query
@@ -228,6 +421,8 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
                 query = query.filter(Compound.compound_name.ilike('/%' * slash_count))
                 slash_count += 1
                 query = query.filter(not_(Compound.compound_name.ilike('/%' * slash_count)))
+            if parent is not None:
+                query = query.filter(Compound.compound_parent == parent)
             if min_size is not None:
                 if min_size < 0:
                     raise ValueError('negative minimum file size')
@@ -367,20 +562,22 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             return session.query(Resource).count()
 
     def removeCompound(self, compound_id):
-        with self.session_scope() as session:  # type: Session
-            self._delete(session, Compound, Compound.compound_id == compound_id)
+        with self.session_scope(write=True) as session:  # type: Session
+            with self._tracking_compounds_statistics(session, Compound.compound_id == compound_id):
+                self._delete(session, Compound, Compound.compound_id == compound_id)
 
     def renameCompound(self, old_name, new_name):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             query = session.query(Compound)  # type: Query
             query = query.filter(Compound.compound_name == old_name)  # type: Query
             count = query.count()
             if count < 1:
                 raise NotExistingException('no compound found with name ' + old_name)
-            query.update({Compound.compound_name: new_name}, synchronize_session='fetch')
+            query.update({Compound.compound_name: new_name, Compound.compound_parent: compoundParent(new_name)},
+                         synchronize_session='fetch')
 
     def renameResource(self, old_resource_name, new_resource_name):
-        with self.session_scope() as session:
+        with self.session_scope(write=True) as session:
             query = session.query(Resource)  # type: Query
             query = query.filter(Resource.resource_name == old_resource_name)
             count = query.count()
@@ -389,7 +586,7 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             query.update({Resource.resource_name: new_resource_name}, synchronize_session='fetch')
 
     def massRenameResource(self, old_new_resource_name_pairs, skip_unknown=False):
-        with self.session_scope() as session:
+        with self.session_scope(write=True) as session:
             for old_resource_name, new_resource_name in old_new_resource_name_pairs:
                 query = session.query(Resource)  # type: Query
                 query = query.filter(Resource.resource_name == old_resource_name)
@@ -401,7 +598,7 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
                 query.update({Resource.resource_name: new_resource_name}, synchronize_session='fetch')
 
     def collectGarbage(self, keep_fragments=False, keep_resources=True):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             # if not keep_payloads:
             #     query = self.session.query(Payload.payload_id)  # type: Query
             #     query = query.outerjoin(Compound, Payload.payload_id == Compound.payload_id)  # type: Query
@@ -422,12 +619,15 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
                 query = query.filter(Fragment.fragment_id.in_(subquery))
                 # for x in query.all():
                 #     print("deleting fragment in cache_meta", x)
-                query.delete(synchronize_session='fetch')
+                with self._tracking_statistics(session, fragment_criteria=[self._unreferenced_fragment_criterion()]):
+                    query.delete(synchronize_session='fetch')
             if not keep_resources:
+                unreferenced = not_(
+                    Resource.resource_id.in_(session.query(FragmentResourceMapping.resource_id).subquery()))
                 query = session.query(Resource)  # type: Query
-                query = query.filter(
-                    not_(Resource.resource_id.in_(session.query(FragmentResourceMapping.resource_id).subquery())))
-                query.delete(synchronize_session='fetch')
+                query = query.filter(unreferenced)
+                with self._tracking_statistics(session, resource_criteria=[unreferenced]):
+                    query.delete(synchronize_session='fetch')
 
     # def getPayloadByID(self, payload_id):
     #     with self.session_scope():
@@ -459,12 +659,14 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             # return [fht[0] for fht in query.all()]
 
     def deleteResourceByID(self, resource_id):
-        with self.session_scope() as session:  # type: Session
-            self._delete(session, Resource, Resource.resource_id == resource_id)
+        with self.session_scope(write=True) as session:  # type: Session
+            with self._tracking_statistics(session, resource_criteria=[Resource.resource_id == resource_id]):
+                self._delete(session, Resource, Resource.resource_id == resource_id)
 
     def deleteResourceByName(self, resource_name):
-        with self.session_scope() as session:  # type: Session
-            self._delete(session, Resource, Resource.resource_name == resource_name)
+        with self.session_scope(write=True) as session:  # type: Session
+            with self._tracking_statistics(session, resource_criteria=[Resource.resource_name == resource_name]):
+                self._delete(session, Resource, Resource.resource_name == resource_name)
 
     def getResourceForFragment(self, fragment_id):
         with self.session_scope() as session:  # type: Session
@@ -472,8 +674,9 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
                                  FragmentResourceMapping.fragment_id == fragment_id)
 
     def truncateAllCompounds(self):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             self._delete(session, Compound)
+            self._recompute_statistics(session)
 
     def getDuplicateFragmentsCount(self):
         with self.session_scope() as session:  # type: Session
@@ -637,12 +840,12 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
                 raise NotImplementedError
 
     def makeFragmentResourceMapping(self, fragment_id, resource_id, fragment_offset):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             self._get_or_create(session, FragmentResourceMapping, fragment_id=fragment_id, resource_id=resource_id,
                                 fragment_offset=fragment_offset)
 
     def makeMultipleFragmentResourceMapping(self, resource_id, fragment_id_fragment_offset):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             for chunk in chunkiterable_gen((fid for fid, _ in fragment_id_fragment_offset), 500, skip_none=True):
                 try:
                     self._delete(session, FragmentResourceMapping, FragmentResourceMapping.fragment_id.in_(chunk))
@@ -659,13 +862,10 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
 
     def getSmallestResource(self, ignore=None):
         with self.session_scope() as session:  # type: Session
-
-            referenced_resources = aliased(FragmentResourceMapping, session.query(FragmentResourceMapping).distinct(
-                FragmentResourceMapping.resource_id).subquery())  # type: Type[FragmentResourceMapping]
-
+            # walks the payload size index and stops at the first referenced resource, instead of sorting all
+            # referenced resources
             query = session.query(Resource)
-            query = query.select_from(referenced_resources)
-            query = query.join(Resource, Resource.resource_id == referenced_resources.resource_id)
+            query = query.filter(exists().where(FragmentResourceMapping.resource_id == Resource.resource_id))
             if ignore:
                 query = query.filter(Resource.resource_hash.notin_(ignore))
             query = query.order_by(Resource.resource_payloadsize.asc())
@@ -676,24 +876,27 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
     def updateResource(self, resource_id, resource_name, resource_size, resource_payloadsize, resource_hash,
                        resource_wrap_type,
                        resource_compress_type):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             old_resource = self._get(session, Resource, Resource.resource_id == resource_id)
             # self.session.expunge(old_resource)
-            new_resource = self._update(session,
-                                        Resource,
-                                        get_by=[Resource.resource_id == resource_id, ],
-                                        update_to={Resource.resource_name: resource_name,
-                                                   Resource.resource_size: resource_size,
-                                                   Resource.resource_payloadsize: resource_payloadsize,
-                                                   Resource.resource_hash: resource_hash,
-                                                   Resource.wrapping_type: resource_wrap_type,
-                                                   Resource.compression_type: resource_compress_type})
-            if new_resource.resource_hash != old_resource.resource_hash:
-                self._create(session, Resource, resource_name=old_resource.resource_name,
-                             resource_size=old_resource.resource_size,
-                             resource_payloadsize=old_resource.resource_payloadsize,
-                             resource_hash=old_resource.resource_hash, wrapping_type=old_resource.wrapping_type,
-                             compression_type=old_resource.compression_type)
+            resource_names = {old_resource.resource_name, resource_name}
+            with self._tracking_statistics(session, resource_criteria=self._in_criteria(Resource.resource_name,
+                                                                                          resource_names)):
+                new_resource = self._update(session,
+                                            Resource,
+                                            get_by=[Resource.resource_id == resource_id, ],
+                                            update_to={Resource.resource_name: resource_name,
+                                                       Resource.resource_size: resource_size,
+                                                       Resource.resource_payloadsize: resource_payloadsize,
+                                                       Resource.resource_hash: resource_hash,
+                                                       Resource.wrapping_type: resource_wrap_type,
+                                                       Resource.compression_type: resource_compress_type})
+                if new_resource.resource_hash != old_resource.resource_hash:
+                    self._create(session, Resource, resource_name=old_resource.resource_name,
+                                 resource_size=old_resource.resource_size,
+                                 resource_payloadsize=old_resource.resource_payloadsize,
+                                 resource_hash=old_resource.resource_hash, wrapping_type=old_resource.wrapping_type,
+                                 compression_type=old_resource.compression_type)
             return new_resource
 
     def getUnreferencedFragments(self):
@@ -713,15 +916,17 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
 
     def deleteFragments(self, unreferenced_fragments):
         fragment_ids = set((f.fragment_id for f in unreferenced_fragments))
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             query = session.query(Fragment)  # type: Query
             # if only_pending:
             #     query = query.filter(Fragment.fragment_pending.is_(True))
-            for chunk in chunkiterable_gen(fragment_ids, 500, skip_none=True):
-                query.filter(Fragment.fragment_id.in_(chunk)).delete(synchronize_session='fetch')
+            with self._tracking_statistics(session,
+                                           fragment_criteria=self._in_criteria(Fragment.fragment_id, fragment_ids)):
+                for chunk in chunkiterable_gen(fragment_ids, 500, skip_none=True):
+                    query.filter(Fragment.fragment_id.in_(chunk)).delete(synchronize_session='fetch')
 
     def deleteUnreferencedFragments(self):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             query = session.query(Fragment.fragment_id)  # type: Query
             query = query.outerjoin(CompoundFragmentMapping,
                                     CompoundFragmentMapping.fragment_id == Fragment.fragment_id)  # type: Query
@@ -729,8 +934,9 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             # for i in query.all():
             #     print(i)
             # query = query.order_by(Fragment.fragment_id)
-            session.query(Fragment).filter(Fragment.fragment_id.in_(query.subquery())).delete(
-                synchronize_session='fetch')
+            with self._tracking_statistics(session, fragment_criteria=[self._unreferenced_fragment_criterion()]):
+                session.query(Fragment).filter(Fragment.fragment_id.in_(query.subquery())).delete(
+                    synchronize_session='fetch')
 
     def getResourceByResourceName(self, resource_name):
         with self.session_scope() as session:  # type: Session
@@ -752,13 +958,13 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             # return [i[0] for i in query.all()]
 
     def removeCompoundByName(self, compoundname, keep_snapshots=False):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             if keep_snapshots:
-                self._delete(session, Compound,
-                             Compound.compound_name == compoundname,
-                             Compound.compound_version.is_(None))
+                criterion = (Compound.compound_name == compoundname, Compound.compound_version.is_(None))
             else:
-                self._delete(session, Compound, Compound.compound_name == compoundname)
+                criterion = (Compound.compound_name == compoundname,)
+            with self._tracking_compounds_statistics(session, *criterion):
+                self._delete(session, Compound, *criterion)
 
     def getResourceWithReferencedFragmentSize(self):
         with self.exposable_session_scope() as exposed_session:  # type: ExposableGeneratorQuery
@@ -779,15 +985,16 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
     def getFragmentsWithOffsetOnResource(self, resource_id):
         with self.exposable_session_scope() as exposed_session:  # type: ExposableGeneratorQuery
             session = exposed_session.session
-            FragmentResourceMappingSQ = aliased(FragmentResourceMapping, session.query(FragmentResourceMapping).filter(
-                FragmentResourceMapping.resource_id == resource_id).subquery())  # type: Type[FragmentResourceMapping]
-            query = session.query(Fragment, FragmentResourceMappingSQ.fragment_offset)  # type: Query
-            query = query.select_from(FragmentResourceMappingSQ)
-            query = query.join(Fragment, Fragment.fragment_id == FragmentResourceMappingSQ.fragment_id)
-            return self._exposable_lengen_query(exposed_session, query, Fragment.fragment_id)
+            query = session.query(Fragment, FragmentResourceMapping.fragment_offset)  # type: Query
+            query = query.select_from(FragmentResourceMapping)
+            query = query.filter(FragmentResourceMapping.resource_id == resource_id)
+            query = query.join(Fragment, Fragment.fragment_id == FragmentResourceMapping.fragment_id)
+            # the order of the covering resource offset index
+            query = query.order_by(FragmentResourceMapping.fragment_offset, FragmentResourceMapping.fragment_id)
+            return self._exposable_lengen_query(exposed_session, query)
 
     def moveFragmentMappings(self, old_resource, new_resource):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
             query = session.query(FragmentResourceMapping)
             query = query.filter(FragmentResourceMapping.resource_id == old_resource)  # type: Query
             query.update({FragmentResourceMapping.resource_id: new_resource})
@@ -851,27 +1058,52 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             return self._exposable_lengen_query(exposed_session, query)
 
     def makeAndMapFragmentsToResource(self, resource_id, fragments_offset):
-        with self.session_scope() as session:  # type: Session
-            new_fragments_offset = []  # type: List[Tuple[Fragment, FragmentOffset]]
-            for fragment, offset in fragments_offset:
-                new_fragment = self._get_or_create(session, Fragment, None, fragment_hash=fragment.fragment_hash,
-                                                   fragment_size=fragment.fragment_size,
-                                                   fragment_payload_size=fragment.fragment_payload_size)
-                new_fragments_offset.append((new_fragment, offset))
-            for chunk in chunkiterable_gen((f.fragment_id for f, _ in new_fragments_offset), 500, skip_none=True):
-                try:
-                    self._delete(session, FragmentResourceMapping, FragmentResourceMapping.fragment_id.in_(chunk))
-                except NotExistingException:
-                    pass
-            session.bulk_insert_mappings(FragmentResourceMapping,
-                                         (dict(fragment_id=fragment.fragment_id,
-                                               resource_id=resource_id,
-                                               fragment_offset=fragment_offset)
-                                          for fragment, fragment_offset in new_fragments_offset))
-            return new_fragments_offset
+        with self.session_scope(write=True) as session:  # type: Session
+            fragments_offset = list(fragments_offset)
+            self._add_to_filter(False, (f.fragment_hash for f, _ in fragments_offset))
+            fragment_rows = {f.fragment_hash: dict(fragment_hash=f.fragment_hash,
+                                                   fragment_size=f.fragment_size,
+                                                   fragment_payload_size=f.fragment_payload_size)
+                             for f, _ in fragments_offset}
+            with self._tracking_statistics(session, fragment_criteria=self._in_criteria(Fragment.fragment_hash,
+                                                                                          fragment_rows)):
+                self._bulk_insert(session, Fragment.__table__, list(fragment_rows.values()),
+                                  skip_existing=Fragment.__table__.c.fragment_hash)
+            fragments = self._fragments_by_hash(session, fragment_rows)
+            # already mapped fragments are moved to the given resource
+            self._bulk_insert(session, FragmentResourceMapping.__table__,
+                              [dict(fragment_id=fragments[f.fragment_hash].fragment_id,
+                                    resource_id=resource_id,
+                                    fragment_offset=fragment_offset)
+                               for f, fragment_offset in fragments_offset],
+                              replace_existing=FragmentResourceMapping.__table__.c.fragment_id)
+            return [(fragments[f.fragment_hash], fragment_offset) for f, fragment_offset in fragments_offset]
 
     def addOverwriteCompoundAndMapFragments(self, compound, fragment_payload_index):
-        with self.session_scope() as session:  # type: Session
+        with self.session_scope(write=True) as session:  # type: Session
+            self._add_overwrite_compound(session, compound, list(fragment_payload_index))
+
+    def addOverwriteCompoundsAndMapFragments(self, compounds_fragment_payload_index):
+        with self.session_scope(write=True) as session:  # type: Session
+            for compound, fragment_payload_index in compounds_fragment_payload_index:
+                self._add_overwrite_compound(session, compound, list(fragment_payload_index))
+
+    def _add_overwrite_compound(self, session, compound, fragment_payload_index):
+        # type: (Session, Compound, List[Tuple[Fragment, SequenceIndex]]) -> None
+        existing_compound = (Compound.compound_name == compound.compound_name,
+                             Compound.compound_version == compound.compound_version)
+        compound_hashes = self._compound_hashes(session, *existing_compound)
+        compound_hashes.add(compound.compound_hash)
+        fragment_ids = dict((f.fragment_hash, f.fragment_id) for f in self._fragments_by_hash(
+            session, set(f.fragment_hash for f, _ in fragment_payload_index)).values())
+        for fragment, _ in fragment_payload_index:
+            if fragment.fragment_hash not in fragment_ids:
+                raise NotExistingException('no fragment found with hash ' + repr(fragment.fragment_hash))
+        tracked_fragment_ids = self._mapped_fragment_ids(session, *existing_compound)
+        tracked_fragment_ids.update(fragment_ids.values())
+        with self._tracking_statistics(session,
+                                       self._in_criteria(Compound.compound_hash, compound_hashes),
+                                       self._in_criteria(Fragment.fragment_id, tracked_fragment_ids)):
             try:
                 self._update(session,
                              Compound,
@@ -889,17 +1121,22 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             new_compound = self._get_one(session, Compound,
                                          Compound.compound_name == compound.compound_name,
                                          Compound.compound_version == compound.compound_version)
-            new_fragment_payload_index = []  # type: List[Tuple[Fragment, SequenceIndex]]
-            for fragment, payload_index in fragment_payload_index:
-                new_fragment = self._get_one(session, Fragment, Fragment.fragment_hash == fragment.fragment_hash)
-                new_fragment_payload_index.append((new_fragment, payload_index))
-            self._delete(session, CompoundFragmentMapping,
-                         CompoundFragmentMapping.compound_id == new_compound.compound_id)
-            session.bulk_insert_mappings(CompoundFragmentMapping,
-                                         (dict(compound_id=new_compound.compound_id,
-                                               fragment_id=fragment.fragment_id,
-                                               sequence_index=sequence_index)
-                                          for fragment, sequence_index in new_fragment_payload_index))
+            session.query(CompoundFragmentMapping).filter(
+                CompoundFragmentMapping.compound_id == new_compound.compound_id).delete(synchronize_session=False)
+            self._bulk_insert(session, CompoundFragmentMapping.__table__,
+                              [dict(compound_id=new_compound.compound_id,
+                                    fragment_id=fragment_ids[fragment.fragment_hash],
+                                    sequence_index=sequence_index)
+                               for fragment, sequence_index in fragment_payload_index])
+
+    def _fragments_by_hash(self, session, fragment_hashes):
+        # type: (Session, Iterable[FragmentHash]) -> Dict[FragmentHash, Fragment]
+        fragments = {}  # type: Dict[FragmentHash, Fragment]
+        for chunk in chunkiterable_gen(fragment_hashes, 500, skip_none=True):
+            if chunk:
+                fragments.update((f.fragment_hash, f) for f in session.query(Fragment).filter(
+                    Fragment.fragment_hash.in_(chunk)))
+        return fragments
 
     def getSnapshotsOfCompound(self, compound_name, min_version=None, max_version=None, include_live_version=False):
         with self.exposable_session_scope() as exposed_session:  # type: ExposableGeneratorQuery
@@ -915,3 +1152,292 @@ class SQLAlchemyMetaDB(MetaDBInterface, SQLAlchemyHelperMixin):
             query = query.order_by(Compound.compound_version)
 
             return self._exposable_lengen_query(exposed_session, query)
+
+    # region Export
+
+    @property
+    def engine(self):
+        # type: () -> Engine
+        return self.sessionmaker.session_factory.kw['bind']
+
+    def exportMeta(self, stream, chunk_size=10000):
+        with self._scope_lock(False):
+            exportTables(self.engine, stream, chunk_size=chunk_size)
+
+    def importMeta(self, stream, resume=True, chunk_size=10000):
+        with self._scope_lock(True):
+            try:
+                importTables(self.engine, stream, chunk_size=chunk_size, resume=resume)
+            finally:
+                # also recount the chunks of an interrupted import, they are committed
+                self._invalidate_filters()
+                self.recomputeStatistics()
+
+    # endregion
+
+    # region Statistics
+
+    def getStatistics(self):
+        with self.session_scope() as session:  # type: Session
+            return Statistics({name: int(value) for name, value in
+                               session.query(Statistic.statistic_name, Statistic.statistic_value)})
+
+    def recomputeStatistics(self):
+        with self.session_scope(write=True) as session:  # type: Session
+            self._recompute_statistics(session)
+
+    def _init_statistics(self):
+        # databases created before the statistics table existed, start with an empty table
+        with self.session_scope(write=True) as session:  # type: Session
+            if session.query(Statistic).first() is None:
+                self._recompute_statistics(session)
+
+    def _recompute_statistics(self, session):
+        # type: (Session) -> None
+        statistics = self._statistics(session, [true()], [true()], [true()])
+        # the untyped counters are always stored, an empty table marks missing statistics
+        for statistic_name in (COMPOUND_SIZE, UNIQUE_COMPOUND_COUNT, UNIQUE_COMPOUND_SIZE, FRAGMENT_COUNT,
+                               FRAGMENT_SIZE, DUPLICATE_FRAGMENT_COUNT, DUPLICATE_FRAGMENT_SAVED_SIZE,
+                               UNNEEDED_FRAGMENT_COUNT, UNNEEDED_FRAGMENT_SIZE, RESOURCE_COUNT, RESOURCE_SIZE):
+            statistics.setdefault(statistic_name, 0)
+        self._discard_statistics(session)
+        session.query(Statistic).delete(synchronize_session=False)
+        session.bulk_insert_mappings(Statistic, (dict(statistic_name=name, statistic_value=value)
+                                                 for name, value in statistics.items()))
+
+    @contextmanager
+    def _tracking_statistics(self, session, compound_criteria=(), fragment_criteria=(), resource_criteria=()):
+        # type: (Session, StatisticCriteria, StatisticCriteria, StatisticCriteria) -> Generator[None, None, None]
+        """
+        updates the statistic counters by the change done within the context. The criteria have to match every
+        partition, which gets touched by the change, before and after it.
+        """
+        before = self._statistics(session, compound_criteria, fragment_criteria, resource_criteria)
+        yield
+        session.flush()
+        after = self._statistics(session, compound_criteria, fragment_criteria, resource_criteria)
+        self._add_statistics(session, {name: after[name] - before[name] for name in set(before) | set(after)})
+
+    @contextmanager
+    def _tracking_compounds_statistics(self, session, *criterion):
+        # type: (Session, *ClauseElement) -> Generator[None, None, None]
+        """
+        tracks the statistics of compounds, which get deleted within the context, including their mapped fragments
+        """
+        with self._tracking_statistics(
+                session,
+                compound_criteria=self._in_criteria(Compound.compound_hash, self._compound_hashes(session, *criterion)),
+                fragment_criteria=self._in_criteria(Fragment.fragment_id,
+                                                    self._mapped_fragment_ids(session, *criterion))):
+            yield
+
+    @staticmethod
+    def _add_statistics(session, deltas):
+        # type: (Session, Dict[StatisticName, int]) -> None
+        """
+        collects the counter changes, they are written once, when the transaction gets committed
+        """
+        session.info.setdefault(_STATISTIC_DELTAS, Counter()).update(deltas)
+
+    @staticmethod
+    def _apply_statistics(session):
+        # type: (Session) -> None
+        deltas = session.info.pop(_STATISTIC_DELTAS, None)
+        if not deltas:
+            return
+        # the counter rows are locked in the same order by every writer, concurrent transactions would deadlock
+        # otherwise
+        for statistic_name in sorted(deltas):
+            delta = deltas[statistic_name]
+            if not delta:
+                continue
+            updated = session.query(Statistic).filter(Statistic.statistic_name == statistic_name).update(
+                {Statistic.statistic_value: Statistic.statistic_value + delta}, synchronize_session=False)
+            if not updated:
+                session.add(Statistic(statistic_name, delta))
+
+    @staticmethod
+    def _discard_statistics(session):
+        # type: (Session) -> None
+        session.info.pop(_STATISTIC_DELTAS, None)
+
+    @staticmethod
+    def _in_criteria(column, keys):
+        # type: (InstrumentedAttribute, Iterable) -> List[ClauseElement]
+        return [column.in_(chunk) for chunk in chunkiterable_gen(keys, 500, skip_none=True) if chunk]
+
+    @staticmethod
+    def _compound_hashes(session, *criterion):
+        # type: (Session, *ClauseElement) -> Set[CompoundHash]
+        return set(h for h, in session.query(Compound.compound_hash).filter(*criterion))
+
+    @staticmethod
+    def _mapped_fragment_ids(session, *criterion):
+        # type: (Session, *ClauseElement) -> Set[FragmentID]
+        query = session.query(CompoundFragmentMapping.fragment_id)  # type: Query
+        query = query.join(Compound, Compound.compound_id == CompoundFragmentMapping.compound_id)
+        return set(fragment_id for fragment_id, in query.filter(*criterion))
+
+    @staticmethod
+    def _unreferenced_fragment_criterion():
+        # type: () -> ClauseElement
+        return not_(exists().where(CompoundFragmentMapping.fragment_id == Fragment.fragment_id).correlate_except(
+            CompoundFragmentMapping))
+
+    def _statistics(self, session, compound_criteria, fragment_criteria, resource_criteria):
+        # type: (Session, StatisticCriteria, StatisticCriteria, StatisticCriteria) -> Counter
+        """
+        sums up the statistics of all partitions matched by the criteria, the criteria must not overlap
+        """
+        statistics = Counter()
+        for criterion in compound_criteria:
+            self._compound_statistics(session, criterion, statistics)
+        for criterion in fragment_criteria:
+            self._fragment_statistics(session, criterion, statistics)
+        for criterion in resource_criteria:
+            self._resource_statistics(session, criterion, statistics)
+        return statistics
+
+    @staticmethod
+    def _compound_statistics(session, criterion, statistics):
+        # type: (Session, ClauseElement, Counter) -> None
+        live = Compound.compound_version.is_(None)
+        query = session.query(Compound.compound_type, func.count(Compound.compound_id),
+                              func.count(distinct(Compound.compound_hash)),
+                              func.sum(Compound.compound_size))  # type: Query
+        query = query.filter(live, criterion).group_by(Compound.compound_type)
+        for compound_type, count, unique_count, size in query:
+            statistics[typedStatisticName(COMPOUND_COUNT, compound_type)] += count
+            statistics[typedStatisticName(UNIQUE_COMPOUND_COUNT, compound_type)] += unique_count
+            statistics[COMPOUND_SIZE] += int(size or 0)
+
+        query = session.query(Compound.compound_type, func.count(Compound.compound_id))  # type: Query
+        query = query.filter(Compound.compound_version.isnot(None), criterion).group_by(Compound.compound_type)
+        for compound_type, count in query:
+            statistics[typedStatisticName(SNAPSHOT_COUNT, compound_type)] += count
+
+        unique_compounds = session.query(Compound.compound_hash, Compound.compound_size)  # type: Query
+        unique_compounds = unique_compounds.filter(live, criterion).distinct().subquery()
+        count, size = session.query(func.count(distinct(unique_compounds.c.compound_hash)),
+                                    func.sum(unique_compounds.c.compound_size)).one()
+        statistics[UNIQUE_COMPOUND_COUNT] += count
+        statistics[UNIQUE_COMPOUND_SIZE] += int(size or 0)
+
+    @staticmethod
+    def _fragment_statistics(session, criterion, statistics):
+        # type: (Session, ClauseElement, Counter) -> None
+        count, size = session.query(func.count(Fragment.fragment_id),
+                                    func.sum(Fragment.fragment_size)).filter(criterion).one()
+        statistics[FRAGMENT_COUNT] += count
+        statistics[FRAGMENT_SIZE] += int(size or 0)
+
+        usages = func.count(CompoundFragmentMapping.payload_fragment_id)
+        duplicates = session.query(Fragment.fragment_size, usages.label('usages'))  # type: Query
+        duplicates = duplicates.join(CompoundFragmentMapping,
+                                     CompoundFragmentMapping.fragment_id == Fragment.fragment_id)
+        duplicates = duplicates.join(Compound, Compound.compound_id == CompoundFragmentMapping.compound_id)
+        duplicates = duplicates.filter(Compound.compound_version.is_(None), criterion)
+        duplicates = duplicates.group_by(Fragment.fragment_id, Fragment.fragment_size).having(usages > 1).subquery()
+        count, size = session.query(func.count(duplicates.c.fragment_size),
+                                    func.sum(duplicates.c.fragment_size * (duplicates.c.usages - 1))).one()
+        statistics[DUPLICATE_FRAGMENT_COUNT] += count
+        statistics[DUPLICATE_FRAGMENT_SAVED_SIZE] += int(size or 0)
+
+        count, size = session.query(func.count(Fragment.fragment_id), func.sum(Fragment.fragment_size)).filter(
+            SQLAlchemyMetaDB._unreferenced_fragment_criterion(), criterion).one()
+        statistics[UNNEEDED_FRAGMENT_COUNT] += count
+        statistics[UNNEEDED_FRAGMENT_SIZE] += int(size or 0)
+
+    @staticmethod
+    def _resource_statistics(session, criterion, statistics):
+        # type: (Session, ClauseElement, Counter) -> None
+        count, size = session.query(func.count(Resource.resource_id),
+                                    func.sum(Resource.resource_size)).filter(criterion).one()
+        statistics[RESOURCE_COUNT] += count
+        statistics[RESOURCE_SIZE] += int(size or 0)
+
+    # endregion
+
+    # region Membership Filters
+
+    def _startFilterRebuild(self):
+        # type: () -> bool
+        """
+        starts recording added hashes for a rebuild, returns False if a rebuild is already running
+        """
+        with self._filter_lock:
+            if self._filter_additions is not None:
+                return False
+            self._filter_additions = ([], [])
+            return True
+
+    def _load_filters(self):
+        """
+        scans all hashes into new filters. The scan does not hold the write lock, hashes added in the meantime are
+        recorded by _add_to_filter and added before the new filters replace the old ones.
+        """
+        try:
+            # hashes added before the recording started belong to writing sessions, which commit before the scan
+            with self._scope_lock(True):
+                with self._filter_lock:
+                    generation = self._filter_generation
+            with self.session_scope() as session:  # type: Session
+                fragment_filter = self._scan_filter(session, Fragment.fragment_hash)
+                plaintext_filter = self._scan_filter(session, FragmentPlaintextMapping.plaintext_hash)
+            with self._filter_lock:
+                if generation == self._filter_generation:
+                    fragment_additions, plaintext_additions = self._filter_additions
+                    fragment_filter.update(fragment_additions)
+                    plaintext_filter.update(plaintext_additions)
+                    self._fragment_filter = fragment_filter
+                    self._plaintext_filter = plaintext_filter
+        finally:
+            with self._filter_lock:
+                self._filter_additions = None
+
+    def _scan_filter(self, session, column):
+        # type: (Session, InstrumentedAttribute) -> BloomFilter
+        count = session.query(func.count(column)).scalar() or 0
+        # twice the current amount leaves room to grow before the filter needs to get rebuilt
+        hash_filter = BloomFilter(max(count * 2, 1024), self.filter_error_rate)
+        hash_filter.update(h for h, in session.query(column).yield_per(self.yield_size))
+        return hash_filter
+
+    def _add_to_filter(self, plaintext, hashes):
+        # type: (bool, Iterable[bytes]) -> None
+        with self._filter_lock:
+            hash_filter = self._plaintext_filter if plaintext else self._fragment_filter
+            if hash_filter is None and self._filter_additions is None:
+                return
+            hashes = list(hashes)
+            if hash_filter is not None:
+                hash_filter.update(hashes)
+            if self._filter_additions is not None:
+                self._filter_additions[plaintext].extend(hashes)
+
+    def _invalidate_filters(self):
+        # hashes inserted without _add_to_filter, e.g. by an import, are missing in the filters, drop them and rebuild
+        # them on the next lookup. Deleted hashes stay in the filters, they only cause false positives.
+        with self._filter_lock:
+            self._fragment_filter = None
+            self._plaintext_filter = None
+            self._filter_generation += 1
+
+    def _surely_missing(self, hash_value, plaintext):
+        # type: (bytes, bool) -> bool
+        """
+        returns True if the hash is definitely not stored, False if the DB has to be asked.
+        A full or dropped filter gets rebuilt in the background, until then the full filter keeps answering with more
+        false positives, without a filter the DB is asked.
+        """
+        if not self.fragment_filter_enabled:
+            return False
+        with self._filter_lock:
+            hash_filter = self._plaintext_filter if plaintext else self._fragment_filter
+            rebuild = hash_filter is None or hash_filter.isFull
+            missing = hash_filter is not None and hash_value not in hash_filter
+        if rebuild and self._startFilterRebuild():
+            Thread(target=self._load_filters, name='FilterRebuild', daemon=True).start()
+        return missing
+
+    # endregion
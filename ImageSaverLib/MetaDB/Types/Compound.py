@@ -1,8 +1,9 @@
+import posixpath
 from typing import NewType, Optional
 
 from ImageSaverLib.Encapsulation import WrappingType, CompressionType
 from ImageSaverLib.MetaDB.Types import ColumnPrinterMixin
-from sqlalchemy import Column, Integer, String, UniqueConstraint, LargeBinary, BigInteger, Sequence, Text
+from sqlalchemy import Column, Integer, String, UniqueConstraint, LargeBinary, BigInteger, Sequence, Text, Index
 
 from ImageSaverLib.MetaDB import Base
 
@@ -20,6 +21,16 @@ CompoundVersion = NewType('CompoundVersion', Optional[int])
 # CompoundPendingFlag = NewType('CompoundPendingFlag', bool)
 
 
+def compoundParent(compound_name):
+    # type: (CompoundName) -> Optional[CompoundName]
+    """
+    returns the name of the directory containing the compound, the root directory has no parent
+    """
+    if compound_name == '/':
+        return None
+    return CompoundName(posixpath.dirname(compound_name))
+
+
 class Compound(Base, ColumnPrinterMixin):
     FILE_TYPE = 'File'
     DIR_TYPE = 'Dir'
@@ -33,10 +44,15 @@ class Compound(Base, ColumnPrinterMixin):
     wrapping_type = Column(String(255))  # type: CompoundWrappingType
     compression_type = Column(String(255))  # type: CompoundCompressionType
     compound_version = Column(Integer)  # type: CompoundVersion
+    # materialized parent directory name, lets directory listings look up the children by index
+    compound_parent = Column(Text)  # type: Optional[CompoundName]
 
     # compound_pending = Column(Boolean)  # type: CompoundPendingFlag
     __table_args__ = (UniqueConstraint('compound_name', 'compound_hash', 'compound_type', 'compound_version'),
-                      UniqueConstraint('compound_name', 'compound_version')
+                      UniqueConstraint('compound_name', 'compound_version'),
+                      Index('ix_compounds_compound_parent', 'compound_parent', 'compound_version'),
+                      # hash lookups ask for one version, all empty files share the same hash
+                      Index('ix_compounds_compound_hash_version', 'compound_hash', 'compound_version')
                       )
 
     def __init__(self, compound_name, compound_type, compound_hash, compound_size, wrapping_type, compression_type, compound_version=None):
@@ -48,4 +64,5 @@ class Compound(Base, ColumnPrinterMixin):
         self.wrapping_type = wrapping_type
         self.compression_type = compression_type
         self.compound_version = compound_version
+        self.compound_parent = compoundParent(compound_name)
         # self.payload_id = payload_id
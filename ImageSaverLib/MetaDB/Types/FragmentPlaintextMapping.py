@@ -0,0 +1,36 @@
+from typing import NewType
+
+from sqlalchemy import Column, Integer, ForeignKey, LargeBinary, String, UniqueConstraint, Sequence
+
+from ImageSaverLib.Encapsulation import WrappingType, CompressionType
+from .. import Base
+from . import ColumnPrinterMixin
+from .Fragment import FragmentID
+
+FragmentPlaintextMappingID = NewType('FragmentPlaintextMappingID', int)
+PlaintextHash = NewType('PlaintextHash', bytes)
+"""sha256 of the fragment payload, before compression and wrapping is applied"""
+
+
+class FragmentPlaintextMapping(Base, ColumnPrinterMixin):
+    """
+    Maps the hash of an unencapsulated fragment payload plus the used compression and wrapping to the resulting
+    fragment, so known payloads do not need to be compressed and wrapped again.
+    """
+    __tablename__ = 'fragment_plaintext_mappings'
+    fragment_plaintext_mapping_id = Column(Integer, Sequence('fragment_plaintext_mapping_id_seq'), primary_key=True,
+                                           unique=True)  # type: FragmentPlaintextMappingID
+    plaintext_hash = Column(LargeBinary(64), nullable=False)  # type: PlaintextHash
+    compression_type = Column(String(255), nullable=False)  # type: CompressionType
+    wrapping_type = Column(String(255), nullable=False)  # type: WrappingType
+    fragment_id = Column(Integer, ForeignKey('fragments.fragment_id', ondelete='CASCADE'),
+                         nullable=False, index=True)  # type: FragmentID
+
+    __table_args__ = (UniqueConstraint('plaintext_hash', 'compression_type', 'wrapping_type'),)
+
+    def __init__(self, plaintext_hash, compression_type, wrapping_type, fragment_id):
+        # type: (PlaintextHash, CompressionType, WrappingType, FragmentID) -> None
+        self.plaintext_hash = plaintext_hash
+        self.compression_type = compression_type
+        self.wrapping_type = wrapping_type
+        self.fragment_id = fragment_id
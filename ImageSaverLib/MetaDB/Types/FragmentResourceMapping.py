@@ -4,7 +4,7 @@ from .. import Base
 from . import ColumnPrinterMixin
 from .Fragment import FragmentID
 from .Resource import ResourceID
-from sqlalchemy import Column, Integer, ForeignKey, BigInteger, UniqueConstraint, Sequence
+from sqlalchemy import Column, Integer, ForeignKey, BigInteger, UniqueConstraint, Sequence, Index
 
 FragmentResourceMappingID = NewType('FragmentResourceMappingID', int)
 FragmentOffset = NewType('FragmentOffset', int)
@@ -17,10 +17,13 @@ class FragmentResourceMapping(Base, ColumnPrinterMixin):
     fragment_id = Column(Integer, ForeignKey('fragments.fragment_id', ondelete='CASCADE'),
                          nullable=False, unique=True, index=True)  # type: FragmentID
     resource_id = Column(Integer, ForeignKey('resources.resource_id', ondelete='CASCADE'),
-                         nullable=False, unique=False, index=True)  # type: ResourceID
+                         nullable=False, unique=False)  # type: ResourceID
     fragment_offset = Column(BigInteger)  # type: FragmentOffset
 
-    __table_args__ = (UniqueConstraint('fragment_id', 'resource_id'), )
+    __table_args__ = (UniqueConstraint('fragment_id', 'resource_id'),
+                      # covers listing the fragments of a resource in offset order without reading the table
+                      Index('ix_fragment_resource_mappings_resource_offset', 'resource_id', 'fragment_offset',
+                            'fragment_id'))
 
     def __init__(self, fragment_id, resource_id, fragment_offset):
         # type: (FragmentID, ResourceID, FragmentOffset) -> None
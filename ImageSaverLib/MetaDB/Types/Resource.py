@@ -3,7 +3,7 @@ from typing import NewType
 
 from ImageSaverLib.Encapsulation import CompressionType, WrappingType
 from ImageSaverLib.MetaDB.Types import ColumnPrinterMixin
-from sqlalchemy import Column, Integer, String, LargeBinary, UniqueConstraint, BigInteger, Sequence
+from sqlalchemy import Column, Integer, String, LargeBinary, UniqueConstraint, BigInteger, Sequence, Index
 
 from ImageSaverLib.MetaDB import Base
 
@@ -25,7 +25,9 @@ class Resource(Base, ColumnPrinterMixin):
     resource_hash = Column(LargeBinary(64), unique=True)  # type: ResourceHash
     wrapping_type = Column(String(255))  # type: ResourceWrappingType
     compression_type = Column(String(255))  # type: ResourceCompressionType
-    __table_args__ = (UniqueConstraint('resource_name', 'resource_hash'), )
+    __table_args__ = (UniqueConstraint('resource_name', 'resource_hash'),
+                      # the fragment cache looks for the smallest resource to append fragments to
+                      Index('ix_resources_resource_payloadsize', 'resource_payloadsize'))
 
     def __init__(self, resource_name, resource_size, resource_payloadsize, resource_hash, wrapping_type, compression_type):
         # type: (ResourceName, ResourceSize, ResourcePayloadSize, ResourceHash, ResourceWrappingType, ResourceCompressionType) -> None
@@ -0,0 +1,135 @@
+from typing import NewType, Dict, Optional
+
+from sqlalchemy import Column, String, BigInteger
+
+from .. import Base
+from . import ColumnPrinterMixin
+from .Compound import CompoundType
+
+StatisticName = NewType('StatisticName', str)
+StatisticValue = NewType('StatisticValue', int)
+
+COMPOUND_COUNT = StatisticName('compound_count')
+"""live compounds, suffixed with '.' and the compound type"""
+SNAPSHOT_COUNT = StatisticName('snapshot_count')
+"""snapshotted compounds, suffixed with '.' and the compound type"""
+COMPOUND_SIZE = StatisticName('compound_size')
+UNIQUE_COMPOUND_COUNT = StatisticName('unique_compound_count')
+"""distinct hashes of live compounds, additionally kept per type with '.' and the compound type as suffix"""
+UNIQUE_COMPOUND_SIZE = StatisticName('unique_compound_size')
+FRAGMENT_COUNT = StatisticName('fragment_count')
+FRAGMENT_SIZE = StatisticName('fragment_size')
+DUPLICATE_FRAGMENT_COUNT = StatisticName('duplicate_fragment_count')
+DUPLICATE_FRAGMENT_SAVED_SIZE = StatisticName('duplicate_fragment_saved_size')
+UNNEEDED_FRAGMENT_COUNT = StatisticName('unneeded_fragment_count')
+UNNEEDED_FRAGMENT_SIZE = StatisticName('unneeded_fragment_size')
+RESOURCE_COUNT = StatisticName('resource_count')
+RESOURCE_SIZE = StatisticName('resource_size')
+
+
+def typedStatisticName(statistic_name, compound_type):
+    # type: (StatisticName, CompoundType) -> StatisticName
+    return StatisticName(statistic_name + '.' + compound_type)
+
+
+class Statistic(Base, ColumnPrinterMixin):
+    """
+    Counter maintained by the meta db on every compound, fragment and resource change, so statistics do not need to
+    aggregate over the whole tables.
+    """
+    __tablename__ = 'statistics'
+    statistic_name = Column(String(255), primary_key=True)  # type: StatisticName
+    statistic_value = Column(BigInteger, nullable=False)  # type: StatisticValue
+
+    def __init__(self, statistic_name, statistic_value):
+        # type: (StatisticName, StatisticValue) -> None
+        self.statistic_name = statistic_name
+        self.statistic_value = statistic_value
+
+
+class Statistics(object):
+    """
+    Snapshot of all statistic counters, answers the same questions as the aggregating getters of the meta db.
+    """
+
+    def __init__(self, values):
+        # type: (Dict[StatisticName, int]) -> None
+        self._values = values
+
+    def _value(self, statistic_name, compound_type=None):
+        # type: (StatisticName, Optional[CompoundType]) -> int
+        if compound_type:
+            return self._values.get(typedStatisticName(statistic_name, compound_type), 0)
+        return self._values.get(statistic_name, 0)
+
+    def _typed_sum(self, statistic_name):
+        # type: (StatisticName) -> int
+        prefix = statistic_name + '.'
+        return sum(value for name, value in self._values.items() if name.startswith(prefix))
+
+    def getTotalCompoundCount(self, with_type=None):
+        # type: (Optional[CompoundType]) -> int
+        if with_type:
+            return self._value(COMPOUND_COUNT, with_type)
+        return self._typed_sum(COMPOUND_COUNT)
+
+    def getSnapshotCount(self, with_type=None):
+        # type: (Optional[CompoundType]) -> int
+        if with_type:
+            return self._value(SNAPSHOT_COUNT, with_type)
+        return self._typed_sum(SNAPSHOT_COUNT)
+
+    def getTotalCompoundSize(self):
+        # type: () -> int
+        return self._value(COMPOUND_SIZE)
+
+    def getUniqueCompoundCount(self, with_type=None):
+        # type: (Optional[CompoundType]) -> int
+        return self._value(UNIQUE_COMPOUND_COUNT, with_type)
+
+    def getUniqueCompoundSize(self):
+        # type: () -> int
+        return self._value(UNIQUE_COMPOUND_SIZE)
+
+    def getMultipleUsedCompoundsCount(self, compound_type=None):
+        # type: (Optional[CompoundType]) -> int
+        return self.getTotalCompoundCount(compound_type) - self.getUniqueCompoundCount(compound_type)
+
+    def getSavedBytesByMultipleUsedCompounds(self):
+        # type: () -> int
+        return self.getTotalCompoundSize() - self.getUniqueCompoundSize()
+
+    def getTotalFragmentCount(self):
+        # type: () -> int
+        return self._value(FRAGMENT_COUNT)
+
+    def getTotalFragmentSize(self):
+        # type: () -> int
+        return self._value(FRAGMENT_SIZE)
+
+    def getDuplicateFragmentsCount(self):
+        # type: () -> int
+        return self._value(DUPLICATE_FRAGMENT_COUNT)
+
+    def getSavedBytesByDuplicateFragments(self):
+        # type: () -> int
+        return self._value(DUPLICATE_FRAGMENT_SAVED_SIZE)
+
+    def getUnneededFragmentCount(self):
+        # type: () -> int
+        return self._value(UNNEEDED_FRAGMENT_COUNT)
+
+    def getUnneededFragmentSize(self):
+        # type: () -> int
+        return self._value(UNNEEDED_FRAGMENT_SIZE)
+
+    def getTotalResourceCount(self):
+        # type: () -> int
+        return self._value(RESOURCE_COUNT)
+
+    def getTotalResourceSize(self):
+        # type: () -> int
+        return self._value(RESOURCE_SIZE)
+
+    def __repr__(self):
+        return '<Statistics ' + ', '.join(name + '=' + str(value) for name, value in sorted(self._values.items())) + '>'
@@ -6,8 +6,10 @@ def register_types_on_base():
     from .Compound import Compound as _
     from .CompoundFragmentMapping import CompoundFragmentMapping as _
     from .Fragment import Fragment as _
+    from .FragmentPlaintextMapping import FragmentPlaintextMapping as _
     from .FragmentResourceMapping import FragmentResourceMapping as _
     from .Resource import Resource as _
+    from .Statistic import Statistic as _
 
 
 class ColumnPrinterMixin(object):
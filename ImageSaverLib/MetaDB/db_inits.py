@@ -1,18 +1,23 @@
+import atexit
 import os
+from typing import Optional
 
+import humanfriendly
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import StaticPool, QueuePool
 
-from . import Base
+from .MemoryMetaDB import MemoryMetaDB
 from .MetaBuilder import MetaBuilderInterface, str_to_bool
 from .MetaDB import MetaDBInterface
+from .MetaExport import exportedTables, lastKey, tableChunks, resetSequence
+from .PostgresMetaDB import PostgresMetaDB
 from .SQLAlchemyMetaDB import init_db
 from .Types import register_types_on_base
 
 
-def sqliteRAM(echo=False, recreate=False):
-    # type: (bool, bool) -> MetaDBInterface
+def sqliteRAM(echo=False, recreate=False, fragment_filter=True):
+    # type: (bool, bool, bool) -> MetaDBInterface
     register_types_on_base()
     engine = create_engine('sqlite:///:memory:', echo=echo, connect_args={'check_same_thread': False},
                            poolclass=StaticPool)
@@ -34,17 +39,46 @@ def sqliteRAM(echo=False, recreate=False):
     # engine.execute('PRAGMA secure_delete = ON')
     # engine.execute('PRAGMA auto_vacuum = FULL')
 
-    return init_db(engine, recreate=recreate)
-
-
-def sqliteFile(filepath, echo=False, recreate=False):
-    # type: (str, bool, bool) -> MetaDBInterface
+    return init_db(engine, recreate=recreate, fragment_filter=fragment_filter)
+
+
+def dictRAM(snapshot_path=None):
+    # type: (Optional[str]) -> MetaDBInterface
+    """
+    :param snapshot_path: file the meta gets loaded from, if it exists, and saved into when the interpreter exits
+    """
+    if snapshot_path:
+        path = os.path.dirname(snapshot_path)
+        if path and not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+    meta = MemoryMetaDB(snapshot_path=snapshot_path)
+    if snapshot_path:
+        atexit.register(meta.close)
+    return meta
+
+
+def sqliteFile(filepath, echo=False, recreate=False, fragment_filter=True, concurrent=False, pool_size=8,
+               cache_size=64 * 1024 * 1024, mmap_size=256 * 1024 * 1024, timeout=30):
+    # type: (str, bool, bool, bool, bool, int, int, int, int) -> MetaDBInterface
+    """
+    :param concurrent: use a write ahead log and one connection per thread, so readers do not wait for writers.
+                       Otherwise all meta calls share one connection and run one after another.
+    :param pool_size: number of connections kept open in concurrent mode
+    :param cache_size: page cache size in bytes of each connection in concurrent mode
+    :param mmap_size: number of bytes of the database file, which are memory mapped in concurrent mode
+    :param timeout: seconds to wait for the write lock of the database file in concurrent mode
+    """
     register_types_on_base()
     path = os.path.dirname(filepath)
     if not os.path.exists(path):
         os.makedirs(path, exist_ok=True)
-    engine = create_engine('sqlite:///' + filepath, echo=echo, connect_args={'check_same_thread': False},
-                           poolclass=StaticPool)
+    if concurrent:
+        engine = create_engine('sqlite:///' + filepath, echo=echo,
+                               connect_args={'check_same_thread': False, 'timeout': timeout},
+                               poolclass=QueuePool, pool_size=pool_size, max_overflow=pool_size)
+    else:
+        engine = create_engine('sqlite:///' + filepath, echo=echo, connect_args={'check_same_thread': False},
+                               poolclass=StaticPool)
 
     from sqlalchemy import event
 
@@ -53,6 +87,16 @@ def sqliteFile(filepath, echo=False, recreate=False):
         # disable pysqlite's emitting of the BEGIN statement entirely.
         # also stops it from emitting COMMIT before any DDL.
         dbapi_connection.isolation_level = None
+        if concurrent:
+            cursor = dbapi_connection.cursor()
+            # readers keep reading the last committed state, while a writer appends to the log
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # in WAL mode, syncing at checkpoints only still keeps the database consistent
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            # negative values are interpreted as KiB
+            cursor.execute("PRAGMA cache_size=" + str(-(cache_size // 1024)))
+            cursor.execute("PRAGMA mmap_size=" + str(mmap_size))
+            cursor.close()
 
     @event.listens_for(engine, "begin")
     def do_begin(conn):
@@ -63,66 +107,97 @@ def sqliteFile(filepath, echo=False, recreate=False):
     # engine.execute('PRAGMA secure_delete = ON')
     # engine.execute('PRAGMA auto_vacuum = FULL')
 
-    return init_db(engine, recreate=recreate)
+    return init_db(engine, recreate=recreate, fragment_filter=fragment_filter, concurrent=concurrent)
 
 
 def postgres(username='sqlalchemy', password='sqlalchemy', host='localhost', port=5432, dbname='imagesaver', echo=False,
-             recreate=False, timeout=30):
-    # type: (str, str, str, int, str, bool, bool, int) -> MetaDBInterface
+             recreate=False, timeout=30, fragment_filter=False, pool_size=8):
+    # type: (str, str, str, int, str, bool, bool, int, bool, int) -> MetaDBInterface
+    # a postgres database may be shared between several processes, the fragment filter has to be enabled explicitly
     register_types_on_base()
     return init_db(
         create_engine('postgresql://' + username + ':' + password + '@' + host + ':' + str(port) + '/' + dbname,
-                      echo=echo, connect_args={'connect_timeout': timeout}),
-        recreate=recreate)
-
-
-def copyDB(src_engine, dest_engine, verbose=False, recreate_dest=False):
-    # type: (Engine, Engine, bool, bool) -> None
-    init_db(dest_engine, recreate=recreate_dest)
-    register_types_on_base()
-    tables = Base.metadata.tables
-    for tbl in tables:
-        if verbose:
-            print('##################################')
-            print(tbl)
-            print(tables[tbl].select())
-        data = src_engine.execute(tables[tbl].select()).fetchall()
-        if verbose:
-            for a in data:
-                print(a)
-        if data:
+                      echo=echo, connect_args={'connect_timeout': timeout},
+                      poolclass=QueuePool, pool_size=pool_size, max_overflow=pool_size, pool_pre_ping=True),
+        recreate=recreate, fragment_filter=fragment_filter, concurrent=True, meta_class=PostgresMetaDB)
+
+
+def copyDB(src_engine, dest_engine, verbose=False, recreate_dest=False, chunk_size=10000):
+    # type: (Engine, Engine, bool, bool, int) -> None
+    """
+    copies all rows chunk by chunk, every chunk is committed on its own. A copy into an existing destination continues
+    after the rows copied by an interrupted run.
+    """
+    dest_meta = init_db(dest_engine, recreate=recreate_dest)
+    with src_engine.connect() as src, dest_engine.connect() as dest:
+        for table in exportedTables():
+            last_key = lastKey(dest, table)
             if verbose:
-                print(tables[tbl].insert())
-            dest_engine.execute(tables[tbl].insert(), data)
+                print('##################################')
+                print(table.name, 'after', last_key)
+            copied = 0
+            for rows in tableChunks(src, table, chunk_size, after=last_key):
+                with dest.begin():
+                    dest.execute(table.insert(), [dict(row) for row in rows])
+                copied += len(rows)
+                if verbose:
+                    print(table.name, copied)
+            resetSequence(dest, table)
+    # the statistics are not copied, the counters of the destination get recomputed from the copied objects
+    dest_meta.recomputeStatistics()
 
 
 class SqliteRamBuilder(MetaBuilderInterface):
     __meta_name__ = 'memory'
 
     @classmethod
-    def build(cls, echo='False', recreate='False'):
+    def build(cls, echo='False', recreate='False', fragment_filter='True'):
         echo = str_to_bool(echo)
         recreate = str_to_bool(recreate)
-        return sqliteRAM(echo=echo, recreate=recreate)
+        fragment_filter = str_to_bool(fragment_filter)
+        return sqliteRAM(echo=echo, recreate=recreate, fragment_filter=fragment_filter)
+
+
+class DictRamBuilder(MetaBuilderInterface):
+    __meta_name__ = 'dict'
+
+    # noinspection PyUnusedLocal
+    @classmethod
+    def build(cls, snapshot=None, echo='False'):
+        # there are no statements to echo
+        if snapshot:
+            snapshot = os.path.abspath(os.path.normpath(os.path.expanduser(snapshot)))
+        return dictRAM(snapshot_path=snapshot)
 
 
 class SqliteFileBuilder(MetaBuilderInterface):
     __meta_name__ = 'file'
 
     @classmethod
-    def build(cls, path, echo='False', recreate='False'):
+    def build(cls, path, echo='False', recreate='False', fragment_filter='True', concurrent='False', pool_size='8',
+              cache_size='64 MiB', mmap_size='256 MiB'):
         path = os.path.abspath(os.path.normpath(os.path.expanduser(path)))
         echo = str_to_bool(echo)
         recreate = str_to_bool(recreate)
-        return sqliteFile(filepath=path, echo=echo, recreate=recreate)
+        fragment_filter = str_to_bool(fragment_filter)
+        concurrent = str_to_bool(concurrent)
+        pool_size = int(pool_size)
+        cache_size = humanfriendly.parse_size(cache_size, binary=True)
+        mmap_size = humanfriendly.parse_size(mmap_size, binary=True)
+        return sqliteFile(filepath=path, echo=echo, recreate=recreate, fragment_filter=fragment_filter,
+                          concurrent=concurrent, pool_size=pool_size, cache_size=cache_size, mmap_size=mmap_size)
 
 
 class PostgresBuilder(MetaBuilderInterface):
     __meta_name__ = 'postgres'
 
     @classmethod
-    def build(cls, username, password, host, port='5432', db='imagesaver', echo='False', recreate='False'):
+    def build(cls, username, password, host, port='5432', db='imagesaver', echo='False', recreate='False',
+              fragment_filter='False', pool_size='8'):
         echo = str_to_bool(echo)
         recreate = str_to_bool(recreate)
         port = int(port)
-        return postgres(username, password, host, port, db, echo=echo, recreate=recreate)
+        fragment_filter = str_to_bool(fragment_filter)
+        pool_size = int(pool_size)
+        return postgres(username, password, host, port, db, echo=echo, recreate=recreate,
+                        fragment_filter=fragment_filter, pool_size=pool_size)
@@ -1,5 +1,5 @@
 from threading import RLock
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Set, TypeVar
 
 from ImageSaverLib.MetaDB.Types.Compound import CompoundName, CompoundHash
 from ImageSaverLib.MetaDB.Types.CompoundFragmentMapping import SequenceIndex
@@ -7,14 +7,37 @@ from ImageSaverLib.MetaDB.Types.Fragment import FragmentHash
 from .MetaDB.Types.Compound import Compound
 from .MetaDB.Types.Fragment import Fragment
 
+K = TypeVar('K')
+
 
 class PendingObjectsController(object):
+    """
+    Keeps track of compounds, which are written but wait for some of their fragments to get stored in a resource.
+
+    Compounds are indexed by name and hash, each pending fragment knows the compounds waiting for it, so adding and
+    removing objects does not depend on the amount of pending compounds. Lookups by name or hash return the earliest
+    added compound.
+    """
+
     def __init__(self):
         self._mutex = RLock()
-        self.compound_fragment_map = {}  # type: Dict[Compound, List[Fragment]]
+        # compounds, which still wait for the stored fragment hashes
+        self.compound_fragment_map = {}  # type: Dict[Compound, Set[FragmentHash]]
         self.compound_fragment_sequence_map = {}  # type: Dict[Compound, List[Tuple[Fragment, SequenceIndex]]]
         self.pending_fragments = {}  # type: Dict[FragmentHash, Fragment]
 
+        # region indexes
+        # dicts with None values are used as insertion ordered sets
+        self._compounds_by_name = {}  # type: Dict[CompoundName, Dict[Compound, None]]
+        self._compounds_by_hash = {}  # type: Dict[CompoundHash, Dict[Compound, None]]
+        self._compounds_by_fragment = {}  # type: Dict[FragmentHash, Set[Compound]]
+        self._compound_order = {}  # type: Dict[Compound, int]
+        self._added_compounds = 0
+        # compounds of compound_fragment_sequence_map, which do not wait for fragments anymore
+        self._ready_compounds = {}  # type: Dict[Compound, None]
+        self._ready_size = 0
+        # endregion
+
     def addFragment(self, fragment):
         # type: (Fragment) -> None
         with self._mutex:
@@ -25,55 +48,60 @@ class PendingObjectsController(object):
     def addCompound(self, compound, needed_fragments, fragment_sequence):
         # type: (Compound, List[Fragment], List[Tuple[Fragment, SequenceIndex]]) -> None
         with self._mutex:
-            reservable_fragments = []
-            for f in needed_fragments:
-                if f.fragment_hash in self.pending_fragments:
-                    reservable_fragments.append(f)
+            reservable_fragments = set(f.fragment_hash for f in needed_fragments
+                                       if f.fragment_hash in self.pending_fragments)
             if compound in self.compound_fragment_map:
                 raise Exception('compound double pending '+repr(compound))
             if len(reservable_fragments) > 0:
                 self.compound_fragment_map[compound] = reservable_fragments
+                for fragment_hash in reservable_fragments:
+                    self._compounds_by_fragment.setdefault(fragment_hash, set()).add(compound)
+                self._unmark_ready(compound)
+            else:
+                self._mark_ready(compound, force=True)
             self.compound_fragment_sequence_map[compound] = fragment_sequence
+            self._compounds_by_name.setdefault(compound.compound_name, {})[compound] = None
+            self._compounds_by_hash.setdefault(compound.compound_hash, {})[compound] = None
+            if compound not in self._compound_order:
+                self._compound_order[compound] = self._added_compounds
+                self._added_compounds += 1
 
     def hasCompoundWithName(self, compound_name):
-        return any((c.compound_name == compound_name for c in self.compound_fragment_sequence_map))
+        with self._mutex:
+            return compound_name in self._compounds_by_name
 
     def removeFragment(self, fragment):
         # type: (Fragment) -> None
         with self._mutex:
-            for k in self.compound_fragment_map:
-                try:
-                    fragment_list = self.compound_fragment_map[k]
-                except ValueError:
-                    continue
-                self.compound_fragment_map[k] = [f for f in fragment_list if f.fragment_hash != fragment.fragment_hash]
-                # for f in list(fragment_list):
-                #     if f.fragment_hash == fragment.fragment_hash:
-                #         fragment_list.remove(f)
-            try:
-                self.pending_fragments.pop(fragment.fragment_hash)
-            except KeyError:
-                pass
-            for k in list(self.compound_fragment_map.keys()):
-                if len(self.compound_fragment_map[k]) == 0:
-                    self.compound_fragment_map.pop(k)
+            for compound in self._compounds_by_fragment.pop(fragment.fragment_hash, ()):
+                pending_hashes = self.compound_fragment_map[compound]
+                pending_hashes.discard(fragment.fragment_hash)
+                if len(pending_hashes) == 0:
+                    self.compound_fragment_map.pop(compound)
+                    self._mark_ready(compound)
                     # print("removeFragment: removing pending compound", k.compound_name)
+            self.pending_fragments.pop(fragment.fragment_hash, None)
 
     def removeCompound(self, compound):
         # type: (Compound) -> None
+        """
+        stops waiting for the fragments of the compound
+        """
         with self._mutex:
-            self.compound_fragment_map.pop(compound)
+            self._unlink_fragments(compound, self.compound_fragment_map.pop(compound))
+            self._mark_ready(compound)
 
     def removeCompoundByName(self, name):
         # type: (CompoundName) -> Optional[Compound]
         with self._mutex:
-            for c in self.compound_fragment_sequence_map.keys():
-                if c.compound_name == name:
-                    self.compound_fragment_sequence_map.pop(c)
-                    if c in self.compound_fragment_map:
-                        self.compound_fragment_map.pop(c)
-                    return c
-            return None
+            c = self._first(self._compounds_by_name, name)
+            if c is None:
+                return None
+            self.compound_fragment_sequence_map.pop(c)
+            if c in self.compound_fragment_map:
+                self._unlink_fragments(c, self.compound_fragment_map.pop(c))
+            self._forget(c)
+            return c
 
     def getPendingCompounds(self):
         # type: () -> List[Compound]
@@ -83,52 +111,118 @@ class PendingObjectsController(object):
     def getPendingCompoundWithName(self, name):
         # type: (CompoundName) -> Optional[Compound]
         with self._mutex:
-            for c in self.compound_fragment_sequence_map.keys():
-                if c.compound_name == name:
-                    return c
-            return None
+            return self._first(self._compounds_by_name, name)
 
     def getPendingCompoundWithHash(self, compound_hash):
         # type: (CompoundHash) -> Optional[Compound]
         with self._mutex:
-            for c in self.compound_fragment_sequence_map.keys():
-                if c.compound_hash == compound_hash:
-                    return c
-            return None
+            return self._first(self._compounds_by_hash, compound_hash)
 
     def getFragmentsNeededForPendingCompoundByName(self, name):
         # type: (CompoundName) -> Optional[List[Tuple[Fragment, SequenceIndex]]]
         with self._mutex:
-            for c in self.compound_fragment_sequence_map.keys():
-                if c.compound_name == name:
-                    return list(self.compound_fragment_sequence_map[c])
-            return None
+            c = self._first(self._compounds_by_name, name)
+            if c is None:
+                return None
+            return list(self.compound_fragment_sequence_map[c])
 
     def getFragmentsNeededForPendingCompoundByHash(self, compound_hash):
         # type: (CompoundHash) -> Optional[List[Tuple[Fragment, SequenceIndex]]]
         with self._mutex:
-            for c in self.compound_fragment_sequence_map.keys():
-                if c.compound_hash == compound_hash:
-                    return list(self.compound_fragment_sequence_map[c])
-            return None
+            c = self._first(self._compounds_by_hash, compound_hash)
+            if c is None:
+                return None
+            return list(self.compound_fragment_sequence_map[c])
 
     def getFragmentHashesNeededForCompound(self, compound_hash):
         with self._mutex:
-            for c in self.compound_fragment_sequence_map.keys():
-                if c.compound_hash == compound_hash:
-                    return [f.fragment_hash for f, i in self.compound_fragment_sequence_map[c]]
-            return None
+            c = self._first(self._compounds_by_hash, compound_hash)
+            if c is None:
+                return None
+            return [f.fragment_hash for f, i in self.compound_fragment_sequence_map[c]]
 
     def getPendingFragments(self):
         # type: () -> List[Fragment]
         with self._mutex:
             return list(self.pending_fragments.values())
 
+    def getNonPendingCompoundCount(self):
+        # type: () -> int
+        """
+        returns the number of compounds, which do not wait for fragments anymore and can get popped
+        """
+        with self._mutex:
+            return len(self._ready_compounds)
+
+    def getNonPendingCompoundSize(self):
+        # type: () -> int
+        """
+        returns the summed up size of the compounds, which do not wait for fragments anymore and can get popped
+        """
+        with self._mutex:
+            return self._ready_size
+
     def popNonPendingFragmentSequences(self):
         with self._mutex:
             return_dict = {}  # type: Dict[Compound, List[Tuple[Fragment, SequenceIndex]]]
-            for c in list(self.compound_fragment_sequence_map.keys()):
-                if c not in self.compound_fragment_map:
-                    # print(c.compound_name, 'not in compound_fragment_map')
-                    return_dict[c] = self.compound_fragment_sequence_map.pop(c)
+            # keep the order the compounds got added in, later compounds overwrite earlier ones with the same name
+            for c in sorted(self._ready_compounds, key=self._compound_order.__getitem__):
+                return_dict[c] = self.compound_fragment_sequence_map.pop(c)
+                self._forget(c)
             return return_dict
+
+    # region index maintenance
+
+    @staticmethod
+    def _first(index, key):
+        # type: (Dict[K, Dict[Compound, None]], K) -> Optional[Compound]
+        compounds = index.get(key)
+        if not compounds:
+            return None
+        return next(iter(compounds))
+
+    @staticmethod
+    def _discard(index, key, compound):
+        # type: (Dict[K, Dict[Compound, None]], K, Compound) -> None
+        compounds = index.get(key)
+        if compounds is None:
+            return
+        compounds.pop(compound, None)
+        if not compounds:
+            index.pop(key)
+
+    def _mark_ready(self, compound, force=False):
+        # type: (Compound, bool) -> None
+        if compound in self._ready_compounds:
+            return
+        if force or compound in self.compound_fragment_sequence_map:
+            self._ready_compounds[compound] = None
+            self._ready_size += compound.compound_size
+
+    def _unmark_ready(self, compound):
+        # type: (Compound) -> None
+        if compound in self._ready_compounds:
+            self._ready_compounds.pop(compound)
+            self._ready_size -= compound.compound_size
+
+    def _unlink_fragments(self, compound, fragment_hashes):
+        # type: (Compound, Set[FragmentHash]) -> None
+        for fragment_hash in fragment_hashes:
+            compounds = self._compounds_by_fragment.get(fragment_hash)
+            if compounds is None:
+                continue
+            compounds.discard(compound)
+            if not compounds:
+                self._compounds_by_fragment.pop(fragment_hash)
+
+    def _forget(self, compound):
+        # type: (Compound) -> None
+        """
+        removes a compound, which is not part of compound_fragment_sequence_map anymore, from the indexes
+        """
+        self._discard(self._compounds_by_name, compound.compound_name, compound)
+        self._discard(self._compounds_by_hash, compound.compound_hash, compound)
+        self._unmark_ready(compound)
+        self._compound_order.pop(compound, None)
+
+    # endregion
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from ImageSaverLib.MetaDB.Types.Resource import ResourceHash
+
+
+class ResourcePayloadCache(object):
+    """
+    LRU cache of downloaded and decapsulated resource payloads, keyed by resource hash.
+
+    The cache is bounded by the summed up payload sizes, payloads larger than max_size are not cached at all.
+    A max_size of 0 disables the cache.
+    """
+
+    def __init__(self, max_size):
+        # type: (int) -> None
+        if max_size < 0:
+            raise ValueError('max_size must not be negative')
+        self._max_size = max_size
+        self._payloads = OrderedDict()  # type: OrderedDict[ResourceHash, bytes]
+        self._size = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def __contains__(self, resource_hash):
+        # type: (ResourceHash) -> bool
+        return resource_hash in self._payloads
+
+    @property
+    def size(self):
+        # type: () -> int
+        return self._size
+
+    @property
+    def max_size(self):
+        # type: () -> int
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, max_size):
+        # type: (int) -> None
+        if max_size < 0:
+            raise ValueError('max_size must not be negative')
+        with self._lock:
+            self._max_size = max_size
+            self._evict(0)
+
+    def get(self, resource_hash):
+        # type: (ResourceHash) -> Optional[bytes]
+        with self._lock:
+            try:
+                payload = self._payloads[resource_hash]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._payloads.move_to_end(resource_hash)
+            self.hits += 1
+            return payload
+
+    def put(self, resource_hash, payload):
+        # type: (ResourceHash, bytes) -> None
+        with self._lock:
+            if resource_hash in self._payloads:
+                self._size -= len(self._payloads.pop(resource_hash))
+            if len(payload) > self._max_size:
+                return
+            self._evict(len(payload))
+            self._payloads[resource_hash] = payload
+            self._size += len(payload)
+
+    def discard(self, resource_hash):
+        # type: (ResourceHash) -> None
+        with self._lock:
+            if resource_hash in self._payloads:
+                self._size -= len(self._payloads.pop(resource_hash))
+
+    def clear(self):
+        with self._lock:
+            self._payloads.clear()
+            self._size = 0
+
+    def _evict(self, required_size):
+        # type: (int) -> None
+        while self._payloads and self._size + required_size > self._max_size:
+            _, payload = self._payloads.popitem(last=False)
+            self._size -= len(payload)
+
+    def __repr__(self):
+        return ('<ResourcePayloadCache resources=' + str(len(self._payloads)) + ' size=' + str(self._size)
+                + ' max_size=' + str(self._max_size) + ' hits=' + str(self.hits) + ' misses=' + str(self.misses) + '>')
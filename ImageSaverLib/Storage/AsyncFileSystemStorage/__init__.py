@@ -0,0 +1,85 @@
+import asyncio
+import os
+import uuid
+from typing import Optional, List
+
+from ..AsyncStorageInterface import AsyncStorageInterface
+from ..Errors import DownloadError, NotFoundError, UploadError, DeleteError, ListError
+from ...Encapsulation.Wrappers import WrappingType
+from ...MetaDB.Types.Resource import ResourceSize, ResourceName
+
+
+class AsyncFileSystemStorage(AsyncStorageInterface):
+    """
+    stores resources as files below a directory, read and written with aiofiles.
+
+    Files are grouped into 256 sub directories by the first byte of the resource hash. A random suffix keeps resources
+    with the same hash apart, files are written under a temporary name and renamed when complete.
+    """
+
+    def __init__(self, directory, extension='bin', wrap_type=None, max_resource_size=None):
+        # type: (str, str, Optional[WrappingType], Optional[ResourceSize]) -> None
+        super().__init__(wrap_type, max_resource_size)
+        self.directory = os.path.abspath(os.path.normpath(os.path.expanduser(directory)))
+        self.extension = extension
+
+    def identifier(self):
+        return '_r' + self.directory + '_e' + self.extension + '@async-local'
+
+    def _path(self, resource_name):
+        # type: (ResourceName) -> str
+        path = os.path.normpath(os.path.join(self.directory, resource_name))
+        if not path.startswith(self.directory + os.sep):
+            raise NotFoundError("resource name " + repr(resource_name) + " points outside of the storage directory")
+        return path
+
+    async def loadRessource(self, resource_name):
+        import aiofiles
+        path = self._path(resource_name)
+        try:
+            async with aiofiles.open(path, 'rb') as f:
+                return await f.read()
+        except FileNotFoundError:
+            raise NotFoundError("resource " + repr(resource_name) + " not found")
+        except OSError as e:
+            raise DownloadError("Unable to load data from " + repr(path) + ': ' + repr(e))
+
+    async def saveResource(self, resource_data, resource_hash, resource_size):
+        import aiofiles
+        import aiofiles.os
+        hex_hash = resource_hash.hex()
+        resource_name = ResourceName(hex_hash[:2] + '/' + hex_hash + '-' + uuid.uuid4().hex[:8] + '.' + self.extension)
+        path = self._path(resource_name)
+        try:
+            await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+            async with aiofiles.open(path + '.tmp', 'wb') as f:
+                await f.write(resource_data)
+            await aiofiles.os.replace(path + '.tmp', path)
+        except OSError as e:
+            raise UploadError("Unable to save data to " + repr(path) + ': ' + repr(e))
+        return resource_name
+
+    async def deleteResource(self, resource_name):
+        import aiofiles.os
+        path = self._path(resource_name)
+        try:
+            await aiofiles.os.remove(path)
+        except OSError as e:
+            raise DeleteError("Unable to delete " + repr(path) + ': ' + repr(e))
+
+    async def listResourceNames(self):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self._list)
+        except OSError as e:
+            raise ListError("Unable to list " + repr(self.directory) + ': ' + repr(e))
+
+    def _list(self):
+        # type: () -> List[ResourceName]
+        resource_names = []  # type: List[ResourceName]
+        suffix = '.' + self.extension
+        for dirname, _, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith(suffix):
+                    path = os.path.relpath(os.path.join(dirname, file), self.directory)
+                    resource_names.append(ResourceName(path.replace(os.sep, '/')))
+        return resource_names
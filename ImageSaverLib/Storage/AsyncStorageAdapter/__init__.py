@@ -0,0 +1,57 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Any
+
+from ..AsyncStorageInterface import AsyncStorageInterface
+from ..StorageInterface import StorageInterface
+
+
+class AsyncStorageAdapter(AsyncStorageInterface):
+    """
+    runs the calls of a sync storage on a bounded thread pool, so sync backends can be used where an
+    AsyncStorageInterface is expected.
+    """
+
+    def __init__(self, storage, max_workers=None):
+        # type: (StorageInterface, Optional[int]) -> None
+        """
+        :param max_workers: number of threads, which call the storage. Defaults to the batch_workers of the storage,
+                            which is 1 for storages, which are not thread safe
+        """
+        super().__init__()
+        self._storage = storage
+        self._executor = ThreadPoolExecutor(max_workers or storage.batch_workers,
+                                            thread_name_prefix='AsyncStorageAdapter')
+
+    def getMaxSupportedResourceSize(self):
+        return self._storage.getMaxSupportedResourceSize()
+
+    def getRequiredWrapType(self):
+        return self._storage.getRequiredWrapType()
+
+    def supportsWrapType(self, wrap_type):
+        return self._storage.supportsWrapType(wrap_type)
+
+    def identifier(self):
+        return self._storage.identifier()
+
+    async def _run(self, function, *args):
+        # type: (Callable[..., Any], *Any) -> Any
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(function, *args))
+
+    async def loadRessource(self, resource_name):
+        return await self._run(self._storage.loadRessource, resource_name)
+
+    async def saveResource(self, resource_data, resource_hash, resource_size):
+        return await self._run(self._storage.saveResource, resource_data, resource_hash, resource_size)
+
+    async def deleteResource(self, resource_name):
+        return await self._run(self._storage.deleteResource, resource_name)
+
+    async def listResourceNames(self):
+        return await self._run(self._storage.listResourceNames)
+
+    async def close(self):
+        # the storage itself belongs to the caller and stays open
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,85 @@
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from ImageSaverLib.Encapsulation import WrappingType
+from ImageSaverLib.Encapsulation.Wrappers.Types import PassThroughWrapper
+# noinspection PyUnresolvedReferences
+from .Errors import (DownloadError, NotFoundError, UploadError, DeleteError, ListError)
+from ..MetaDB.Types.Resource import ResourceName, ResourceHash, ResourceSize
+
+
+class AsyncStorageInterface(ABC):
+    """
+    asyncio counterpart of the StorageInterface. Every resource call is a coroutine, so thousands of calls can be in
+    flight on one event loop thread. Storages hold their connections until close() is awaited.
+    """
+    DEFAULT_MAX_RESOURCE_SIZE = ResourceSize(10000000)  # 10 MB
+    max_resource_size = DEFAULT_MAX_RESOURCE_SIZE
+
+    DEFAULT_WRAP_TYPE = PassThroughWrapper.get_wrapper_type()
+    required_wrap_type = DEFAULT_WRAP_TYPE
+
+    def __init__(self, wrap_type=None, max_resource_size=None):
+        # type: (Optional[WrappingType], Optional[ResourceSize]) -> None
+        if wrap_type:
+            self.required_wrap_type = wrap_type
+        if max_resource_size:
+            self.max_resource_size = max_resource_size
+
+    def getMaxSupportedResourceSize(self):
+        return self.max_resource_size
+
+    def getRequiredWrapType(self):
+        return self.required_wrap_type
+
+    def supportsWrapType(self, wrap_type):
+        # type: (WrappingType) -> bool
+        return wrap_type.endswith(self.getRequiredWrapType())
+
+    @abstractmethod
+    def identifier(self):
+        # type: () -> str
+        pass
+
+    @abstractmethod
+    async def loadRessource(self, resource_name):
+        # type: (ResourceName) -> bytes
+        """
+        :raises DownloadError:
+        :raises NotFoundError:
+        """
+        pass
+
+    @abstractmethod
+    async def saveResource(self, resource_data, resource_hash, resource_size):
+        # type: (bytes, ResourceHash, ResourceSize) -> ResourceName
+        """
+        :raises UploadError:
+        """
+        pass
+
+    @abstractmethod
+    async def deleteResource(self, resource_name):
+        # type: (ResourceName) -> None
+        """
+        :raises DeleteError:
+        """
+        pass
+
+    @abstractmethod
+    async def listResourceNames(self):
+        # type: () -> List[ResourceName]
+        """
+        :raises ListError:
+        """
+        pass
+
+    async def close(self):
+        # type: () -> None
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -1,7 +1,10 @@
 from abc import ABC, abstractmethod
+from threading import RLock
 
 
 class CacheInterface(ABC):
     def __init__(self, wrapped_storage):
         self.cache_enabled = True
         self.wrapped_storage = wrapped_storage
+        # guards the cache bookkeeping, calls to the wrapped storage run without it and may overlap
+        self.cache_lock = RLock()
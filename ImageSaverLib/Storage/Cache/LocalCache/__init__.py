@@ -1,6 +1,6 @@
 import hashlib
 import os
-from typing import Optional, Set, Callable, cast
+from typing import Optional, Set, Callable, cast, Dict
 
 import cachetools
 
@@ -81,14 +81,28 @@ class LocalCache(StorageInterface, CacheInterface):
             self._cache_meta.removeAliasOfResourceName(resource_name)
 
     def loadRessource(self, resource_name):
-        try:
-            if not self.cache_enabled:
-                raise KeyError
-            alias = self._cache[resource_name]  # raises KeyError
+        data = self._loadCached(resource_name)
+        if data is None:
+            data = self.wrapped_storage.loadRessource(resource_name)
+            self._cacheLoaded(resource_name, data)
+        return data
+
+    def _loadCached(self, resource_name):
+        # type: (ResourceName) -> Optional[bytes]
+        """
+        returns the data of a cached resource, if the cached copy still matches the resource hash in the meta
+        """
+        if not self.cache_enabled:
+            return None
+        with self.cache_lock:
+            try:
+                alias = self._cache[resource_name]
+            except KeyError:
+                return None
             try:
                 data = self._local_storage.loadRessource(alias)
             except DownloadError:
-                raise KeyError
+                return None
             resource_hash = ResourceHash(hashlib.sha256(data).digest())
             try:
                 meta_resource_hash = self._meta.getResourceByResourceName(resource_name).resource_hash
@@ -98,39 +112,80 @@ class LocalCache(StorageInterface, CacheInterface):
                 self._cache.pop(resource_name)
                 self._cache_meta.removeAliasOfResourceName(resource_name)
                 self._local_storage.deleteResource(alias)
-                raise KeyError
-        except KeyError:
-            data = self.wrapped_storage.loadRessource(resource_name)
-            if self.cache_enabled:
-                resource_hash = ResourceHash(hashlib.sha256(data).digest())
+                return None
+            return data
+
+    def _cacheLoaded(self, resource_name, data):
+        # type: (ResourceName, bytes) -> None
+        if self.cache_enabled:
+            resource_hash = ResourceHash(hashlib.sha256(data).digest())
+            with self.cache_lock:
                 alias = ResourceNameAlias(
                     self._local_storage.saveResource(data, resource_hash, ResourceSize(len(data))))
                 self._cache[resource_name] = alias
                 self._cache_meta.addAlias(resource_name, alias, resource_hash)
-        return data
 
     def saveResource(self, resource_data, resource_hash, resource_size):
         resource_name = self.wrapped_storage.saveResource(resource_data, resource_hash, resource_size)
         if self.cache_enabled:
-            alias = ResourceNameAlias(self._local_storage.saveResource(resource_data, resource_hash, resource_size))
-            self._cache[resource_name] = alias
-            self._cache_meta.addAlias(resource_name, alias, resource_hash)
+            with self.cache_lock:
+                alias = ResourceNameAlias(self._local_storage.saveResource(resource_data, resource_hash,
+                                                                           resource_size))
+                self._cache[resource_name] = alias
+                self._cache_meta.addAlias(resource_name, alias, resource_hash)
         return resource_name
 
     def deleteResource(self, resource_name):
-        try:
-            if self._cache_meta.hasAliasForResourceName(resource_name):
-                alias = self._cache_meta.getAliasOfResourceName(resource_name)
-                self._local_storage.deleteResource(alias)
-                self._cache_meta.removeAliasOfResourceName(resource_name)
-                self._cache.pop(resource_name)
-            else:
-                alias = self._cache.pop(resource_name)
-                self._local_storage.deleteResource(alias)
-        except KeyError:
-            pass
+        self._dropCached(resource_name)
         self.wrapped_storage.deleteResource(resource_name)
 
+    def _dropCached(self, resource_name):
+        # type: (ResourceName) -> None
+        with self.cache_lock:
+            try:
+                if self._cache_meta.hasAliasForResourceName(resource_name):
+                    alias = self._cache_meta.getAliasOfResourceName(resource_name)
+                    self._local_storage.deleteResource(alias)
+                    self._cache_meta.removeAliasOfResourceName(resource_name)
+                    self._cache.pop(resource_name)
+                else:
+                    alias = self._cache.pop(resource_name)
+                    self._local_storage.deleteResource(alias)
+            except KeyError:
+                pass
+
+    def loadResources(self, resource_names):
+        resource_names = list(resource_names)
+        loaded = {}  # type: Dict[ResourceName, bytes]
+        for resource_name in resource_names:
+            data = self._loadCached(resource_name)
+            if data is not None:
+                loaded[resource_name] = data
+        missing = [n for n in dict.fromkeys(resource_names) if n not in loaded]
+        if missing:
+            for resource_name, data in zip(missing, self.wrapped_storage.loadResources(missing)):
+                self._cacheLoaded(resource_name, data)
+                loaded[resource_name] = data
+        return [loaded[n] for n in resource_names]
+
+    def saveResources(self, resources):
+        resources = list(resources)
+        resource_names = self.wrapped_storage.saveResources(resources)
+        if self.cache_enabled:
+            with self.cache_lock:
+                for resource_name, (resource_data, resource_hash, resource_size) in zip(resource_names, resources):
+                    alias = ResourceNameAlias(self._local_storage.saveResource(resource_data, resource_hash,
+                                                                               resource_size))
+                    self._cache[resource_name] = alias
+                    self._cache_meta.addAlias(resource_name, alias, resource_hash)
+        return resource_names
+
+    def deleteResources(self, resource_names):
+        resource_names = list(resource_names)
+        for resource_name in resource_names:
+            self._dropCached(resource_name)
+        self.wrapped_storage.deleteResources(resource_names)
+
     def listResourceNames(self):
         return self.wrapped_storage.listResourceNames()
 
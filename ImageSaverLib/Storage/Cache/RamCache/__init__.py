@@ -1,4 +1,4 @@
-from typing import Optional, Set, cast
+from typing import Optional, Set, cast, Dict
 
 import cachetools
 
@@ -30,54 +30,90 @@ class RamStorageCache(StorageInterface, CacheInterface):
         return self.wrapped_storage.identifier()
 
     def loadRessource(self, resource_name):
-        assert self._cache.currsize <= self._cache_size
-        try:
-            if not self.cache_enabled:
-                raise KeyError
-            data = self._cache.get(resource_name)
-            if data is None:
-                raise KeyError
-            self.debugPrint("loaded", resource_name, "from RAM cache")
-            return data
-        except KeyError:
-            data = self.wrapped_storage.loadRessource(resource_name)
-            self.debugPrint("loaded", resource_name, "from storage", self.wrapped_storage.__class__)
-            assert data is not None
+        if self.cache_enabled:
+            with self.cache_lock:
+                assert self._cache.currsize <= self._cache_size
+                data = self._cache.get(resource_name)
+            if data is not None:
+                self.debugPrint("loaded", resource_name, "from RAM cache")
+                return data
+        data = self.wrapped_storage.loadRessource(resource_name)
+        self.debugPrint("loaded", resource_name, "from storage", self.wrapped_storage.__class__)
+        assert data is not None
+        with self.cache_lock:
             self._cache[resource_name] = data
-            return data
+        return data
 
     def saveResource(self, resource_data, resource_hash, resource_size):
-        assert self._cache.currsize <= self._cache_size
         resource_name = self.wrapped_storage.saveResource(resource_data, resource_hash, resource_size)
         assert resource_data is not None
         if self.cache_enabled:
-            self._cache[resource_name] = resource_data
-            if self._resource_names:
-                self._resource_names.add(resource_name)
+            with self.cache_lock:
+                self._cache[resource_name] = resource_data
+                if self._resource_names:
+                    self._resource_names.add(resource_name)
         return resource_name
 
     def deleteResource(self, resource_name):
         self.wrapped_storage.deleteResource(resource_name)
-        try:
-            self._cache.pop(resource_name)
-        except KeyError:
-            pass
-        if self._resource_names:
-            # self._resource_names = set(self._storage.listResourceNames())
-            try:
-                self._resource_names.remove(resource_name)
-            except KeyError:
-                pass
+        with self.cache_lock:
+            self._cache.pop(resource_name, None)
+            if self._resource_names:
+                # self._resource_names = set(self._storage.listResourceNames())
+                self._resource_names.discard(resource_name)
+
+    def loadResources(self, resource_names):
+        resource_names = list(resource_names)
+        loaded = {}  # type: Dict[ResourceName, bytes]
+        if self.cache_enabled:
+            with self.cache_lock:
+                for resource_name in resource_names:
+                    data = self._cache.get(resource_name)
+                    if data is not None:
+                        self.debugPrint("loaded", resource_name, "from RAM cache")
+                        loaded[resource_name] = data
+        missing = [n for n in dict.fromkeys(resource_names) if n not in loaded]
+        if missing:
+            for resource_name, data in zip(missing, self.wrapped_storage.loadResources(missing)):
+                self.debugPrint("loaded", resource_name, "from storage", self.wrapped_storage.__class__)
+                assert data is not None
+                with self.cache_lock:
+                    self._cache[resource_name] = data
+                loaded[resource_name] = data
+        return [loaded[n] for n in resource_names]
+
+    def saveResources(self, resources):
+        resources = list(resources)
+        resource_names = self.wrapped_storage.saveResources(resources)
+        if self.cache_enabled:
+            with self.cache_lock:
+                for resource_name, (resource_data, _, _) in zip(resource_names, resources):
+                    self._cache[resource_name] = resource_data
+                    if self._resource_names:
+                        self._resource_names.add(resource_name)
+        return resource_names
+
+    def deleteResources(self, resource_names):
+        resource_names = list(resource_names)
+        self.wrapped_storage.deleteResources(resource_names)
+        with self.cache_lock:
+            for resource_name in resource_names:
+                self._cache.pop(resource_name, None)
+                if self._resource_names:
+                    self._resource_names.discard(resource_name)
 
     def listResourceNames(self):
-        self._resource_names = set(self.wrapped_storage.listResourceNames())
-        return list(self._resource_names)
+        resource_names = set(self.wrapped_storage.listResourceNames())
+        with self.cache_lock:
+            self._resource_names = resource_names
+        return list(resource_names)
 
     def wipeResources(self):
         self.wrapped_storage.wipeResources()
-        self._cache.clear()
-        if self._resource_names is not None:
-            self._resource_names.clear()
+        with self.cache_lock:
+            self._cache.clear()
+            if self._resource_names is not None:
+                self._resource_names.clear()
 
 
 class SizableRamStorageCache(SizableStorageInterface, RamStorageCache):
@@ -1,8 +1,25 @@
 import hashlib
+from contextlib import contextmanager
 
+from ...Errors import ThrottledError, ThrottledUploadError, ThrottledDownloadError
 from ...FileSystemStorage import FileSystemInterface
 
 
+@contextmanager
+def _throttling(error_type=ThrottledError):
+    """
+    raises rate limits and server errors of the dropbox api as ThrottledErrors of the given type, so they can be
+    retried
+    """
+    from dropbox.exceptions import RateLimitError, InternalServerError
+    try:
+        yield
+    except RateLimitError as e:
+        raise error_type("dropbox rate limit reached: " + repr(e.error), retry_after=e.backoff)
+    except InternalServerError as e:
+        raise error_type("dropbox server error, status code " + str(e.status_code))
+
+
 class DropboxFileSystemConnector(FileSystemInterface):
 
     def __init__(self, access_token):
@@ -38,21 +55,25 @@ class DropboxFileSystemConnector(FileSystemInterface):
     def saveFile(self, data, path):
         from dropbox import files
         # print(self, "uploading", len(data), "bytes")
-        self.client.files_upload(data, path, mode=files.WriteMode.overwrite)
+        with _throttling(ThrottledUploadError):
+            self.client.files_upload(data, path, mode=files.WriteMode.overwrite)
         return True
 
     def loadFile(self, path):
-        return bytes(self.client.files_download(path)[1].content)
+        with _throttling(ThrottledDownloadError):
+            return bytes(self.client.files_download(path)[1].content)
 
     def deleteFile(self, path):
-        self.client.files_delete(path)
+        with _throttling():
+            self.client.files_delete(path)
 
     def os_walk(self, path):
         from dropbox.files import FolderMetadata, FileMetadata
         dirs, nondirs = [], []
 
         path = '' if path == '/' or path == '.' else path
-        folder_items = self.client.files_list_folder(path).entries
+        with _throttling():
+            folder_items = self.client.files_list_folder(path).entries
 
         for folder_item in folder_items:
             if type(folder_item) == FolderMetadata:
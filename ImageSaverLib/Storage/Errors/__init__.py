@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 class StorageError(Exception):
     pass
 
@@ -32,3 +35,22 @@ class WipeError(ManagementError):
 
 class ListError(ManagementError):
     pass
+
+
+class ThrottledError(TransferError):
+    """
+    the service rejected a request because of a rate limit or its load, the request can be sent again later
+    """
+
+    def __init__(self, *args, retry_after=None):
+        # type: (*object, Optional[float]) -> None
+        super().__init__(*args)
+        self.retry_after = retry_after  # seconds the service asked to wait, if it did
+
+
+class ThrottledUploadError(ThrottledError, UploadError):
+    pass
+
+
+class ThrottledDownloadError(ThrottledError, DownloadError):
+    pass
@@ -1,4 +1,5 @@
 import hashlib
+from threading import RLock
 from typing import List, Optional
 
 from .Connectors import FileSystemInterface
@@ -18,9 +19,16 @@ class FolderStructurizer(object):
         self.folder_max_items = folder_max_items
 
         self.nested_folders = None  # type: Optional[NestedFolder]
+        # guards the bookkeeping of used names, batch calls of the storages run adds and deletes in parallel
+        self._pool_lock = RLock()
 
         # self.build_current_pool()
 
+    def _ensure_pool(self):
+        with self._pool_lock:
+            if not self.nested_folders:
+                self.build_current_pool()
+
     def build_current_pool(self):
         """
         walk through root and check where space can be reused
@@ -92,19 +100,25 @@ class FolderStructurizer(object):
 
     def add(self, data, data_hash, data_size):
         # type: (bytes, bytes, int) -> str
-        if not self.nested_folders:
-            self.build_current_pool()
-        pool_path = self.nested_folders.getNextName()
+        with self._pool_lock:
+            self._ensure_pool()
+            pool_path = self.nested_folders.getNextName()
+            # reserve the name before writing, so parallel adds get different names
+            self.nested_folders.useName(pool_path)
         # print(pool_path)
         pool_path_str = '/'.join((str(i) for i in reversed(pool_path[1:])))
         file_name = self.makeDataName(pool_path, data_hash, data_size)
         path = self.fs_connector.path_join(self.root, pool_path_str)
         data_name = self.fs_connector.path_join(pool_path_str, file_name + '.' + self.extension)
-        self.fs_connector.os_makedirs(path)
-        path = self.fs_connector.path_join(path, file_name + '.' + self.extension)
-        # print(path)
-        self.fs_connector.saveFile(data, path)
-        self.nested_folders.useName(pool_path)
+        try:
+            self.fs_connector.os_makedirs(path)
+            path = self.fs_connector.path_join(path, file_name + '.' + self.extension)
+            # print(path)
+            self.fs_connector.saveFile(data, path)
+        except BaseException:
+            with self._pool_lock:
+                self.nested_folders.reuse(pool_path)
+            raise
         return data_name
 
     def makeDataName(self, pool_path, data_hash, data_size):
@@ -119,16 +133,14 @@ class FolderStructurizer(object):
 
     def get(self, data_name):
         # type: (str) -> bytes
-        if not self.nested_folders:
-            self.build_current_pool()
+        self._ensure_pool()
         # path = self.fs_connector.path_join(self.root, data_name + '.' + self.extension)
         path = self.fs_connector.path_join(self.root, data_name)
         return self.fs_connector.loadFile(path)
 
     def delete(self, data_name):
         # type: (str) -> None
-        if not self.nested_folders:
-            self.build_current_pool()
+        self._ensure_pool()
         # path = self.fs_connector.path_join(self.root, data_name + '.' + self.extension)
         path = self.fs_connector.path_join(self.root, data_name)
         self.fs_connector.deleteFile(path)
@@ -136,11 +148,11 @@ class FolderStructurizer(object):
         # print(pool_path)
         pool_path = list((int(i) for i in pool_path.split('/')))
         pool_path.reverse()
-        self.nested_folders.reuse([0] + pool_path)
+        with self._pool_lock:
+            self.nested_folders.reuse([0] + pool_path)
 
     def list(self):
-        if not self.nested_folders:
-            self.build_current_pool()
+        self._ensure_pool()
         all_files = []
         for dirname, folders, files in self.fs_connector.os_walk(self.root):
             if files:
@@ -158,9 +170,10 @@ class FolderStructurizer(object):
         return all_files
 
     def wipe(self):
-        self.fs_connector.os_rmdir(self.root)
-        self.fs_connector.os_makedirs(self.root)
-        self.build_current_pool()
+        with self._pool_lock:
+            self.fs_connector.os_rmdir(self.root)
+            self.fs_connector.os_makedirs(self.root)
+            self.build_current_pool()
 
     @staticmethod
     def _rreplace(string, old, new, count=None):
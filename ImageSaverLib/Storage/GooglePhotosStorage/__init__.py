@@ -1,11 +1,13 @@
 import hashlib
 import json
-from typing import Optional, Dict
+from threading import Condition, Lock
+from typing import Optional, Dict, List, Tuple
 
 
 from ImageSaverLib.Encapsulation.Wrappers.Types import MinimumSizeWrapper, PNG3DWrapper
-from ImageSaverLib.MetaDB.Types.Resource import ResourceSize
+from ImageSaverLib.MetaDB.Types.Resource import ResourceSize, ResourceName
 from .api.resources.Album import Album
+from .api.resources.MediaItem import MediaItem
 from ..Errors import NotFoundError
 from ..StorageBuilder import StorageBuilderInterface, str_to_bool, str_to_bytesize
 from ..StorageInterface import AbstractSizableStorageInterface, StorageSize
@@ -37,19 +39,32 @@ class GooglePhotosStorage(AbstractSizableStorageInterface, StorageBuilderInterfa
     For a free plan this means, that you can upload 15GB of photos per day.
 
     Internally the GooglePhotosStorage wraps given bytes in an RGB PNG image, so you dont have to do this yourself.
+
+    Up to max_connections requests run at the same time over keep-alive connections. Uploads, which finish while a
+    batchCreate request is running, are committed together with the next batchCreate request.
     """
     __storage_name__ = 'gphotos'
     max_album_size = 20000
+    max_batch_size = 50  # most media items per batchCreate request
     _trash_album = 'isl_trash'
     _album_praefix = 'isl_album_'
     required_wrap_type = MinimumSizeWrapper(1000).get_wrapper_type()
 
-    def __init__(self, client_token_path, credentials_path, max_resource_size=None, debug=False, max_storage_size=None):
-        # type: (str, str, Optional[ResourceSize], bool, Optional[StorageSize]) -> None
+    def __init__(self, client_token_path, credentials_path, max_resource_size=None, debug=False, max_storage_size=None,
+                 max_connections=8):
+        # type: (str, str, Optional[ResourceSize], bool, Optional[StorageSize], int) -> None
         from google.auth.transport.requests import AuthorizedSession
         AbstractSizableStorageInterface.__init__(self, debug=debug, max_resource_size=max_resource_size, max_storage_size=max_storage_size)
         self.client_token_path = client_token_path
         self.credentials_path = credentials_path
+        self.max_connections = max_connections
+        self.batch_workers = max_connections
+        # upload tokens waiting for a batchCreate request, the thread which finds no running request sends the next one
+        self._commit_condition = Condition(Lock())
+        self._commit_queue = []  # type: List[_PendingMediaItem]
+        self._committing = False
+        # guards the album caches, so concurrent requests do not create the same album twice
+        self._album_lock = Lock()
         self._session = None  # type: Optional[AuthorizedSession]
         self._api = None  # type: Optional['ApiCaller']
         self.albums = {}  # type: Dict[str, Album]
@@ -67,24 +82,29 @@ class GooglePhotosStorage(AbstractSizableStorageInterface, StorageBuilderInterfa
     def api(self):
         if not self._api:
             from .api.ApiCaller import ApiCaller
-            self._api = ApiCaller(self.session)
+            self._api = ApiCaller(self.session, self.max_connections)
         return self._api
 
     def _calculateCurrentSize(self):
-        size = 0
-        for album in self.api.listAlbums(exclude_non_app_created=True):
-            for mediaitem in self.api.listMediaItemsInAlbum(album):
-                size += self.api.getSizeOfMediaItem(mediaitem)
-        return size
+        albums = list(self.api.listAlbums(exclude_non_app_created=True))
+        media_items = [i for items in self._listMediaItemsInAlbums(albums) for i in items]
+        return sum(self._batched(self.api.getSizeOfMediaItem, media_items))
+
+    def _listMediaItemsInAlbums(self, albums):
+        # type: (List[Album]) -> List[List[MediaItem]]
+        # the pages of one album are chained by their page tokens, so only the albums are listed in parallel
+        return self._batched(lambda album: list(self.api.listMediaItemsInAlbum(album)), albums)
 
     @classmethod
-    def build(cls, client_token_path, credentials_path, debug='False', max_resource_size=None, max_storage_size=None):
+    def build(cls, client_token_path, credentials_path, debug='False', max_resource_size=None, max_storage_size=None,
+              max_connections='8'):
         debug = str_to_bool(debug)
         if max_resource_size:
             max_resource_size = str_to_bytesize(max_resource_size)
         if max_storage_size:
             max_storage_size = str_to_bytesize(max_storage_size)
-        return cls(client_token_path, credentials_path, max_resource_size, debug, max_storage_size)
+        return cls(client_token_path, credentials_path, max_resource_size, debug, max_storage_size,
+                   int(max_connections))
 
     def identifier(self):
         from .api.ApiCaller import SessionBuilder
@@ -99,63 +119,104 @@ class GooglePhotosStorage(AbstractSizableStorageInterface, StorageBuilderInterfa
 
     def nextEmptyAlbum(self):
         # type: () -> Album
-        if len(self.albums) == 0:
-            # either no albums created or not yet fetched
-            # first try fetching
-            for a in self.api.listAlbums(exclude_non_app_created=True):
-                if a.title.startswith(self._album_praefix) and a.title.replace(self._album_praefix, '').isnumeric():
-                    self.albums_count[a.id] = a.mediaItemsCount
-                    self.albums[a.id] = a
+        with self._album_lock:
+            if len(self.albums) == 0:
+                # either no albums created or not yet fetched
+                # first try fetching
+                for a in self.api.listAlbums(exclude_non_app_created=True):
+                    if a.title.startswith(self._album_praefix) and a.title.replace(self._album_praefix, '').isnumeric():
+                        self.albums_count[a.id] = a.mediaItemsCount
+                        self.albums[a.id] = a
 
-        # if albums dict is empty, create a new album
-        if len(self.albums) == 0:
-            self.debugPrint("creating storage album", self._album_praefix+'0')
-            a = self.api.createAlbum(self._album_praefix+'0')
-            self.albums_count[a.id] = a.mediaItemsCount
-            self.albums[a.id] = a
-            return a
-        # otherwise search biggest album where size is smaller than 20000
-        else:
-            if any((c < self.max_album_size for c in self.albums_count.values())):
-                # album exists where size is smaller than 20000
-                biggest_album_title = sorted(self.albums_count.keys(),
-                                             key=lambda k: self.albums_count[k],
-                                             reverse=True)[0]
-                return self.albums[biggest_album_title]
-            else:
-                # all albums are maxed out to 20000, create a new one
-                self.debugPrint("creating storage album", self._album_praefix + str(len(self.albums)))
-                a = self.api.createAlbum(self._album_praefix + str(len(self.albums)))
+            # if albums dict is empty, create a new album
+            if len(self.albums) == 0:
+                self.debugPrint("creating storage album", self._album_praefix+'0')
+                a = self.api.createAlbum(self._album_praefix+'0')
                 self.albums_count[a.id] = a.mediaItemsCount
                 self.albums[a.id] = a
                 return a
+            # otherwise search biggest album where size is smaller than 20000
+            else:
+                if any((c < self.max_album_size for c in self.albums_count.values())):
+                    # album exists where size is smaller than 20000
+                    biggest_album_title = sorted(self.albums_count.keys(),
+                                                 key=lambda k: self.albums_count[k],
+                                                 reverse=True)[0]
+                    return self.albums[biggest_album_title]
+                else:
+                    # all albums are maxed out to 20000, create a new one
+                    self.debugPrint("creating storage album", self._album_praefix + str(len(self.albums)))
+                    a = self.api.createAlbum(self._album_praefix + str(len(self.albums)))
+                    self.albums_count[a.id] = a.mediaItemsCount
+                    self.albums[a.id] = a
+                    return a
 
     def saveResource(self, resource_data, resource_hash, resource_size):
         png = PNG3DWrapper.wrap(resource_data)
-        album = self.nextEmptyAlbum()
         file_name = resource_hash.hex() + '.png'
         token = self.api.uploadBytes(file_name, png)
-        new_media_item = self.api.createMediaItem([(token, file_name), ], album)[0]
-        try:
-            self.albums_count[album.id] += 1
-        except KeyError:
-            self.debugPrint(self.albums_count)
-            self.debugPrint(self.albums)
-            raise
-        self.increaseCurrentSize(resource_size)
-        return self.format_resource_name(album.id, new_media_item.mediaItem.id)
+        resource_name = self._commitUploadTokens([(token, file_name)])[0]
+        with self._commit_condition:
+            self.increaseCurrentSize(resource_size)
+        return resource_name
+
+    def _commitUploadTokens(self, tokens_file_names):
+        # type: (List[Tuple[str, str]]) -> List[ResourceName]
+        """
+        creates media items for the given upload tokens. Tokens of all threads are collected and committed with
+        batchCreate requests of up to max_batch_size tokens, only one request runs at a time.
+        """
+        pending_items = [_PendingMediaItem(token, file_name) for token, file_name in tokens_file_names]
+        with self._commit_condition:
+            self._commit_queue.extend(pending_items)
+            while not all(i.done() for i in pending_items):
+                if self._committing:
+                    self._commit_condition.wait()
+                    continue
+                self._committing = True
+                batch = self._commit_queue[:self.max_batch_size]
+                del self._commit_queue[:self.max_batch_size]
+                self._commit_condition.release()
+                try:
+                    self._createMediaItems(batch)
+                finally:
+                    self._commit_condition.acquire()
+                    self._committing = False
+                    self._commit_condition.notify_all()
+        for pending_item in pending_items:
+            if pending_item.error:
+                raise pending_item.error
+        return [i.resource_name for i in pending_items]
+
+    def _createMediaItems(self, pending_items):
+        # type: (List[_PendingMediaItem]) -> None
+        while pending_items:
+            chunk = []  # type: List[_PendingMediaItem]
+            try:
+                album = self.nextEmptyAlbum()
+                count = min(self.max_album_size - self.albums_count[album.id], len(pending_items))
+                chunk, pending_items = pending_items[:count], pending_items[count:]
+                new_media_items = self.api.createMediaItem([(i.token, i.file_name) for i in chunk], album)
+            except Exception as e:
+                for pending_item in pending_items + chunk:
+                    pending_item.error = e
+                return
+            self.albums_count[album.id] += len(chunk)
+            for pending_item, new_media_item in zip(chunk, new_media_items):
+                pending_item.resource_name = self.format_resource_name(album.id, new_media_item.mediaItem.id)
 
     def createTrashAlbum(self):
-        if not self.trash_album:
-            for album in self.api.listAlbums(exclude_non_app_created=True):
-                if album.title == self._trash_album:
-                    self.trash_album = album
-                    return self.trash_album
-            self.debugPrint("creating trash album")
-            self.trash_album = self.api.createAlbum(self._trash_album)
-            return self.trash_album
-        else:
-            return self.trash_album
+        with self._album_lock:
+            if not self.trash_album:
+                for album in self.api.listAlbums(exclude_non_app_created=True):
+                    if album.title == self._trash_album:
+                        self.trash_album = album
+                        return self.trash_album
+                self.debugPrint("creating trash album")
+                self.trash_album = self.api.createAlbum(self._trash_album)
+                return self.trash_album
+            else:
+                return self.trash_album
 
     def deleteResource(self, resource_name):
         self.resetCurrentSize()
@@ -175,21 +236,74 @@ class GooglePhotosStorage(AbstractSizableStorageInterface, StorageBuilderInterfa
         else:
             self.api.removeMediaItemsFromAlbum(src_album, [media_item, ])
 
+    def loadResources(self, resource_names):
+        resource_names = list(resource_names)
+        media_items = self._getMediaItems(resource_names)
+        for resource_name, media_item in zip(resource_names, media_items):
+            if media_item is None:
+                raise NotFoundError("media item of resource " + resource_name + " not found")
+        remote_pngs = self._batched(self.api.downloadMediaItem, media_items)
+        return [PNG3DWrapper.unwrap(remote_png) for remote_png in remote_pngs]
+
+    def saveResources(self, resources):
+        resources = list(resources)
+        file_names = [resource_hash.hex() + '.png' for _, resource_hash, _ in resources]
+
+        def upload(file_name_resource):
+            # type: (Tuple[str, Tuple[bytes, bytes, int]]) -> str
+            file_name, (resource_data, _, _) = file_name_resource
+            return self.api.uploadBytes(file_name, PNG3DWrapper.wrap(resource_data))
+
+        # uploads run in parallel, the media items are then created with one batchCreate request per 50 uploads
+        tokens = self._batched(upload, list(zip(file_names, resources)))
+        resource_names = self._commitUploadTokens(list(zip(tokens, file_names)))
+        with self._commit_condition:
+            for _, _, resource_size in resources:
+                self.increaseCurrentSize(resource_size)
+        return resource_names
+
+    def deleteResources(self, resource_names):
+        resource_names = list(resource_names)
+        if not resource_names:
+            return
+        self.resetCurrentSize()
+        trash_album = self.createTrashAlbum()
+        album_media_items = {}  # type: Dict[str, List[MediaItem]]
+        for resource_name, media_item in zip(resource_names, self._getMediaItems(resource_names)):
+            if media_item is None:
+                continue
+            src_album_id, _ = self.parse_resource_name(resource_name)
+            album_media_items.setdefault(src_album_id, []).append(media_item)
+        media_items = list({i.id: i for items in album_media_items.values() for i in items}.values())
+        if not media_items:
+            return
+        self.api.addMediaItemsToAlbum(trash_album, media_items)
+        for src_album_id, items in album_media_items.items():
+            try:
+                src_album = self.api.getAlbumByID(src_album_id)
+            except NotFoundError:
+                continue
+            self.api.removeMediaItemsFromAlbum(src_album, list({i.id: i for i in items}.values()))
+
+    def _getMediaItems(self, resource_names):
+        # type: (List[ResourceName]) -> List[Optional[MediaItem]]
+        if not resource_names:
+            return []
+        return self.api.getMediaItemsByIDs([self.parse_resource_name(n)[1] for n in resource_names])
+
     def listResourceNames(self):
         id_list = []
-        for album in self.api.listAlbums(exclude_non_app_created=True):
-            if album.title == self._trash_album:
-                continue
-            for media_item in self.api.listMediaItemsInAlbum(album):
+        albums = [a for a in self.api.listAlbums(exclude_non_app_created=True) if a.title != self._trash_album]
+        for album, media_items in zip(albums, self._listMediaItemsInAlbums(albums)):
+            for media_item in media_items:
                 id_list.append(self.format_resource_name(album.id, media_item.id))
         return id_list
 
     def wipeResources(self):
         self.resetCurrentSize()
         trash_album = None
-        for album in self.api.listAlbums(exclude_non_app_created=True):
-            # print(list(self.api.listMediaItemsInAlbum(album)))
-            album_media_items = list(self.api.listMediaItemsInAlbum(album))
+        albums = list(self.api.listAlbums(exclude_non_app_created=True))
+        for album, album_media_items in zip(albums, self._listMediaItemsInAlbums(albums)):
             if len(album_media_items) > 0:
                 if not trash_album:
                     trash_album = self.createTrashAlbum()
@@ -202,3 +316,20 @@ class GooglePhotosStorage(AbstractSizableStorageInterface, StorageBuilderInterfa
 
     def format_resource_name(self, album_id, mediaitem_id):
         return json.dumps({'aid': album_id, 'mid': mediaitem_id}, sort_keys=True)
+
+
+class _PendingMediaItem(object):
+    """
+    upload token waiting for its media item
+    """
+
+    def __init__(self, token, file_name):
+        # type: (str, str) -> None
+        self.token = token
+        self.file_name = file_name
+        self.resource_name = None  # type: Optional[ResourceName]
+        self.error = None  # type: Optional[Exception]
+
+    def done(self):
+        # type: () -> bool
+        return self.resource_name is not None or self.error is not None
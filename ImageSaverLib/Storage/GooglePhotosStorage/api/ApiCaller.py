@@ -1,16 +1,19 @@
 import json
 import logging
 import os
-from typing import Generator, List, Tuple
+from typing import Generator, List, Tuple, Optional, Type
 
 # noinspection PyPackageRequirements
 from google.auth.transport.requests import AuthorizedSession
 # noinspection PyPackageRequirements
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
+from requests import Session, Response
+from requests.adapters import HTTPAdapter
 
 from ImageSaverLib.Helpers import chunkiterable_gen
-from ImageSaverLib.Storage.Errors import UploadError, DownloadError, StorageError, NotFoundError
+from ImageSaverLib.Storage.Errors import (UploadError, DownloadError, StorageError, NotFoundError, ThrottledError,
+                                          ThrottledUploadError, ThrottledDownloadError)
 from .resources.Album import Album
 from .resources.MediaItem import MediaItem
 from .resources.NewMediaItemResult import NewMediaItemResult
@@ -85,18 +88,41 @@ class SessionBuilder(object):
 
 
 class ApiCaller(object):
-    def __init__(self, session):
-        # type: (AuthorizedSession) -> None
+    api_url = 'https://photoslibrary.googleapis.com/v1'
+
+    def __init__(self, session, max_connections=10, api_url=None):
+        # type: (Session, int, Optional[str]) -> None
+        """
+        :param max_connections: size of the keep-alive connection pool of the session, should be at least the number of
+                                threads, which call the api at the same time. Otherwise connections are closed after
+                                each request.
+        :param api_url: base url of the Google Photos Library API
+        """
         self.session = session
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if api_url:
+            self.api_url = api_url.rstrip('/')
         self.pageSize = 50
         self.album_max_size = 20000
         self.debug = False
 
+    @staticmethod
+    def _raiseIfThrottled(response, error_type=ThrottledError):
+        # type: (Response, Type[ThrottledError]) -> None
+        # the api answers 429 when a quota is exceeded, 5xx responses are temporary as well
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get('Retry-After', '')
+            raise error_type("request throttled, response code was " + str(response.status_code),
+                             retry_after=float(retry_after) if retry_after.isdigit() else None)
+
     def createAlbum(self, album_name):
         create_album_body = json.dumps({"album": {"title": album_name}})
         if self.debug:
             print("createAlbum post", album_name)
-        response = self.session.post('https://photoslibrary.googleapis.com/v1/albums', create_album_body)
+        response = self.session.post(self.api_url + '/albums', create_album_body)
+        self._raiseIfThrottled(response)
         if response.status_code != 200:
             print(response.json())
             raise StorageError("unable to download media, response code was not 200: " + str(response.status_code))
@@ -114,7 +140,9 @@ class ApiCaller(object):
             if self.debug:
                 print("listAlbums get iteration", i)
             i += 1
-            response = self.session.get('https://photoslibrary.googleapis.com/v1/albums', params=params).json()
+            response = self.session.get(self.api_url + '/albums', params=params)
+            self._raiseIfThrottled(response)
+            response = response.json()
             if 'albums' in response:
                 for album in response['albums']:
                     yield Album(album)
@@ -136,8 +164,10 @@ class ApiCaller(object):
             # traceback.print_stack()
             i += 1
             # response = self.session.get('https://photoslibrary.googleapis.com/v1/mediaItems', params=params).json()
-            response = self.session.post('https://photoslibrary.googleapis.com/v1/mediaItems:search',
-                                         json.dumps(params)).json()
+            response = self.session.post(self.api_url + '/mediaItems:search',
+                                         json.dumps(params))
+            self._raiseIfThrottled(response)
+            response = response.json()
             # print(response)
             # print('-' * 20)
             if 'mediaItems' in response:
@@ -156,8 +186,9 @@ class ApiCaller(object):
                                     # + '-w' + str(media_item.mediaMetadata.width)
                                     # + '-h' + str(media_item.mediaMetadata.height)
                                     # + '-c',
-                                    allow_redirect=True
+                                    allow_redirects=True
                                     )
+        self._raiseIfThrottled(response, ThrottledDownloadError)
         if response.status_code != 200:
             print(response.json())
             raise DownloadError("unable to download media, response code was not 200: " + str(response.status_code))
@@ -169,17 +200,15 @@ class ApiCaller(object):
         Uploads bytes to Google servers, returning an umpload token.
         This token can be used to create a MediaItem
         """
-        self.session.headers["X-Goog-Upload-File-Name"] = file_name
-        self.session.headers["X-Goog-Upload-Protocol"] = 'raw'
-        try:
-            if self.debug:
-                print("uploadBytes post, bytes:", len(file_bytes))
-            response = self.session.post('https://photoslibrary.googleapis.com/v1/uploads', file_bytes)
-            if response.status_code != 200:
-                raise UploadError("unable to upload media, response code was not 200: " + str(response.status_code))
-        finally:
-            self.session.headers.pop("X-Goog-Upload-File-Name")
-            self.session.headers.pop("X-Goog-Upload-Protocol")
+        # headers are passed per request instead of set on the session, so uploads can run in parallel
+        headers = {"X-Goog-Upload-File-Name": file_name,
+                   "X-Goog-Upload-Protocol": 'raw'}
+        if self.debug:
+            print("uploadBytes post, bytes:", len(file_bytes))
+        response = self.session.post(self.api_url + '/uploads', file_bytes, headers=headers)
+        self._raiseIfThrottled(response, ThrottledUploadError)
+        if response.status_code != 200:
+            raise UploadError("unable to upload media, response code was not 200: " + str(response.status_code))
         return response.content.decode()
 
     def createMediaItem(self, upload_tokens_descriptions, target_album):
@@ -201,8 +230,9 @@ class ApiCaller(object):
                        "newMediaItems": new_media_items_list}
         if self.debug:
             print("createMediaItem post")
-        response = self.session.post('https://photoslibrary.googleapis.com/v1/mediaItems:batchCreate',
+        response = self.session.post(self.api_url + '/mediaItems:batchCreate',
                                      json.dumps(create_body))
+        self._raiseIfThrottled(response, ThrottledUploadError)
         response_json = response.json()
         if 'newMediaItemResults' not in response_json:
             print(response.status_code, response_json)
@@ -226,20 +256,51 @@ class ApiCaller(object):
             raise ValueError('mediaitem_id is empty')
         if self.debug:
             print("getMediaItemByID get")
-        response = self.session.get('https://photoslibrary.googleapis.com/v1/mediaItems/' + mediaitem_id)
+        response = self.session.get(self.api_url + '/mediaItems/' + mediaitem_id)
+        self._raiseIfThrottled(response, ThrottledDownloadError)
         if response.status_code != 200:
             # print(response.json())
             raise NotFoundError("unable to download media, response code was not 200: " + str(response.status_code)+"; response: "
                                +str(response.raw))
         return MediaItem(response.json())
 
+    def getMediaItemsByIDs(self, mediaitem_ids):
+        # type: (List[str]) -> List[Optional[MediaItem]]
+        """
+        fetches multiple media items with batchGet requests of up to 50 ids. The results are in the order of the given
+        ids, missing media items are None.
+        """
+        if not all(mediaitem_ids):
+            raise ValueError('mediaitem_id is empty')
+        media_items = []  # type: List[Optional[MediaItem]]
+        for chunk in chunkiterable_gen(mediaitem_ids, 50, skip_none=True):
+            if not chunk:
+                continue
+            if self.debug:
+                print("getMediaItemsByIDs get")
+            response = self.session.get(self.api_url + '/mediaItems:batchGet',
+                                        params={'mediaItemIds': list(chunk)})
+            self._raiseIfThrottled(response, ThrottledDownloadError)
+            if response.status_code != 200:
+                print(response.json())
+                raise StorageError("unable to get media items, response code was not 200: "
+                                   + str(response.status_code))
+            results = response.json().get('mediaItemResults', [])
+            if len(results) != len(chunk):
+                raise StorageError("unable to get media items, requested " + str(len(chunk)) + ", got "
+                                   + str(len(results)))
+            for result in results:
+                media_items.append(MediaItem(result['mediaItem']) if 'mediaItem' in result else None)
+        return media_items
+
     def getAlbumByID(self, album_id):
         # type: (str) -> Album
         if not album_id:
             raise ValueError('album_id is empty')
         if self.debug:
             print("getAlbumByID get")
-        response = self.session.get('https://photoslibrary.googleapis.com/v1/albums/' + album_id)
+        response = self.session.get(self.api_url + '/albums/' + album_id)
+        self._raiseIfThrottled(response)
         if response.status_code != 200:
             print(response.json())
             raise NotFoundError("unable to download album_id, response code was not 200: " + str(response.status_code))
@@ -256,6 +317,7 @@ class ApiCaller(object):
                                     # + '-h' + str(media_item.mediaMetadata.height)
                                     # + '-c'
                                     )
+        self._raiseIfThrottled(response, ThrottledDownloadError)
         if response.status_code != 200:
             print(response.json())
             raise DownloadError("unable to download media, response code was not 200: " + str(response.status_code))
@@ -269,10 +331,11 @@ class ApiCaller(object):
             request_body = {'mediaItemIds': [i.id for i in chunk]}
             if self.debug:
                 print("removeMediaItemsFromAlbum post")
-            response = self.session.post('https://photoslibrary.googleapis.com/v1/albums/'
+            response = self.session.post(self.api_url + '/albums/'
                                          + album.id
                                          + ':batchRemoveMediaItems',
                                          json.dumps(request_body))
+            self._raiseIfThrottled(response)
             if response.status_code != 200:
                 print(response.json())
                 raise StorageError("unable to remove media, response code was not 200: " + str(response.status_code))
@@ -285,10 +348,11 @@ class ApiCaller(object):
             request_body = {'mediaItemIds': [i.id for i in chunk]}
             if self.debug:
                 print("addMediaItemsToAlbum post")
-            response = self.session.post('https://photoslibrary.googleapis.com/v1/albums/'
+            response = self.session.post(self.api_url + '/albums/'
                                          + album.id
                                          + ':batchAddMediaItems',
                                          json.dumps(request_body))
+            self._raiseIfThrottled(response)
             if response.status_code != 200:
                 print(response.json())
                 raise StorageError("unable to add media, response code was not 200: " + str(response.status_code))
@@ -0,0 +1,104 @@
+import asyncio
+import uuid
+from typing import Optional, Dict
+
+from ..AsyncStorageInterface import AsyncStorageInterface
+from ..Errors import DownloadError, NotFoundError, UploadError, DeleteError, ListError
+from ...Encapsulation.Wrappers import WrappingType
+from ...MetaDB.Types.Resource import ResourceSize, ResourceName
+
+
+class HTTPObjectStorage(AsyncStorageInterface):
+    """
+    stores resources as objects of a plain HTTP object store, through one aiohttp session with a pool of keep-alive
+    connections. The store has to answer:
+
+    PUT <base_url>/<name>       stores the request body under the name
+    GET <base_url>/<name>       returns the stored body, 404 if there is no object with the name
+    DELETE <base_url>/<name>    removes the object
+    GET <base_url>/             returns a JSON list of all object names
+    """
+
+    def __init__(self, base_url, max_connections=100, headers=None, timeout=60.0, wrap_type=None,
+                 max_resource_size=None):
+        # type: (str, int, Optional[Dict[str, str]], float, Optional[WrappingType], Optional[ResourceSize]) -> None
+        """
+        :param max_connections: most requests, which are sent at the same time, further requests wait for a free
+                                connection
+        :param headers: sent with every request, for example for authentication
+        :param timeout: seconds a single request may take
+        """
+        super().__init__(wrap_type, max_resource_size)
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.headers = headers or {}
+        self.timeout = timeout
+        self._session = None  # type: Optional['aiohttp.ClientSession']
+
+    @property
+    def session(self):
+        # type: () -> 'aiohttp.ClientSession'
+        # created on first use, the session binds to the running event loop
+        if self._session is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections),
+                                                  headers=self.headers,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    def identifier(self):
+        return self.base_url + '@http'
+
+    def _url(self, resource_name):
+        # type: (ResourceName) -> str
+        return self.base_url + '/' + resource_name
+
+    async def loadRessource(self, resource_name):
+        import aiohttp
+        try:
+            async with self.session.get(self._url(resource_name)) as response:
+                if response.status == 404:
+                    raise NotFoundError("resource " + repr(resource_name) + " not found")
+                if response.status != 200:
+                    raise DownloadError("unable to download resource, response code was not 200: "
+                                        + str(response.status))
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise DownloadError("unable to download resource " + repr(resource_name) + ': ' + repr(e))
+
+    async def saveResource(self, resource_data, resource_hash, resource_size):
+        import aiohttp
+        resource_name = ResourceName(resource_hash.hex() + '-' + uuid.uuid4().hex[:8])
+        try:
+            async with self.session.put(self._url(resource_name), data=resource_data) as response:
+                if response.status not in (200, 201, 204):
+                    raise UploadError("unable to upload resource, response code was " + str(response.status))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise UploadError("unable to upload resource: " + repr(e))
+        return resource_name
+
+    async def deleteResource(self, resource_name):
+        import aiohttp
+        try:
+            async with self.session.delete(self._url(resource_name)) as response:
+                if response.status not in (200, 202, 204):
+                    raise DeleteError("unable to delete resource " + repr(resource_name) + ", response code was "
+                                      + str(response.status))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise DeleteError("unable to delete resource " + repr(resource_name) + ': ' + repr(e))
+
+    async def listResourceNames(self):
+        import aiohttp
+        try:
+            async with self.session.get(self.base_url + '/') as response:
+                if response.status != 200:
+                    raise ListError("unable to list resources, response code was not 200: " + str(response.status))
+                # stores may answer with any content type
+                return [ResourceName(n) for n in await response.json(content_type=None)]
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise ListError("unable to list resources: " + repr(e))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,281 @@
+import random
+import time
+from threading import Condition, Lock
+from typing import Optional, Callable, TypeVar, cast
+
+from ..Errors import StorageError, ThrottledError, TransferError, NotFoundError
+from ..StorageInterface import StorageInterface, SizableStorageInterface
+
+T = TypeVar('T')
+
+
+class TokenBucket(object):
+    """
+    paces requests to rate requests per second, up to capacity requests pass without waiting after an idle time.
+    Without a rate only pauses are applied.
+    """
+
+    def __init__(self, rate=None, capacity=None):
+        # type: (Optional[float], Optional[float]) -> None
+        if rate is not None and rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate or 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = Lock()
+
+    def pause(self, seconds):
+        # type: (float) -> None
+        """
+        hands out no tokens for the given time, used when the service asks to retry later
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        # type: () -> None
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if self.rate is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if wait <= 0 and self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = max(wait, (1 - self._tokens) / self.rate)
+                elif wait <= 0:
+                    return
+            time.sleep(wait)
+
+
+class AIMDLimiter(object):
+    """
+    limits the number of requests in flight with additive increase, multiplicative decrease.
+
+    Every successful request raises the limit by 1/limit, so the limit grows by one per limit requests. A throttled
+    request, or a request which took longer than latency_tolerance times the usual latency, multiplies the limit with
+    decrease_factor. Requests which were started before the last decrease neither decrease nor raise the limit again,
+    they saw the old limit.
+    """
+
+    def __init__(self, initial_limit=1, min_limit=1, max_limit=32, decrease_factor=0.5, latency_tolerance=None):
+        # type: (int, int, int, float, Optional[float]) -> None
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError('limits must satisfy 1 <= min_limit <= initial_limit <= max_limit')
+        if not 0 < decrease_factor < 1:
+            raise ValueError('decrease_factor must be between 0 and 1')
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.base_latency = None  # type: Optional[float]
+        self._last_decrease = 0.0
+        self._condition = Condition(Lock())
+
+    def acquire(self):
+        # type: () -> float
+        """
+        waits until the request may be sent, returns the start time, which has to be passed to release()
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started, throttled=False, succeeded=True):
+        # type: (float, bool, bool) -> None
+        """
+        :param throttled: the service rejected the request because of its load
+        :param succeeded: False for failed requests, which are no sign of the service load, they leave the limit as is
+        """
+        with self._condition:
+            self.in_flight -= 1
+            latency = time.monotonic() - started
+            if throttled:
+                self._decrease(started)
+            elif succeeded:
+                if self.base_latency is None or latency < self.base_latency:
+                    self.base_latency = latency
+                else:
+                    # slowly follows lasting latency changes, e.g. after the network route changed
+                    self.base_latency += (latency - self.base_latency) * 0.01
+                if self.latency_tolerance is not None and latency > self.base_latency * self.latency_tolerance:
+                    self._decrease(started)
+                elif started >= self._last_decrease:
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / int(self.limit))
+            self._condition.notify_all()
+
+    def _decrease(self, started):
+        # type: (float) -> None
+        if started < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+
+
+class RateLimitedStorage(StorageInterface):
+    """
+    paces the requests to a storage with a token bucket, limits the requests in flight with an AIMDLimiter and sends
+    requests again, which failed with a ThrottledError, after a jittered exponential backoff.
+
+    The number of requests in flight starts at one and grows until the service throttles, so the ingest settles at the
+    throughput the service allows. The batch methods are forwarded to the batch methods of the storage, a batch takes
+    one slot of the limiter, a token for each item and is retried as a whole. Resources of a batch upload, which was
+    throttled after some uploads succeeded, are left unreferenced on the storage.
+    """
+
+    def __init__(self, storage, requests_per_second=None, burst=None, max_concurrency=None, max_retries=8,
+                 base_backoff=0.5, max_backoff=60.0, latency_tolerance=None, retry_transfer_errors=False):
+        # type: (StorageInterface, Optional[float], Optional[float], Optional[int], int, float, float, Optional[float], bool) -> None
+        """
+        :param requests_per_second: most requests started per second, None does not pace the requests
+        :param burst: requests, which may be started at once after an idle time, defaults to requests_per_second
+        :param max_concurrency: most requests in flight, defaults to the batch_workers of the storage
+        :param max_retries: how often a request is sent again, before its error is raised
+        :param base_backoff: seconds to wait at most before the first retry, doubles with every further retry
+        :param max_backoff: seconds to wait at most before a retry
+        :param latency_tolerance: also decrease the requests in flight, if a request takes longer than this many times
+                                  the usual latency. None only reacts to throttling
+        :param retry_transfer_errors: also retry uploads and downloads, which failed with other errors than throttling,
+                                      except NotFoundErrors
+        """
+        super().__init__()
+        self._storage = storage
+        self.max_retries = max_retries
+        self.retry_transfer_errors = retry_transfer_errors
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.limiter = AIMDLimiter(max_limit=max_concurrency or storage.batch_workers,
+                                   latency_tolerance=latency_tolerance)
+        self.batch_workers = self.limiter.max_limit
+        self.throttled_count = 0
+        self.retry_count = 0
+        self._stats_lock = Lock()
+
+    def getMaxSupportedResourceSize(self):
+        return self._storage.getMaxSupportedResourceSize()
+
+    def getRequiredWrapType(self):
+        return self._storage.getRequiredWrapType()
+
+    def supportsWrapType(self, wrap_type):
+        return self._storage.supportsWrapType(wrap_type)
+
+    def identifier(self):
+        return self._storage.identifier()
+
+    def _backoff(self, attempt, error):
+        # type: (int, StorageError) -> float
+        # full jitter, spreads the retries of all threads over the backoff window
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1)))
+        if isinstance(error, ThrottledError) and error.retry_after is not None:
+            delay += error.retry_after
+        return delay
+
+    def _call(self, function, *args, requests=1):
+        # type: (Callable[..., T], *object, int) -> T
+        """
+        :param requests: number of requests the call sends, the call waits for a token for each of them
+        """
+        attempt = 0
+        while True:
+            for _ in range(requests):
+                self.bucket.acquire()
+            started = self.limiter.acquire()
+            try:
+                result = function(*args)
+            except ThrottledError as e:
+                self.limiter.release(started, throttled=True, succeeded=False)
+                error = e  # type: StorageError
+                with self._stats_lock:
+                    self.throttled_count += 1
+                if e.retry_after is not None:
+                    # the whole service is limited, not only this request
+                    self.bucket.pause(e.retry_after)
+            except TransferError as e:
+                self.limiter.release(started, succeeded=False)
+                if not self.retry_transfer_errors or isinstance(e, NotFoundError):
+                    raise
+                error = e
+            except BaseException:
+                self.limiter.release(started, succeeded=False)
+                raise
+            else:
+                self.limiter.release(started)
+                return result
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            with self._stats_lock:
+                self.retry_count += 1
+            self.debugPrint('retrying', function.__name__, 'after', repr(error))
+            time.sleep(self._backoff(attempt, error))
+
+    def loadRessource(self, resource_name):
+        return self._call(self._storage.loadRessource, resource_name)
+
+    def saveResource(self, resource_data, resource_hash, resource_size):
+        return self._call(self._storage.saveResource, resource_data, resource_hash, resource_size)
+
+    def deleteResource(self, resource_name):
+        return self._call(self._storage.deleteResource, resource_name)
+
+    def loadResources(self, resource_names):
+        resource_names = list(resource_names)
+        if not resource_names:
+            return []
+        return self._call(self._storage.loadResources, resource_names, requests=len(resource_names))
+
+    def saveResources(self, resources):
+        resources = list(resources)
+        if not resources:
+            return []
+        return self._call(self._storage.saveResources, resources, requests=len(resources))
+
+    def deleteResources(self, resource_names):
+        resource_names = list(resource_names)
+        if not resource_names:
+            return
+        self._call(self._storage.deleteResources, resource_names, requests=len(resource_names))
+
+    def listResourceNames(self):
+        return self._call(self._storage.listResourceNames)
+
+    def wipeResources(self):
+        return self._call(self._storage.wipeResources)
+
+
+class SizableRateLimitedStorage(SizableStorageInterface, RateLimitedStorage):
+
+    def __init__(self, storage, requests_per_second=None, burst=None, max_concurrency=None, max_retries=8,
+                 base_backoff=0.5, max_backoff=60.0, latency_tolerance=None, retry_transfer_errors=False):
+        # type: (SizableStorageInterface, Optional[float], Optional[float], Optional[int], int, float, float, Optional[float], bool) -> None
+        RateLimitedStorage.__init__(self, storage, requests_per_second, burst, max_concurrency, max_retries,
+                                    base_backoff, max_backoff, latency_tolerance, retry_transfer_errors)
+        self._storage = cast(SizableStorageInterface, self._storage)
+
+    def getTotalSize(self):
+        return self._storage.getTotalSize()
+
+    def getCurrentSize(self):
+        return self._storage.getCurrentSize()
+
+    def increaseCurrentSize(self, size):
+        return self._storage.increaseCurrentSize(size)
+
+    def resetCurrentSize(self):
+        return self._storage.resetCurrentSize()
+
+    def calculateFullness(self, default_total_size=None):
+        return self._storage.calculateFullness(default_total_size)
+
+    def hasFreeSize(self, required_space):
+        return self._storage.hasFreeSize(required_space)
@@ -2,7 +2,7 @@ import hashlib
 import json
 import os
 import random
-from typing import Dict, List, Optional, Union, Callable, Iterator, Set
+from typing import Dict, List, Optional, Union, Callable, Iterator, Set, Tuple
 
 from ImageSaverLib.Encapsulation.Wrappers.Types import PassThroughWrapper
 from ImageSaverLib.MetaDB.MetaDB import MetaDBInterface
@@ -16,6 +16,8 @@ from ..StorageInterface import StorageInterface, SizableStorageInterface
 
 
 class RedundantStorage(StorageInterface):
+    batch_workers = 1  # storages are picked by their fill level, which changes with every saved resource
+
     def __init__(self, policy, redundancy, *storages, debug=False, meta_dir='~/.isl/.pool', meta=None):
         # type: (int, int, *Union[StorageInterface, SizableStorageInterface], bool, str, Optional[RSMetaInterface]) -> None
         super().__init__(debug)
@@ -105,6 +107,41 @@ class RedundantStorage(StorageInterface):
         for storage_ident in matching_storages:
             self._storages[storage_ident].deleteResource(storage_hashes__resource_names[storage_ident])
 
+    def loadResources(self, resource_names):
+        resource_names = list(resource_names)
+        # group the names by the storage they get loaded from, to pass them with one batch call to each storage
+        storage_names = {}  # type: Dict[str, List[Tuple[int, ResourceName]]]
+        for index, resource_name in enumerate(resource_names):
+            alias = self._meta.getAliasOfResourceName(resource_name)
+            storage_hashes__resource_names = json.loads(alias)  # type: Dict[str, ResourceName]
+            matching_storages = set(self._storages.keys()).intersection(set(storage_hashes__resource_names.keys()))
+            if len(matching_storages) == 0:
+                raise NotFoundError("Unable to download Resource, No storage matches.")
+            storage = random.choice(list(matching_storages))
+            storage_names.setdefault(storage, []).append((index, storage_hashes__resource_names[storage]))
+        resources_data = [b''] * len(resource_names)  # type: List[bytes]
+        for storage, index_names in storage_names.items():
+            loaded = self._storages[storage].loadResources([n for _, n in index_names])
+            for (index, _), resource_data in zip(index_names, loaded):
+                resources_data[index] = resource_data
+        return resources_data
+
+    def deleteResources(self, resource_names):
+        resource_names = list(resource_names)
+        storage_names = {}  # type: Dict[str, List[ResourceName]]
+        for resource_name in resource_names:
+            alias = self._meta.getAliasOfResourceName(resource_name)
+            storage_hashes__resource_names = json.loads(alias)  # type: Dict[str, ResourceName]
+            matching_storages = set(self._storages.keys()).intersection(set(storage_hashes__resource_names.keys()))
+            if len(matching_storages) == 0:
+                raise NotFoundError("Unable to delete Resource, No storage matches.")
+            for storage_ident in matching_storages:
+                storage_names.setdefault(storage_ident, []).append(storage_hashes__resource_names[storage_ident])
+        for storage_ident, names in storage_names.items():
+            self._storages[storage_ident].deleteResources(names)
+        for resource_name in resource_names:
+            self._meta.removeAliasOfResourceName(resource_name)
+
     def listResourceNames(self):
         return list(self._meta.getAllResourceNames())
 
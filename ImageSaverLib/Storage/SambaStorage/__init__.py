@@ -10,6 +10,7 @@ from ...MetaDB.Types.Resource import ResourceSize
 
 class SambaStorage(AbstractSizableStorageInterface, StorageBuilderInterface):
     __storage_name__ = 'samba'
+    batch_workers = 1  # the smb connection is not thread safe
 
     def __init__(self, user_id, password, server_ip, server_name=None, client_machine_name='imagesaver',
                  extension='png', service_name='ImageSaver', directory='isl_storage', debug=False, folder_depth=1,
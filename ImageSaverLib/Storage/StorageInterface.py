@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, NewType
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, NewType, Iterable, Tuple, Callable, TypeVar
 
 from ImageSaverLib.Encapsulation import WrappingType
 from ImageSaverLib.Encapsulation.Wrappers.Types import PassThroughWrapper
@@ -11,6 +12,9 @@ from ..MetaDB.Types.Resource import ResourceName, ResourceHash, ResourceSize
 
 StorageSize = NewType('StorageSize', int)
 
+T = TypeVar('T')
+R = TypeVar('R')
+
 
 class StorageInterface(ABC):
     supported_comresserclasses = []  # type: List[BaseCompressor]
@@ -22,6 +26,10 @@ class StorageInterface(ABC):
     DEFAULT_WRAP_TYPE = PassThroughWrapper.get_wrapper_type()
     required_wrap_type = DEFAULT_WRAP_TYPE
 
+    # number of threads, which run the single calls of the default batch methods, 1 runs them one after the other
+    DEFAULT_BATCH_WORKERS = 4
+    batch_workers = DEFAULT_BATCH_WORKERS
+
     def __init__(self, debug=False, wrap_type=None, max_resource_size=None):
         # type: (bool, Optional[WrappingType], Optional[ResourceSize]) -> None
         self.__debug = debug
@@ -95,6 +103,43 @@ class StorageInterface(ABC):
         """
         pass
 
+    def loadResources(self, resource_names):
+        # type: (Iterable[ResourceName]) -> List[bytes]
+        """
+        loads multiple resources, the data is returned in the order of the given names
+
+        :raises DownloadError:
+        :raises NotFoundError:
+        """
+        return self._batched(self.loadRessource, list(resource_names))
+
+    def saveResources(self, resources):
+        # type: (Iterable[Tuple[bytes, ResourceHash, ResourceSize]]) -> List[ResourceName]
+        """
+        saves multiple resources, given as (data, hash, size) tuples, the names are returned in the given order
+
+        :raises UploadError:
+        """
+        return self._batched(lambda r: self.saveResource(*r), list(resources))
+
+    def deleteResources(self, resource_names):
+        # type: (Iterable[ResourceName]) -> None
+        """
+        :raises DeleteError:
+        """
+        self._batched(self.deleteResource, list(resource_names))
+
+    def _batched(self, function, items):
+        # type: (Callable[[T], R], List[T]) -> List[R]
+        """
+        calls the function for every item on a bounded thread pool. If calls fail, the exception of the first failed
+        item is raised after all calls finished
+        """
+        if self.batch_workers <= 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.batch_workers, len(items))) as executor:
+            return list(executor.map(function, items))
+
     @classmethod
     @abstractmethod
     def listResourceNames(cls):
@@ -5,6 +5,10 @@ from ..StorageInterface import StorageInterface, SizableStorageInterface
 
 
 class SynchronizedStorage(StorageInterface):
+    """
+    calls the wrapped storage from one thread at a time, for storages which are not thread safe
+    """
+    batch_workers = 1  # the calls wait for the lock anyway
 
     def __init__(self, storage, lock_type=Lock):
         # type: (StorageInterface, Type[Lock, RLock]) -> None
@@ -40,6 +44,18 @@ class SynchronizedStorage(StorageInterface):
         with self.storage_lock:
             return self._storage.deleteResource(resource_name)
 
+    def loadResources(self, resource_names):
+        with self.storage_lock:
+            return self._storage.loadResources(resource_names)
+
+    def saveResources(self, resources):
+        with self.storage_lock:
+            return self._storage.saveResources(resources)
+
+    def deleteResources(self, resource_names):
+        with self.storage_lock:
+            return self._storage.deleteResources(resource_names)
+
     def listResourceNames(self):
         with self.storage_lock:
             return self._storage.listResourceNames()
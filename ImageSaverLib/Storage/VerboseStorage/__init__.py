@@ -120,6 +120,28 @@ class VerboseStorage(StorageInterface):
             self.on_deleteResource(resource_name)
         return self._storage.deleteResource(resource_name)
 
+    def loadResources(self, resource_names):
+        resource_names = list(resource_names)
+        resources_data = self._storage.loadResources(resource_names)
+        if self.verbose:
+            for resource_name, resource_data in zip(resource_names, resources_data):
+                self.on_loadRessource(resource_name, cast(ResourceSize, len(resource_data)))
+        return resources_data
+
+    def saveResources(self, resources):
+        resources = list(resources)
+        if self.verbose:
+            for _, resource_hash, resource_size in resources:
+                self.on_saveResource(resource_hash, resource_size)
+        return self._storage.saveResources(resources)
+
+    def deleteResources(self, resource_names):
+        resource_names = list(resource_names)
+        if self.verbose:
+            for resource_name in resource_names:
+                self.on_deleteResource(resource_name)
+        return self._storage.deleteResources(resource_names)
+
     def listResourceNames(self):
         if self.verbose:
             self.on_listResourceNames()
@@ -8,6 +8,7 @@ from ..StorageInterface import AbstractSizableStorageInterface, StorageSize
 
 class VoidStorage(AbstractSizableStorageInterface, StorageBuilderInterface):
     __storage_name__ = 'void'
+    batch_workers = 1  # nothing to wait for, threads only add overhead
 
     def __init__(self, debug=False, wrap_type=None, max_resource_size=None, max_storage_size=None):
         # type: (bool, Optional[WrappingType], Optional[ResourceSize], Optional[StorageSize]) -> None
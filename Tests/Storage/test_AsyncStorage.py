@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from abc import ABC, abstractmethod
+from typing import cast, Dict, Optional
+
+from aiohttp import web
+
+from ImageSaverLib.MetaDB.Types.Resource import ResourceSize, ResourceHash
+from ImageSaverLib.Storage.AsyncFileSystemStorage import AsyncFileSystemStorage
+from ImageSaverLib.Storage.AsyncStorageAdapter import AsyncStorageAdapter
+from ImageSaverLib.Storage.AsyncStorageInterface import AsyncStorageInterface
+from ImageSaverLib.Storage.Errors import NotFoundError
+from ImageSaverLib.Storage.FileSystemStorage import FileSystemStorage2
+from ImageSaverLib.Storage.HTTPObjectStorage import HTTPObjectStorage
+
+
+class ObjectStoreStandIn(object):
+    """
+    in-memory HTTP object store on localhost, records how many requests were handled at the same time.
+    """
+
+    def __init__(self, delay=0.0):
+        # type: (float) -> None
+        self.delay = delay
+        self.objects = {}  # type: Dict[str, bytes]
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self.request_count = 0
+        self._runner = None  # type: Optional[web.AppRunner]
+        self.base_url = None  # type: Optional[str]
+
+    async def start(self):
+        app = web.Application(client_max_size=100 * 1024 * 1024)
+        app.router.add_get('/', self._list)
+        app.router.add_route('*', '/{name:.+}', self._object)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = 'http://127.0.0.1:' + str(port)
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _list(self, request):
+        return web.json_response(list(self.objects))
+
+    async def _object(self, request):
+        name = request.match_info['name']
+        self.request_count += 1
+        self.active_requests += 1
+        self.max_active_requests = max(self.max_active_requests, self.active_requests)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if request.method == 'PUT':
+                self.objects[name] = await request.read()
+                return web.Response(status=201)
+            if name not in self.objects:
+                return web.Response(status=404)
+            if request.method == 'GET':
+                return web.Response(body=self.objects[name])
+            if request.method == 'DELETE':
+                del self.objects[name]
+                return web.Response(status=204)
+            return web.Response(status=405)
+        finally:
+            self.active_requests -= 1
+
+
+class TestBasicAsyncStorage(unittest.IsolatedAsyncioTestCase, ABC):
+    test_data_size = 100000
+
+    @abstractmethod
+    async def acquireStorage(self):
+        # type: () -> AsyncStorageInterface
+        pass
+
+    async def asyncSetUp(self):
+        self.storage = await self.acquireStorage()
+
+    async def asyncTearDown(self):
+        await self.storage.close()
+
+    async def _save(self, data):
+        return await self.storage.saveResource(data, cast(ResourceHash, hashlib.sha256(data).digest()),
+                                               cast(ResourceSize, len(data)))
+
+    @abstractmethod
+    async def test_saveAndLoadResource(self):
+        test_data = os.urandom(self.test_data_size)
+        name = await self._save(test_data)
+        self.assertEqual(test_data, await self.storage.loadRessource(name))
+
+    @abstractmethod
+    async def test_sameDataGetsSeparateNames(self):
+        test_data = os.urandom(100)
+        self.assertNotEqual(await self._save(test_data), await self._save(test_data))
+
+    @abstractmethod
+    async def test_deleteResource(self):
+        names = [await self._save(os.urandom(100)) for _ in range(3)]
+        await self.storage.deleteResource(names[1])
+        self.assertEqual(sorted(names[::2]), sorted(await self.storage.listResourceNames()))
+
+    @abstractmethod
+    async def test_listResourceNames(self):
+        names = [await self._save(os.urandom(100)) for _ in range(10)]
+        self.assertEqual(sorted(names), sorted(await self.storage.listResourceNames()))
+
+    @abstractmethod
+    async def test_concurrentLoads(self):
+        test_data = [os.urandom(100) for _ in range(50)]
+        names = await asyncio.gather(*(self._save(d) for d in test_data))
+        loaded = await asyncio.gather(*(self.storage.loadRessource(n) for n in names))
+        self.assertEqual(test_data, loaded)
+
+
+class TestAsyncStorageAdapter(TestBasicAsyncStorage):
+    async def acquireStorage(self):
+        self.tmp_dir_context = tempfile.TemporaryDirectory()
+        return AsyncStorageAdapter(FileSystemStorage2(self.tmp_dir_context.name), max_workers=4)
+
+    async def asyncTearDown(self):
+        await super(TestAsyncStorageAdapter, self).asyncTearDown()
+        self.tmp_dir_context.cleanup()
+
+    async def test_saveAndLoadResource(self):
+        await super(TestAsyncStorageAdapter, self).test_saveAndLoadResource()
+
+    async def test_sameDataGetsSeparateNames(self):
+        await super(TestAsyncStorageAdapter, self).test_sameDataGetsSeparateNames()
+
+    async def test_deleteResource(self):
+        await super(TestAsyncStorageAdapter, self).test_deleteResource()
+
+    async def test_listResourceNames(self):
+        await super(TestAsyncStorageAdapter, self).test_listResourceNames()
+
+    async def test_concurrentLoads(self):
+        await super(TestAsyncStorageAdapter, self).test_concurrentLoads()
+
+
+class TestAsyncFileSystemStorage(TestBasicAsyncStorage):
+    async def acquireStorage(self):
+        self.tmp_dir_context = tempfile.TemporaryDirectory()
+        return AsyncFileSystemStorage(self.tmp_dir_context.name)
+
+    async def asyncTearDown(self):
+        await super(TestAsyncFileSystemStorage, self).asyncTearDown()
+        self.tmp_dir_context.cleanup()
+
+    async def test_saveAndLoadResource(self):
+        await super(TestAsyncFileSystemStorage, self).test_saveAndLoadResource()
+
+    async def test_sameDataGetsSeparateNames(self):
+        await super(TestAsyncFileSystemStorage, self).test_sameDataGetsSeparateNames()
+
+    async def test_deleteResource(self):
+        await super(TestAsyncFileSystemStorage, self).test_deleteResource()
+
+    async def test_listResourceNames(self):
+        await super(TestAsyncFileSystemStorage, self).test_listResourceNames()
+
+    async def test_concurrentLoads(self):
+        await super(TestAsyncFileSystemStorage, self).test_concurrentLoads()
+
+    async def test_nameOutsideDirectory(self):
+        with self.assertRaises(NotFoundError):
+            await self.storage.loadRessource('../outside.bin')
+
+
+class TestHTTPObjectStorage(TestBasicAsyncStorage):
+    async def acquireStorage(self):
+        self.server = ObjectStoreStandIn()
+        await self.server.start()
+        return HTTPObjectStorage(self.server.base_url, max_connections=200)
+
+    async def asyncTearDown(self):
+        await super(TestHTTPObjectStorage, self).asyncTearDown()
+        await self.server.stop()
+
+    async def test_saveAndLoadResource(self):
+        await super(TestHTTPObjectStorage, self).test_saveAndLoadResource()
+
+    async def test_sameDataGetsSeparateNames(self):
+        await super(TestHTTPObjectStorage, self).test_sameDataGetsSeparateNames()
+
+    async def test_deleteResource(self):
+        await super(TestHTTPObjectStorage, self).test_deleteResource()
+
+    async def test_listResourceNames(self):
+        await super(TestHTTPObjectStorage, self).test_listResourceNames()
+
+    async def test_concurrentLoads(self):
+        await super(TestHTTPObjectStorage, self).test_concurrentLoads()
+
+    async def test_manyReadsInFlightWithoutThreads(self):
+        names = [await self._save(os.urandom(100)) for _ in range(1000)]
+        self.server.delay = 0.05
+        threads_before = threading.active_count()
+        loaded = await asyncio.gather(*(self.storage.loadRessource(n) for n in names))
+        self.assertEqual([self.server.objects[n] for n in names], loaded)
+        # bounded by the connection limit, not by a thread pool
+        self.assertGreater(self.server.max_active_requests, 100)
+        self.assertLessEqual(self.server.max_active_requests, 200)
+        self.assertLessEqual(threading.active_count() - threads_before, 2)
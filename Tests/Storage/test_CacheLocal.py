@@ -46,6 +46,15 @@ class TestCacheLocal(TestBasicStorage):
     def test_wipeResources(self):
         super(TestCacheLocal, self).test_wipeResources()
 
+    def test_saveResources(self):
+        super(TestCacheLocal, self).test_saveResources()
+
+    def test_loadResources(self):
+        super(TestCacheLocal, self).test_loadResources()
+
+    def test_deleteResources(self):
+        super(TestCacheLocal, self).test_deleteResources()
+
 
 if __name__ == '__main__':
     unittest.main()
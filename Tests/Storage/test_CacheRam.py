@@ -27,6 +27,15 @@ class TestCacheRam(TestBasicStorage):
     def test_wipeResources(self):
         super(TestCacheRam, self).test_wipeResources()
 
+    def test_saveResources(self):
+        super(TestCacheRam, self).test_saveResources()
+
+    def test_loadResources(self):
+        super(TestCacheRam, self).test_loadResources()
+
+    def test_deleteResources(self):
+        super(TestCacheRam, self).test_deleteResources()
+
 
 if __name__ == '__main__':
     unittest.main()
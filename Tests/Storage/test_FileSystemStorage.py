@@ -31,6 +31,15 @@ class TestFileSystemStorage(TestBasicStorage):
     def test_wipeResources(self):
         super(TestFileSystemStorage, self).test_wipeResources()
 
+    def test_saveResources(self):
+        super(TestFileSystemStorage, self).test_saveResources()
+
+    def test_loadResources(self):
+        super(TestFileSystemStorage, self).test_loadResources()
+
+    def test_deleteResources(self):
+        super(TestFileSystemStorage, self).test_deleteResources()
+
 
 if __name__ == '__main__':
     unittest.main()
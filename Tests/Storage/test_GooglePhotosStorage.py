@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import unittest
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import cast, Dict, List, Set, Optional
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from ImageSaverLib.Encapsulation import AutoWrapper
+from ImageSaverLib.MetaDB.Types.Resource import ResourceSize
+from ImageSaverLib.Storage.GooglePhotosStorage import GooglePhotosStorage
+from ImageSaverLib.Storage.GooglePhotosStorage.api.ApiCaller import ApiCaller
+from .test_basicStorage import TestBasicStorage
+
+
+class FakePhotosLibrary(object):
+    """
+    in-memory stand-in for the Google Photos Library REST endpoints used by the GooglePhotosStorage, served on
+    localhost. Records the requests per endpoint, the number of requests handled at the same time and the number of
+    client connections.
+    """
+
+    def __init__(self, delay=0.0, page_size=3):
+        # type: (float, int) -> None
+        self.delay = delay
+        self.page_size = page_size  # overrides the requested page size, so listings need multiple pages
+        self.uploads = {}  # type: Dict[str, bytes]
+        self.media_items = {}  # type: Dict[str, dict]
+        self.media_data = {}  # type: Dict[str, bytes]
+        self.albums = {}  # type: Dict[str, dict]
+        self.album_items = {}  # type: Dict[str, List[str]]
+        self.requests = {}  # type: Dict[str, int]
+        self.batch_create_sizes = []  # type: List[int]
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self.connections = set()  # type: Set[tuple]
+        self.lock = threading.Lock()
+        self._server = None  # type: Optional[ThreadingHTTPServer]
+        self.url = None  # type: Optional[str]
+
+    def start(self):
+        library = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                library._handle(self)
+
+            def do_POST(self):
+                library._handle(self)
+
+            def do_HEAD(self):
+                library._handle(self)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.url = 'http://127.0.0.1:' + str(self._server.server_address[1])
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, handler):
+        # type: (BaseHTTPRequestHandler) -> None
+        length = int(handler.headers.get('Content-Length', 0))
+        body = handler.rfile.read(length) if length else b''
+        url = urlparse(handler.path)
+        path = url.path
+        if path.startswith('/v1/albums/') and ':' in path:
+            endpoint = handler.command + ' /v1/albums/*:' + path.split(':')[-1]
+        elif path.startswith('/v1/albums/') or path.startswith('/v1/mediaItems/') or path.startswith('/media/'):
+            endpoint = handler.command + ' ' + path.rsplit('/', 1)[0] + '/*'
+        else:
+            endpoint = handler.command + ' ' + path
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.connections.add(handler.client_address)
+            self.active_requests += 1
+            self.max_active_requests = max(self.max_active_requests, self.active_requests)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            with self.lock:
+                status, response = self._respond(endpoint, handler, url, body)
+        finally:
+            with self.lock:
+                self.active_requests -= 1
+        if isinstance(response, bytes):
+            data, content_type = response, 'application/octet-stream'
+        else:
+            data, content_type = json.dumps(response).encode(), 'application/json'
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        if handler.command != 'HEAD':
+            handler.wfile.write(data)
+
+    def _respond(self, endpoint, handler, url, body):
+        path = url.path
+        if endpoint == 'POST /v1/uploads':
+            token = uuid.uuid4().hex
+            self.uploads[token] = body
+            return 200, token.encode()
+        if endpoint == 'POST /v1/mediaItems:batchCreate':
+            request = json.loads(body)
+            self.batch_create_sizes.append(len(request['newMediaItems']))
+            results = []
+            for new_media_item in request['newMediaItems']:
+                token = new_media_item['simpleMediaItem']['uploadToken']
+                media_item = self._makeMediaItem(self.uploads.pop(token), new_media_item['description'])
+                self.album_items[request['albumId']].append(media_item['id'])
+                results.append({'uploadToken': token, 'status': {'message': 'Success'}, 'mediaItem': media_item})
+            return 200, {'newMediaItemResults': results}
+        if endpoint == 'GET /v1/mediaItems:batchGet':
+            results = []
+            for media_item_id in parse_qs(url.query)['mediaItemIds']:
+                if media_item_id in self.media_items:
+                    results.append({'mediaItem': self.media_items[media_item_id]})
+                else:
+                    results.append({'status': {'code': 5, 'message': 'NOT_FOUND'}})
+            return 200, {'mediaItemResults': results}
+        if endpoint == 'GET /v1/mediaItems/*':
+            media_item_id = path.split('/')[-1]
+            if media_item_id not in self.media_items:
+                return 404, {}
+            return 200, self.media_items[media_item_id]
+        if endpoint == 'POST /v1/mediaItems:search':
+            request = json.loads(body)
+            return 200, self._page(self.album_items[request['albumId']], request.get('pageToken'),
+                                   'mediaItems', self.media_items)
+        if endpoint == 'GET /v1/albums':
+            page_token = parse_qs(url.query).get('pageToken', [None])[0]
+            albums = {album_id: self._albumJson(album_id) for album_id in self.albums}
+            return 200, self._page(list(albums), page_token, 'albums', albums)
+        if endpoint == 'POST /v1/albums':
+            album_id = uuid.uuid4().hex
+            self.albums[album_id] = {'id': album_id, 'title': json.loads(body)['album']['title'],
+                                     'productUrl': self.url + '/albums/' + album_id}
+            self.album_items[album_id] = []
+            return 200, self.albums[album_id]
+        if endpoint == 'GET /v1/albums/*':
+            album_id = path.split('/')[-1]
+            if album_id not in self.albums:
+                return 404, {}
+            return 200, self._albumJson(album_id)
+        if endpoint in ('POST /v1/albums/*:batchAddMediaItems', 'POST /v1/albums/*:batchRemoveMediaItems'):
+            album_items = self.album_items[path.split('/')[-1].split(':')[0]]
+            for media_item_id in json.loads(body)['mediaItemIds']:
+                if endpoint.endswith('batchAddMediaItems'):
+                    if media_item_id not in album_items:
+                        album_items.append(media_item_id)
+                else:
+                    album_items.remove(media_item_id)
+            return 200, {}
+        if endpoint in ('GET /media/*', 'HEAD /media/*'):
+            return 200, self.media_data[path.split('/')[-1][:-len('=d')]]
+        return 404, {}
+
+    def _albumJson(self, album_id):
+        album = dict(self.albums[album_id])
+        # like the api, the count and cover are left out for empty albums
+        if self.album_items[album_id]:
+            album['mediaItemsCount'] = str(len(self.album_items[album_id]))
+            album['coverPhotoBaseUrl'] = self.media_items[self.album_items[album_id][0]]['baseUrl']
+        return album
+
+    def _page(self, ids, page_token, key, objects):
+        start = int(page_token or 0)
+        response = {key: [objects[i] for i in ids[start:start + self.page_size]]}
+        if start + self.page_size < len(ids):
+            response['nextPageToken'] = str(start + self.page_size)
+        return response
+
+    def _makeMediaItem(self, data, file_name):
+        media_item_id = uuid.uuid4().hex
+        self.media_data[media_item_id] = data
+        self.media_items[media_item_id] = {'id': media_item_id, 'description': file_name,
+                                           'productUrl': self.url + '/photos/' + media_item_id,
+                                           'baseUrl': self.url + '/media/' + media_item_id,
+                                           'mimeType': 'image/png', 'filename': file_name,
+                                           'mediaMetadata': {'creationTime': '2020-01-01T00:00:00.000000000Z',
+                                                             'width': '1', 'height': '1'}}
+        return self.media_items[media_item_id]
+
+
+def makeGooglePhotosStorage(library, max_connections=8):
+    # type: (FakePhotosLibrary, int) -> GooglePhotosStorage
+    storage = GooglePhotosStorage('unused', 'unused', max_resource_size=ResourceSize(20000),
+                                  max_connections=max_connections)
+    storage._api = ApiCaller(requests.Session(), max_connections, api_url=library.url + '/v1')
+    return storage
+
+
+class TestGooglePhotosStorage(TestBasicStorage):
+
+    def acquireStorage(self):
+        self.library = FakePhotosLibrary()
+        self.library.start()
+        return makeGooglePhotosStorage(self.library)
+
+    def releaseStorage(self):
+        self.library.stop()
+
+    def test_saveResource(self):
+        super(TestGooglePhotosStorage, self).test_saveResource()
+
+    def test_loadResource(self):
+        super(TestGooglePhotosStorage, self).test_loadResource()
+
+    def test_listResourceNames(self):
+        super(TestGooglePhotosStorage, self).test_listResourceNames()
+
+    def test_deleteResource(self):
+        super(TestGooglePhotosStorage, self).test_deleteResource()
+
+    def test_wipeResources(self):
+        super(TestGooglePhotosStorage, self).test_wipeResources()
+
+    def test_saveResources(self):
+        super(TestGooglePhotosStorage, self).test_saveResources()
+
+    def test_loadResources(self):
+        super(TestGooglePhotosStorage, self).test_loadResources()
+
+    def test_deleteResources(self):
+        super(TestGooglePhotosStorage, self).test_deleteResources()
+
+
+class TestGooglePhotosStorageConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.library = FakePhotosLibrary(delay=0.02)
+        self.library.start()
+        self.storage = makeGooglePhotosStorage(self.library)
+        self.auto_wrapper = AutoWrapper()
+
+    def tearDown(self):
+        self.library.stop()
+
+    def makeResource(self):
+        data = self.auto_wrapper.wrap(os.urandom(1000), self.storage.getRequiredWrapType())
+        return data, hashlib.sha256(data).digest(), cast(ResourceSize, len(data))
+
+    def test_saveResourcesCommitsInGroupsOf50(self):
+        resources = [self.makeResource() for _ in range(120)]
+        keys = self.storage.saveResources(resources)
+        self.assertEqual([50, 50, 20], self.library.batch_create_sizes)
+        self.assertGreater(self.library.max_active_requests, 1)
+        self.assertEqual([r[0] for r in resources], self.storage.loadResources(keys))
+
+    def test_concurrentSaveResourceSharesBatchCreate(self):
+        resources = [self.makeResource() for _ in range(64)]
+        keys = [None] * len(resources)
+
+        def save(offset):
+            for index in range(offset, len(resources), 8):
+                keys[index] = self.storage.saveResource(*resources[index])
+
+        threads = [threading.Thread(target=save, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(resources), sum(self.library.batch_create_sizes))
+        self.assertLess(len(self.library.batch_create_sizes), len(resources))
+        self.assertEqual([r[0] for r in resources], self.storage.loadResources(keys))
+
+    def test_concurrentSavesShareAlbums(self):
+        resources = [self.makeResource() for _ in range(16)]
+        threads = [threading.Thread(target=self.storage.saveResource, args=resource) for resource in resources]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(self.library.albums))
+        self.assertEqual(16, len(self.storage.listResourceNames()))
+        keys = self.storage.listResourceNames()
+        threads = [threading.Thread(target=self.storage.deleteResource, args=(key,)) for key in keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['isl_album_0', 'isl_trash'], sorted(a['title'] for a in self.library.albums.values()))
+
+    def test_parallelListingAndDownloads(self):
+        self.storage.max_album_size = 10
+        keys = self.storage.saveResources([self.makeResource() for _ in range(40)])
+        self.assertEqual(4, len(self.library.albums))
+        self.library.max_active_requests = 0
+        self.assertSetEqual(set(keys), set(self.storage.listResourceNames()))
+        self.assertGreater(self.library.max_active_requests, 1)
+        self.library.max_active_requests = 0
+        self.storage.loadResources(keys)
+        self.assertGreater(self.library.max_active_requests, 1)
+
+    def test_connectionsAreReused(self):
+        self.storage.saveResources([self.makeResource() for _ in range(40)])
+        self.assertGreater(sum(self.library.requests.values()), 40)
+        self.assertLessEqual(len(self.library.connections), self.storage.max_connections)
+
+
+if __name__ == '__main__':
+    unittest.main()
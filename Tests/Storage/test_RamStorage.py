@@ -27,6 +27,15 @@ class TestRamStorage(TestBasicStorage):
     def test_wipeResources(self):
         super(TestRamStorage, self).test_wipeResources()
 
+    def test_saveResources(self):
+        super(TestRamStorage, self).test_saveResources()
+
+    def test_loadResources(self):
+        super(TestRamStorage, self).test_loadResources()
+
+    def test_deleteResources(self):
+        super(TestRamStorage, self).test_deleteResources()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,307 @@
+import hashlib
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import cast, Optional
+
+from ImageSaverLib.Encapsulation import makeWrappingType, makeCompressingType
+from ImageSaverLib.Encapsulation.Compressors.Types import PassThroughCompressor
+from ImageSaverLib.Encapsulation.Wrappers.Types import PassThroughWrapper
+from ImageSaverLib.ImageSaverLib import ImageSaver
+from ImageSaverLib.MetaDB.Types.Resource import ResourceSize, ResourceHash
+from ImageSaverLib.MetaDB.db_inits import sqliteRAM
+from ImageSaverLib.Storage.Errors import (ThrottledError, NotFoundError, UploadError, DownloadError,
+                                          ThrottledUploadError, ThrottledDownloadError)
+from ImageSaverLib.Storage.RamStorage import RamStorage
+from ImageSaverLib.Storage.RateLimitedStorage import RateLimitedStorage, AIMDLimiter, TokenBucket
+from .test_basicStorage import TestBasicStorage
+
+
+class ThrottlingRamStorage(RamStorage):
+    """
+    RamStorage, which throttles like a remote service. Requests beyond max_in_flight concurrent requests, or beyond
+    rate requests per second, fail at once with a ThrottledError. Every accepted request takes latency seconds plus
+    latency_per_request seconds for each other request in flight.
+    """
+
+    def __init__(self, max_in_flight=None, rate=None, retry_after=None, latency=0.0, latency_per_request=0.0,
+                 throttle_first=0):
+        # type: (Optional[int], Optional[float], Optional[float], float, float, int) -> None
+        super().__init__()
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.retry_after = retry_after
+        self.latency = latency
+        self.latency_per_request = latency_per_request
+        self.throttle_first = throttle_first
+        self.in_flight = 0
+        self.max_accepted_in_flight = 0
+        self.accepted = 0
+        self.throttled = 0
+        self.request_times = []
+        self._lock = threading.Lock()
+
+    def _request(self, function, *args):
+        with self._lock:
+            now = time.monotonic()
+            throttle = self.throttle_first > 0
+            self.throttle_first -= 1
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                throttle = True
+            if self.rate is not None and len([t for t in self.request_times if t > now - 1.0]) >= self.rate:
+                throttle = True
+            if throttle:
+                # rejected right away, like a 429 response, the request does not use the capacity of the service
+                self.throttled += 1
+                raise ThrottledError("throttled", retry_after=self.retry_after)
+            self.in_flight += 1
+            self.accepted += 1
+            self.request_times.append(now)
+            self.max_accepted_in_flight = max(self.max_accepted_in_flight, self.in_flight)
+            latency = self.latency + self.latency_per_request * (self.in_flight - 1)
+        try:
+            time.sleep(latency)
+            return function(*args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def loadRessource(self, resource_name):
+        return self._request(super().loadRessource, resource_name)
+
+    def saveResource(self, resource_data, resource_hash, resource_size):
+        return self._request(super().saveResource, resource_data, resource_hash, resource_size)
+
+    def deleteResource(self, resource_name):
+        return self._request(super().deleteResource, resource_name)
+
+
+def makeResource(size=100):
+    data = os.urandom(size)
+    return data, cast(ResourceHash, hashlib.sha256(data).digest()), cast(ResourceSize, len(data))
+
+
+def saveConcurrently(storage, count, threads=16):
+    # like the upload workers, every thread saves single resources
+    with ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(lambda resource: storage.saveResource(*resource),
+                                 [makeResource() for _ in range(count)]))
+
+
+class TestRateLimitedStorage(TestBasicStorage):
+    test_data_size = 1000
+
+    def acquireStorage(self):
+        return RateLimitedStorage(RamStorage(), max_concurrency=4)
+
+    def releaseStorage(self):
+        pass
+
+    def test_saveResource(self):
+        super(TestRateLimitedStorage, self).test_saveResource()
+
+    def test_loadResource(self):
+        super(TestRateLimitedStorage, self).test_loadResource()
+
+    def test_listResourceNames(self):
+        super(TestRateLimitedStorage, self).test_listResourceNames()
+
+    def test_deleteResource(self):
+        super(TestRateLimitedStorage, self).test_deleteResource()
+
+    def test_wipeResources(self):
+        super(TestRateLimitedStorage, self).test_wipeResources()
+
+    def test_saveResources(self):
+        super(TestRateLimitedStorage, self).test_saveResources()
+
+    def test_loadResources(self):
+        super(TestRateLimitedStorage, self).test_loadResources()
+
+    def test_deleteResources(self):
+        super(TestRateLimitedStorage, self).test_deleteResources()
+
+
+class TestAdaptiveRateLimit(unittest.TestCase):
+    def test_throttledRequestsAreRetried(self):
+        backend = ThrottlingRamStorage(throttle_first=3)
+        storage = RateLimitedStorage(backend, base_backoff=0.01)
+        data, resource_hash, resource_size = makeResource()
+        name = storage.saveResource(data, resource_hash, resource_size)
+        self.assertEqual(data, backend.loadRessource(name))
+        self.assertEqual(3, storage.throttled_count)
+        self.assertEqual(3, storage.retry_count)
+
+    def test_givesUpAfterMaxRetries(self):
+        backend = ThrottlingRamStorage(throttle_first=100)
+        storage = RateLimitedStorage(backend, max_retries=2, base_backoff=0.01)
+        self.assertRaises(ThrottledError, storage.saveResource, *makeResource())
+        self.assertEqual(3, backend.throttled)
+
+    def test_otherErrorsAreNotRetried(self):
+        backend = ThrottlingRamStorage()
+        storage = RateLimitedStorage(backend, base_backoff=0.01, retry_transfer_errors=True)
+        self.assertRaises(NotFoundError, storage.loadRessource, 'missing')
+        self.assertEqual(0, storage.retry_count)
+
+        class FailingRamStorage(RamStorage):
+            def __init__(self):
+                super().__init__()
+                self.calls = 0
+
+            def saveResource(self, resource_data, resource_hash, resource_size):
+                self.calls += 1
+                raise UploadError()
+
+        failing = FailingRamStorage()
+        self.assertRaises(UploadError, RateLimitedStorage(failing, base_backoff=0.01).saveResource, *makeResource())
+        self.assertEqual(1, failing.calls)
+        self.assertRaises(UploadError, RateLimitedStorage(failing, max_retries=2, base_backoff=0.01,
+                                                          retry_transfer_errors=True).saveResource, *makeResource())
+        self.assertEqual(4, failing.calls)
+
+    def test_retryAfterPausesAllRequests(self):
+        backend = ThrottlingRamStorage(throttle_first=1, retry_after=0.3)
+        storage = RateLimitedStorage(backend, base_backoff=0.01)
+        started = time.monotonic()
+        storage.saveResource(*makeResource())
+        storage.saveResource(*makeResource())
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    def test_requestsArePaced(self):
+        storage = RateLimitedStorage(ThrottlingRamStorage(), requests_per_second=50, burst=1, max_concurrency=4)
+        started = time.monotonic()
+        storage.saveResources([makeResource() for _ in range(26)])
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+
+    def test_concurrencySettlesAtServiceLimit(self):
+        backend = ThrottlingRamStorage(max_in_flight=4, latency=0.005)
+        storage = RateLimitedStorage(backend, max_concurrency=16, base_backoff=0.01)
+        names = saveConcurrently(storage, 600)
+        self.assertEqual(600, len(set(names)))
+        # the limit oscillates around the capacity of the service, additive increase, halving on throttling
+        self.assertGreaterEqual(storage.limiter.limit, 2)
+        self.assertLessEqual(storage.limiter.limit, 8)
+        self.assertEqual(4, backend.max_accepted_in_flight)
+        self.assertLess(backend.throttled, 600 * 0.15)
+
+    def test_risingLatencyDecreasesConcurrency(self):
+        # the service queues requests instead of throttling, the latency grows with every request in flight
+        backend = ThrottlingRamStorage(latency=0.005, latency_per_request=0.005)
+        storage = RateLimitedStorage(backend, max_concurrency=16, latency_tolerance=2.0)
+        saveConcurrently(storage, 300)
+        self.assertEqual(0, backend.throttled)
+        self.assertLess(storage.limiter.limit, 5)
+
+    def test_batchesAreForwarded(self):
+        class BatchCountingStorage(ThrottlingRamStorage):
+            def __init__(self, **kwargs):
+                super().__init__(**kwargs)
+                self.batch_calls = 0
+
+            def saveResources(self, resources):
+                self.batch_calls += 1
+                return super().saveResources(resources)
+
+            def loadResources(self, resource_names):
+                self.batch_calls += 1
+                return super().loadResources(resource_names)
+
+            def deleteResources(self, resource_names):
+                self.batch_calls += 1
+                return super().deleteResources(resource_names)
+
+        backend = BatchCountingStorage(throttle_first=1)
+        storage = RateLimitedStorage(backend, base_backoff=0.01)
+        resources = [makeResource() for _ in range(5)]
+        names = storage.saveResources(resources)
+        # the throttled batch is sent again as a whole
+        self.assertEqual(2, backend.batch_calls)
+        self.assertEqual(1, storage.retry_count)
+        self.assertEqual([r[0] for r in resources], storage.loadResources(names))
+        storage.deleteResources(names)
+        self.assertEqual(4, backend.batch_calls)
+        self.assertEqual([], backend.listResourceNames())
+
+    def test_throttledErrorsKeepTheTransferContract(self):
+        self.assertTrue(issubclass(ThrottledUploadError, UploadError))
+        self.assertTrue(issubclass(ThrottledDownloadError, DownloadError))
+        storage = RateLimitedStorage(ThrottlingRamStorage(throttle_first=100), max_retries=0)
+
+        class ThrottledUploadStorage(RamStorage):
+            def saveResource(self, resource_data, resource_hash, resource_size):
+                raise ThrottledUploadError("throttled")
+
+        self.assertRaises(UploadError, RateLimitedStorage(ThrottledUploadStorage(), max_retries=0).saveResource,
+                          *makeResource())
+        self.assertRaises(ThrottledError, storage.saveResource, *makeResource())
+
+    def test_ingestThroughThrottlingService(self):
+        backend = ThrottlingRamStorage(max_in_flight=2, latency=0.02, throttle_first=3)
+        storage = RateLimitedStorage(backend, max_concurrency=8, base_backoff=0.01)
+        service = ImageSaver(sqliteRAM(), storage, 1000, 2000, upload_workers=4)
+        service.wrap_type = makeWrappingType(PassThroughWrapper)
+        service.compress_type = makeCompressingType(PassThroughCompressor)
+        data = {str(i): os.urandom(20000) for i in range(5)}
+        with service:
+            for name, compound_data in data.items():
+                service.saveBytes(compound_data, name)
+        self.assertGreaterEqual(storage.retry_count, 3)
+        self.assertEqual(service.getTotalResourceCount(), len(backend.listResourceNames()))
+        for name, compound_data in data.items():
+            self.assertEqual(compound_data, service.loadCompoundBytes(name))
+
+
+class TestAIMDLimiter(unittest.TestCase):
+    def test_additiveIncrease(self):
+        limiter = AIMDLimiter(max_limit=8)
+        for _ in range(1 + 2 + 3):
+            limiter.release(limiter.acquire())
+        self.assertEqual(4, int(limiter.limit))
+
+    def test_oneDecreasePerWindow(self):
+        limiter = AIMDLimiter(initial_limit=8, max_limit=8)
+        starts = [limiter.acquire() for _ in range(8)]
+        time.sleep(0.001)
+        for started in starts:
+            limiter.release(started, throttled=True, succeeded=False)
+        # all requests were in flight, when the throttling started, they decrease the limit only once
+        self.assertEqual(4, limiter.limit)
+        limiter.release(limiter.acquire(), throttled=True, succeeded=False)
+        self.assertEqual(2, limiter.limit)
+
+    def test_limitsRequestsInFlight(self):
+        limiter = AIMDLimiter(initial_limit=2, max_limit=2)
+        limiter.acquire()
+        limiter.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        limiter.release(time.monotonic())
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burstPassesWithoutWaiting(self):
+        bucket = TokenBucket(rate=10, capacity=5)
+        started = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.05)
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_pause(self):
+        bucket = TokenBucket()
+        bucket.pause(0.1)
+        started = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
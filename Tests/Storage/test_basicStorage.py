@@ -136,6 +136,66 @@ class TestBasicStorage(unittest.TestCase, ABC):
             storage.wipeResources()
             self.assertEqual(0, len(list(storage.listResourceNames())))
 
+    @abstractmethod
+    def test_saveResources(self):
+        self._test_saveResources()
+
+    def _test_saveResources(self):
+        auto_wrapper = AutoWrapper()
+        with self.withStorage() as storage:  # type: StorageInterface
+            resources = []
+            for i in range(self.test_upload_count):
+                test_data_wrapped = auto_wrapper.wrap(os.urandom(1000), storage.getRequiredWrapType())
+                resources.append((test_data_wrapped, hashlib.sha256(test_data_wrapped).digest(),
+                                  cast(ResourceSize, len(test_data_wrapped))))
+            keys = storage.saveResources(resources)
+            self.assertEqual(self.test_upload_count, len(set(keys)))
+            self.assertSetEqual(set(keys), set(storage.listResourceNames()))
+
+    @abstractmethod
+    def test_loadResources(self):
+        self._test_loadResources()
+
+    def _test_loadResources(self):
+        auto_wrapper = AutoWrapper()
+        with self.withStorage() as storage:  # type: StorageInterface
+            test_datas = []
+            keys = []
+            for i in range(self.test_upload_count):
+                test_data = os.urandom(1000)
+                test_data_wrapped = auto_wrapper.wrap(test_data, storage.getRequiredWrapType())
+                resource_size = cast(ResourceSize, len(test_data_wrapped))
+                resource_hash = cast(ResourceHash, hashlib.sha256(test_data_wrapped).digest())
+                key = storage.saveResource(test_data_wrapped, resource_hash, resource_size)
+                self.getMeta().makeResource(key, resource_size, cast(ResourcePayloadSize, len(test_data)),
+                                            resource_hash, storage.getRequiredWrapType(),
+                                            cast(ResourceCompressionType, ''))
+                test_datas.append(test_data)
+                keys.append(key)
+            # reversed and with a duplicate, the data has to be returned in the order of the requested names
+            keys = list(reversed(keys)) + [keys[0]]
+            test_datas = list(reversed(test_datas)) + [test_datas[0]]
+            retrieved = storage.loadResources(keys)
+            self.assertEqual(test_datas, [auto_wrapper.unwrap(d, storage.getRequiredWrapType()) for d in retrieved])
+
+    @abstractmethod
+    def test_deleteResources(self):
+        self._test_deleteResources()
+
+    def _test_deleteResources(self):
+        auto_wrapper = AutoWrapper()
+        saved_keys = []
+        with self.withStorage() as storage:  # type: StorageInterface
+            for i in range(self.test_upload_count):
+                test_data_wrapped = auto_wrapper.wrap(os.urandom(1000), storage.getRequiredWrapType())
+                key = storage.saveResource(test_data_wrapped, hashlib.sha256(test_data_wrapped).digest(),
+                                           cast(ResourceSize, len(test_data_wrapped)))
+                saved_keys.append(key)
+            storage.deleteResources(saved_keys[::2])
+            self.assertSetEqual(set(saved_keys[1::2]), set(storage.listResourceNames()))
+            storage.deleteResources(saved_keys[1::2])
+            self.assertEqual(0, len(list(storage.listResourceNames())))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+"""
+Benchmark for WritableCompound.write with different write sizes.
+
+The cost per written byte should stay flat from small to huge writes, buffering must not copy the whole buffer on
+every write call.
+
+usage: python -m Tests.benchmark_writableCompound [total size, default 64 MiB]
+"""
+import os
+import sys
+import time
+
+import humanfriendly
+
+from ImageSaverLib.Encapsulation.Compressors.Types import PassThroughCompressor
+from ImageSaverLib.Encapsulation.Wrappers.Types import PassThroughWrapper
+from ImageSaverLib.ImageSaverLib import ImageSaver
+from ImageSaverLib.MetaDB.db_inits import sqliteRAM
+from ImageSaverLib.Storage.VoidStorage import VoidStorage
+
+KiB = 1024
+MiB = 1024 * KiB
+WRITE_SIZES = [4 * KiB, 16 * KiB, 64 * KiB, 256 * KiB, 1 * MiB, 4 * MiB, 16 * MiB, 64 * MiB]
+FRAGMENT_SIZE = 1 * MiB
+RESOURCE_SIZE = 16 * MiB
+
+
+def makeSaveService():
+    # type: () -> ImageSaver
+    service = ImageSaver(sqliteRAM(), VoidStorage(max_resource_size=RESOURCE_SIZE), FRAGMENT_SIZE, RESOURCE_SIZE)
+    service.setDefaultCompoundWrapper(PassThroughWrapper)
+    service.setDefaultCompoundCompressor(PassThroughCompressor)
+    return service
+
+
+def benchmarkWriteSize(write_size, total_size):
+    # type: (int, int) -> float
+    """
+    writes total_size bytes in write_size chunks, returns the needed seconds per MiB
+    """
+    service = makeSaveService()
+    chunk = os.urandom(min(write_size, total_size))
+    writes = max(total_size // write_size, 1)
+    with service:
+        start = time.perf_counter()
+        with service.openWritableCompound('benchmark_' + str(write_size)) as w_c:
+            for _ in range(writes):
+                w_c.write(chunk)
+        duration = time.perf_counter() - start
+    return duration / (writes * len(chunk) / MiB)
+
+
+def main(total_size=64 * MiB):
+    # type: (int) -> None
+    print('write size'.rjust(12), 'seconds/MiB'.rjust(12))
+    for write_size in WRITE_SIZES:
+        seconds_per_mib = benchmarkWriteSize(write_size, total_size)
+        print(humanfriendly.format_size(write_size, binary=True).rjust(12), ('%.6f' % seconds_per_mib).rjust(12))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(humanfriendly.parse_size(sys.argv[1], binary=True))
+    else:
+        main()
@@ -0,0 +1,29 @@
+import hashlib
+from unittest import TestCase
+
+from ImageSaverLib.Helpers.BloomFilter import BloomFilter
+
+
+class TestBloomFilter(TestCase):
+    def test_noFalseNegatives(self):
+        bloom_filter = BloomFilter(1000)
+        keys = [hashlib.sha256(str(i).encode()).digest() for i in range(1000)]
+        bloom_filter.update(keys)
+        self.assertEqual(1000, len(bloom_filter))
+        self.assertFalse(bloom_filter.isFull)
+        for key in keys:
+            self.assertIn(key, bloom_filter)
+
+    def test_falsePositiveRate(self):
+        bloom_filter = BloomFilter(1000, error_rate=0.01)
+        bloom_filter.update(hashlib.sha256(str(i).encode()).digest() for i in range(1000))
+        false_positives = sum(1 for i in range(1000, 11000)
+                              if hashlib.sha256(str(i).encode()).digest() in bloom_filter)
+        self.assertLess(false_positives, 300)
+
+    def test_isFull(self):
+        bloom_filter = BloomFilter(2)
+        bloom_filter.update([b'a', b'b'])
+        self.assertFalse(bloom_filter.isFull)
+        bloom_filter.add(b'c')
+        self.assertTrue(bloom_filter.isFull)
@@ -0,0 +1,39 @@
+import os
+from unittest import TestCase
+
+from ImageSaverLib.Helpers.ByteBuffer import ByteBuffer
+
+
+class TestByteBuffer(TestCase):
+    def test_appendConsume(self):
+        buffer = ByteBuffer()
+        data = os.urandom(10000)
+        for index in range(0, len(data), 300):
+            buffer.append(data[index:index + 300])
+        self.assertEqual(len(data), len(buffer))
+        consumed = []
+        while len(buffer):
+            consumed.append(buffer.consume(1024))
+            buffer.compact()
+        self.assertEqual(data, b''.join(consumed))
+
+    def test_viewDoesNotConsume(self):
+        buffer = ByteBuffer()
+        buffer.append(b'hello ')
+        buffer.append(bytearray(b'world'))
+        self.assertEqual(b'hello', buffer.consume(5))
+        with buffer.view() as view:
+            self.assertEqual(b' world', bytes(view))
+        buffer.append(b'!')
+        self.assertEqual(b' world!', buffer.consume(100))
+        self.assertEqual(0, len(buffer))
+
+    def test_appendedBytesAreNotModified(self):
+        buffer = ByteBuffer()
+        data = b'abcdef'
+        buffer.append(data)
+        buffer.consume(2)
+        buffer.append(b'gh')
+        buffer.compact()
+        self.assertEqual(b'abcdef', data)
+        self.assertEqual(b'cdefgh', buffer.consume(6))
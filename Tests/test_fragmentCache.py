@@ -1,17 +1,24 @@
 import hashlib
 import os
+import tempfile
+import time
+from threading import Event, Lock
+from typing import Optional
 from unittest import TestCase
 
-from ImageSaverLib.FragmentCache import FragmentCache
-from ImageSaverLib.MetaDB.Types.Fragment import FragmentSize, FragmentPayloadSize
+from ImageSaverLib.FragmentCache import FragmentCache, FlushError
+from ImageSaverLib.ImageSaverLib import ImageSaver
+from ImageSaverLib.MetaDB.Types.Fragment import FragmentSize, FragmentPayloadSize, FragmentHash
 from ImageSaverLib.MetaDB.Types.Resource import ResourceSize
 from ImageSaverLib.MetaDB.db_inits import sqliteRAM, sqliteFile
 from ImageSaverLib.PendingObjectsController import PendingObjectsController
 from ImageSaverLib.Storage.RamStorage import RamStorage
+from ImageSaverLib.Storage.Cache.LocalCache import LocalCache
 from ImageSaverLib.Storage.Cache.RamCache import RamStorageCache
 from ImageSaverLib.Encapsulation import makeWrappingType, makeCompressingType
 from ImageSaverLib.Encapsulation.Wrappers.Types import *
 from ImageSaverLib.Encapsulation.Compressors.Types import *
+from ImageSaverLib.Storage.Errors import UploadError
 from ImageSaverLib.Storage.VoidStorage import VoidStorage
 
 
@@ -66,3 +73,179 @@ class TestFragmentCache(TestCase):
 
     def test__flush_resource_appending(self):
         self.fail()
+
+
+class TestFragmentCacheUploadWorkers(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self, storage=None, upload_workers=3):
+        # type: (Optional[RamStorage], int) -> ImageSaver
+        meta = sqliteRAM()
+        if storage is None:
+            storage = RamStorage()
+        service = ImageSaver(meta, storage, 100, 1000, upload_workers=upload_workers)
+        service.setDefaultCompoundWrapper(PassThroughWrapper)
+        service.setDefaultCompoundCompressor(PassThroughCompressor)
+        return service
+
+    def test_saveLoad(self):
+        service = self.makeSaveService()
+        data = {str(index): os.urandom(1 + index * 37) for index in range(40)}
+        with service:
+            for name, payload in data.items():
+                service.saveBytes(payload, name)
+        self.assertEqual(0, len(service.fragment_cache._in_flight))
+        self.assertEqual(0, len(service.pending_objects.getPendingFragments()))
+        self.assertEqual(0, len(service.fragment_cache._upload_threads))
+        for name, payload in data.items():
+            self.assertEqual(payload, service.loadCompoundBytes(name))
+
+    def test_loadInFlightFragment(self):
+        upload_started = Event()
+        release_upload = Event()
+
+        class BlockingStorage(RamStorage):
+            def saveResource(self, resource_data, resource_hash, resource_size):
+                upload_started.set()
+                release_upload.wait(10)
+                return super().saveResource(resource_data, resource_hash, resource_size)
+
+        service = self.makeSaveService(BlockingStorage(), upload_workers=1)
+        payload = os.urandom(900)
+        try:
+            with service:
+                service.saveBytes(payload, 'blocked')
+                service.fragment_cache._flush_percentage_filled(empty=True)
+                self.assertTrue(upload_started.wait(10))
+                self.assertTrue(len(service.fragment_cache._in_flight) > 0)
+                fragment = next(iter(service.fragment_cache._in_flight.values()))[1]
+                self.assertEqual(fragment.fragment_size, len(service.fragment_cache.loadFragment(fragment)))
+                release_upload.set()
+        finally:
+            release_upload.set()
+        self.assertEqual(payload, service.loadCompoundBytes('blocked'))
+
+    def test_uploadsOverlapThroughCaches(self):
+        class SlowStorage(RamStorage):
+            def __init__(self):
+                super().__init__()
+                self.lock = Lock()
+                self.in_flight = 0
+                self.max_in_flight = 0
+
+            def saveResource(self, resource_data, resource_hash, resource_size):
+                with self.lock:
+                    self.in_flight += 1
+                    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                try:
+                    time.sleep(0.02)
+                    return super().saveResource(resource_data, resource_hash, resource_size)
+                finally:
+                    with self.lock:
+                        self.in_flight -= 1
+
+        meta = sqliteRAM()
+        remote = SlowStorage()
+        uploads = []
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # the storage stack of the cli
+            local_cache = LocalCache(meta, remote, cache_dir=cache_dir, ram_cache_meta=True)
+            service = ImageSaver(meta, RamStorageCache(local_cache), 100, 1000, upload_workers=4)
+            service.setDefaultCompoundWrapper(PassThroughWrapper)
+            service.setDefaultCompoundCompressor(PassThroughCompressor)
+            service.fragment_cache.onUpload = lambda resource_size, fragments_count: uploads.append(resource_size)
+            data = {str(index): os.urandom(2000) for index in range(10)}
+            with service:
+                for name, payload in data.items():
+                    service.saveBytes(payload, name)
+            self.assertGreater(remote.max_in_flight, 1)
+            self.assertEqual(len(remote.listResourceNames()), len(uploads))
+            for name, payload in data.items():
+                self.assertEqual(payload, service.loadCompoundBytes(name))
+
+    def test_uploadError(self):
+        class FailingStorage(RamStorage):
+            def saveResource(self, resource_data, resource_hash, resource_size):
+                raise UploadError('upload rejected')
+
+        service = self.makeSaveService(FailingStorage())
+        with self.assertRaises(FlushError) as context:
+            with service.fragment_cache:
+                service.fragment_cache.addFragmentData(b'x' * 100, FragmentHash(hashlib.sha256(b'x').digest()),
+                                                       FragmentPayloadSize(100))
+        self.assertIsInstance(context.exception.orig_error, UploadError)
+        self.assertEqual(1, len(service.fragment_cache.fragment_cache))
+        self.assertEqual(0, len(service.fragment_cache._in_flight))
+
+
+class TestFragmentCacheMetaBatching(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self, **meta_batching):
+        # type: (**object) -> ImageSaver
+        service = ImageSaver(sqliteRAM(), RamStorage(), 100, 1000, **meta_batching)
+        service.setDefaultCompoundWrapper(PassThroughWrapper)
+        service.setDefaultCompoundCompressor(PassThroughCompressor)
+        return service
+
+    # noinspection PyMethodMayBeStatic
+    def recordCommits(self, service):
+        # type: (ImageSaver) -> list
+        commits = []
+        add_compounds = service.meta.addOverwriteCompoundsAndMapFragments
+
+        def recording_add_compounds(compounds_fragment_payload_index):
+            compounds_fragment_payload_index = list(compounds_fragment_payload_index)
+            commits.append([c.compound_name for c, _ in compounds_fragment_payload_index])
+            add_compounds(compounds_fragment_payload_index)
+
+        service.meta.addOverwriteCompoundsAndMapFragments = recording_add_compounds
+        return commits
+
+    def test_batchedCompoundsReadableBeforeCommit(self):
+        service = self.makeSaveService(meta_batch_count=1000)
+        commits = self.recordCommits(service)
+        data = {str(index): os.urandom(1 + index * 37) for index in range(40)}
+        with service:
+            for name, payload in data.items():
+                service.saveBytes(payload, name)
+            self.assertEqual([], commits)
+            self.assertFalse(service.meta.hasCompoundWithName('0'))
+            for name, payload in data.items():
+                self.assertTrue(service.hasCompoundWithName(name))
+                self.assertEqual(payload, service.loadCompoundBytes(name))
+        self.assertEqual([sorted(data)], [sorted(names) for names in commits])
+        for name, payload in data.items():
+            self.assertEqual(payload, service.loadCompoundBytes(name))
+
+    def test_batchCount(self):
+        service = self.makeSaveService(meta_batch_count=5)
+        commits = self.recordCommits(service)
+        names = [str(index) for index in range(30)]
+        with service:
+            for name in names:
+                service.saveBytes(os.urandom(150), name)
+        self.assertGreater(len(commits), 1)
+        self.assertTrue(all(len(batch) >= 5 for batch in commits[:-1]), commits)
+        self.assertEqual(names, [name for batch in commits for name in batch])
+
+    def test_batchSize(self):
+        service = self.makeSaveService(meta_batch_count=1000, meta_batch_size=1000)
+        commits = self.recordCommits(service)
+        with service:
+            for index in range(30):
+                service.saveBytes(os.urandom(150), str(index))
+        self.assertGreater(len(commits), 1)
+        self.assertTrue(all(len(batch) * 150 >= 1000 for batch in commits[:-1]), commits)
+
+    def test_commitOnError(self):
+        service = self.makeSaveService(meta_batch_count=1000)
+        with self.assertRaises(ValueError):
+            with service:
+                service.saveBytes(os.urandom(150), 'finished')
+                service.fragment_cache._flush_percentage_filled(empty=True)
+                self.assertFalse(service.meta.hasCompoundWithName('finished'))
+                raise ValueError('aborted')
+        self.assertTrue(service.meta.hasCompoundWithName('finished'))
+
+    def test_invalidBatchCount(self):
+        with self.assertRaises(ValueError):
+            self.makeSaveService(meta_batch_count=0)
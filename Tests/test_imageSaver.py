@@ -1,5 +1,14 @@
+import asyncio
+import hashlib
+import io
+import os
+import random
+import threading
+import time
+from io import BytesIO
 from typing import cast
-from unittest import TestCase
+from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import patch
 
 from tqdm import tqdm
 import humanfriendly
@@ -8,10 +17,15 @@ from ImageSaverLib.Encapsulation import makeWrappingType, makeCompressingType
 from ImageSaverLib.Encapsulation.Wrappers.Types import *
 from ImageSaverLib.Encapsulation.Compressors.Types import *
 from ImageSaverLib.Errors import *
+from ImageSaverLib.Helpers.Chunker import ContentDefinedChunker
+from ImageSaverLib.ImageSaverFS2 import ImageSaverFS
 from ImageSaverLib.ImageSaverLib import ImageSaver
+from ImageSaverLib.MetaDB.Errors import NotExistingException
 from ImageSaverLib.MetaDB.db_inits import sqliteRAM
 from ImageSaverLib.Storage.Errors import NotFoundError
+from ImageSaverLib.Storage.HTTPObjectStorage import HTTPObjectStorage
 from ImageSaverLib.Storage.RamStorage import RamStorage
+from Tests.Storage.test_AsyncStorage import ObjectStoreStandIn
 
 VERBOSE_SAVE_SERVICE = False
 
@@ -239,3 +253,751 @@ class TestAbstractSaveService(TestCase):
         self.assertEqual(1, service.getUniqueCompoundCount())
         self.assertEqual(7, service.getTotalFragmentCount())
         self.assertEqual(7, service.getTotalResourceCount())
+
+
+class TestContentDefinedChunking(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self):
+        # type: () -> ImageSaver
+        meta = sqliteRAM()
+        storage = RamStorage()
+        service = ImageSaver(meta, storage, 4096, 65536)
+        service.setDefaultCompoundWrapper(PassThroughWrapper)
+        service.setDefaultCompoundCompressor(PassThroughCompressor)
+        service.setDefaultChunker(ContentDefinedChunker(1024, 4096, 16384))
+        return service
+
+    def test_boundariesWithinLimits(self):
+        chunker = ContentDefinedChunker(1024, 4096, 16384)
+        data = os.urandom(1000000)
+        sizes = []
+        while data:
+            boundary = chunker.nextBoundary(data)
+            sizes.append(boundary)
+            data = data[boundary:]
+        self.assertTrue(all(1024 <= size <= 16384 for size in sizes[:-1]))
+        self.assertTrue(2048 < sum(sizes) / len(sizes) < 8192, sum(sizes) / len(sizes))
+
+    def test_vectorizedHashFindsSameBoundaries(self):
+        # boundaries of already saved data must never move
+        for chunker in (ContentDefinedChunker(1024, 4096, 16384), ContentDefinedChunker(16, 64, 128),
+                        ContentDefinedChunker(20000, 65536, 131072)):
+            for data in [os.urandom(200000) for _ in range(10)] + [bytes(200000), b'ab' * 100000]:
+                normal = min(len(data), chunker.max_size, chunker.avg_size)
+                expected = chunker._scanBoundary(data, normal, min(len(data), chunker.max_size))
+                self.assertEqual(expected, chunker.nextBoundary(data))
+                self.assertEqual(expected, chunker.nextBoundary(memoryview(bytearray(data))))
+
+    def test_saveLoad(self):
+        service = self.makeSaveService()
+        data = os.urandom(200000)
+        with service:
+            service.saveBytes(data, 'cdc')
+        self.assertEqual(data, service.loadCompoundBytes('cdc'))
+
+    def test_insertedByteKeepsFragments(self):
+        service = self.makeSaveService()
+        data = os.urandom(200000)
+        shifted = data[:1000] + b'x' + data[1000:]
+        with service:
+            service.saveBytes(data, 'original')
+        fragment_count = service.getTotalFragmentCount()
+        with service:
+            service.saveBytes(shifted, 'shifted')
+        # only the fragments around the inserted byte are new
+        self.assertLessEqual(service.getTotalFragmentCount() - fragment_count, 3)
+        self.assertEqual(shifted, service.loadCompoundBytes('shifted'))
+
+    def test_chunkerPerCompound(self):
+        service = self.makeSaveService()
+        service.setDefaultChunker(None)
+        data = os.urandom(40000)
+        with service:
+            service.saveBytes(data, 'fixed')
+            service.saveBytes(data, 'cdc', chunker=ContentDefinedChunker(1024, 4096, 16384), overwrite=True)
+        self.assertEqual(data, service.loadCompoundBytes('fixed'))
+        self.assertEqual(data, service.loadCompoundBytes('cdc'))
+
+    def test_chunkerLargerThanResource(self):
+        service = self.makeSaveService()
+        with self.assertRaises(ValueError):
+            service.setDefaultChunker(ContentDefinedChunker(1024, 4096, 1000000))
+
+
+class TestParallelEncapsulation(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self):
+        # type: () -> ImageSaver
+        meta = sqliteRAM()
+        storage = RamStorage()
+        service = ImageSaver(meta, storage, 1000, 100000)
+        service.setDefaultCompoundWrapper(SizeChecksumWrapper)
+        service.setDefaultCompoundCompressor(LZMACompressor)
+        return service
+
+    def test_saveLoad(self):
+        service = self.makeSaveService()
+        data = os.urandom(50000) + bytes(50000)
+        with service:
+            service.saveBytes(data, 'parallel', encapsulation_workers=4)
+        self.assertEqual(data, service.loadCompoundBytes('parallel'))
+
+    def test_sameFragmentsAsSerial(self):
+        data = os.urandom(30000) + bytes(30000) + os.urandom(30000)
+        fragments = []
+        for encapsulation_workers in (0, 4):
+            service = self.makeSaveService()
+            service.encapsulation_workers = encapsulation_workers
+            with service:
+                service.saveStream(BytesIO(data), 'compound', read_speed=777)
+            compound = service.meta.getCompoundByName('compound')
+            fragments.append(list(service.meta.getFragmentHashesNeededForCompound(compound.compound_id)))
+        self.assertEqual(fragments[0], fragments[1])
+
+    def test_closeStopsOwnExecutor(self):
+        service = self.makeSaveService()
+        data = os.urandom(5000)
+        with service:
+            w_c = service.openWritableCompound('closed', encapsulation_workers=3)
+            w_c.write(data)
+            w_c.close()
+        self.assertFalse([t for t in threading.enumerate() if t.name.startswith('WritableCompoundEncapsulation')])
+        self.assertEqual(data, service.loadCompoundBytes('closed'))
+
+    def test_filesShareOneExecutor(self):
+        running = self.encapsulationThreads()
+        service = self.makeSaveService()
+        service.encapsulation_workers = 3
+        with service:
+            for i in range(10):
+                w_c = service.openWritableCompound('file' + str(i))
+                w_c.write(os.urandom(3000))
+                w_c.close()
+            self.assertLessEqual(len(self.encapsulationThreads() - running), 3)
+        # leaving the context stops the shared threads
+        self.assertFalse(self.encapsulationThreads() - running)
+        self.assertFalse([t for t in threading.enumerate() if t.name.startswith('WritableCompoundEncapsulation')])
+
+    def test_closeStopsSharedExecutor(self):
+        running = self.encapsulationThreads()
+        service = self.makeSaveService()
+        service.encapsulation_workers = 2
+        w_c = service.openWritableCompound('open')
+        w_c.write(os.urandom(3000))
+        service.close()
+        # the open compound keeps using the executor until it is closed
+        w_c.write(os.urandom(3000))
+        w_c.close()
+        for thread in self.encapsulationThreads() - running:
+            thread.join(5)
+        self.assertFalse(self.encapsulationThreads() - running)
+        service.saveBytes(b'after close', 'after')
+        self.assertEqual(b'after close', service.loadCompoundBytes('after'))
+        service.close()
+        self.assertFalse(self.encapsulationThreads() - running)
+
+    def test_replacedExecutorShutDownAfterLastCompound(self):
+        service = self.makeSaveService()
+        service.encapsulation_workers = 2
+        first = service.openWritableCompound('first')
+        old_executor = service._encapsulation_executor
+        service.encapsulation_workers = 3
+        second = service.openWritableCompound('second')
+        self.assertIsNot(old_executor, service._encapsulation_executor)
+        first.write(os.urandom(3000))
+        first.close()
+        with self.assertRaises(RuntimeError):
+            old_executor.submit(print)
+        second.write(os.urandom(3000))
+        second.close()
+        service.close()
+
+    @staticmethod
+    def encapsulationThreads():
+        return {t for t in threading.enumerate() if t.name.startswith('ImageSaverEncapsulation')}
+
+
+class TestPlaintextHashIndex(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self):
+        # type: () -> ImageSaver
+        meta = sqliteRAM()
+        storage = RamStorage()
+        service = ImageSaver(meta, storage, 1000, 10000)
+        service.setDefaultCompoundWrapper(SizeChecksumWrapper)
+        service.setDefaultCompoundCompressor(ZLibCompressor)
+        return service
+
+    def test_knownPlaintextSkipsEncapsulation(self):
+        service = self.makeSaveService()
+        data = os.urandom(5500)
+        with service:
+            service.saveBytes(data, 'first')
+        with patch('ImageSaverLib.Helpers.WritableStream.encapsulate_fragment') as encapsulate_fragment:
+            with service:
+                service.saveBytes(data, 'second')
+            self.assertEqual(0, encapsulate_fragment.call_count)
+        self.assertEqual(data, service.loadCompoundBytes('second'))
+
+    def test_plaintextLookupsBatchedPerFlush(self):
+        service = self.makeSaveService()
+        data = os.urandom(5500)
+        with service:
+            service.saveBytes(data, 'first')
+        with patch.object(service.meta, 'getFragmentsByPlaintextHashes',
+                          wraps=service.meta.getFragmentsByPlaintextHashes) as lookup:
+            with service:
+                service.saveBytes(data, 'second')
+            # the write flushes the five full fragments, closing flushes the rest
+            self.assertEqual([5, 1], [len(call[0][0]) for call in lookup.call_args_list])
+        self.assertEqual(data, service.loadCompoundBytes('second'))
+
+    def test_plaintextKeyedByEncapsulation(self):
+        service = self.makeSaveService()
+        data = os.urandom(2000)
+        with service:
+            service.saveBytes(data, 'zlib')
+            service.saveBytes(data, 'lzma', compress_type=LZMACompressor.get_compressor_type())
+        self.assertEqual(4, service.getTotalFragmentCount())
+        self.assertEqual(data, service.loadCompoundBytes('zlib'))
+        self.assertEqual(data, service.loadCompoundBytes('lzma'))
+
+    def test_plaintextKeyedByWrapperKey(self):
+        service = self.makeSaveService()
+        wrap_type = 'sc-' + AES256CTRWrapper.get_wrapper_type()
+        data = os.urandom(2000)
+        service.wrapper.addWrapper(AES256CTRWrapper(b'a' * 32))
+        with service:
+            service.saveBytes(data, 'key a', wrap_type=wrap_type)
+        service.wrapper.addWrapper(AES256CTRWrapper(b'b' * 32))
+        with service:
+            service.saveBytes(data, 'key b', wrap_type=wrap_type)
+        self.assertEqual(4, service.getTotalFragmentCount())
+        self.assertEqual(data, service.loadCompoundBytes('key b'))
+        service.wrapper.addWrapper(AES256CTRWrapper(b'a' * 32))
+        self.assertEqual(data, service.loadCompoundBytes('key a'))
+
+    def test_plaintextHashOfExistingFragment(self):
+        service = self.makeSaveService()
+        data = os.urandom(1000)
+        with service:
+            service.saveBytes(data, 'first')
+        plaintext_hash = hashlib.sha256(data).digest()
+        fragment = service.meta.getFragmentByPlaintextHash(plaintext_hash, ZLibCompressor.get_compressor_type(),
+                                                           SizeChecksumWrapper.get_wrapper_type())
+        self.assertEqual(1000, fragment.fragment_payload_size)
+        with self.assertRaises(NotExistingException):
+            service.meta.getFragmentByPlaintextHash(plaintext_hash, LZMACompressor.get_compressor_type(),
+                                                    SizeChecksumWrapper.get_wrapper_type())
+
+
+class ConcurrencyRecordingRamStorage(RamStorage):
+    """
+    RamStorage with slow downloads, which records how many downloads ran at the same time
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.loads = []
+        self.max_parallel_loads = 0
+        self._parallel_loads = 0
+        self._lock = threading.Lock()
+
+    def loadRessource(self, resource_name):
+        with self._lock:
+            self.loads.append(resource_name)
+            self._parallel_loads += 1
+            self.max_parallel_loads = max(self.max_parallel_loads, self._parallel_loads)
+        try:
+            time.sleep(0.02)
+            return super().loadRessource(resource_name)
+        finally:
+            with self._lock:
+                self._parallel_loads -= 1
+
+
+class TestResourcePrefetching(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self):
+        # type: () -> ImageSaver
+        meta = sqliteRAM()
+        storage = ConcurrencyRecordingRamStorage()
+        service = ImageSaver(meta, storage, 1000, 5000)
+        service.setDefaultCompoundWrapper(PassThroughWrapper)
+        service.setDefaultCompoundCompressor(PassThroughCompressor)
+        return service
+
+    def test_prefetchLoadsInParallel(self):
+        service = self.makeSaveService()
+        data = os.urandom(40000)
+        with service:
+            service.saveBytes(data, 'compound')
+        service.prefetch_resources = 3
+        self.assertEqual(data, service.loadCompoundBytes('compound'))
+        storage = cast(ConcurrencyRecordingRamStorage, service.storage)
+        self.assertGreater(storage.max_parallel_loads, 1)
+        self.assertEqual(len(storage.loads), len(set(storage.loads)))
+
+    def test_prefetchKeepsOrderOfSharedResources(self):
+        service = self.makeSaveService()
+        block = os.urandom(3000)
+        with service:
+            service.saveBytes(block + os.urandom(20000), 'first')
+        data = os.urandom(7000) + block + os.urandom(9000) + block
+        with service:
+            service.saveBytes(data, 'second')
+        for prefetch in (0, 1, 4):
+            service.prefetch_resources = prefetch
+            self.assertEqual(data, service.loadCompoundBytes('second'))
+
+    def test_prefetchPendingCompound(self):
+        service = self.makeSaveService()
+        service.prefetch_resources = 2
+        data = os.urandom(12500)
+        with service:
+            service.saveBytes(data, 'pending')
+            self.assertEqual(data, service.loadCompoundBytes('pending'))
+        self.assertEqual(data, service.loadCompoundBytes('pending'))
+
+    def test_prefetchMissingResource(self):
+        service = self.makeSaveService()
+        with service:
+            service.saveBytes(os.urandom(20000), 'compound')
+        service.storage.deleteResource(service.storage.listResourceNames()[-1])
+        service.prefetch_resources = 2
+        self.assertRaises(NotFoundError, service.loadCompoundBytes, 'compound')
+
+
+class TestMappedFragmentReads(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self):
+        # type: () -> ImageSaver
+        meta = sqliteRAM()
+        storage = ConcurrencyRecordingRamStorage()
+        service = ImageSaver(meta, storage, 1000, 5000)
+        service.setDefaultCompoundWrapper(PassThroughWrapper)
+        service.setDefaultCompoundCompressor(PassThroughCompressor)
+        return service
+
+    def test_fragmentsWithResource(self):
+        service = self.makeSaveService()
+        data = os.urandom(12000) + bytes(1000)
+        with service:
+            service.saveBytes(data, 'compound')
+        compound = service.meta.getCompoundByName('compound')
+        locations = list(service.meta.getSequenceIndexSortedFragmentsWithResourceForCompound(compound.compound_id))
+        self.assertEqual(13, len(locations))
+        self.assertEqual(list(range(13)), [i for i, _, _, _ in locations])
+        for _, fragment, resource, offset in locations:
+            expected_resource, expected_offset = service.meta.getResourceOffsetForFragment(fragment.fragment_id)
+            self.assertEqual(expected_resource.resource_id, resource.resource_id)
+            self.assertEqual(expected_offset, offset)
+
+    def test_loadWithoutPerFragmentQueries(self):
+        service = self.makeSaveService()
+        data = os.urandom(23000)
+        with service:
+            service.saveBytes(data, 'compound')
+        storage = cast(ConcurrencyRecordingRamStorage, service.storage)
+        for prefetch in (0, 2):
+            service.prefetch_resources = prefetch
+            storage.loads.clear()
+            with patch.object(service.meta, 'getResourceOffsetForFragment') as getResourceOffsetForFragment, \
+                    patch.object(service.meta, 'getFragmentsWithOffsetOnResource') as getFragmentsWithOffset:
+                self.assertEqual(data, service.loadCompoundBytes('compound'))
+                self.assertEqual(0, getResourceOffsetForFragment.call_count)
+                self.assertEqual(0, getFragmentsWithOffset.call_count)
+            self.assertEqual(len(storage.loads), len(set(storage.loads)))
+
+    def test_smallCompoundsShareDownload(self):
+        service = self.makeSaveService()
+        with service:
+            for index in range(4):
+                service.saveBytes(str(index).encode('ascii') * 100, 'small' + str(index))
+        storage = cast(ConcurrencyRecordingRamStorage, service.storage)
+        storage.loads.clear()
+        for index in range(4):
+            self.assertEqual(str(index).encode('ascii') * 100, service.loadCompoundBytes('small' + str(index)))
+        self.assertEqual(1, len(storage.loads))
+
+
+class TestResourcePayloadCache(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self):
+        # type: () -> ImageSaver
+        meta = sqliteRAM()
+        storage = ConcurrencyRecordingRamStorage()
+        service = ImageSaver(meta, storage, 1000, 5000)
+        service.setDefaultCompoundWrapper(PassThroughWrapper)
+        service.setDefaultCompoundCompressor(PassThroughCompressor)
+        return service
+
+    def test_interleavedReadsHitCache(self):
+        service = self.makeSaveService()
+        first = os.urandom(5000)
+        second = os.urandom(5000)
+        with service:
+            service.saveBytes(first, 'first')
+            service.saveBytes(second, 'second')
+        storage = cast(ConcurrencyRecordingRamStorage, service.storage)
+        storage.loads.clear()
+        for _ in range(3):
+            self.assertEqual(first, service.loadCompoundBytes('first'))
+            self.assertEqual(second, service.loadCompoundBytes('second'))
+        self.assertEqual(2, len(storage.loads))
+        payload_cache = service.fragment_cache.resource_payload_cache
+        self.assertEqual(2, payload_cache.misses)
+        self.assertEqual(4, payload_cache.hits)
+
+    def test_fragmentViewsAreNotCopied(self):
+        service = self.makeSaveService()
+        data = os.urandom(3000)
+        with service:
+            service.saveBytes(data, 'compound')
+        compound = service.meta.getCompoundByName('compound')
+        fragment = next(iter(service.meta.getSequenceIndexSortedFragmentsForCompound(compound.compound_id)))[1]
+        fragment_view = service.fragment_cache.loadFragmentView(fragment)
+        self.assertIsInstance(fragment_view, memoryview)
+        self.assertEqual(data[:1000], bytes(fragment_view))
+        self.assertEqual(data[:1000], service.fragment_cache.loadFragment(fragment))
+
+    def test_disabledCache(self):
+        service = self.makeSaveService()
+        service.fragment_cache.resource_payload_cache.max_size = 0
+        data = os.urandom(3000)
+        with service:
+            service.saveBytes(data, 'compound')
+        storage = cast(ConcurrencyRecordingRamStorage, service.storage)
+        storage.loads.clear()
+        self.assertEqual(data, service.loadCompoundBytes('compound'))
+        self.assertEqual(data, service.loadCompoundBytes('compound'))
+        self.assertEqual(2, len(storage.loads))
+
+
+class TestReadableCompound(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self):
+        # type: () -> ImageSaver
+        meta = sqliteRAM()
+        storage = ConcurrencyRecordingRamStorage()
+        service = ImageSaver(meta, storage, 1000, 5000)
+        service.setDefaultCompoundWrapper(SizeChecksumWrapper)
+        service.setDefaultCompoundCompressor(ZLibCompressor)
+        return service
+
+    def test_sequentialRead(self):
+        service = self.makeSaveService()
+        data = os.urandom(23456)
+        with service:
+            service.saveBytes(data, 'compound')
+        with service.openReadableCompound('compound') as r_c:
+            self.assertTrue(r_c.seekable())
+            self.assertEqual(data, r_c.read())
+            self.assertEqual(len(data), r_c.tell())
+            self.assertEqual(b'', r_c.read(10))
+
+    def test_randomSeeks(self):
+        service = self.makeSaveService()
+        service.setDefaultChunker(ContentDefinedChunker(200, 800, 1600))
+        data = os.urandom(30000)
+        with service:
+            service.saveBytes(data, 'compound')
+        rng = random.Random(42)
+        with service.openReadableCompound('compound') as r_c:
+            for _ in range(50):
+                offset = rng.randrange(len(data))
+                size = rng.randrange(1, 3000)
+                self.assertEqual(offset, r_c.seek(offset))
+                self.assertEqual(data[offset:offset + size], r_c.read(size))
+            self.assertEqual(len(data) - 100, r_c.seek(-100, io.SEEK_END))
+            self.assertEqual(data[-100:], r_c.read())
+
+    def test_tailReadLoadsOnlyCoveringResources(self):
+        service = self.makeSaveService()
+        service.setDefaultCompoundCompressor(PassThroughCompressor)
+        data = os.urandom(40000)
+        with service:
+            service.saveBytes(data, 'compound')
+        storage = cast(ConcurrencyRecordingRamStorage, service.storage)
+        storage.loads.clear()
+        with service.openReadableCompound('compound') as r_c:
+            r_c.seek(-1500, io.SEEK_END)
+            self.assertEqual(data[-1500:], r_c.read())
+        self.assertEqual(1, len(storage.loads))
+
+    def test_manipulatedFragment(self):
+        service = self.makeSaveService()
+        service.fragment_cache.resource_payload_cache.max_size = 0
+        data = os.urandom(3000)
+        with service:
+            service.saveBytes(data, 'compound')
+        storage = cast(ConcurrencyRecordingRamStorage, service.storage)
+        name = storage.storage.list()[0]
+        resource_data = bytearray(storage.storage.load(name))
+        resource_data[-10] ^= 0xFF
+        storage.storage.add(name, bytes(resource_data))
+        with service.openReadableCompound('compound') as r_c:
+            self.assertRaises(ResourceManipulatedException, r_c.read)
+
+    def test_pendingCompound(self):
+        service = self.makeSaveService()
+        data = os.urandom(2500)
+        with service:
+            service.saveBytes(data, 'pending')
+            with service.openReadableCompound('pending') as r_c:
+                r_c.seek(1200)
+                self.assertEqual(data[1200:], r_c.read())
+
+    def test_reservedUntilClosed(self):
+        service = self.makeSaveService()
+        with service:
+            service.saveBytes(b'hello world', 'compound')
+        r_c = service.openReadableCompound('compound')
+        self.assertTrue(service.reserved_compounds.managesValue(('compound', None)))
+        r_c.close()
+        self.assertFalse(service.reserved_compounds.managesValue(('compound', None)))
+
+    def test_imageSaverFSOpenbin(self):
+        service = self.makeSaveService()
+        is_fs = ImageSaverFS(service)
+        data = os.urandom(12000)
+        with is_fs.openbin('/file', 'w') as f:
+            f.write(data)
+        service.flush()
+        with is_fs.openbin('/file', 'r') as f:
+            self.assertTrue(f.seekable())
+            f.seek(-4000, io.SEEK_END)
+            self.assertEqual(data[-4000:], f.read())
+
+
+class TestDirectoryIndex(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeFS(self):
+        # type: () -> ImageSaverFS
+        service = ImageSaver(sqliteRAM(), RamStorage(), 1000, 5000)
+        return ImageSaverFS(service)
+
+    def test_listdirReturnsDirectChildren(self):
+        is_fs = self.makeFS()
+        is_fs.makedirs('/a/b/c')
+        is_fs.makedirs('/ab')
+        is_fs.writebytes('/a/file', b'data')
+        is_fs.writebytes('/a/b/file', b'data')
+        is_fs.flush()
+        self.assertEqual({'a', 'ab'}, set(is_fs.listdir('/')))
+        self.assertEqual({'b', 'file'}, set(is_fs.listdir('/a')))
+        self.assertEqual({'c', 'file'}, set(is_fs.listdir('/a/b')))
+        self.assertEqual([], is_fs.listdir('/a/b/c'))
+        infos = {info.name: info for info in is_fs.scandir('/a')}
+        self.assertTrue(infos['b'].is_dir)
+        self.assertFalse(infos['file'].is_dir)
+        self.assertEqual({'/a', '/a/b', '/a/b/c', '/ab'}, set(is_fs.walk.dirs()))
+
+    def test_listdirAfterRename(self):
+        is_fs = self.makeFS()
+        is_fs.makedirs('/src')
+        is_fs.makedirs('/dst')
+        is_fs.writebytes('/src/file', b'data')
+        is_fs.flush()
+        is_fs.move('/src/file', '/dst/moved')
+        self.assertEqual([], is_fs.listdir('/src'))
+        self.assertEqual(['moved'], is_fs.listdir('/dst'))
+        self.assertEqual(b'data', is_fs.readbytes('/dst/moved'))
+
+
+class BatchRecordingRamStorage(RamStorage):
+    """
+    RamStorage, which records the size of every batched storage call
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def loadResources(self, resource_names):
+        resource_names = list(resource_names)
+        self.batches.append(('load', len(resource_names)))
+        return super().loadResources(resource_names)
+
+    def saveResources(self, resources):
+        resources = list(resources)
+        self.batches.append(('save', len(resources)))
+        return super().saveResources(resources)
+
+    def deleteResources(self, resource_names):
+        resource_names = list(resource_names)
+        self.batches.append(('delete', len(resource_names)))
+        return super().deleteResources(resource_names)
+
+    def batchSizes(self, kind):
+        return [size for batch_kind, size in self.batches if batch_kind == kind]
+
+
+class TestBatchedStorageCalls(TestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self):
+        # type: () -> ImageSaver
+        meta = sqliteRAM()
+        storage = BatchRecordingRamStorage()
+        service = ImageSaver(meta, storage, 1000, 5000)
+        service.setDefaultCompoundWrapper(PassThroughWrapper)
+        service.setDefaultCompoundCompressor(PassThroughCompressor)
+        return service
+
+    def test_collectGarbageDeletesInBatches(self):
+        service = self.makeSaveService()
+        data = os.urandom(20000)
+        with service:
+            service.saveBytes(os.urandom(20000), 'deleted')
+        with service:
+            service.saveBytes(data, 'kept')
+        resource_count = service.getTotalResourceCount()
+        service.deleteCompound('deleted')
+        service.delete_batch_size = 3
+        service.collectGarbage(keep_fragments=False)
+        storage = cast(BatchRecordingRamStorage, service.storage)
+        deleted_count = resource_count - service.getTotalResourceCount()
+        self.assertGreater(deleted_count, 3)
+        self.assertEqual(deleted_count, sum(storage.batchSizes('delete')))
+        self.assertLessEqual(max(storage.batchSizes('delete')), 3)
+        self.assertSetEqual(set(service.meta.getAllResourceNames()), set(storage.listResourceNames()))
+        self.assertEqual(data, service.loadCompoundBytes('kept'))
+
+    def test_optimizeResourceSpaceInBatches(self):
+        service = self.makeSaveService()
+        kept = {}
+        with service:
+            for index in range(4):
+                data = os.urandom(2500)
+                service.saveBytes(data, str(index))
+                if index % 2:
+                    kept[str(index)] = data
+        for index in range(0, 4, 2):
+            service.deleteCompound(str(index))
+        service.collectGarbage(keep_fragments=False)
+        holey_resources = service.getTotalResourceCount()
+        self.assertGreater(holey_resources, 1)
+        service.optimizeResourceSpace()
+        service.collectGarbage()
+        storage = cast(BatchRecordingRamStorage, service.storage)
+        self.assertEqual([holey_resources], storage.batchSizes('load'))
+        self.assertEqual([holey_resources], storage.batchSizes('save'))
+        self.assertEqual(holey_resources, service.getTotalResourceCount())
+        self.assertEqual(sum(len(d) for d in kept.values()), service.getTotalResourceSize())
+        for name, data in kept.items():
+            self.assertEqual(data, service.loadCompoundBytes(name))
+
+
+class TestAsyncRead(IsolatedAsyncioTestCase):
+    # noinspection PyMethodMayBeStatic
+    def makeSaveService(self):
+        # type: () -> ImageSaver
+        meta = sqliteRAM()
+        storage = RamStorage()
+        service = ImageSaver(meta, storage, 1000, 2000)
+        service.setDefaultCompoundWrapper(PassThroughWrapper)
+        service.setDefaultCompoundCompressor(PassThroughCompressor)
+        return service
+
+    async def loadAsync(self, service, name, **kwargs):
+        return b''.join([d async for d in service.loadCompoundAsync(name, **kwargs)])
+
+    async def test_loadThroughDefaultAdapter(self):
+        service = self.makeSaveService()
+        data = os.urandom(20000)
+        with service:
+            service.saveBytes(data, 'compound')
+        self.assertEqual(data, await self.loadAsync(service, 'compound'))
+        self.assertFalse(service.reserved_compounds.managedValues())
+        self.assertFalse(service.reserved_fragments.managedValues())
+        await service.async_storage.close()
+
+    async def test_loadThroughHTTPObjectStorage(self):
+        service = self.makeSaveService()
+        data = os.urandom(100000)
+        with service:
+            service.saveBytes(data, 'compound')
+        server = ObjectStoreStandIn(delay=0.01)
+        await server.start()
+        try:
+            for resource_name in service.storage.listResourceNames():
+                server.objects[resource_name] = service.storage.loadRessource(resource_name)
+            async with HTTPObjectStorage(server.base_url) as async_storage:
+                service.async_storage = async_storage
+                self.assertEqual(data, await self.loadAsync(service, 'compound', in_flight=16))
+        finally:
+            await server.stop()
+        self.assertEqual(service.getTotalResourceCount(), server.request_count)
+        self.assertGreater(server.max_active_requests, 1)
+        self.assertLessEqual(server.max_active_requests, 17)
+
+    async def test_manipulatedResource(self):
+        service = self.makeSaveService()
+        service.fragment_cache.resource_payload_cache.max_size = 0
+        with service:
+            service.saveBytes(os.urandom(5000), 'compound')
+        storage = cast(RamStorage, service.storage)
+        name = storage.storage.list()[0]
+        resource_data = bytearray(storage.storage.load(name))
+        resource_data[-10] ^= 0xFF
+        storage.storage.add(name, bytes(resource_data))
+        with self.assertRaises(ResourceManipulatedException):
+            await self.loadAsync(service, 'compound')
+        self.assertFalse(service.reserved_fragments.managedValues())
+        await service.async_storage.close()
+
+    async def test_pendingCompound(self):
+        service = self.makeSaveService()
+        data = os.urandom(500)
+        with service:
+            service.saveBytes(data, 'compound')
+            self.assertEqual(data, await self.loadAsync(service, 'compound'))
+
+    async def test_decapsulationOffTheLoop(self):
+        service = self.makeSaveService()
+        service.fragment_cache.resource_payload_cache.max_size = 0
+        data = os.urandom(20000)
+        with service:
+            service.saveBytes(data, 'compound')
+        threads = set()
+        decapsulate_resource = service.fragment_cache._decapsulate_resource
+
+        def recording_decapsulate(resource, resource_data):
+            threads.add(threading.get_ident())
+            return decapsulate_resource(resource, resource_data)
+
+        service.fragment_cache._decapsulate_resource = recording_decapsulate
+        self.assertEqual(data, await self.loadAsync(service, 'compound'))
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+        await service.async_storage.close()
+
+    async def test_waitingForReservationKeepsLoopRunning(self):
+        service = self.makeSaveService()
+        data = os.urandom(5000)
+        with service:
+            service.saveBytes(data, 'compound')
+        released = threading.Event()
+        reserved = threading.Event()
+
+        def hold_compound():
+            service.reserved_compounds.exclusiveAccess(('compound', None))
+            reserved.set()
+            released.wait(5)
+            service.reserved_compounds.exclusiveLeave(('compound', None))
+
+        holder = threading.Thread(target=hold_compound)
+        holder.start()
+        reserved.wait(5)
+        load = asyncio.ensure_future(self.loadAsync(service, 'compound'))
+        # the loop keeps running while the load waits for the reservation
+        start = time.monotonic()
+        await asyncio.sleep(0.1)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(load.done())
+        released.set()
+        self.assertEqual(data, await load)
+        holder.join(5)
+        self.assertFalse(service.reserved_compounds.managedValues())
+        self.assertFalse(service.reserved_fragments.managedValues())
+        await service.async_storage.close()
@@ -0,0 +1,59 @@
+import time
+from threading import Lock
+from unittest import TestCase
+
+from ImageSaverLib.Helpers.JobQueue import JobQueue
+
+
+class TestJobQueue(TestCase):
+    def test_runsAllJobs(self):
+        results = []
+        lock = Lock()
+
+        def job(i):
+            with lock:
+                results.append(i)
+
+        with JobQueue(4) as job_queue:
+            for i in range(100):
+                job_queue.submit(job, i)
+        self.assertEqual(list(range(100)), sorted(results))
+
+    def test_boundsPendingJobs(self):
+        lock = Lock()
+        state = {'running': 0, 'max_running': 0}
+
+        def job():
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+
+        with JobQueue(3, max_pending=3) as job_queue:
+            for _ in range(20):
+                job_queue.submit(job)
+            job_queue.join()
+            self.assertEqual(0, state['running'])
+        self.assertLessEqual(state['max_running'], 3)
+        self.assertGreater(state['max_running'], 1)
+
+    def test_raisesJobError(self):
+        def failing_job():
+            raise ValueError('failed')
+
+        job_queue = JobQueue(2)
+        job_queue.submit(failing_job)
+        with self.assertRaises(ValueError):
+            job_queue.join()
+        with self.assertRaises(ValueError):
+            job_queue.submit(failing_job)
+        with self.assertRaises(ValueError):
+            job_queue.close()
+
+    def test_invalidWorkers(self):
+        with self.assertRaises(ValueError):
+            JobQueue(0)
+        with self.assertRaises(ValueError):
+            JobQueue(4, max_pending=2)
@@ -0,0 +1,95 @@
+import hashlib
+from unittest import TestCase
+
+from ImageSaverLib.MetaDB.Types.Compound import Compound
+from ImageSaverLib.MetaDB.Types.Fragment import Fragment
+from ImageSaverLib.PendingObjectsController import PendingObjectsController
+
+
+def _hash(data):
+    return hashlib.sha256(data).digest()
+
+
+def makeFragment(name):
+    return Fragment(_hash(name.encode()), 10, 10)
+
+
+def makeCompound(name, content=None):
+    return Compound(name, Compound.FILE_TYPE, _hash((content or name).encode()), 10, 'pass', 'pass')
+
+
+class TestPendingObjectsController(TestCase):
+    def setUp(self):
+        self.pending_objects = PendingObjectsController()
+
+    def addCompound(self, compound, *fragments):
+        for fragment in fragments:
+            self.pending_objects.addFragment(fragment)
+        self.pending_objects.addCompound(compound, list(fragments), [(f, i) for i, f in enumerate(fragments)])
+
+    def test_compoundPendingUntilAllFragmentsRemoved(self):
+        f1, f2 = makeFragment('f1'), makeFragment('f2')
+        compound = makeCompound('/a')
+        self.addCompound(compound, f1, f2, f1)
+        self.assertEqual([compound], self.pending_objects.getPendingCompounds())
+        self.pending_objects.removeFragment(f1)
+        self.assertEqual({}, self.pending_objects.popNonPendingFragmentSequences())
+        self.pending_objects.removeFragment(f2)
+        self.assertEqual([], self.pending_objects.getPendingCompounds())
+        self.assertEqual({compound: [(f1, 0), (f2, 1), (f1, 2)]},
+                         self.pending_objects.popNonPendingFragmentSequences())
+        self.assertIsNone(self.pending_objects.getPendingCompoundWithName('/a'))
+        self.assertEqual({}, self.pending_objects.popNonPendingFragmentSequences())
+
+    def test_sharedFragment(self):
+        fragment = makeFragment('shared')
+        a, b = makeCompound('/a', 'same'), makeCompound('/b', 'same')
+        self.addCompound(a, fragment)
+        self.addCompound(b, fragment)
+        self.assertIs(a, self.pending_objects.getPendingCompoundWithHash(a.compound_hash))
+        self.pending_objects.removeFragment(fragment)
+        self.assertEqual([a, b], list(self.pending_objects.popNonPendingFragmentSequences()))
+        self.assertEqual([], self.pending_objects.getPendingFragments())
+
+    def test_lookupByNameAndHash(self):
+        fragment = makeFragment('f')
+        compound = makeCompound('/a')
+        self.addCompound(compound, fragment)
+        self.assertTrue(self.pending_objects.hasCompoundWithName('/a'))
+        self.assertFalse(self.pending_objects.hasCompoundWithName('/b'))
+        self.assertIs(compound, self.pending_objects.getPendingCompoundWithName('/a'))
+        self.assertIs(compound, self.pending_objects.getPendingCompoundWithHash(compound.compound_hash))
+        self.assertEqual([(fragment, 0)], self.pending_objects.getFragmentsNeededForPendingCompoundByName('/a'))
+        self.assertEqual([(fragment, 0)],
+                         self.pending_objects.getFragmentsNeededForPendingCompoundByHash(compound.compound_hash))
+        self.assertEqual([fragment.fragment_hash],
+                         self.pending_objects.getFragmentHashesNeededForCompound(compound.compound_hash))
+        self.assertIsNone(self.pending_objects.getFragmentsNeededForPendingCompoundByName('/b'))
+
+    def test_removeCompoundByName(self):
+        fragment = makeFragment('f')
+        a, b = makeCompound('/a'), makeCompound('/b')
+        self.addCompound(a, fragment)
+        self.addCompound(b, fragment)
+        self.assertIs(a, self.pending_objects.removeCompoundByName('/a'))
+        self.assertIsNone(self.pending_objects.removeCompoundByName('/a'))
+        self.assertIsNone(self.pending_objects.getPendingCompoundWithHash(a.compound_hash))
+        self.pending_objects.removeFragment(fragment)
+        self.assertEqual([b], list(self.pending_objects.popNonPendingFragmentSequences()))
+
+    def test_removeCompound(self):
+        compound = makeCompound('/a')
+        self.addCompound(compound, makeFragment('f'))
+        self.pending_objects.removeCompound(compound)
+        self.assertEqual([], self.pending_objects.getPendingCompounds())
+        with self.assertRaises(KeyError):
+            self.pending_objects.removeCompound(compound)
+
+    def test_popKeepsInsertionOrder(self):
+        fragments = [makeFragment(str(i)) for i in range(1000)]
+        compounds = [makeCompound('/' + str(i)) for i in range(1000)]
+        for compound, fragment in zip(compounds, fragments):
+            self.addCompound(compound, fragment)
+        for fragment in reversed(fragments):
+            self.pending_objects.removeFragment(fragment)
+        self.assertEqual(compounds, list(self.pending_objects.popNonPendingFragmentSequences()))
@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from ImageSaverLib.ResourcePayloadCache import ResourcePayloadCache
+
+
+class TestResourcePayloadCache(TestCase):
+    def test_hitsAndMisses(self):
+        cache = ResourcePayloadCache(100)
+        self.assertIsNone(cache.get(b'a'))
+        cache.put(b'a', b'x' * 10)
+        self.assertEqual(b'x' * 10, cache.get(b'a'))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_evictsLeastRecentlyUsed(self):
+        cache = ResourcePayloadCache(100)
+        cache.put(b'a', bytes(40))
+        cache.put(b'b', bytes(40))
+        cache.get(b'a')
+        cache.put(b'c', bytes(40))
+        self.assertIn(b'a', cache)
+        self.assertNotIn(b'b', cache)
+        self.assertIn(b'c', cache)
+        self.assertEqual(80, cache.size)
+
+    def test_oversizedPayloadNotCached(self):
+        cache = ResourcePayloadCache(100)
+        cache.put(b'a', bytes(40))
+        cache.put(b'b', bytes(101))
+        self.assertNotIn(b'b', cache)
+        self.assertIn(b'a', cache)
+
+    def test_shrinkMaxSize(self):
+        cache = ResourcePayloadCache(100)
+        cache.put(b'a', bytes(40))
+        cache.put(b'b', bytes(40))
+        cache.max_size = 50
+        self.assertEqual(1, len(cache))
+        self.assertIn(b'b', cache)
+        cache.max_size = 0
+        self.assertEqual(0, cache.size)